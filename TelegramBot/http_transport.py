@@ -0,0 +1,214 @@
+"""
+HTTP Transport — pooled, retrying, circuit-broken outbound HTTP.
+
+Every upstream host (Tatum, DynoPay, Retell recording storage, Telegram
+file downloads) gets its own keep-alive requests.Session, so repeated calls
+reuse TCP+TLS connections instead of handshaking each time:
+
+  1. request() fills in a default (connect, read) timeout
+  2. Connection errors, timeouts, 429 and 502/503/504 are retried with
+     full-jitter exponential backoff (Retry-After is honoured). Non-idempotent
+     methods are only retried when the connection was never made
+  3. After HTTP_CIRCUIT_FAILURES consecutive failures the host's circuit opens
+     and calls fail fast with CircuitOpenError for HTTP_CIRCUIT_RESET_SECONDS;
+     then a single trial request decides whether it closes again
+  4. Per-host counters and latency are kept in memory (stats())
+
+CircuitOpenError subclasses requests' ConnectionError, so existing
+`except RequestException` handlers keep working.
+"""
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 502, 503, 504)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+# Upper bounds (seconds) of the per-host latency buckets; the last is +Inf
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """The upstream host failed repeatedly; calls are short-circuited."""
+
+
+class _Host:
+    def __init__(self, name):
+        self.name = name
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.HTTP_POOL_MAXSIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.lock = threading.Lock()
+        # Circuit breaker
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        # Metrics
+        self.counters = {"requests": 0, "errors": 0, "retries": 0, "short_circuited": 0}
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+    # -- circuit breaker ------------------------------------------------------
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < settings.HTTP_CIRCUIT_RESET_SECONDS:
+                self.counters["short_circuited"] += 1
+                return False
+            # Half-open: let exactly one request through
+            if self.trial_in_flight:
+                self.counters["short_circuited"] += 1
+                return False
+            self.trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                logger.info(f"[http] Circuit for {self.name} closed")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.counters["errors"] += 1
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= settings.HTTP_CIRCUIT_FAILURES:
+                if self.opened_at is None:
+                    logger.warning(f"[http] Circuit for {self.name} opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+
+    # -- metrics --------------------------------------------------------------
+
+    def observe(self, seconds):
+        with self.lock:
+            self.counters["requests"] += 1
+            index = next((i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS))
+            self.latency_counts[index] += 1
+            self.latency_sum += seconds
+            self.latency_max = max(self.latency_max, seconds)
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def snapshot(self):
+        with self.lock:
+            requests_made = self.counters["requests"]
+            return {
+                **self.counters,
+                "circuit": "closed" if self.opened_at is None else "open",
+                "latency_avg": round(self.latency_sum / requests_made, 4) if requests_made else None,
+                "latency_max": round(self.latency_max, 4),
+                "latency_buckets": dict(zip([str(b) for b in LATENCY_BUCKETS] + ["+Inf"], self.latency_counts)),
+            }
+
+
+_hosts = {}
+_hosts_lock = threading.Lock()
+
+
+def _host(url):
+    parts = urlsplit(url)
+    name = f"{parts.scheme}://{parts.netloc}"
+    host = _hosts.get(name)
+    if host is None:
+        with _hosts_lock:
+            host = _hosts.get(name)
+            if host is None:
+                host = _hosts[name] = _Host(name)
+    return host
+
+
+def get_session(url):
+    """The pooled session for the host of `url` (for callers that need it directly)."""
+    return _host(url).session
+
+
+def _backoff(attempt, response=None):
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), settings.HTTP_BACKOFF_MAX)
+    return random.uniform(0, min(settings.HTTP_BACKOFF_MAX, settings.HTTP_BACKOFF_BASE * 2 ** attempt))
+
+
+def _never_sent(error):
+    """True when the request failed before a connection was established."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def request(method, url, retries=None, **kwargs):
+    """
+    requests.request() over the host's pooled session, with a default
+    timeout, retries and circuit breaking. Returns the final response
+    (which may be a retryable status once retries run out).
+    """
+    method = method.upper()
+    host = _host(url)
+    retries = settings.HTTP_MAX_RETRIES if retries is None else retries
+    kwargs.setdefault("timeout", (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT))
+
+    attempt = 0
+    while True:
+        if not host.allow():
+            raise CircuitOpenError(f"Circuit open for {host.name}")
+
+        started = time.monotonic()
+        try:
+            response = host.session.request(method, url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            host.observe(time.monotonic() - started)
+            host.record_failure()
+            # A POST that may have reached the server must not be repeated
+            if attempt >= retries or (method not in IDEMPOTENT_METHODS and not _never_sent(e)):
+                raise
+            delay = _backoff(attempt)
+            logger.info(f"[http] {method} {host.name} failed ({e.__class__.__name__}), retry in {delay:.2f}s")
+        else:
+            host.observe(time.monotonic() - started)
+            if response.status_code >= 500:
+                host.record_failure()
+            else:
+                host.record_success()
+            if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                return response
+            if method not in IDEMPOTENT_METHODS and response.status_code != 429:
+                return response
+            delay = _backoff(attempt, response)
+            logger.info(f"[http] {method} {host.name} -> {response.status_code}, retry in {delay:.2f}s")
+            response.close()
+
+        host.count("retries")
+        attempt += 1
+        time.sleep(delay)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def stats():
+    """Per-host request counters, circuit state and latency."""
+    return {name: host.snapshot() for name, host in sorted(_hosts.items())}
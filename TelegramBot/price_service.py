@@ -0,0 +1,214 @@
+"""
+Price Service — USD rates for the supported crypto payment currencies.
+
+  1. bot.tasks.refresh_crypto_prices (beat) fetches every supported symbol
+     in one Tatum batch request and stores the rates in a Redis hash with
+     their fetch time, shared by all web and Celery workers
+  2. get_price() serves the stored rate. Past PRICE_FRESH_SECONDS it is still
+     served (stale-while-revalidate) while one background thread refreshes it
+  3. A cold miss refreshes synchronously; concurrent misses — across threads
+     and processes — wait on one Redis lock, so only one upstream call is made
+  4. price_ages() reports how old each rate is (api/prices/stats)
+"""
+import json
+import logging
+import os
+import threading
+import time
+from decimal import ROUND_UP, Decimal
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from TelegramBot import http_transport
+
+logger = logging.getLogger(__name__)
+
+TATUM_RATE_URL = "https://api.tatum.io/v3/tatum/rate"
+PRICES_KEY = "crypto_prices"
+REFRESH_LOCK_KEY = "crypto_prices:refresh"
+REVALIDATE_KEY = "crypto_prices:revalidate"
+REFRESH_LOCK_TIMEOUT = 60
+
+# Payment currencies (bot.utils.get_currency) priced under another Tatum symbol
+TATUM_SYMBOLS = {
+    "USDT-TRC20": "USDT",
+    "USDT-ERC20": "USDT",
+}
+
+
+def _redis():
+    from bot.utils import redis_client
+
+    return redis_client
+
+
+def supported_symbols():
+    from bot.utils import PAYMENT_METHOD_CURRENCIES
+
+    return sorted(set(PAYMENT_METHOD_CURRENCIES.values()))
+
+
+def _headers():
+    return {"accept": "application/json", "x-api-key": f"{os.getenv('x-api-key')}"}
+
+
+# =============================================================================
+# Upstream
+# =============================================================================
+
+def fetch_rates(symbols):
+    """{symbol: USD rate} from Tatum — one batch request, then single-symbol
+    requests for anything the batch did not return."""
+    wanted = {}
+    for symbol in symbols:
+        wanted.setdefault(TATUM_SYMBOLS.get(symbol, symbol), []).append(symbol)
+
+    rates = {}
+    try:
+        response = http_transport.post(
+            TATUM_RATE_URL,
+            json=[{"currency": code, "basePair": "USD", "batchId": code} for code in wanted],
+            headers=_headers(),
+        )
+        if response.status_code == 200:
+            for item in response.json():
+                code = item.get("batchId") or item.get("id")
+                if code in wanted and item.get("value") is not None:
+                    rates[code] = float(item["value"])
+        else:
+            logger.warning(f"[price_service] Batch rate request -> {response.status_code}")
+    except (http_transport.requests.RequestException, ValueError, TypeError) as e:
+        logger.warning(f"[price_service] Batch rate request failed: {e}")
+
+    for code in wanted:
+        if code in rates:
+            continue
+        try:
+            response = http_transport.get(f"{TATUM_RATE_URL}/{code}?basePair=USD", headers=_headers())
+            if response.status_code == 200:
+                rates[code] = float(response.json()["value"])
+        except (http_transport.requests.RequestException, ValueError, KeyError) as e:
+            logger.warning(f"[price_service] Rate for {code} failed: {e}")
+
+    return {symbol: rates[code] for code, group in wanted.items() if code in rates for symbol in group}
+
+
+# =============================================================================
+# Store
+# =============================================================================
+
+def _load(symbols=None):
+    if symbols is None:
+        raw = _redis().hgetall(PRICES_KEY)
+        items = {key.decode(): value for key, value in raw.items()}
+    else:
+        items = dict(zip(symbols, _redis().hmget(PRICES_KEY, symbols)))
+    return {symbol: json.loads(value) for symbol, value in items.items() if value}
+
+
+def _store(rates):
+    fetched_at = time.time()
+    _redis().hset(PRICES_KEY, mapping={
+        symbol: json.dumps({"price": price, "fetched_at": fetched_at})
+        for symbol, price in rates.items()
+    })
+
+
+def refresh_prices(symbols=None, wait=None):
+    """
+    Fetch and store all supported rates, unless another caller is already
+    doing so — then wait up to `wait` seconds for it and reuse its result.
+    Returns the stored entries {symbol: {"price", "fetched_at"}}.
+    """
+    symbols = symbols or supported_symbols()
+    wait = settings.PRICE_WAIT_SECONDS if wait is None else wait
+    started = time.time()
+    lock = _redis().lock(REFRESH_LOCK_KEY, timeout=REFRESH_LOCK_TIMEOUT, blocking_timeout=wait)
+    if not lock.acquire(blocking=wait > 0):
+        return _load(symbols)
+
+    try:
+        current = _load(symbols)
+        if current and all(entry["fetched_at"] >= started for entry in current.values()):
+            # Refreshed by the holder we waited for
+            return current
+        rates = fetch_rates(symbols)
+        if rates:
+            _store(rates)
+            logger.info(f"[price_service] Refreshed {len(rates)}/{len(symbols)} rates")
+        return _load(symbols)
+    finally:
+        try:
+            lock.release()
+        except RedisError:
+            pass
+
+
+def _revalidate():
+    """Refresh in a background thread; at most one per REVALIDATE window."""
+    try:
+        if not _redis().set(REVALIDATE_KEY, 1, nx=True, ex=settings.PRICE_FRESH_SECONDS):
+            return
+    except RedisError:
+        return
+    threading.Thread(target=_refresh_quietly, name="price-revalidate", daemon=True).start()
+
+
+def _refresh_quietly():
+    try:
+        refresh_prices(wait=0)
+    except (RedisError, ValueError) as e:
+        logger.warning(f"[price_service] Background refresh failed: {e}")
+
+
+# =============================================================================
+# Public API
+# =============================================================================
+
+def get_price(symbol):
+    """USD rate for a payment currency. Raises ValueError if none is known."""
+    symbol = symbol.upper()
+    now = time.time()
+    try:
+        entry = _load([symbol]).get(symbol)
+        if entry and now - entry["fetched_at"] < settings.PRICE_MAX_STALE_SECONDS:
+            if now - entry["fetched_at"] >= settings.PRICE_FRESH_SECONDS:
+                _revalidate()
+            return entry["price"]
+        symbols = supported_symbols()
+        entry = refresh_prices(symbols if symbol in symbols else symbols + [symbol]).get(symbol) or entry
+    except RedisError as e:
+        logger.warning(f"[price_service] Store unavailable, fetching {symbol} directly: {e}")
+        entry = None
+        rate = fetch_rates([symbol]).get(symbol)
+        if rate is not None:
+            return rate
+
+    if entry:
+        if time.time() - entry["fetched_at"] >= settings.PRICE_MAX_STALE_SECONDS:
+            logger.warning(f"[price_service] Serving {symbol} rate {time.time() - entry['fetched_at']:.0f}s old")
+        return entry["price"]
+    raise ValueError(f"Failed to fetch price for {symbol} and no cached value available.")
+
+
+def usd_to_crypto(usd_amount, symbol, places=8):
+    """Amount of `symbol` worth `usd_amount`, or None if no rate is known."""
+    try:
+        price = Decimal(str(get_price(symbol)))
+    except (ValueError, RedisError):
+        return None
+    if price <= 0:
+        return None
+    return (Decimal(str(usd_amount)) / price).quantize(Decimal(1).scaleb(-places), rounding=ROUND_UP)
+
+
+def price_ages():
+    """Seconds since each supported rate was fetched (None if never)."""
+    now = time.time()
+    symbols = supported_symbols()
+    entries = _load(symbols)
+    return {
+        symbol: round(now - entries[symbol]["fetched_at"], 1) if symbol in entries else None
+        for symbol in symbols
+    }
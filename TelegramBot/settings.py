@@ -41,6 +41,12 @@ REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 REDIS_HOST = REDIS_URL.split("@")[-1].split(":")[0] if "@" in REDIS_URL else "localhost"
 REDIS_PORT = int(REDIS_URL.split(":")[-1].split("/")[0]) if REDIS_URL else 6379
 REDIS_DB = 0
+
+# Telegram conversation state (bot.state_store): "redis" or "memory"
+USER_STATE_BACKEND = os.getenv("USER_STATE_BACKEND", "redis")
+# Idle sessions expire after this many seconds
+USER_STATE_TTL = int(os.getenv("USER_STATE_TTL", "86400"))
+
 # Redis as the broker
 CELERY_BROKER_URL = REDIS_URL
 CELERY_ACCEPT_CONTENT = ["json"]
@@ -77,10 +83,105 @@ CELERY_BEAT_SCHEDULE = {
         "task": "bot.tasks.sync_caller_ids_task",
         "schedule": 86400.0,  # every 24 hours
     },
+    "sweep-retell-events-every-1min": {
+        "task": "bot.tasks.sweep_pending_retell_events",
+        "schedule": 60.0,  # re-enqueue events whose drain task was lost
+    },
+    "prune-webhook-ledgers-daily": {
+        "task": "bot.tasks.prune_webhook_event_ledgers",
+        "schedule": 86400.0,  # every 24 hours
+    },
+    "resume-campaign-dispatches-every-1min": {
+        "task": "bot.tasks.resume_campaign_dispatches",
+        "schedule": 60.0,  # restart throttled/interrupted campaign dispatches
+    },
+    "deliver-outbound-messages-every-1min": {
+        "task": "bot.tasks.deliver_outbound_messages",
+        "schedule": 60.0,  # each run drains the Telegram outbox for ~55s
+    },
+    "refresh-crypto-prices-every-1min": {
+        "task": "bot.tasks.refresh_crypto_prices",
+        "schedule": 60.0,
+    },
+    "maintain-recording-storage-every-15min": {
+        "task": "bot.tasks.maintain_recording_storage",
+        "schedule": 900.0,
+    },
 }
 
 # Retell AI
 RETELL_API_KEY = os.environ.get("RETELL_API_KEY", "")
+# Persist Retell webhooks and process them in Celery instead of inline
+RETELL_WEBHOOK_ASYNC = os.environ.get("RETELL_WEBHOOK_ASYNC", "false").lower() == "true"
+
+# Full ITU prefix -> (region, rate) table used by bot.call_gate
+INTERNATIONAL_RATES_FILE = os.environ.get(
+    "INTERNATIONAL_RATES_FILE", os.path.join(BASE_DIR, "data_files", "international_rates.txt")
+)
+
+# Upper bound on recipients accepted for a single bulk IVR campaign
+BULK_MAX_CONTACTS = int(os.environ.get("BULK_MAX_CONTACTS", "20000"))
+
+# Bulk campaign dispatch (bot.campaign_dispatcher)
+RETELL_DISPATCH_CHUNK_SIZE = int(os.environ.get("RETELL_DISPATCH_CHUNK_SIZE", "50"))
+RETELL_DISPATCH_CALLS_PER_SECOND = float(os.environ.get("RETELL_DISPATCH_CALLS_PER_SECOND", "10"))
+RETELL_MAX_CONCURRENT_CALLS = int(os.environ.get("RETELL_MAX_CONCURRENT_CALLS", "100"))
+RETELL_DISPATCH_MAX_ATTEMPTS = int(os.environ.get("RETELL_DISPATCH_MAX_ATTEMPTS", "5"))
+# Calls queued longer than this without call_ended stop counting as in flight
+RETELL_IN_FLIGHT_TIMEOUT_SECONDS = int(os.environ.get("RETELL_IN_FLIGHT_TIMEOUT_SECONDS", "1800"))
+
+# Telegram webhook update processing (bot.update_dispatcher)
+TELEGRAM_DISPATCH_SHARDS = int(os.environ.get("TELEGRAM_DISPATCH_SHARDS", "8"))
+TELEGRAM_DISPATCH_QUEUE_SIZE = int(os.environ.get("TELEGRAM_DISPATCH_QUEUE_SIZE", "200"))
+# Max seconds one chat stays locked across web workers; 0 disables the lock
+TELEGRAM_CHAT_LOCK_TIMEOUT = int(os.environ.get("TELEGRAM_CHAT_LOCK_TIMEOUT", "120"))
+
+# Internal stats endpoints (bot.internal_api): staff sessions, or this bearer token
+INTERNAL_STATS_TOKEN = os.environ.get("INTERNAL_STATS_TOKEN", "")
+
+# Outbound Telegram messages (bot.message_gateway); disabled = send inline
+TELEGRAM_OUTBOX_ENABLED = os.environ.get("TELEGRAM_OUTBOX_ENABLED", "true").lower() == "true"
+TELEGRAM_GLOBAL_MESSAGES_PER_SECOND = float(os.environ.get("TELEGRAM_GLOBAL_MESSAGES_PER_SECOND", "25"))
+TELEGRAM_CHAT_MESSAGES_PER_SECOND = float(os.environ.get("TELEGRAM_CHAT_MESSAGES_PER_SECOND", "1"))
+TELEGRAM_CHAT_MESSAGE_BURST = int(os.environ.get("TELEGRAM_CHAT_MESSAGE_BURST", "3"))
+TELEGRAM_OUTBOX_MAX_ATTEMPTS = int(os.environ.get("TELEGRAM_OUTBOX_MAX_ATTEMPTS", "5"))
+
+# Outbound HTTP to third-party APIs (TelegramBot.http_transport)
+HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "20"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "30"))
+HTTP_MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", "2"))
+HTTP_BACKOFF_BASE = float(os.environ.get("HTTP_BACKOFF_BASE", "0.5"))
+HTTP_BACKOFF_MAX = float(os.environ.get("HTTP_BACKOFF_MAX", "10"))
+HTTP_CIRCUIT_FAILURES = int(os.environ.get("HTTP_CIRCUIT_FAILURES", "5"))
+HTTP_CIRCUIT_RESET_SECONDS = float(os.environ.get("HTTP_CIRCUIT_RESET_SECONDS", "30"))
+
+# Crypto USD rates (TelegramBot.price_service), refreshed every minute by beat
+PRICE_FRESH_SECONDS = int(os.environ.get("PRICE_FRESH_SECONDS", "120"))
+PRICE_MAX_STALE_SECONDS = int(os.environ.get("PRICE_MAX_STALE_SECONDS", "3600"))
+PRICE_WAIT_SECONDS = int(os.environ.get("PRICE_WAIT_SECONDS", "10"))
+
+# Call recordings (bot.recording_pipeline)
+RECORDING_DOWNLOAD_CONCURRENCY = int(os.environ.get("RECORDING_DOWNLOAD_CONCURRENCY", "4"))
+RECORDING_DOWNLOAD_CHUNK_SIZE = int(os.environ.get("RECORDING_DOWNLOAD_CHUNK_SIZE", str(1024 * 1024)))
+RECORDING_STREAM_CHUNK_SIZE = int(os.environ.get("RECORDING_STREAM_CHUNK_SIZE", str(256 * 1024)))
+RECORDING_TRANSCODE_FORMAT = os.environ.get("RECORDING_TRANSCODE_FORMAT", "mp3")  # mp3, opus or "" to keep WAV
+RECORDING_TRANSCODE_BITRATE = os.environ.get("RECORDING_TRANSCODE_BITRATE", "32k")
+# e.g. "/protected-recordings/" when nginx has an internal location aliased to media/recordings
+RECORDING_ACCEL_REDIRECT_PREFIX = os.environ.get("RECORDING_ACCEL_REDIRECT_PREFIX", "")
+# Local (hot) disk budget; least recently used files beyond it move to the cold tier
+RECORDING_HOT_BUDGET_BYTES = int(os.environ.get("RECORDING_HOT_BUDGET_BYTES", str(5 * 1024 ** 3)))
+# Cold tier (bot.recording_storage): "s3", "filesystem" or "" for none
+RECORDING_COLD_STORAGE = os.environ.get("RECORDING_COLD_STORAGE", "")
+RECORDING_COLD_STORAGE_PATH = os.environ.get("RECORDING_COLD_STORAGE_PATH", os.path.join(BASE_DIR, "cold_recordings"))
+RECORDING_S3_BUCKET = os.environ.get("RECORDING_S3_BUCKET", "")
+RECORDING_S3_PREFIX = os.environ.get("RECORDING_S3_PREFIX", "recordings/")
+RECORDING_S3_ENDPOINT_URL = os.environ.get("RECORDING_S3_ENDPOINT_URL", "")  # e.g. MinIO
+# Delete recording audio older than this many days from both tiers; 0 keeps it forever
+RECORDING_RETENTION_DAYS = int(os.environ.get("RECORDING_RETENTION_DAYS", "0"))
+
+# Supervisor DTMF approval (bot.dtmf_approval): auto-approve after this long
+DTMF_SUPERVISOR_TIMEOUT_SECONDS = int(os.environ.get("DTMF_SUPERVISOR_TIMEOUT_SECONDS", "20"))
 
 
 INSTALLED_APPS = [
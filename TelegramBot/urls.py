@@ -20,13 +20,32 @@ from django.urls import path
 from bot import views as bot_views
 from bot.telegrambot import crypto_transaction_webhook, payment_deposit_webhook
 from bot import webhooks as webhook_views
-from bot.telegram_webhook import telegram_webhook
+from bot.telegram_webhook import (
+    telegram_dispatcher_stats,
+    telegram_outbox_stats,
+    telegram_webhook,
+)
 from django.conf.urls.static import static
 from django.conf import settings
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/telegram/webhook/", telegram_webhook, name="telegram_webhook"),
+    path(
+        "api/telegram/dispatcher/stats",
+        telegram_dispatcher_stats,
+        name="telegram_dispatcher_stats",
+    ),
+    path(
+        "api/telegram/outbox/stats",
+        telegram_outbox_stats,
+        name="telegram_outbox_stats",
+    ),
+    path(
+        "api/prices/stats",
+        bot_views.crypto_price_stats,
+        name="crypto_price_stats",
+    ),
     path("create_flow/", bot_views.create_flow, name="create_flow"),
     path("view_flows/", bot_views.view_flows, name="view_flows"),
     path(
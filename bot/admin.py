@@ -38,8 +38,9 @@ class CallLogsTableAdmin(admin.ModelAdmin):
 
 
 class CallDetailsAdmin(admin.ModelAdmin):
-    list_display = ("call_id", "call_details")
+    list_display = ("call_id", "call_status", "updated_at")
     search_fields = ("call_id",)
+    list_filter = ("call_status",)
 
 
 class TransferCallNumbersAdmin(admin.ModelAdmin):
@@ -0,0 +1,186 @@
+"""
+Batch Recordings — data, caching and export for the batch recordings page
+(bot.views.batch_recordings_page).
+
+  1. batch_rows() is one query: CallRecording annotated with the phone
+     number, duration and keypresses via primary-key subqueries, ordered by
+     (created_at, call_id) so it can be paged with an opaque cursor
+  2. Each batch has a version and a last-modified time in Redis;
+     invalidate_batch_page() bumps them when a recording is added, its
+     download finishes or call_analyzed stores the summary. They become the
+     page's ETag / Last-Modified, so unchanged pages answer 304
+  3. Rendered pages are cached in Redis per (batch, version, cursor, size) —
+     a bumped version simply stops matching the old entries, which expire
+  4. export_rows() streams every row for the CSV / JSON export
+"""
+import base64
+import logging
+import time
+
+from django.db.models import OuterRef, Q, Subquery
+from django.utils.dateparse import parse_datetime
+from redis.exceptions import RedisError
+
+from bot.models import BatchCallLogs, CallDuration, CallRecording
+from bot.recording_utils import format_duration, get_recording_url, mask_phone_number
+from payment.models import DTMF_Inbox
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+PAGE_CACHE_TTL = 3600
+STATE_TTL = 30 * 86400
+SENTIMENT_ICONS = {"Positive": "😊", "Negative": "😞", "Neutral": "😐"}
+EXPORT_FIELDS = (
+    "call_id", "phone", "duration_seconds", "keypresses", "sentiment",
+    "summary", "transcript", "recording_url", "created_at",
+)
+
+
+def _state_key(batch_id):
+    return f"batch_page:{batch_id}"
+
+
+# =============================================================================
+# Query
+# =============================================================================
+
+def batch_rows(batch_id, user_id):
+    """All recordings of a batch with their call details, in page order."""
+    return (
+        CallRecording.objects.filter(batch_id=batch_id, user_id=user_id)
+        .annotate(
+            to_number=Subquery(
+                BatchCallLogs.objects.filter(call_id=OuterRef("call_id")).values("to_number")[:1]
+            ),
+            duration_seconds=Subquery(
+                CallDuration.objects.filter(call_id=OuterRef("call_id")).values("duration_in_seconds")[:1]
+            ),
+            keypresses=Subquery(
+                DTMF_Inbox.objects.filter(call_id=OuterRef("call_id")).values("dtmf_input")[:1]
+            ),
+        )
+        .only("call_id", "token", "transcript_text", "call_summary", "user_sentiment", "created_at")
+        .order_by("created_at", "call_id")
+    )
+
+
+def encode_cursor(rec):
+    raw = f"{rec.created_at.isoformat()}|{rec.call_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(created_at, call_id) from a cursor, or None if it is not valid."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, call_id = raw.split("|", 1)
+        created_at = parse_datetime(created_at)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if created_at is None:
+        return None
+    return created_at, call_id
+
+
+def page(rows, cursor=None, size=PAGE_SIZE):
+    """(records, next cursor or None) for the page after `cursor`."""
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        created_at, call_id = position
+        rows = rows.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, call_id__gt=call_id))
+    records = list(rows[: size + 1])
+    if len(records) > size:
+        return records[:size], encode_cursor(records[size - 1])
+    return records, None
+
+
+def row_context(rec):
+    """Display values for one page row."""
+    lines = rec.transcript_text.split("\n") if rec.transcript_text else []
+    snippet = "\n".join(lines[:4]) + ("\n..." if len(lines) > 4 else "")
+    return {
+        "phone": mask_phone_number(rec.to_number or ""),
+        "duration": format_duration((rec.duration_seconds or 0) * 1000) if rec.duration_seconds is not None else "N/A",
+        "keypresses": rec.keypresses or "-",
+        "recording_url": get_recording_url(rec.token),
+        "transcript_snippet": snippet,
+        "summary": rec.call_summary[:120],
+        "sentiment": rec.user_sentiment,
+        "sentiment_icon": SENTIMENT_ICONS.get(rec.user_sentiment, "📊"),
+    }
+
+
+def export_row(rec):
+    return {
+        "call_id": rec.call_id,
+        "phone": mask_phone_number(rec.to_number or ""),
+        "duration_seconds": rec.duration_seconds,
+        "keypresses": rec.keypresses or "",
+        "sentiment": rec.user_sentiment,
+        "summary": rec.call_summary,
+        "transcript": rec.transcript_text,
+        "recording_url": get_recording_url(rec.token),
+        "created_at": rec.created_at.isoformat(),
+    }
+
+
+def export_rows(batch_id, user_id):
+    for rec in batch_rows(batch_id, user_id).iterator(chunk_size=500):
+        yield export_row(rec)
+
+
+# =============================================================================
+# Versioning & page cache
+# =============================================================================
+
+def _redis():
+    from bot.utils import redis_client
+
+    return redis_client
+
+
+def page_state(batch_id):
+    """(version, last-modified epoch) of a batch page."""
+    key = _state_key(batch_id)
+    pipe = _redis().pipeline()
+    pipe.hsetnx(key, "modified", int(time.time()))
+    pipe.hmget(key, "version", "modified")
+    pipe.expire(key, STATE_TTL)
+    _, (version, modified), _ = pipe.execute()
+    return int(version or 0), int(modified)
+
+
+def invalidate_batch_page(batch_id):
+    """Call whenever a batch's recordings or their details change."""
+    if not batch_id:
+        return
+    key = _state_key(batch_id)
+    try:
+        pipe = _redis().pipeline()
+        pipe.hincrby(key, "version", 1)
+        pipe.hset(key, "modified", int(time.time()))
+        pipe.expire(key, STATE_TTL)
+        pipe.execute()
+    except RedisError as e:
+        logger.warning(f"[batch_recordings] Could not invalidate page for {batch_id}: {e}")
+
+
+def _page_key(batch_id, version, cursor, size):
+    return f"batch_page:{batch_id}:v{version}:{cursor or '-'}:{size}"
+
+
+def cached_page(batch_id, version, cursor, size):
+    try:
+        html = _redis().get(_page_key(batch_id, version, cursor, size))
+    except RedisError:
+        return None
+    return html.decode() if html is not None else None
+
+
+def store_page(batch_id, version, cursor, size, html):
+    try:
+        _redis().set(_page_key(batch_id, version, cursor, size), html, ex=PAGE_CACHE_TTL)
+    except RedisError as e:
+        logger.warning(f"[batch_recordings] Could not cache page for {batch_id}: {e}")
@@ -0,0 +1,132 @@
+"""
+Batch Summary — per-batch running aggregates (BatchSummary rows).
+
+  1. persist_batch_call_logs() adds the batch's calls to total_calls
+  2. Each call_ended moves its BatchCallLogs row to "complete" and, only if
+     that changed the row, adds the call to completed / duration / DTMF in
+     the same transaction — a redelivered event cannot count twice
+  3. Recording rows add to `recordings` when they are created
+  4. Calls of a campaign chunk that gave up move from "pending" to
+     "failed" and add to failed_calls the same way
+  5. claim_consolidated_summary() flips summary_sent once every call is
+     complete or failed, so exactly one caller sends the consolidated summary
+
+The summary row is locked (SELECT ... FOR UPDATE) while it is updated, so
+concurrent call_ended events of one batch serialize on it. Batches created
+before the counters existed get their row built from one scan on first use.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from bot.models import BatchCallLogs, BatchSummary, CallDuration, CallRecording
+from payment.models import DTMF_Inbox
+
+
+def add_batch_calls(batch_id, user_id, count):
+    """Count `count` new calls into a batch's total."""
+    _, created = BatchSummary.objects.get_or_create(
+        batch_id=batch_id, defaults={"user_id": user_id, "total_calls": count}
+    )
+    if not created:
+        BatchSummary.objects.filter(batch_id=batch_id).update(total_calls=F("total_calls") + count)
+
+
+def _backfill(batch_id, user_id):
+    """Aggregates of a batch that predates BatchSummary, from one scan."""
+    calls = BatchCallLogs.objects.filter(batch_id=batch_id)
+    call_ids = calls.values("call_id")
+    completed = calls.filter(call_status="complete")
+    return BatchSummary(
+        batch_id=batch_id,
+        user_id=user_id,
+        total_calls=calls.count(),
+        completed_calls=completed.count(),
+        failed_calls=calls.filter(call_status="failed").count(),
+        total_duration_seconds=CallDuration.objects.filter(call_id__in=call_ids)
+        .aggregate(total=Sum("duration_in_seconds"))["total"] or 0,
+        dtmf_responses=DTMF_Inbox.objects.filter(call_id__in=call_ids)
+        .exclude(dtmf_input__isnull=True).exclude(dtmf_input="").count(),
+        recordings=CallRecording.objects.filter(batch_id=batch_id).count(),
+    )
+
+
+def _locked_summary(batch_id, user_id):
+    """(summary row locked for this transaction, whether it was just built
+    from a scan — and so already includes the current state)."""
+    summary = BatchSummary.objects.select_for_update().filter(batch_id=batch_id).first()
+    if summary is not None:
+        return summary, False
+    try:
+        with transaction.atomic():
+            _backfill(batch_id, user_id).save(force_insert=True)
+    except IntegrityError:
+        pass  # created concurrently
+    return BatchSummary.objects.select_for_update().get(batch_id=batch_id), True
+
+
+def record_call_completed(batch_call, duration_seconds, has_dtmf):
+    """Mark a batch call complete and fold it into the batch's aggregates.
+    Returns the updated BatchSummary."""
+    with transaction.atomic():
+        # Built before this call is marked complete, so it never includes it
+        summary, _ = _locked_summary(batch_call.batch_id, batch_call.user_id)
+        changed = (
+            BatchCallLogs.objects.filter(call_id=batch_call.call_id)
+            .exclude(call_status="complete")
+            .update(call_status="complete")
+        )
+        batch_call.call_status = "complete"
+        if changed:
+            summary.completed_calls += 1
+            summary.total_duration_seconds += duration_seconds or 0
+            if has_dtmf:
+                summary.dtmf_responses += 1
+            summary.save(update_fields=[
+                "completed_calls", "total_duration_seconds", "dtmf_responses", "updated_at",
+            ])
+    return summary
+
+
+def record_calls_failed(batch_id, user_id, call_ids):
+    """Mark never-placed "pending" calls of a batch failed and count them.
+    Returns the updated BatchSummary."""
+    with transaction.atomic():
+        summary, _ = _locked_summary(batch_id, user_id)
+        changed = (
+            BatchCallLogs.objects.filter(call_id__in=call_ids, call_status="pending")
+            .update(call_status="failed")
+        )
+        if changed:
+            summary.failed_calls += changed
+            summary.save(update_fields=["failed_calls", "updated_at"])
+    return summary
+
+
+def record_recording(batch_id, user_id):
+    """Count a newly created CallRecording into its batch."""
+    if not batch_id:
+        return
+    with transaction.atomic():
+        summary, backfilled = _locked_summary(batch_id, user_id)
+        if not backfilled:
+            summary.recordings += 1
+            summary.save(update_fields=["recordings", "updated_at"])
+
+
+def get_batch_summary(batch_id, user_id):
+    summary = BatchSummary.objects.filter(batch_id=batch_id).first()
+    if summary is None:
+        with transaction.atomic():
+            summary, _ = _locked_summary(batch_id, user_id)
+    return summary
+
+
+def claim_consolidated_summary(batch_id):
+    """True for exactly one caller once every call in the batch has ended
+    or failed."""
+    return bool(
+        BatchSummary.objects.filter(
+            batch_id=batch_id, summary_sent=False,
+            total_calls__lte=F("completed_calls") + F("failed_calls"),
+        ).update(summary_sent=True)
+    )
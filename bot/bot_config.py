@@ -3,15 +3,28 @@ import os, telebot
 from django.core.wsgi import get_wsgi_application
 from telebot.types import BotCommand, BotCommandScopeDefault
 
+from bot.state_store import UserStateMiddleware, build_user_data_store
+
 API_TOKEN = os.getenv("API_TOKEN") or "000000000:AAFakeTokenForLocalDev"
-bot = telebot.TeleBot(API_TOKEN, parse_mode="MARKDOWN")
+# threaded=False: handlers run on the update dispatcher's shard threads
+# (bot.update_dispatcher), which keep each chat's updates in order
+bot = telebot.TeleBot(
+    API_TOKEN, parse_mode="MARKDOWN", threaded=False, use_class_middlewares=True
+)
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "TelegramBot.settings")
 application = get_wsgi_application()
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 global_language_variable = "English"
-user_data = {}
+
+from django.conf import settings  # after get_wsgi_application()
+
+# Conversation state shared by all bot processes (see bot.state_store)
+user_data = build_user_data_store(
+    settings.USER_STATE_BACKEND, settings.USER_STATE_TTL, settings.REDIS_URL
+)
+bot.setup_middleware(UserStateMiddleware(user_data))
 
 
 def clear_bot_commands(bot):
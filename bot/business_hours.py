@@ -0,0 +1,179 @@
+"""
+Business Hours — precomputed open/closed schedules for the mid-call
+get_current_time function (bot.webhooks.time_check_endpoint).
+
+  1. A number's hours (start/end, open weekdays, holidays, timezone — read
+     from bot.phone_index, so no database access) are expanded into UTC
+     open/close transition times from yesterday to HORIZON_DAYS ahead and
+     merged into one sorted list
+  2. status() is a bisect on that list plus one local-time conversion;
+     timezone objects are built once per name
+  3. A schedule is rebuilt when the number's entry changes (the phone index
+     reloads on every UserPhoneNumber save) and once a day
+
+A window that ends at or before its start runs past midnight. A holiday
+closes the window that opens on that date.
+"""
+import datetime
+import re
+import time
+from bisect import bisect_right
+from functools import cache
+from typing import NamedTuple
+
+import pytz
+
+from bot import phone_index
+
+DEFAULT_TIMEZONE = "US/Eastern"
+DAY_NAMES = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+ALL_DAYS = "0123456"
+HORIZON_DAYS = 7
+REBUILD_SECONDS = 86400
+
+
+class Schedule(NamedTuple):
+    entry: phone_index.PhoneEntry
+    tz: datetime.tzinfo
+    edges: list  # UTC epoch seconds: open, close, open, close, ...
+    valid_from: float
+    valid_until: float
+    hours: str
+    days: str
+
+
+class BusinessHoursStatus(NamedTuple):
+    is_open: bool
+    local_time: datetime.datetime
+    timezone: str
+    hours: str
+    days: str
+    next_change: datetime.datetime | None
+
+
+@cache
+def get_timezone(name):
+    return pytz.timezone(name or DEFAULT_TIMEZONE)
+
+
+# =============================================================================
+# Weekdays & holidays — parsing and display
+# =============================================================================
+
+def describe_days(days):
+    """"01234" -> "Mon-Fri", "0246" -> "Mon, Wed, Fri, Sun"."""
+    if days == ALL_DAYS:
+        return "every day"
+    if not days:
+        return "no days"
+    runs = []
+    for day in sorted(int(d) for d in set(days)):
+        if runs and runs[-1][1] == day - 1:
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    parts = []
+    for first, last in runs:
+        if last - first > 1:
+            parts.append(f"{DAY_NAMES[first]}-{DAY_NAMES[last]}")
+        else:
+            parts.extend(DAY_NAMES[first:last + 1])
+    return ", ".join(parts)
+
+
+def parse_days(text):
+    """"Mon-Fri", "Mon,Wed,Fri", "Sat-Sun", "daily" -> weekday digits. Raises ValueError."""
+    text = text.strip().lower()
+    if text in ("daily", "every day", "all"):
+        return ALL_DAYS
+    names = [name.lower() for name in DAY_NAMES]
+    days = set()
+    for part in re.split(r"[,\s]+", text):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        if first[:3] not in names or (last and last[:3] not in names):
+            raise ValueError(f"Unknown day: {part}")
+        start = names.index(first[:3])
+        end = names.index(last[:3]) if last else start
+        span = (end - start) % 7
+        days.update((start + i) % 7 for i in range(span + 1))
+    if not days:
+        raise ValueError("No days given")
+    return "".join(str(d) for d in sorted(days))
+
+
+def parse_holidays(text):
+    """"2026-12-25, 2027-01-01" -> sorted ISO dates; "none" -> []. Raises ValueError."""
+    text = text.strip().lower()
+    if text in ("none", "clear", "-"):
+        return []
+    dates = {datetime.date.fromisoformat(part).isoformat() for part in re.split(r"[,\s]+", text) if part}
+    return sorted(dates)
+
+
+# =============================================================================
+# Schedule
+# =============================================================================
+
+def build_schedule(entry, now):
+    """Schedule of a PhoneEntry from yesterday to HORIZON_DAYS after `now` (epoch)."""
+    tz = get_timezone(entry.business_hours_timezone)
+    start, end = entry.business_hours_start, entry.business_hours_end
+    open_days = entry.business_days if entry.business_days is not None else ALL_DAYS
+    holidays = set(entry.business_holidays or ())
+    first_day = datetime.datetime.fromtimestamp(now, tz).date() - datetime.timedelta(days=1)
+
+    edges = []
+    for offset in range(HORIZON_DAYS + 2):
+        day = first_day + datetime.timedelta(days=offset)
+        if str(day.weekday()) not in open_days or day.isoformat() in holidays:
+            continue
+        close_day = day if end > start else day + datetime.timedelta(days=1)
+        opens = tz.localize(datetime.datetime.combine(day, start)).timestamp()
+        closes = tz.localize(datetime.datetime.combine(close_day, end)).timestamp()
+        if edges and opens <= edges[-1]:
+            edges[-1] = max(edges[-1], closes)
+        else:
+            edges += [opens, closes]
+
+    return Schedule(
+        entry=entry,
+        tz=tz,
+        edges=edges,
+        valid_from=now,
+        valid_until=now + REBUILD_SECONDS,
+        hours=f"{start.strftime('%H:%M')}-{end.strftime('%H:%M')}",
+        days=describe_days(open_days),
+    )
+
+
+# phone number -> Schedule (this process)
+_schedules = {}
+
+
+def status(number, now=None):
+    """BusinessHoursStatus of a purchased number, or None when it has no
+    business hours configured."""
+    entry = phone_index.lookup(number)
+    if (
+        entry is None or not entry.business_hours_enabled
+        or entry.business_hours_start is None or entry.business_hours_end is None
+    ):
+        return None
+
+    now = time.time() if now is None else now
+    schedule = _schedules.get(entry.phone_number)
+    if schedule is None or not schedule.valid_from <= now < schedule.valid_until or schedule.entry != entry:
+        schedule = _schedules[entry.phone_number] = build_schedule(entry, now)
+
+    edges = schedule.edges
+    i = bisect_right(edges, now)
+    return BusinessHoursStatus(
+        is_open=i % 2 == 1,
+        local_time=datetime.datetime.fromtimestamp(now, schedule.tz),
+        timezone=str(schedule.tz),
+        hours=schedule.hours,
+        days=schedule.days,
+        next_change=datetime.datetime.fromtimestamp(edges[i], schedule.tz) if i < len(edges) else None,
+    )
@@ -0,0 +1,67 @@
+"""
+Call Context — the rows stored about one call, loaded once per Retell event.
+
+dispatch_retell_event() builds one CallContext per event and passes it to
+every handler. Each row is fetched on first use by its primary key and
+memoised, so a handler chain never reads the same table twice:
+
+  call_log        CallLogsTable
+  batch_call      BatchCallLogs
+  free_plan_call  ManageFreePlanSingleIVRCall
+  recording       CallRecording
+  subscription    UserSubscription of the call's user, with its plan
+  phone_number    the PhoneEntry of to_number, if it is an active purchased
+                  number (bot.phone_index — no query)
+  transcript      the TranscriptAnalysis of the event's transcript_object,
+                  analysed once and cached for later readers
+                  (bot.transcript_analysis — no query)
+
+A handler that creates one of these rows assigns it back (ctx.call_log = ...)
+so later handlers see it. Writes still go straight to the database.
+"""
+from functools import cached_property
+
+from bot import phone_index, transcript_analysis
+from bot.models import BatchCallLogs, CallLogsTable, CallRecording
+from payment.models import ManageFreePlanSingleIVRCall, UserSubscription
+
+
+class CallContext:
+    def __init__(self, call_data):
+        self.call_id = call_data.get("call_id", "")
+        self.to_number = call_data.get("to_number", "")
+        self.transcript_object = call_data.get("transcript_object", [])
+
+    @cached_property
+    def call_log(self):
+        return CallLogsTable.objects.filter(call_id=self.call_id).first()
+
+    @cached_property
+    def batch_call(self):
+        return BatchCallLogs.objects.filter(call_id=self.call_id).first()
+
+    @cached_property
+    def free_plan_call(self):
+        return ManageFreePlanSingleIVRCall.objects.filter(call_id=self.call_id).first()
+
+    @cached_property
+    def recording(self):
+        return CallRecording.objects.filter(call_id=self.call_id).first()
+
+    @property
+    def user_id(self):
+        return self.call_log.user_id if self.call_log else None
+
+    @cached_property
+    def subscription(self):
+        if self.user_id is None:
+            return None
+        return UserSubscription.objects.select_related("plan_id").filter(user_id=self.user_id).first()
+
+    @cached_property
+    def phone_number(self):
+        return phone_index.lookup(self.to_number)
+
+    @cached_property
+    def transcript(self):
+        return transcript_analysis.analyze_call(self.call_id, self.transcript_object)
@@ -0,0 +1,67 @@
+"""
+Call Details Store — Retell call objects kept in CallDetails, so reading a
+call does not need a call.retrieve() round-trip.
+
+  1. dispatch_retell_event() saves the payload of every applied
+     call_started / call_ended / call_analyzed (bot.call_state orders them,
+     so the stored copy only moves forward)
+  2. load() serves a stored call once it is final: ended with its
+     call_analysis (nothing changes after call_analyzed), or errored
+  3. Anything else — no row, a call still in progress, an ended call whose
+     analysis has not arrived yet, or refresh=True — is fetched from Retell
+     and stored for the next reader
+
+Payloads are stored as zlib-compressed JSON without transcript_with_tool_calls
+(a second copy of transcript_object).
+"""
+import json
+import logging
+import zlib
+
+from bot.models import CallDetails
+from bot.retell_service import get_retell_client
+
+logger = logging.getLogger(__name__)
+
+DROPPED_KEYS = ("transcript_with_tool_calls",)
+
+
+def save(call):
+    """Store a Retell call object (webhook payload or retrieved call)."""
+    call_id = call.get("call_id")
+    if not call_id:
+        return
+    payload = {key: value for key, value in call.items() if key not in DROPPED_KEYS}
+    CallDetails(
+        call_id=call_id,
+        call_details=zlib.compress(json.dumps(payload, separators=(",", ":")).encode()),
+        call_status=call.get("call_status") or "",
+    ).save()
+
+
+def stored(call_id):
+    """The stored call object, or None."""
+    row = CallDetails.objects.filter(call_id=call_id).first()
+    if row is None:
+        return None
+    return json.loads(zlib.decompress(bytes(row.call_details)))
+
+
+def is_final(call):
+    """True once nothing more will be added to the call object."""
+    status = call.get("call_status")
+    return status == "error" or (status == "ended" and bool(call.get("call_analysis")))
+
+
+def load(call_id, refresh=False):
+    """The call object of call_id, from the store when it is final,
+    otherwise from Retell (and stored). Raises on a Retell error."""
+    if not refresh:
+        call = stored(call_id)
+        if call is not None and is_final(call):
+            return call
+
+    call = get_retell_client().call.retrieve(call_id).to_dict()
+    save(call)
+    logger.info(f"[call_details] Fetched {call_id} from Retell ({call.get('call_status')})")
+    return call
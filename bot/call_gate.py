@@ -11,11 +11,11 @@ Usage:
     # proceed with call...
 """
 import logging
-import re
 from decimal import Decimal
+from typing import NamedTuple
 
 from django.conf import settings
-from payment.models import UserSubscription, SubscriptionPlans
+
 from user.models import TelegramUser
 
 logger = logging.getLogger(__name__)
@@ -91,31 +91,128 @@ US_CA_OVERAGE_RATE = Decimal("0.35")
 # Minimum minutes to pre-check (2 min buffer)
 MIN_MINUTES_BUFFER = 2
 
+# Characters stripped from numbers before prefix matching
+_STRIP_TABLE = str.maketrans("", "", " \t\n\r\f\v-()")
+
+
+def load_international_rates(file_path):
+    """
+    Read a pipe-delimited ITU prefix table: `+44|UK|0.45` per line.
+    Returns {prefix: (region_name, rate_per_minute)}; blank/# lines are skipped.
+    """
+    rates = {}
+    with open(file_path, "r", encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            prefix, region, rate = line.split("|")[:3]
+            rates[prefix.strip()] = (region.strip(), Decimal(rate.strip()))
+    return rates
+
+
+def build_prefix_index(rates):
+    """
+    Compile a rate table into a longest-prefix index.
+    Returns (index, lengths): index maps prefix -> (region, rate, is_domestic),
+    lengths lists the distinct prefix lengths, longest first.
+    """
+    index = {
+        prefix: (region, rate, rate == Decimal("0.00"))
+        for prefix, (region, rate) in rates.items()
+    }
+    lengths = sorted({len(prefix) for prefix in index}, reverse=True)
+    return index, lengths
+
+
+def _load_rate_table():
+    """Built-in rates overlaid with the full ITU table from INTERNATIONAL_RATES_FILE."""
+    rates = dict(INTERNATIONAL_RATES)
+    file_path = getattr(settings, "INTERNATIONAL_RATES_FILE", "")
+    if file_path:
+        try:
+            rates.update(load_international_rates(file_path))
+        except FileNotFoundError:
+            logger.warning(f"International rates file not found: {file_path} — using built-in table")
+        except (ValueError, ArithmeticError) as e:
+            logger.error(f"Invalid international rates file {file_path}: {e} — using built-in table")
+            rates = dict(INTERNATIONAL_RATES)
+    return rates
+
+
+# Compiled once at import — classify_destination does at most one dict
+# lookup per distinct prefix length instead of scanning every prefix.
+_PREFIX_INDEX, _PREFIX_LENGTHS = build_prefix_index(_load_rate_table())
+
+_DOMESTIC_RESULT = ("US/Canada", Decimal("0.00"), True)
+_INTERNATIONAL_RESULT = ("International", DEFAULT_INTERNATIONAL_RATE, False)
+
 
 def classify_destination(phone_number):
     """
     Classify a phone number by region. Returns (region_name, rate_per_minute, is_domestic).
     Domestic = US/Canada (+1).
     """
-    cleaned = re.sub(r"[\s\-\(\)]", "", str(phone_number))
+    cleaned = str(phone_number).translate(_STRIP_TABLE)
     if not cleaned.startswith("+"):
         # Assume US/Canada if no country code
-        return "US/Canada", Decimal("0.00"), True
+        return _DOMESTIC_RESULT
 
     # Match longest prefix first (e.g., +966 before +9)
-    best_match = None
-    best_len = 0
-    for prefix, (region, rate) in INTERNATIONAL_RATES.items():
-        if cleaned.startswith(prefix) and len(prefix) > best_len:
-            best_match = (region, rate)
-            best_len = len(prefix)
+    for length in _PREFIX_LENGTHS:
+        match = _PREFIX_INDEX.get(cleaned[:length])
+        if match:
+            return match
+
+    return _INTERNATIONAL_RESULT
 
-    if best_match:
-        region, rate = best_match
-        is_domestic = (rate == Decimal("0.00"))
-        return region, rate, is_domestic
 
-    return "International", DEFAULT_INTERNATIONAL_RATE, False
+# Columns needed by the gate, fetched in one LEFT JOIN across
+# TelegramUser -> UserSubscription -> SubscriptionPlans
+_PROFILE_FIELDS = (
+    "wallet_balance",
+    "subscription_user_id__subscription_status",
+    "subscription_user_id__single_ivr_left",
+    "subscription_user_id__bulk_ivr_calls_left",
+    "subscription_user_id__plan_id",
+    "subscription_user_id__plan_id__plan_price",
+)
+
+
+class BillingProfile(NamedTuple):
+    wallet_balance: Decimal
+    has_active_sub: bool
+    has_plan: bool
+    plan_price: Decimal | None
+    single_ivr_left: float
+    bulk_ivr_calls_left: float
+
+    @property
+    def is_free_plan(self):
+        return self.has_active_sub and self.has_plan and self.plan_price == 0
+
+    @property
+    def is_paid_plan(self):
+        return self.has_active_sub and self.has_plan and (self.plan_price or 0) > 0
+
+
+def load_billing_profile(user_id):
+    """
+    Load wallet + subscription + plan for a user with a single joined query.
+    Returns a BillingProfile, or None if the user does not exist.
+    """
+    row = TelegramUser.objects.filter(user_id=user_id).values(*_PROFILE_FIELDS).first()
+    if row is None:
+        return None
+
+    return BillingProfile(
+        wallet_balance=row["wallet_balance"] or Decimal("0.00"),
+        has_active_sub=row["subscription_user_id__subscription_status"] == "active",
+        has_plan=row["subscription_user_id__plan_id"] is not None,
+        plan_price=row["subscription_user_id__plan_id__plan_price"],
+        single_ivr_left=float(row["subscription_user_id__single_ivr_left"] or 0),
+        bulk_ivr_calls_left=float(row["subscription_user_id__bulk_ivr_calls_left"] or 0),
+    )
 
 
 def pre_call_check(user_id, phone_number, call_type="single", num_calls=1):
@@ -132,30 +229,20 @@ def pre_call_check(user_id, phone_number, call_type="single", num_calls=1):
     """
     region, rate, is_domestic = classify_destination(phone_number)
 
-    try:
-        user = TelegramUser.objects.get(user_id=user_id)
-    except TelegramUser.DoesNotExist:
+    profile = load_billing_profile(user_id)
+    if profile is None:
         return _blocked(region, rate, is_domestic, "User not found. Please /start first.")
 
-    wallet_balance = user.wallet_balance or Decimal("0.00")
-
-    # Get subscription
-    try:
-        subscription = UserSubscription.objects.get(user_id=user_id)
-        has_active_sub = subscription.subscription_status == "active"
-    except UserSubscription.DoesNotExist:
-        subscription = None
-        has_active_sub = False
+    wallet_balance = profile.wallet_balance
 
     # ── FREE PLAN ──
-    if has_active_sub and subscription.plan_id and subscription.plan_id.plan_price == 0:
+    if profile.is_free_plan:
         if not is_domestic:
             return _blocked(region, rate, is_domestic,
                 "International calls are not available on the Free Trial. "
                 "Please upgrade to a paid plan.")
 
-        single_left = float(subscription.single_ivr_left or 0)
-        if single_left < 1:
+        if profile.single_ivr_left < 1:
             return _blocked(region, rate, is_domestic,
                 "Free Trial minutes exhausted. Please upgrade to continue calling.")
 
@@ -174,18 +261,13 @@ def pre_call_check(user_id, phone_number, call_type="single", num_calls=1):
         return _allowed(region, rate, False, "wallet")
 
     # ── DOMESTIC (US/Canada) WITH ACTIVE SUBSCRIPTION ──
-    if has_active_sub and subscription.plan_id:
+    if profile.has_active_sub and profile.has_plan:
         if call_type == "single":
-            single_left = float(subscription.single_ivr_left or 0)
-            if single_left >= MIN_MINUTES_BUFFER:
+            if profile.single_ivr_left >= MIN_MINUTES_BUFFER:
                 return _allowed(region, Decimal("0.00"), True, "plan")
             # Single IVR exhausted — fall through to wallet/overage check
-
-        elif call_type == "bulk":
-            bulk_left = float(subscription.bulk_ivr_calls_left or 0)
-            if bulk_left >= MIN_MINUTES_BUFFER * num_calls:
-                return _allowed(region, Decimal("0.00"), True, "plan")
-            # Bulk exhausted — fall through to wallet/overage check
+        elif call_type == "bulk" and profile.bulk_ivr_calls_left >= MIN_MINUTES_BUFFER * num_calls:
+            return _allowed(region, Decimal("0.00"), True, "plan")
 
         # Plan minutes exhausted — check wallet for overage
         required = US_CA_OVERAGE_RATE * MIN_MINUTES_BUFFER * num_calls
@@ -210,69 +292,121 @@ def pre_call_check(user_id, phone_number, call_type="single", num_calls=1):
         f"Please top up your wallet or subscribe to a plan.")
 
 
-def pre_call_check_bulk(user_id, phone_numbers, call_type="bulk"):
+def _entry_number(entry):
+    if isinstance(entry, dict):
+        return entry.get("phone_number", entry.get("to_number", ""))
+    return str(entry)
+
+
+def bulk_gate(user_id, phone_numbers, call_type="bulk"):
     """
-    Pre-call gate for bulk/batch calls. Checks all numbers.
-    Groups by domestic vs international and validates total cost.
+    Vectorised pre-call gate for a whole campaign. One DB round-trip
+    regardless of list size. Returns dict:
+        {
+            "allowed": True/False,
+            "message": "OK" | reason if blocked,
+            "regions": [region per number],
+            "rates": [Decimal per minute per number],
+            "billing_sources": ["plan" | "wallet" per number],
+            "domestic_count": int,
+            "intl_count": int,
+            "intl_cost_estimate": Decimal,
+            "total_wallet_needed": Decimal,
+            "cost_by_region": {region: {"count", "rate", "estimate"}},
+        }
+    Estimates use the MIN_MINUTES_BUFFER minutes per call.
     """
-    domestic_count = 0
-    intl_cost = Decimal("0.00")
-    intl_numbers = []
+    classified = [classify_destination(_entry_number(entry)) for entry in phone_numbers]
+    domestic_count = sum(1 for _, _, is_domestic in classified if is_domestic)
+    intl_count = len(classified) - domestic_count
 
-    for entry in phone_numbers:
-        phone = entry.get("phone_number", entry.get("to_number", "")) if isinstance(entry, dict) else str(entry)
-        region, rate, is_domestic = classify_destination(phone)
+    profile = load_billing_profile(user_id)
+    if profile is None:
+        return {
+            "allowed": False,
+            "message": "User not found.",
+            "regions": [region for region, _, _ in classified],
+            "rates": [rate for _, rate, _ in classified],
+            "billing_sources": ["blocked"] * len(classified),
+            "domestic_count": 0,
+            "intl_count": 0,
+            "intl_cost_estimate": Decimal("0.00"),
+            "total_wallet_needed": Decimal("0.00"),
+            "cost_by_region": {},
+        }
+
+    # Domestic calls ride on the paid plan's bulk minutes when all of them fit,
+    # otherwise every domestic call is billed at the overage rate
+    domestic_on_plan = (
+        domestic_count > 0
+        and profile.is_paid_plan
+        and profile.bulk_ivr_calls_left >= MIN_MINUTES_BUFFER * domestic_count
+    )
+    domestic_rate = Decimal("0.00") if domestic_on_plan else US_CA_OVERAGE_RATE
+    domestic_source = "plan" if domestic_on_plan else "wallet"
+
+    regions = []
+    rates = []
+    billing_sources = []
+    cost_by_region = {}
+    intl_cost = Decimal("0.00")
+    for region, rate, is_domestic in classified:
         if is_domestic:
-            domestic_count += 1
+            rate = domestic_rate
+            billing_sources.append(domestic_source)
         else:
             intl_cost += rate * MIN_MINUTES_BUFFER
-            intl_numbers.append((phone, region, rate))
-
-    try:
-        user = TelegramUser.objects.get(user_id=user_id)
-    except TelegramUser.DoesNotExist:
-        return {"allowed": False, "message": "User not found.", "domestic_count": 0, "intl_count": 0}
-
-    wallet_balance = user.wallet_balance or Decimal("0.00")
-
-    # Check domestic bulk minutes
-    try:
-        subscription = UserSubscription.objects.get(user_id=user_id)
-        has_active_sub = subscription.subscription_status == "active"
-    except UserSubscription.DoesNotExist:
-        subscription = None
-        has_active_sub = False
-
-    domestic_wallet_needed = Decimal("0.00")
-
-    if domestic_count > 0:
-        if has_active_sub and subscription.plan_id and subscription.plan_id.plan_price > 0:
-            bulk_left = float(subscription.bulk_ivr_calls_left or 0)
-            if bulk_left < MIN_MINUTES_BUFFER * domestic_count:
-                domestic_wallet_needed = US_CA_OVERAGE_RATE * MIN_MINUTES_BUFFER * domestic_count
-        else:
-            domestic_wallet_needed = US_CA_OVERAGE_RATE * MIN_MINUTES_BUFFER * domestic_count
+            billing_sources.append("wallet")
+        regions.append(region)
+        rates.append(rate)
 
+        bucket = cost_by_region.get(region)
+        if bucket is None:
+            bucket = cost_by_region[region] = {"count": 0, "rate": rate, "estimate": Decimal("0.00")}
+        bucket["count"] += 1
+        bucket["estimate"] += rate * MIN_MINUTES_BUFFER
+
+    domestic_wallet_needed = domestic_rate * MIN_MINUTES_BUFFER * domestic_count
     total_wallet_needed = intl_cost + domestic_wallet_needed
-    if total_wallet_needed > 0 and wallet_balance < total_wallet_needed:
-        return {
-            "allowed": False,
-            "message": (
-                f"Insufficient wallet balance for batch call.\n"
-                f"Domestic calls: {domestic_count} | International: {len(intl_numbers)}\n"
-                f"Required: ${total_wallet_needed:.2f} | Balance: ${wallet_balance:.2f}\n"
-                f"Please top up your wallet."
-            ),
-            "domestic_count": domestic_count,
-            "intl_count": len(intl_numbers),
-        }
+
+    allowed = not (total_wallet_needed > 0 and profile.wallet_balance < total_wallet_needed)
+    if allowed:
+        message = "OK"
+    else:
+        message = (
+            f"Insufficient wallet balance for batch call.\n"
+            f"Domestic calls: {domestic_count} | International: {intl_count}\n"
+            f"Required: ${total_wallet_needed:.2f} | Balance: ${profile.wallet_balance:.2f}\n"
+            f"Please top up your wallet."
+        )
 
     return {
-        "allowed": True,
-        "message": "OK",
+        "allowed": allowed,
+        "message": message,
+        "regions": regions,
+        "rates": rates,
+        "billing_sources": billing_sources,
         "domestic_count": domestic_count,
-        "intl_count": len(intl_numbers),
+        "intl_count": intl_count,
         "intl_cost_estimate": intl_cost,
+        "total_wallet_needed": total_wallet_needed,
+        "cost_by_region": cost_by_region,
+    }
+
+
+def pre_call_check_bulk(user_id, phone_numbers, call_type="bulk"):
+    """
+    Pre-call gate for bulk/batch calls. Checks all numbers.
+    Groups by domestic vs international and validates total cost.
+    Thin wrapper over bulk_gate that keeps the summary keys only.
+    """
+    gate = bulk_gate(user_id, phone_numbers, call_type=call_type)
+    return {
+        "allowed": gate["allowed"],
+        "message": gate["message"],
+        "domestic_count": gate["domestic_count"],
+        "intl_count": gate["intl_count"],
+        "intl_cost_estimate": gate["intl_cost_estimate"],
     }
 
 
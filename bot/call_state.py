@@ -0,0 +1,149 @@
+"""
+Call State — per-call lifecycle state shared by every webhook worker.
+
+Retell's call_started / transcript_updated / call_ended / call_analyzed can
+arrive late, twice, or concurrently on different processes. One Redis hash
+per call (`call_state:<call_id>`) records what has been applied:
+
+  started, ended, analyzed   1 once that event has been applied
+  seq                        bumped on every change (monotonic version)
+  cursor                     transcript entries already streamed to the user
+  pending_analysis           a call_analyzed payload that arrived before
+                             call_ended, applied right after it and kept
+                             until it has been applied successfully
+
+Every change is an optimistic compare-and-set (WATCH / MULTI): read, decide,
+write only if nobody changed the hash meanwhile, else re-read and decide
+again. The decisions are deterministic:
+
+  call_started     applied once, dropped after call_started or call_ended
+  call_ended       applied once
+  call_analyzed    applied once; before call_ended it is parked and replayed
+  transcript       only entries past the shared cursor are streamed, and
+                   nothing after call_ended
+
+If Redis is unavailable lifecycle events are all applied, as before this
+existed, and live DTMF streaming pauses rather than repeating itself.
+"""
+import json
+import logging
+
+from redis.exceptions import RedisError, WatchError
+
+logger = logging.getLogger(__name__)
+
+STATE_TTL = 2 * 86400
+APPLY, DROP, DEFER = "apply", "drop", "defer"
+FLAGS = {"call_started": "started", "call_ended": "ended", "call_analyzed": "analyzed"}
+
+
+def _key(call_id):
+    return f"call_state:{call_id}"
+
+
+def _redis():
+    from bot.utils import redis_client
+
+    return redis_client
+
+
+def _compare_and_set(call_id, decide):
+    """
+    Run decide(state) -> (result, changes) against the current hash and
+    write `changes` (a dict, None for no write; a None value deletes the
+    field) only if the hash is unchanged since it was read.
+    """
+    key = _key(call_id)
+    with _redis().pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(key)
+                state = {k.decode(): v.decode() for k, v in pipe.hgetall(key).items()}
+                result, changes = decide(state)
+                if not changes:
+                    pipe.unwatch()
+                    return result
+                pipe.multi()
+                deleted = [field for field, value in changes.items() if value is None]
+                updates = {field: value for field, value in changes.items() if value is not None}
+                updates["seq"] = int(state.get("seq", 0)) + 1
+                pipe.hset(key, mapping=updates)
+                if deleted:
+                    pipe.hdel(key, *deleted)
+                pipe.expire(key, STATE_TTL)
+                pipe.execute()
+                return result
+            except WatchError:
+                continue
+
+
+def begin(event, call_data):
+    """APPLY, DROP or DEFER for a lifecycle event (not transcript_updated).
+    APPLY marks it applied; undo it with rollback() if the handler fails."""
+    call_id = call_data.get("call_id", "")
+    flag = FLAGS[event]
+
+    def decide(state):
+        if state.get(flag) == "1":
+            return DROP, None
+        if event == "call_started" and state.get("ended") == "1":
+            return DROP, None
+        if event == "call_analyzed" and state.get("ended") != "1":
+            return DEFER, {"pending_analysis": json.dumps(call_data)}
+        return APPLY, {flag: 1}
+
+    try:
+        return _compare_and_set(call_id, decide)
+    except RedisError as e:
+        logger.warning(f"[call_state] Unavailable for {call_id}, applying {event}: {e}")
+        return APPLY
+
+
+def rollback(event, call_id):
+    """Forget that `event` was applied, so its retry is not dropped."""
+    try:
+        _compare_and_set(call_id, lambda state: (None, {FLAGS[event]: None}))
+    except RedisError as e:
+        logger.warning(f"[call_state] Could not roll back {event} for {call_id}: {e}")
+
+
+def pending_analysis(call_id):
+    """The parked call_analyzed payload, or None. It stays parked — claim it
+    with begin("call_analyzed", ...) and drop it with clear_pending_analysis()
+    once it has been applied, so a failed apply can be retried."""
+    try:
+        pending = _redis().hget(_key(call_id), "pending_analysis")
+    except RedisError as e:
+        logger.warning(f"[call_state] Could not read parked analysis for {call_id}: {e}")
+        return None
+    return json.loads(pending) if pending is not None else None
+
+
+def clear_pending_analysis(call_id):
+    def decide(state):
+        if "pending_analysis" not in state:
+            return None, None
+        return None, {"pending_analysis": None}
+
+    try:
+        _compare_and_set(call_id, decide)
+    except RedisError as e:
+        logger.warning(f"[call_state] Could not clear parked analysis for {call_id}: {e}")
+
+
+def advance_transcript(call_id, length):
+    """
+    Claim transcript entries [cursor, length) for streaming. Returns the old
+    cursor, or None if there is nothing new (or the call already ended).
+    """
+    def decide(state):
+        cursor = int(state.get("cursor", 0))
+        if state.get("ended") == "1" or length <= cursor:
+            return None, None
+        return cursor, {"cursor": length}
+
+    try:
+        return _compare_and_set(call_id, decide)
+    except RedisError as e:
+        logger.warning(f"[call_state] Cursor unavailable for {call_id}: {e}")
+        return None
@@ -0,0 +1,310 @@
+"""
+Campaign Dispatcher — chunked, rate-limited Retell batch calls for bulk IVR.
+
+  1. plan_campaign (request thread) splits the recipients into CampaignChunk
+     rows and writes every BatchCallLogs/CallLogsTable row up front as
+     "pending" under the campaign-wide batch id
+  2. bot.tasks.dispatch_campaign runs CampaignDispatcher, which sends one
+     Retell batch call per chunk, paced by a calls-per-second token bucket
+     and a cap on calls in flight
+  3. Chunk state is committed around every Retell request, so a crashed or
+     throttled run resumes from the first unsent chunk
+  4. Calls count as in flight from the moment their chunk is sent until
+     call_ended, or until RETELL_IN_FLIGHT_TIMEOUT_SECONDS have passed — a
+     call whose call_ended never arrives cannot hold the campaign throttled
+  5. Progress is written to CampaignLogs.dispatched_calls / dispatch_status
+
+The Retell client is injectable — see FakeRetellClient in bot/tests.py.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from retell import APIError
+
+from bot.batch_summary import (
+    claim_consolidated_summary,
+    get_batch_summary,
+    record_calls_failed,
+)
+from bot.models import (
+    BatchCallLogs,
+    CallLogsTable,
+    CampaignChunk,
+    CampaignDispatch,
+    CampaignLogs,
+    CampaignRecipient,
+)
+from bot.rate_limit import TokenBucket
+from bot.retell_service import get_retell_client
+from bot.views import build_batch_task, persist_batch_call_logs, placeholder_call_id
+
+logger = logging.getLogger(__name__)
+
+# CampaignLogs.dispatch_status values / CampaignDispatcher.run() results
+PENDING = "pending"
+DISPATCHING = "dispatching"
+THROTTLED = "throttled"
+RETRYING = "retrying"
+DISPATCHED = "dispatched"
+FAILED = "failed"
+
+# A single run hands the worker back after this long; the task re-enqueues itself
+MAX_RUN_SECONDS = 240
+
+# Batch log statuses that count against the in-flight cap
+IN_FLIGHT_STATUSES = ("queued", "started")
+
+
+# =============================================================================
+# Planning
+# =============================================================================
+
+def _recipient_numbers(campaign, call_data):
+    """Campaign numbers in dispatch order. Legacy call_data lists (scheduled
+    before CampaignRecipient existed) are copied into the table first."""
+    numbers = list(
+        CampaignRecipient.objects.filter(campaign=campaign)
+        .order_by("id")
+        .values_list("phone_number", flat=True)
+    )
+    if numbers:
+        return numbers
+
+    seen = set()
+    for entry in call_data or []:
+        phone = entry.get("phone_number", entry.get("to_number", "")) if isinstance(entry, dict) else str(entry)
+        if phone and phone not in seen:
+            seen.add(phone)
+            numbers.append(phone)
+    CampaignRecipient.objects.bulk_create(
+        [CampaignRecipient(campaign=campaign, phone_number=phone) for phone in numbers],
+        batch_size=1000,
+    )
+    return numbers
+
+
+def plan_campaign(campaign, call_data, user_id, caller_id, task=None, pathway_id=None,
+                  recording_requested=False, chunk_size=None):
+    """
+    Split a campaign into chunks and persist its call logs as "pending".
+    Returns the number of chunks.
+
+    A campaign is planned once. Planning it again while it is still being
+    dispatched (a retried request) returns its existing chunks; planning a
+    campaign that has finished dispatching raises ValueError — its call logs
+    are keyed by the campaign, so calling the recipients again needs a new
+    campaign.
+    """
+    existing = CampaignChunk.objects.filter(campaign=campaign).count()
+    if existing:
+        if campaign.dispatch_status in (DISPATCHED, FAILED):
+            raise ValueError(
+                f"Campaign {campaign.campaign_id} was already dispatched ({campaign.dispatch_status}); "
+                f"start a new campaign to call its recipients again"
+            )
+        logger.info(f"[campaign_dispatch] {campaign.campaign_id} already planned — resuming its dispatch")
+        return existing
+
+    chunk_size = chunk_size or settings.RETELL_DISPATCH_CHUNK_SIZE
+    numbers = _recipient_numbers(campaign, call_data)
+    if not numbers:
+        raise ValueError("Campaign has no recipients")
+
+    # One batch id for the whole campaign keeps batch summaries and the
+    # recordings page campaign-wide; Retell's per-chunk ids live on the chunks
+    group_id = str(campaign.campaign_id)
+    chunks = [
+        CampaignChunk(campaign=campaign, index=index, start=start, size=min(chunk_size, len(numbers) - start))
+        for index, start in enumerate(range(0, len(numbers), chunk_size))
+    ]
+
+    with transaction.atomic():
+        CampaignDispatch.objects.update_or_create(
+            campaign=campaign,
+            defaults={
+                "user_id": user_id,
+                "caller_id": caller_id,
+                "task": task,
+                "pathway_id": pathway_id,
+                "recording_requested": recording_requested,
+            },
+        )
+        CampaignChunk.objects.bulk_create(chunks)
+        persist_batch_call_logs(
+            [(placeholder_call_id(campaign.campaign_id, i), phone) for i, phone in enumerate(numbers)],
+            group_id, user_id, caller_id,
+            pathway_id=pathway_id, recording_requested=recording_requested,
+            call_status="pending",
+        )
+        campaign.batch_id = group_id
+        campaign.total_calls = len(numbers)
+        campaign.dispatched_calls = 0
+        campaign.dispatch_status = PENDING
+        campaign.save(update_fields=["batch_id", "total_calls", "dispatched_calls", "dispatch_status"])
+
+    logger.info(
+        f"[campaign_dispatch] Planned {campaign.campaign_id}: "
+        f"{len(numbers)} calls in {len(chunks)} chunks of {chunk_size}"
+    )
+    return len(chunks)
+
+
+# =============================================================================
+# Dispatch
+# =============================================================================
+
+class CampaignDispatcher:
+    """Sends the unsent chunks of one campaign. Callers must serialise runs
+    per campaign (bot.tasks.dispatch_campaign holds a Redis lock)."""
+
+    def __init__(self, campaign_id, client=None, bucket=None, max_in_flight=None,
+                 max_attempts=None, max_run_seconds=MAX_RUN_SECONDS, clock=time.monotonic):
+        self.campaign_id = campaign_id
+        self.client = client
+        self.bucket = bucket
+        self.max_in_flight = max_in_flight or settings.RETELL_MAX_CONCURRENT_CALLS
+        self.max_attempts = max_attempts or settings.RETELL_DISPATCH_MAX_ATTEMPTS
+        self.max_run_seconds = max_run_seconds
+        self._clock = clock
+
+    def run(self):
+        """
+        Returns DISPATCHED/FAILED when the campaign is finished, THROTTLED when
+        the in-flight cap is reached, RETRYING after a failed chunk and PENDING
+        when the run budget ran out with chunks left.
+        """
+        started = self._clock()
+        self.campaign = CampaignLogs.objects.select_related("dispatch").get(campaign_id=self.campaign_id)
+        self.params = self.campaign.dispatch
+        if self.client is None:
+            self.client = get_retell_client()
+        if self.bucket is None:
+            rate = settings.RETELL_DISPATCH_CALLS_PER_SECOND
+            self.bucket = TokenBucket(rate, max(rate, settings.RETELL_DISPATCH_CHUNK_SIZE))
+
+        self._recover_interrupted()
+
+        chunks = CampaignChunk.objects.filter(
+            campaign=self.campaign, status__in=("pending", "failed"), attempts__lt=self.max_attempts,
+        ).order_by("index")
+        for chunk in chunks:
+            if self._clock() - started > self.max_run_seconds:
+                return self._set_status(PENDING)
+
+            in_flight = self._in_flight()
+            if in_flight and in_flight + chunk.size > self.max_in_flight:
+                return self._set_status(THROTTLED)
+
+            self._set_status(DISPATCHING)
+            self.bucket.acquire(chunk.size)
+            if not self._send(chunk):
+                return self._set_status(RETRYING)
+
+        return self._finish()
+
+    def _in_flight(self):
+        cutoff = timezone.now() - timedelta(seconds=settings.RETELL_IN_FLIGHT_TIMEOUT_SECONDS)
+        return BatchCallLogs.objects.filter(
+            batch_id=self.campaign.batch_id, call_status__in=IN_FLIGHT_STATUSES, queued_at__gte=cutoff,
+        ).count()
+
+    def _placeholders(self, chunk):
+        return [
+            placeholder_call_id(self.campaign.campaign_id, i)
+            for i in range(chunk.start, chunk.start + chunk.size)
+        ]
+
+    def _send(self, chunk):
+        chunk.status = "dispatching"
+        chunk.attempts += 1
+        chunk.save(update_fields=["status", "attempts"])
+
+        numbers = list(
+            CampaignRecipient.objects.filter(campaign=self.campaign)
+            .order_by("id")
+            .values_list("phone_number", flat=True)[chunk.start:chunk.start + chunk.size]
+        )
+        tasks = [
+            build_batch_task(phone, call_id, task=self.params.task, pathway_id=self.params.pathway_id)
+            for phone, call_id in zip(numbers, self._placeholders(chunk))
+        ]
+        kwargs = {"tasks": tasks}
+        if self.params.caller_id:
+            kwargs["from_number"] = self.params.caller_id
+
+        try:
+            batch = self.client.batch_call.create_batch_call(**kwargs)
+        except APIError as e:
+            logger.error(
+                f"[campaign_dispatch] Chunk {chunk.index} of {self.campaign_id} failed "
+                f"(attempt {chunk.attempts}/{self.max_attempts}): {e}"
+            )
+            chunk.status = "failed"
+            chunk.error_message = str(e)
+            chunk.save(update_fields=["status", "error_message"])
+            return False
+
+        # Record Retell's id before anything else so a crash here is not re-sent
+        chunk.retell_batch_id = batch.batch_call_id if hasattr(batch, "batch_call_id") else str(batch)
+        chunk.save(update_fields=["retell_batch_id"])
+        self._mark_dispatched(chunk)
+        return True
+
+    def _mark_dispatched(self, chunk):
+        placeholders = self._placeholders(chunk)
+        with transaction.atomic():
+            BatchCallLogs.objects.filter(call_id__in=placeholders, call_status="pending").update(
+                call_status="queued", queued_at=timezone.now(),
+            )
+            CallLogsTable.objects.filter(call_id__in=placeholders, call_status="pending").update(call_status="new")
+            chunk.status = "dispatched"
+            chunk.error_message = ""
+            chunk.dispatched_at = timezone.now()
+            chunk.save(update_fields=["status", "error_message", "dispatched_at"])
+            CampaignLogs.objects.filter(campaign_id=self.campaign_id).update(
+                dispatched_calls=F("dispatched_calls") + chunk.size
+            )
+        logger.info(
+            f"[campaign_dispatch] Chunk {chunk.index} of {self.campaign_id} sent "
+            f"({chunk.size} calls, retell batch {chunk.retell_batch_id})"
+        )
+
+    def _recover_interrupted(self):
+        """Chunks left "dispatching" by a crashed run: finish the bookkeeping if
+        Retell accepted them, otherwise put them back in the queue."""
+        for chunk in CampaignChunk.objects.filter(campaign=self.campaign, status="dispatching"):
+            if chunk.retell_batch_id:
+                self._mark_dispatched(chunk)
+            else:
+                chunk.status = "pending"
+                chunk.save(update_fields=["status"])
+
+    def _finish(self):
+        exhausted = list(
+            CampaignChunk.objects.filter(campaign=self.campaign).exclude(status="dispatched")
+        )
+        if not exhausted:
+            return self._set_status(DISPATCHED)
+
+        for chunk in exhausted:
+            placeholders = self._placeholders(chunk)
+            record_calls_failed(self.campaign.batch_id, self.params.user_id, placeholders)
+            CallLogsTable.objects.filter(call_id__in=placeholders, call_status="pending").update(call_status="failed")
+        logger.error(f"[campaign_dispatch] {self.campaign_id}: {len(exhausted)} chunks gave up")
+
+        # The failed calls may be the last ones the batch was waiting for
+        if claim_consolidated_summary(self.campaign.batch_id):
+            from bot.webhooks import _send_batch_consolidated_summary
+
+            summary = get_batch_summary(self.campaign.batch_id, self.params.user_id)
+            _send_batch_consolidated_summary(self.campaign.batch_id, self.params.user_id, summary.total_calls)
+        return self._set_status(FAILED)
+
+    def _set_status(self, status):
+        CampaignLogs.objects.filter(campaign_id=self.campaign_id).update(dispatch_status=status)
+        return status
@@ -0,0 +1,175 @@
+"""
+DTMF Approval — supervisor decisions pushed to the waiting request.
+
+  1. dtmf_supervisor_check (an async view) creates a PendingDTMFApproval and
+     asks the bot user on Telegram to approve or reject the digits
+  2. The dtmf_approve_ / dtmf_reject_ callback handlers call resolve(): one
+     conditional UPDATE moves the row out of "pending" and, only if it did,
+     the decision is published on `dtmf_approval:<id>`
+  3. wait_for_decision() awaits that message on a coroutine — one Redis
+     subscription per process is shared by every pending approval, so a
+     waiting call holds no thread and no connection — and returns the
+     instant the supervisor taps. After DTMF_SUPERVISOR_TIMEOUT_SECONDS the
+     same conditional UPDATE marks it "timeout", so a last-moment tap and
+     the timeout cannot both win
+
+The row is re-read every few seconds while waiting, which covers a missed
+message; without Redis that re-read is the only signal and runs every second.
+After a failed subscribe, requests go straight to that fallback for
+LISTENER_RETRY_SECONDS instead of each waiting on Redis again.
+"""
+import asyncio
+import logging
+import time
+
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from bot.models import PendingDTMFApproval
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "dtmf_approval:"
+RECHECK_SECONDS = 5
+FALLBACK_POLL_SECONDS = 1
+SUBSCRIBE_TIMEOUT = 2
+LISTENER_RETRY_SECONDS = 30
+
+# approval id -> futures of the requests waiting on it (this process)
+_waiters = {}
+# (event loop, listener task, subscribed event)
+_listener = None
+# time.monotonic() of the last failed subscribe
+_listener_failed_at = None
+
+
+# =============================================================================
+# Supervisor side (Telegram callback handlers, sync)
+# =============================================================================
+
+def resolve(approval_id, user_id, status):
+    """
+    Record the supervisor's decision ("approved" / "rejected").
+    Returns (approval, decided) — decided is False if it was already settled.
+    Raises PendingDTMFApproval.DoesNotExist for an unknown approval.
+    """
+    decided = PendingDTMFApproval.objects.filter(
+        id=approval_id, user_id=user_id, status="pending"
+    ).update(status=status, resolved_at=timezone.now())
+    approval = PendingDTMFApproval.objects.get(id=approval_id, user_id=user_id)
+    if decided:
+        from bot.utils import redis_client
+
+        try:
+            redis_client.publish(f"{CHANNEL_PREFIX}{approval_id}", status)
+        except RedisError as e:
+            # The waiter re-reads the row, so it still sees the decision
+            logger.warning(f"[supervisor] Could not publish decision for {approval_id}: {e}")
+    return approval, bool(decided)
+
+
+# =============================================================================
+# Waiting side (async view)
+# =============================================================================
+
+async def _listen(subscribed):
+    client = aioredis.from_url(settings.REDIS_URL)
+    try:
+        async with client.pubsub() as pubsub:
+            await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+            subscribed.set()
+            async for message in pubsub.listen():
+                if message["type"] != "pmessage":
+                    continue
+                approval_id = message["channel"].decode()[len(CHANNEL_PREFIX):]
+                for future in _waiters.get(approval_id, ()):
+                    if not future.done():
+                        future.set_result(message["data"].decode())
+    except (RedisError, OSError) as e:
+        logger.warning(f"[supervisor] Approval listener stopped: {e}")
+    finally:
+        try:
+            await client.aclose()
+        finally:
+            # Set last, so a waiter woken by a failure already sees the task done
+            subscribed.set()
+
+
+def _is_listening(loop):
+    return (
+        _listener is not None and _listener[0] is loop
+        and _listener[2].is_set() and not _listener[1].done()
+    )
+
+
+async def _ensure_listener():
+    """Start (or restart) this process's subscription. Returns True once it
+    is subscribed, False if Redis is unavailable."""
+    global _listener, _listener_failed_at
+    loop = asyncio.get_running_loop()
+    if _is_listening(loop):
+        return True
+    if _listener_failed_at is not None and time.monotonic() - _listener_failed_at < LISTENER_RETRY_SECONDS:
+        # Failed moments ago — poll rather than wait SUBSCRIBE_TIMEOUT again
+        return False
+    if _listener is None or _listener[0] is not loop or _listener[1].done():
+        subscribed = asyncio.Event()
+        _listener = (loop, loop.create_task(_listen(subscribed)), subscribed)
+    _, task, subscribed = _listener
+    try:
+        await asyncio.wait_for(subscribed.wait(), SUBSCRIBE_TIMEOUT)
+    except TimeoutError:
+        pass
+    if _is_listening(loop):
+        _listener_failed_at = None
+        return True
+    # Drop a connect that is still hanging; the next retry starts afresh
+    task.cancel()
+    if _listener is not None and _listener[1] is task:
+        _listener = None
+    _listener_failed_at = time.monotonic()
+    return False
+
+
+async def _status(approval_id):
+    return await PendingDTMFApproval.objects.filter(id=approval_id).values_list("status", flat=True).afirst()
+
+
+async def _expire(approval_id):
+    """Time the approval out unless it was decided meanwhile; the final status."""
+    await PendingDTMFApproval.objects.filter(id=approval_id, status="pending").aupdate(
+        status="timeout", resolved_at=timezone.now()
+    )
+    return await _status(approval_id)
+
+
+async def wait_for_decision(approval_id, timeout):
+    """Final status of an approval: "approved", "rejected" or "timeout"."""
+    key = str(approval_id)
+    loop = asyncio.get_running_loop()
+    listening = await _ensure_listener()
+    future = loop.create_future()
+    _waiters.setdefault(key, set()).add(future)
+    deadline = loop.time() + timeout
+    try:
+        while True:
+            # Registered before this read, so a decision is either seen here or pushed
+            status = await _status(approval_id)
+            if status != "pending":
+                return status
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return await _expire(approval_id)
+            interval = RECHECK_SECONDS if listening else FALLBACK_POLL_SECONDS
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), min(remaining, interval))
+            except TimeoutError:
+                continue
+    finally:
+        waiters = _waiters.get(key)
+        if waiters is not None:
+            waiters.discard(future)
+            if not waiters:
+                del _waiters[key]
@@ -0,0 +1,363 @@
+"""
+Handler Index — routes a Telegram update to the few handlers that can match it.
+
+telebot tests every registered predicate in order until one matches. Almost
+all of ours have one of a handful of shapes, so at startup each handler's
+`func=lambda ...` is read back from its source (ast) and reduced to keys that
+*must* hold for it to match:
+
+  - `message.text in MENU.values()` / `== "..."`      -> exact text keys
+  - `_match_menu_text(message.text or "", MENU)`      -> exact text keys via
+    the helper's `dispatch_texts` (see text_matcher)
+  - `user_data.get(message.chat.id, {}).get("step") == "..."` -> step keys
+  - `call.data == "..."` / `in [...]`                 -> exact data keys
+  - `call.data.startswith("...")`                     -> prefix trie
+
+`or` unions the keys of its operands, `and` uses the first operand that has
+any. A handler whose predicate does not reduce (or has no func) stays in the
+fallback list and is tested on every update.
+
+Per update only the handlers under the matching keys plus the fallbacks are
+handed to telebot, in registration order, and telebot still evaluates their
+real predicates — so the first-match result is the same as a linear scan.
+Key sets are evaluated once when the index is built; the translation dicts
+they come from are constants.
+"""
+import ast
+import inspect
+import logging
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+
+def text_matcher(expand):
+    """
+    Mark a predicate helper `fn(message_text, *args)` as matching exactly the
+    texts in `expand(*args)`, so handlers calling it can be indexed.
+    """
+    def decorate(fn):
+        fn.dispatch_texts = expand
+        return fn
+    return decorate
+
+
+class _Unindexable(Exception):
+    pass
+
+
+# =============================================================================
+# Predicate analysis
+# =============================================================================
+
+_SOURCE_CACHE = {}
+
+
+def _lambda_node(func):
+    """The ast.Lambda a function was created from, or None if ambiguous."""
+    code = getattr(func, "__code__", None)
+    if code is None or code.co_name != "<lambda>":
+        return None
+    try:
+        filename = inspect.getsourcefile(func)
+    except TypeError:
+        return None
+    if filename not in _SOURCE_CACHE:
+        try:
+            with open(filename, encoding="utf-8") as source:
+                tree = ast.parse(source.read(), filename)
+        except (OSError, SyntaxError):
+            tree = None
+        by_line = {}
+        if tree is not None:
+            for node in ast.walk(tree):
+                if isinstance(node, ast.Lambda):
+                    by_line.setdefault(node.lineno, []).append(node)
+        _SOURCE_CACHE[filename] = by_line
+    nodes = _SOURCE_CACHE[filename].get(code.co_firstlineno, [])
+    return nodes[0] if len(nodes) == 1 else None
+
+
+class _PredicateAnalyzer:
+    """Reduces a lambda body to a frozenset of index keys:
+    ("exact", field, value), ("prefix", field, value), ("step", path, value)."""
+
+    def __init__(self, func, arg, state):
+        self.globals = func.__globals__
+        self.arg = arg
+        self.state = state
+
+    def keys(self, node):
+        if isinstance(node, ast.BoolOp):
+            if isinstance(node.op, ast.Or):
+                keys = set()
+                for value in node.values:
+                    keys |= self.keys(value)
+                return frozenset(keys)
+            for value in node.values:
+                try:
+                    return self.keys(value)
+                except _Unindexable:
+                    continue
+            raise _Unindexable()
+        if isinstance(node, ast.Compare):
+            return self._compare(node)
+        if isinstance(node, ast.Call):
+            return self._call(node)
+        raise _Unindexable()
+
+    # -- shapes ---------------------------------------------------------------
+
+    def _compare(self, node):
+        if len(node.ops) != 1:
+            raise _Unindexable()
+        left, op, right = node.left, node.ops[0], node.comparators[0]
+        if isinstance(op, ast.Eq):
+            if self._is_subject(right) and not self._is_subject(left):
+                left, right = right, left
+            return self._subject_keys(left, [self._evaluate(right)])
+        if isinstance(op, ast.In):
+            values = self._evaluate(right)
+            if isinstance(values, str):  # substring test, not membership
+                raise _Unindexable()
+            return self._subject_keys(left, values)
+        raise _Unindexable()
+
+    def _call(self, node):
+        func = node.func
+        # call.data.startswith("prefix")
+        if isinstance(func, ast.Attribute) and func.attr == "startswith" and len(node.args) == 1:
+            field = self._field(func.value)
+            prefixes = self._evaluate(node.args[0])
+            if isinstance(prefixes, str):
+                prefixes = (prefixes,)
+            return frozenset(("prefix", field, self._str(p)) for p in prefixes)
+        # helper(message.text or "", ...) marked with @text_matcher
+        helper = self._evaluate(func)
+        expand = getattr(helper, "dispatch_texts", None)
+        if expand is None or not node.args or node.keywords:
+            raise _Unindexable()
+        subject = node.args[0]
+        if isinstance(subject, ast.BoolOp) and isinstance(subject.op, ast.Or):
+            subject = subject.values[0]
+        field = self._field(subject)
+        texts = expand(*(self._evaluate(arg) for arg in node.args[1:]))
+        return frozenset(("exact", field, self._str(text)) for text in texts)
+
+    def _subject_keys(self, subject, values):
+        try:
+            values = list(values)
+        except TypeError:
+            raise _Unindexable() from None
+        path = self._step_path(subject)
+        if path is not None:
+            return frozenset(("step", path, value) for value in values)
+        field = self._field(subject)
+        return frozenset(("exact", field, self._str(value)) for value in values)
+
+    def _is_subject(self, node):
+        try:
+            return self._step_path(node) is not None or bool(self._field(node))
+        except _Unindexable:
+            return False
+
+    def _field(self, node):
+        """`message.text` -> "text"."""
+        if (isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name)
+                and node.value.id == self.arg):
+            return node.attr
+        raise _Unindexable()
+
+    def _step_path(self, node):
+        """`user_data.get(message.chat.id, {}).get("step")` -> ("chat", "id")."""
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and node.func.attr == "get" and len(node.args) == 1
+                and isinstance(node.args[0], ast.Constant) and node.args[0].value == "step"):
+            return None
+        inner = node.func.value
+        if not (isinstance(inner, ast.Call) and isinstance(inner.func, ast.Attribute)
+                and inner.func.attr == "get" and len(inner.args) == 2
+                and isinstance(inner.args[1], ast.Dict) and not inner.args[1].keys):
+            return None
+        if self.state is None or self._evaluate(inner.func.value) is not self.state:
+            return None
+        path = []
+        node = inner.args[0]
+        while isinstance(node, ast.Attribute):
+            path.append(node.attr)
+            node = node.value
+        if not (isinstance(node, ast.Name) and node.id == self.arg and path):
+            return None
+        return tuple(reversed(path))
+
+    # -- constant evaluation --------------------------------------------------
+
+    def _evaluate(self, node):
+        if isinstance(node, ast.Constant):
+            return node.value
+        if isinstance(node, ast.Name):
+            if node.id == self.arg or node.id not in self.globals:
+                raise _Unindexable()
+            return self.globals[node.id]
+        if isinstance(node, ast.Attribute):
+            return getattr(self._evaluate(node.value), node.attr)
+        if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+            return [self._evaluate(item) for item in node.elts]
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and node.func.attr in ("values", "keys") and not node.args and not node.keywords):
+            target = self._evaluate(node.func.value)
+            if not isinstance(target, dict):
+                raise _Unindexable()
+            return list(getattr(target, node.func.attr)())
+        raise _Unindexable()
+
+    @staticmethod
+    def _str(value):
+        if not isinstance(value, str):
+            raise _Unindexable()
+        return value
+
+
+def handler_keys(handler, state=None):
+    """Index keys of a telebot handler dict, or None if it must stay a fallback."""
+    func = handler["filters"].get("func")
+    node = _lambda_node(func) if func is not None else None
+    if node is None or len(node.args.args) != 1:
+        return None
+    try:
+        return _PredicateAnalyzer(func, node.args.args[0].arg, state).keys(node.body)
+    except _Unindexable:
+        return None
+    except Exception:
+        # Anything unexpected in a predicate just keeps it a fallback
+        logger.debug(f"[handler_index] Could not analyse {handler['function'].__name__}", exc_info=True)
+        return None
+
+
+# =============================================================================
+# Index
+# =============================================================================
+
+class PrefixTrie:
+    """Character trie: value -> positions registered under every prefix of it."""
+
+    _END = ""
+
+    def __init__(self):
+        self.root = {}
+
+    def add(self, prefix, position):
+        node = self.root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node.setdefault(self._END, []).append(position)
+
+    def matches(self, value):
+        node = self.root
+        found = list(node.get(self._END, ()))
+        for char in value:
+            node = node.get(char)
+            if node is None:
+                break
+            found.extend(node.get(self._END, ()))
+        return found
+
+
+class HandlerIndex:
+    """Index over one telebot handler list (e.g. bot.message_handlers)."""
+
+    def __init__(self, handlers, state=None):
+        self.handlers = list(handlers)
+        self.state = state
+        self.exact = {}
+        self.prefixes = {}
+        self.steps = {}
+        self.fallback = []
+
+        for position, handler in enumerate(self.handlers):
+            keys = handler_keys(handler, state)
+            if keys is None:
+                self.fallback.append(position)
+                continue
+            for kind, where, value in keys:
+                if kind == "exact":
+                    self.exact.setdefault((where, value), []).append(position)
+                elif kind == "prefix":
+                    self.prefixes.setdefault(where, PrefixTrie()).add(value, position)
+                else:
+                    self.steps.setdefault(where, {}).setdefault(value, []).append(position)
+        self._exact_fields = {field for field, _ in self.exact}
+
+    @property
+    def indexed_count(self):
+        return len(self.handlers) - len(self.fallback)
+
+    def _step(self, update, path):
+        target = update
+        for attr in path:
+            target = getattr(target, attr, None)
+            if target is None:
+                return None
+        try:
+            return self.state.get(target, {}).get("step")
+        except (TypeError, ValueError):
+            return None
+
+    def candidates(self, update):
+        """Handlers that may match `update`, in registration order."""
+        positions = set(self.fallback)
+        for field, trie in self.prefixes.items():
+            value = getattr(update, field, None)
+            if isinstance(value, str):
+                positions.update(trie.matches(value))
+        for field in self._exact_fields:
+            value = getattr(update, field, None)
+            if isinstance(value, str):
+                positions.update(self.exact.get((field, value), ()))
+        for path, by_step in self.steps.items():
+            positions.update(by_step.get(self._step(update, path), ()))
+        return [self.handlers[position] for position in sorted(positions)]
+
+
+# =============================================================================
+# telebot integration
+# =============================================================================
+
+def install_handler_index(bot, state=None):
+    """
+    Route bot.message_handlers / bot.callback_query_handlers through a
+    HandlerIndex. Indexes are (re)built lazily whenever a list changes size,
+    so handlers registered after this call are picked up too.
+
+    `state` is the user_data store the step predicates read; when it has a
+    scope() the step lookup shares the update's cached session.
+    """
+    original = bot._run_middlewares_and_handler
+    indexes = {}
+
+    def index_for(handlers):
+        index = indexes.get(id(handlers))
+        if index is None or len(index.handlers) != len(handlers):
+            index = indexes[id(handlers)] = HandlerIndex(handlers, state)
+            logger.info(
+                f"[handler_index] Indexed {index.indexed_count}/{len(handlers)} handlers "
+                f"({len(index.fallback)} fallbacks)"
+            )
+        return index
+
+    routed = (bot.message_handlers, bot.callback_query_handlers)
+
+    @wraps(original)
+    def run_indexed(message, handlers, middlewares, update_type):
+        if not handlers or not any(handlers is lst for lst in routed):
+            return original(message, handlers, middlewares, update_type)
+        scope = getattr(state, "scope", None)
+        if scope is None:
+            return original(message, index_for(handlers).candidates(message), middlewares, update_type)
+        # Outer scope: the step lookup and the middleware's scope share one load/save
+        with scope():
+            return original(message, index_for(handlers).candidates(message), middlewares, update_type)
+
+    bot._run_middlewares_and_handler = run_indexed
+    bot.handler_index_for = index_for
+    return index_for
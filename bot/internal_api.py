@@ -0,0 +1,33 @@
+"""
+Internal API — access control for operational endpoints (queue depths,
+shard state, price store ages) that must not be public.
+
+A request is let through when it comes from a logged-in staff user (a
+Django admin session) or carries `Authorization: Bearer <token>` matching
+settings.INTERNAL_STATS_TOKEN. Anything else gets a 404, so the endpoints
+do not show up to scanners.
+"""
+import hmac
+from functools import wraps
+
+from django.conf import settings
+from django.http import JsonResponse
+
+
+def is_internal_request(request):
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated and user.is_staff:
+        return True
+    token = settings.INTERNAL_STATS_TOKEN
+    header = request.META.get("HTTP_AUTHORIZATION", "")
+    return bool(token) and hmac.compare_digest(header, f"Bearer {token}")
+
+
+def internal_only(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not is_internal_request(request):
+            return JsonResponse({"error": "not found"}, status=404)
+        return view(request, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,241 @@
+"""
+Live Billing Engine — batched per-tick wallet billing for ActiveCall rows.
+
+Driven by bot.tasks.monitor_active_calls every 30 seconds:
+  1. One query selects the IDs of every wallet-billed call that is due for
+     billing, grouped by user
+  2. Per user: the wallet and the due ActiveCall rows are locked and
+     re-read, charges are computed from the locked rows, then one wallet
+     update, one bulk WalletTransaction insert and one bulk ActiveCall update
+  3. After commit: low-balance warnings and force-ending exhausted calls
+
+Charges come from rows read under the lock, so an overlapping tick finds
+last_billed_at already moved and bills nothing twice.
+
+Tick duration and calls-per-tick are kept in a Redis hash (see get_tick_metrics).
+"""
+import logging
+import time
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from bot.message_gateway import BILLING
+from bot.message_gateway import send_message as queue_message
+from bot.models import ActiveCall
+from bot.utils import redis_client
+from bot.views import stop_single_active_call
+from payment.models import TransactionType, WalletTransaction
+from user.models import TelegramUser
+
+logger = logging.getLogger(__name__)
+
+# Calls billed less than this many seconds ago are skipped for this tick
+BILLING_GRACE_SECONDS = 25
+
+MONITOR_METRICS_KEY = "billing:monitor_active_calls"
+
+
+def _due_calls(now):
+    """Wallet-billed active calls last billed before this tick's grace window.
+    Plan-billed calls (rate 0) never match."""
+    return ActiveCall.objects.filter(
+        is_active=True,
+        rate_per_minute__gt=0,
+        last_billed_at__lte=now - timedelta(seconds=BILLING_GRACE_SECONDS),
+    )
+
+
+def select_due_calls(now):
+    """Return {user_id: [call_id, ...]} of every call due for billing."""
+    call_ids_by_user = defaultdict(list)
+    for call_id, user_id in _due_calls(now).values_list("call_id", "user_id"):
+        call_ids_by_user[user_id].append(call_id)
+    return call_ids_by_user
+
+
+def compute_charge(call, now):
+    """(elapsed_minutes, charge) of a call since it was last billed."""
+    elapsed_seconds = (now - call.last_billed_at).total_seconds()
+    elapsed_minutes = Decimal(str(round(elapsed_seconds / 60, 4)))
+    return elapsed_minutes, call.rate_per_minute * elapsed_minutes
+
+
+def _wallet_tx(user, amount, balance_before, description):
+    return WalletTransaction(
+        user=user,
+        transaction_type=TransactionType.OVERAGE,
+        amount=amount,
+        balance_before=balance_before,
+        balance_after=balance_before - amount,
+        description=description,
+    )
+
+
+def bill_user_calls(user_id, call_ids, now):
+    """
+    Apply one tick of charges for a single user under one wallet lock.
+    The calls are re-read under a row lock, so a call settled by call_ended
+    or billed by an overlapping tick since select_due_calls() is skipped.
+    Returns (warnings, exhausted): [(call, balance)] needing a low-balance
+    warning, and calls whose wallet ran out and must be force-ended.
+    """
+    warnings = []
+    exhausted = []
+
+    with transaction.atomic():
+        try:
+            user = TelegramUser.objects.select_for_update().get(user_id=user_id)
+        except TelegramUser.DoesNotExist:
+            return warnings, exhausted
+
+        entries = []
+        for call in _due_calls(now).select_for_update().filter(call_id__in=call_ids):
+            elapsed_minutes, charge = compute_charge(call, now)
+            if charge > 0:
+                entries.append((call, elapsed_minutes, charge))
+        if not entries:
+            return warnings, exhausted
+
+        balance_start = user.wallet_balance
+        balance = balance_start
+        transactions = []
+
+        for call, elapsed_minutes, charge in entries:
+            # Warn once when the wallet cannot cover the next minute
+            if balance < call.rate_per_minute and not call.warning_sent:
+                call.warning_sent = True
+                warnings.append((call, balance))
+
+            if balance < charge:
+                # Bill what is left, then end the call
+                if balance > Decimal("0.01"):
+                    transactions.append(_wallet_tx(
+                        user, balance, balance,
+                        f"Final billing: {call.region} ({call.call_id[:12]})",
+                    ))
+                    call.total_billed += balance
+                    call.last_billed_at = now
+                    balance = Decimal("0.00")
+                call.is_active = False
+                exhausted.append(call)
+                continue
+
+            transactions.append(_wallet_tx(
+                user, charge, balance,
+                f"Live billing: {call.region} ({call.call_id[:12]}) {elapsed_minutes:.2f}min",
+            ))
+            balance -= charge
+            call.total_billed += charge
+            call.last_billed_at = now
+
+        if transactions:
+            user.wallet_balance = balance
+            user.save(update_fields=["wallet_balance"])
+            WalletTransaction.objects.bulk_create(transactions)
+
+        ActiveCall.objects.bulk_update(
+            [call for call, _, _ in entries],
+            ["total_billed", "last_billed_at", "warning_sent", "is_active"],
+        )
+
+    logger.debug(
+        f"[live_billing] user={user_id} calls={len(entries)} "
+        f"charged=${balance_start - balance:.4f}"
+    )
+    return warnings, exhausted
+
+
+def _send_low_balance_warning(call, balance):
+    # queue_message reports failures itself and never raises
+    queue_message(
+        call.user_id,
+        f"⚠️ LOW BALANCE WARNING\n"
+        f"Active call to {call.region} ({call.to_number})\n"
+        f"Rate: ${call.rate_per_minute}/min\n"
+        f"Balance: ${balance:.2f}\n"
+        f"Call will auto-end when balance runs out.",
+        lane=BILLING,
+    )
+
+
+def _force_end_call(call):
+    logger.info(f"[live_billing] Force-ending call {call.call_id} — wallet exhausted")
+    # Errors come back as a 400 response, not an exception
+    stop_result = stop_single_active_call(call.call_id)
+    logger.info(f"[live_billing] Stop call result: {stop_result.status_code}")
+
+    queue_message(
+        call.user_id,
+        f"🛑 Call to {call.region} ended — insufficient wallet balance.\n"
+        f"Total charged: ${call.total_billed:.2f}\n"
+        f"Please top up your wallet to continue making calls.",
+        lane=BILLING,
+    )
+
+
+def record_tick_metrics(duration_ms, calls, users):
+    """Store the latest tick stats in Redis for dashboards/alerting."""
+    try:
+        redis_client.hset(MONITOR_METRICS_KEY, mapping={
+            "last_tick_ms": f"{duration_ms:.1f}",
+            "last_calls": calls,
+            "last_users": users,
+            "last_run_at": timezone.now().isoformat(),
+        })
+        redis_client.hincrby(MONITOR_METRICS_KEY, "ticks_total", 1)
+        redis_client.hincrby(MONITOR_METRICS_KEY, "calls_total", calls)
+    except RedisError as e:
+        logger.warning(f"[live_billing] Could not record metrics: {e}")
+
+
+def get_tick_metrics():
+    """Return the latest monitor tick stats as a dict of strings."""
+    try:
+        raw = redis_client.hgetall(MONITOR_METRICS_KEY)
+        return {k.decode(): v.decode() for k, v in raw.items()}
+    except RedisError:
+        return {}
+
+
+def run_billing_tick():
+    """Bill every due active call once. Returns a summary dict."""
+    started = time.monotonic()
+    now = timezone.now()
+
+    call_ids_by_user = select_due_calls(now)
+    calls = sum(len(call_ids) for call_ids in call_ids_by_user.values())
+
+    warnings = []
+    exhausted = []
+    for user_id, call_ids in call_ids_by_user.items():
+        try:
+            user_warnings, user_exhausted = bill_user_calls(user_id, call_ids, now)
+            warnings.extend(user_warnings)
+            exhausted.extend(user_exhausted)
+        except Exception:
+            # One user's failure must not stop the others being billed
+            logger.exception(f"[live_billing] Billing failed for user {user_id}")
+
+    # Telegram / Retell round-trips happen outside the wallet locks
+    for call, balance in warnings:
+        _send_low_balance_warning(call, balance)
+    for call in exhausted:
+        _force_end_call(call)
+
+    duration_ms = (time.monotonic() - started) * 1000
+    record_tick_metrics(duration_ms, calls, len(call_ids_by_user))
+    logger.info(
+        f"[live_billing] Tick billed {calls} calls for {len(call_ids_by_user)} users "
+        f"in {duration_ms:.1f}ms ({len(exhausted)} force-ended)"
+    )
+    return {
+        "calls": calls,
+        "users": len(call_ids_by_user),
+        "exhausted": len(exhausted),
+        "duration_ms": duration_ms,
+    }
@@ -0,0 +1,59 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from bot.models import BatchCallLogs, CallLogsTable
+from bot.views import persist_batch_call_logs, placeholder_call_id
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Times batch call log persistence (bulk vs per-row) against recipient count; rolls back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--counts', default='100,1000,5000')
+        parser.add_argument('--skip-per-row', action='store_true')
+
+    def handle(self, *args, **options):
+        counts = [int(count) for count in options['counts'].split(',')]
+        self.stdout.write(f"{'recipients':>10} {'bulk_ms':>10} {'per_row_ms':>11}")
+        for count in counts:
+            bulk_ms = self._timed(self._bulk, count)
+            per_row_ms = None if options['skip_per_row'] else self._timed(self._per_row, count)
+            per_row = f"{per_row_ms:11.1f}" if per_row_ms is not None else f"{'-':>11}"
+            self.stdout.write(f"{count:>10} {bulk_ms:10.1f} {per_row}")
+
+    def _entries(self, count):
+        campaign_id = uuid.uuid4()
+        return [(placeholder_call_id(campaign_id, i), f"+1415555{i % 10000:04d}") for i in range(count)]
+
+    def _timed(self, fn, count):
+        entries = self._entries(count)
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                fn(entries)
+                elapsed = (time.perf_counter() - started) * 1000
+                raise _Rollback()
+        except _Rollback:
+            pass
+        return elapsed
+
+    def _bulk(self, entries):
+        persist_batch_call_logs(entries, 'benchmark', 0, '+14155550000')
+
+    def _per_row(self, entries):
+        # The pre-bulk_create code path: two INSERT round-trips per recipient
+        for call_id, phone in entries:
+            BatchCallLogs.objects.create(
+                call_id=call_id, batch_id='benchmark', pathway_id='', user_id=0,
+                to_number=phone, from_number='+14155550000', call_status='queued',
+            )
+            CallLogsTable.objects.create(
+                call_id=call_id, call_number=phone, pathway_id='', user_id=0, call_status='new',
+            )
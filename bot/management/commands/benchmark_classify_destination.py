@@ -0,0 +1,52 @@
+import random
+import re
+import time
+
+from django.core.management.base import BaseCommand
+
+from bot import call_gate
+from bot.call_gate import classify_destination
+
+FORMATS = ('+{}', '+1 {}', '+44 ({}', '{}', '+9{}')
+
+
+def _linear_scan(phone_number):
+    # The pre-index code path: regex clean-up, then every prefix tried in turn
+    cleaned = re.sub(r'[\s\-\(\)]', '', str(phone_number))
+    if not cleaned.startswith('+'):
+        return call_gate._DOMESTIC_RESULT
+    best, best_length = None, 0
+    for prefix, match in call_gate._PREFIX_INDEX.items():
+        if cleaned.startswith(prefix) and len(prefix) > best_length:
+            best, best_length = match, len(prefix)
+    return best or call_gate._INTERNATIONAL_RESULT
+
+
+class Command(BaseCommand):
+    help = 'Times classify_destination (prefix index vs linear scan) over random numbers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--numbers', type=int, default=1000000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--skip-linear', action='store_true')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        numbers = [
+            rng.choice(FORMATS).format(''.join(rng.choice('0123456789') for _ in range(11)))
+            for _ in range(options['numbers'])
+        ]
+        self.stdout.write(
+            f"{len(numbers)} numbers, {len(call_gate._PREFIX_INDEX)} prefixes, "
+            f"lengths {call_gate._PREFIX_LENGTHS}"
+        )
+        self.stdout.write(f"{'method':>8} {'total_s':>9} {'ns/number':>10}")
+        methods = [('index', classify_destination)]
+        if not options['skip_linear']:
+            methods.append(('linear', _linear_scan))
+        for name, fn in methods:
+            started = time.perf_counter()
+            for number in numbers:
+                fn(number)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{name:>8} {elapsed:9.2f} {elapsed / len(numbers) * 1e9:10.0f}")
@@ -0,0 +1,129 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from telebot import types
+
+from bot.handler_index import HandlerIndex
+from bot.state_store import InMemoryStateBackend
+
+
+class Command(BaseCommand):
+    help = 'Times per-update handler routing (linear scan vs handler index) and checks both pick the same handler'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--updates', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        import bot.telegrambot  # registers the handlers
+        from bot.bot_config import bot, user_data
+
+        # Step predicates read user_data; keep the benchmark off Redis
+        backend, user_data.backend = user_data.backend, InMemoryStateBackend(3600)
+        rng = random.Random(options['seed'])
+        try:
+            self.stdout.write(f"{'handlers':>10} {'updates':>8} {'linear_us':>10} {'indexed_us':>11} "
+                              f"{'linear_tests':>13} {'indexed_tests':>14} {'mismatches':>11}")
+            for handlers, make in ((bot.message_handlers, self._messages),
+                                   (bot.callback_query_handlers, self._callbacks)):
+                index = HandlerIndex(handlers, user_data)
+                updates = make(index, rng, options['updates'])
+                self._report(bot, user_data, handlers, index, updates)
+        finally:
+            user_data.backend = backend
+
+    # -- sample updates -------------------------------------------------------
+
+    def _messages(self, index, rng, count):
+        texts = [value for field, value in index.exact if field == 'text']
+        steps = list(index.steps.get(('chat', 'id'), {}))
+        updates = []
+        for i in range(count):
+            chat_id = 10_000 + i
+            roll = rng.random()
+            step = rng.choice(steps) if roll < 0.4 and steps else None
+            text = rng.choice(texts) if roll >= 0.4 and roll < 0.9 else f"free text {i}"
+            updates.append((self._message(chat_id, text), step))
+        return updates
+
+    def _callbacks(self, index, rng, count):
+        data = [value for field, value in index.exact if field == 'data']
+        prefixes = []
+        trie = index.prefixes.get('data')
+        if trie is not None:
+            prefixes = self._trie_prefixes(trie.root, '')
+        updates = []
+        for i in range(count):
+            roll = rng.random()
+            if roll < 0.5 and data:
+                value = rng.choice(data)
+            elif roll < 0.9 and prefixes:
+                value = f"{rng.choice(prefixes)}{i}"
+            else:
+                value = f"unknown_{i}"
+            updates.append((self._callback(20_000 + i, value), None))
+        return updates
+
+    def _trie_prefixes(self, node, prefix):
+        found = [prefix] if '' in node else []
+        for char, child in node.items():
+            if char:
+                found.extend(self._trie_prefixes(child, prefix + char))
+        return found
+
+    @staticmethod
+    def _message(chat_id, text):
+        return types.Message.de_json({
+            'message_id': 1, 'date': 0, 'text': text,
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'},
+        })
+
+    def _callback(self, chat_id, data):
+        return types.CallbackQuery.de_json({
+            'id': str(chat_id), 'chat_instance': '0', 'data': data,
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'},
+            'message': {'message_id': 1, 'date': 0, 'text': 'menu',
+                        'chat': {'id': chat_id, 'type': 'private'}},
+        })
+
+    # -- measurement ----------------------------------------------------------
+
+    @staticmethod
+    def _route(bot, handlers, update):
+        """First matching handler and the number of predicates evaluated."""
+        for tested, handler in enumerate(handlers, start=1):
+            if bot._test_message_handler(handler, update):
+                return handler, tested
+        return None, len(handlers)
+
+    def _report(self, bot, user_data, handlers, index, updates):
+        for update, step in updates:
+            chat = update.message.chat if isinstance(update, types.CallbackQuery) else update.chat
+            user_data[chat.id] = {'step': step} if step else {}
+
+        linear_time = indexed_time = 0.0
+        linear_tests = indexed_tests = mismatches = 0
+        for update, _ in updates:
+            with user_data.scope():
+                started = time.perf_counter()
+                expected, tested = self._route(bot, handlers, update)
+                linear_time += time.perf_counter() - started
+                linear_tests += tested
+
+            with user_data.scope():
+                started = time.perf_counter()
+                found, tested = self._route(bot, index.candidates(update), update)
+                indexed_time += time.perf_counter() - started
+                indexed_tests += tested
+
+            if found is not expected:
+                mismatches += 1
+
+        count = len(updates)
+        self.stdout.write(
+            f"{len(handlers):>10} {count:>8} {linear_time / count * 1e6:10.1f} "
+            f"{indexed_time / count * 1e6:11.1f} {linear_tests / count:13.1f} "
+            f"{indexed_tests / count:14.1f} {mismatches:>11}"
+        )
@@ -0,0 +1,85 @@
+import json
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from bot.models import CallLogsTable
+from bot.webhooks import retell_webhook
+from user.models import TelegramUser
+
+MODES = {'inline': False, 'queued': True}
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Retell webhook latency, inline handlers vs queued ingestion (RETELL_WEBHOOK_ASYNC); rolls back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=500)
+        parser.add_argument('--modes', default='inline,queued')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'mode':>8} {'requests':>9} {'p50_ms':>9} {'p99_ms':>9} {'max_ms':>9}")
+        for mode in options['modes'].split(','):
+            try:
+                with transaction.atomic(), override_settings(RETELL_WEBHOOK_ASYNC=MODES[mode]):
+                    latencies = self._run(options['calls'])
+                    raise _Rollback()
+            except _Rollback:
+                pass
+            latencies.sort()
+
+            def pct(p, latencies=latencies):
+                return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+            self.stdout.write(
+                f"{mode:>8} {len(latencies):>9} {pct(0.50):9.3f} {pct(0.99):9.3f} {latencies[-1]:9.3f}"
+            )
+
+    def _requests(self, count):
+        user, _ = TelegramUser.objects.get_or_create(user_id=0, defaults={'user_name': 'benchmark'})
+        TelegramUser.objects.filter(user_id=user.user_id).update(wallet_balance=Decimal(1000000))
+
+        # Fresh call_ids every run, so call_state in Redis never sees a repeat
+        run = uuid.uuid4().hex[:8]
+        call_ids = [f'benchmark_{run}_{i}' for i in range(count)]
+        CallLogsTable.objects.bulk_create([
+            CallLogsTable(call_id=call_id, call_number=f'+1415555{i % 10000:04d}', user_id=user.user_id)
+            for i, call_id in enumerate(call_ids)
+        ])
+
+        factory = RequestFactory()
+        requests = []
+        for i, call_id in enumerate(call_ids):
+            call = {
+                'call_id': call_id,
+                'direction': 'outbound',
+                'from_number': '+14155550000',
+                'to_number': f'+1415555{i % 10000:04d}',
+                'start_timestamp': 1700000000000,
+            }
+            started = {**call, 'call_status': 'ongoing'}
+            ended = {**call, 'call_status': 'ended', 'end_timestamp': 1700000120000, 'duration_ms': 120000}
+            for event, data in (('call_started', started), ('call_ended', ended)):
+                requests.append(factory.post(
+                    '/api/webhook/retell',
+                    data=json.dumps({'event': event, 'data': data}),
+                    content_type='application/json',
+                ))
+        return requests
+
+    def _run(self, count):
+        latencies = []
+        for request in self._requests(count):
+            t0 = time.perf_counter()
+            retell_webhook(request)
+            latencies.append((time.perf_counter() - t0) * 1000)
+        return latencies
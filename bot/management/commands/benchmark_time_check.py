@@ -0,0 +1,105 @@
+import json
+import random
+import time
+from datetime import time as dt_time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from bot import phone_index
+from bot.models import UserPhoneNumber
+from bot.webhooks import time_check_endpoint
+from user.models import TelegramUser
+
+TIMEZONES = ('US/Eastern', 'US/Central', 'US/Pacific', 'Europe/London', 'Asia/Tokyo', 'Australia/Sydney')
+DAYS = ('01234', '0123456', '12345', '56')
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Latency of the mid-call time-check endpoint at a paced request rate; rolls back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--numbers', type=int, default=1000)
+        parser.add_argument('--rps', type=int, default=1000)
+        parser.add_argument('--seconds', type=float, default=10)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                numbers = self._create_numbers(options['numbers'])
+                phone_index.forget()
+                self._run(numbers, options['rps'], options['seconds'])
+                raise _Rollback()
+        except _Rollback:
+            pass
+        finally:
+            phone_index.forget()
+
+    def _create_numbers(self, count):
+        user, _ = TelegramUser.objects.get_or_create(user_id=0, defaults={'user_name': 'benchmark'})
+        records = [
+            UserPhoneNumber(
+                user=user,
+                phone_number=f'+1999555{i:04d}',
+                next_renewal_date=timezone.now(),
+                business_hours_enabled=True,
+                business_hours_start=dt_time(9, 0),
+                business_hours_end=dt_time(17, 0) if i % 5 else dt_time(2, 0),
+                business_hours_timezone=TIMEZONES[i % len(TIMEZONES)],
+                business_days=DAYS[i % len(DAYS)],
+                business_holidays=['2026-12-25', '2027-01-01'] if i % 3 == 0 else [],
+            )
+            for i in range(count)
+        ]
+        UserPhoneNumber.objects.bulk_create(records)
+        return [record.phone_number for record in records]
+
+    def _run(self, numbers, rps, seconds):
+        factory = RequestFactory()
+        requests = [
+            factory.post(
+                '/api/time-check',
+                data=json.dumps({'call_id': 'benchmark', 'args': {'phone_number': number}}),
+                content_type='application/json',
+            )
+            for number in numbers
+        ]
+        # Warm up: load the index and build every schedule once
+        for request in requests:
+            time_check_endpoint(request)
+
+        total = int(rps * seconds)
+        interval = 1.0 / rps
+        latencies = []
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            for i in range(total):
+                due = started + i * interval
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                request = random.choice(requests)
+                t0 = time.perf_counter()
+                time_check_endpoint(request)
+                latencies.append((time.perf_counter() - t0) * 1000)
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+
+        def pct(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+        self.stdout.write(
+            f"{len(numbers)} numbers, {total} requests in {elapsed:.2f}s ({total / elapsed:.0f} rps), "
+            f"{len(queries)} queries"
+        )
+        self.stdout.write(
+            f"p50 {pct(0.50):.3f} ms  p90 {pct(0.90):.3f} ms  p99 {pct(0.99):.3f} ms  max {latencies[-1]:.3f} ms"
+        )
@@ -0,0 +1,399 @@
+"""
+Message Gateway — rate-limited, retrying outbound Telegram delivery.
+
+Background senders (Celery tasks, Retell webhooks, live billing) call
+send_message()/send_audio() here instead of the bot directly:
+
+  1. The message is serialised and pushed onto a Redis list for its priority
+     lane: urgent > billing > normal > bulk
+  2. bot.tasks.deliver_outbound_messages (one drainer at a time, Redis lock)
+     takes messages in lane priority order and sends through a global token
+     bucket (Telegram allows ~30 msg/s) and a per-chat one (~1 msg/s). A
+     message is moved (LMOVE) into the drainer's processing list and only
+     removed once it is sent, rescheduled or dropped; a drainer that dies
+     mid-send leaves it there and the next drainer puts it back on its lane
+  3. A 429 puts the message back for `retry_after` seconds; 5xx and network
+     errors retry with jittered backoff; other 4xx (blocked bot, bad chat)
+     are final, and send the optional `fallback` text instead
+  4. Counters and enqueue-to-delivery latency per lane are kept in Redis
+     (stats(), served at api/telegram/outbox/stats)
+
+Interactive handler replies keep calling the bot directly — they answer one
+user and must not wait behind a broadcast.
+"""
+import json
+import logging
+import random
+import time
+import uuid
+
+from django.conf import settings
+from kombu.exceptions import OperationalError
+from redis.exceptions import RedisError
+from requests import RequestException
+from telebot.apihelper import ApiException, ApiTelegramException
+from telebot.types import JsonSerializable
+
+from bot.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Priority lanes, highest first
+URGENT = "urgent"
+BILLING = "billing"
+NORMAL = "normal"
+BULK = "bulk"
+LANES = (URGENT, BILLING, NORMAL, BULK)
+
+KEY_PREFIX = "tg_outbox:"
+DELAYED_KEY = f"{KEY_PREFIX}delayed"
+METRICS_KEY = f"{KEY_PREFIX}metrics"
+KICK_KEY = f"{KEY_PREFIX}kick"
+KICK_INTERVAL_SECONDS = 30
+# processing:<worker> holds the message a drainer is working on; its
+# worker:<worker> heartbeat expires WORKER_TTL_SECONDS after the drainer dies
+PROCESSING_PREFIX = f"{KEY_PREFIX}processing:"
+WORKER_PREFIX = f"{KEY_PREFIX}worker:"
+WORKER_TTL_SECONDS = 30
+IDLE_POLL_SECONDS = 0.2
+
+MAX_BACKOFF_SECONDS = 300
+# 429s are not the message's fault, but a chat that keeps throttling is dropped
+MAX_RATE_LIMITED = 10
+# Per-chat buckets kept in memory before idle (full) ones are pruned
+MAX_CHAT_BUCKETS = 10000
+
+
+def lane_key(lane):
+    return f"{KEY_PREFIX}lane:{lane}"
+
+
+def _redis():
+    from bot.utils import redis_client
+
+    return redis_client
+
+
+# =============================================================================
+# Enqueue
+# =============================================================================
+
+def _envelope(method, chat_id, kwargs, lane, fallback):
+    if lane not in LANES:
+        raise ValueError(f"Unknown lane: {lane}")
+    kwargs = {
+        key: value.to_json() if isinstance(value, JsonSerializable) else value
+        for key, value in kwargs.items()
+    }
+    return {
+        "id": uuid.uuid4().hex,
+        "method": method,
+        "chat_id": chat_id,
+        "kwargs": kwargs,
+        "lane": lane,
+        "fallback": fallback,
+        "attempts": 0,
+        "rate_limited": 0,
+        "enqueued_at": time.time(),
+    }
+
+
+def _enqueue(envelope):
+    if not settings.TELEGRAM_OUTBOX_ENABLED:
+        return _send_now(envelope)
+    try:
+        raw = json.dumps(envelope)
+    except (TypeError, ValueError) as e:
+        logger.warning(f"[message_gateway] Unserialisable {envelope['method']} for {envelope['chat_id']}, sending now: {e}")
+        return _send_now(envelope)
+
+    try:
+        client = _redis()
+        pipe = client.pipeline()
+        pipe.rpush(lane_key(envelope["lane"]), raw)
+        pipe.hincrby(METRICS_KEY, f"enqueued:{envelope['lane']}", 1)
+        pipe.execute()
+        if client.set(KICK_KEY, 1, nx=True, ex=KICK_INTERVAL_SECONDS):
+            _kick()
+    except RedisError as e:
+        logger.warning(f"[message_gateway] Queue unavailable, sending now: {e}")
+        return _send_now(envelope)
+    return True
+
+
+def _kick():
+    """Start a drainer in case none is running (the beat entry is the backstop)."""
+    try:
+        from bot.tasks import deliver_outbound_messages
+
+        deliver_outbound_messages.delay()
+    except OperationalError as e:
+        logger.warning(f"[message_gateway] Could not start drainer: {e}")
+
+
+def _send_now(envelope):
+    from bot.bot_config import bot
+
+    try:
+        _call(bot, envelope)
+        return True
+    except (ApiException, RequestException, OSError) as e:
+        logger.warning(f"[message_gateway] Direct {envelope['method']} to {envelope['chat_id']} failed: {e}")
+    except Exception:
+        # Callers rely on send_message never raising
+        logger.exception(f"[message_gateway] Direct {envelope['method']} to {envelope['chat_id']} failed")
+    return False
+
+
+def send_message(chat_id, text, lane=NORMAL, fallback=None, **kwargs):
+    """Queue bot.send_message(chat_id, text, **kwargs). Returns False only if
+    the message could be neither queued nor sent."""
+    kwargs["text"] = text
+    return _enqueue(_envelope("send_message", chat_id, kwargs, lane, fallback))
+
+
+def send_audio(chat_id, audio=None, audio_path=None, lane=BULK, fallback=None, **kwargs):
+    """
+    Queue bot.send_audio. Pass a Telegram file_id/URL as `audio`, or a local
+    file as `audio_path` (opened at delivery time). `fallback` is a
+    send_message kwargs dict sent instead if delivery fails for good.
+    """
+    if audio is not None:
+        kwargs["audio"] = audio
+    if audio_path is not None:
+        kwargs["audio_path"] = audio_path
+    return _enqueue(_envelope("send_audio", chat_id, kwargs, lane, fallback))
+
+
+def _call(bot, envelope):
+    kwargs = dict(envelope["kwargs"])
+    path = kwargs.pop("audio_path", None)
+    method = getattr(bot, envelope["method"])
+    if path is None:
+        return method(envelope["chat_id"], **kwargs)
+    with open(path, "rb") as audio_file:
+        return method(envelope["chat_id"], audio=audio_file, **kwargs)
+
+
+# =============================================================================
+# Delivery
+# =============================================================================
+
+class OutboxWorker:
+    """Drains the lanes. Run one at a time (bot.tasks.deliver_outbound_messages)."""
+
+    def __init__(self, client=None, bot=None, global_rate=None, chat_rate=None, chat_burst=None,
+                 max_attempts=None, clock=time.time, sleep=time.sleep):
+        self.client = client or _redis()
+        if bot is None:
+            from bot.bot_config import bot
+        self.bot = bot
+        global_rate = global_rate or settings.TELEGRAM_GLOBAL_MESSAGES_PER_SECOND
+        self.chat_rate = chat_rate or settings.TELEGRAM_CHAT_MESSAGES_PER_SECOND
+        self.chat_burst = chat_burst or settings.TELEGRAM_CHAT_MESSAGE_BURST
+        self.max_attempts = max_attempts or settings.TELEGRAM_OUTBOX_MAX_ATTEMPTS
+        self._clock = clock
+        self._sleep = sleep
+        self.global_bucket = TokenBucket(global_rate, global_rate, clock=clock, sleep=sleep)
+        self.chat_buckets = {}
+        # Chat -> time its last deferred message is due; later ones queue behind it
+        self.chat_next_due = {}
+        self.worker_id = uuid.uuid4().hex
+        self.processing_key = f"{PROCESSING_PREFIX}{self.worker_id}"
+        self._heartbeat_at = None
+
+    def run(self, max_seconds):
+        """Deliver until `max_seconds` have passed. Returns the number sent."""
+        deadline = self._clock() + max_seconds
+        sent = 0
+        self.heartbeat()
+        self.recover()
+        try:
+            while self._clock() < deadline:
+                self.heartbeat()
+                self.promote_due()
+                raw = self.claim()
+                if raw is None:
+                    self._sleep(IDLE_POLL_SECONDS)
+                    continue
+                if self.deliver(json.loads(raw)):
+                    sent += 1
+                self.client.lrem(self.processing_key, 1, raw)
+        finally:
+            self.client.delete(f"{WORKER_PREFIX}{self.worker_id}")
+        return sent
+
+    def claim(self):
+        """Move the next message, highest lane first, into this drainer's
+        processing list. Returns it, or None if every lane is empty."""
+        for lane in LANES:
+            raw = self.client.lmove(lane_key(lane), self.processing_key, "LEFT", "RIGHT")
+            if raw is not None:
+                return raw
+        return None
+
+    def heartbeat(self):
+        now = self._clock()
+        if self._heartbeat_at is None or now - self._heartbeat_at >= WORKER_TTL_SECONDS / 3:
+            self.client.set(f"{WORKER_PREFIX}{self.worker_id}", 1, ex=WORKER_TTL_SECONDS)
+            self._heartbeat_at = now
+
+    def recover(self):
+        """Put messages held by drainers that died mid-send back at the head
+        of their lanes. Returns how many were recovered."""
+        recovered = 0
+        for key in self.client.scan_iter(match=f"{PROCESSING_PREFIX}*", count=100):
+            key = key.decode() if isinstance(key, bytes) else key
+            worker_id = key[len(PROCESSING_PREFIX):]
+            if worker_id == self.worker_id or self.client.exists(f"{WORKER_PREFIX}{worker_id}"):
+                continue
+            while True:
+                raw = self.client.lindex(key, -1)
+                if raw is None:
+                    break
+                self.client.lmove(key, lane_key(json.loads(raw)["lane"]), "RIGHT", "LEFT")
+                recovered += 1
+        if recovered:
+            logger.warning(f"[message_gateway] Recovered {recovered} messages from a stopped drainer")
+        return recovered
+
+    def promote_due(self):
+        """Move delayed messages whose time has come back to the head of their
+        lane — they were queued before anything still waiting there."""
+        due = self.client.zrangebyscore(DELAYED_KEY, "-inf", self._clock(), start=0, num=500)
+        for raw in reversed(due):
+            # zrem decides the race if two drainers ever overlap
+            if self.client.zrem(DELAYED_KEY, raw):
+                self.client.lpush(lane_key(json.loads(raw)["lane"]), raw)
+
+    def _defer(self, envelope, seconds, counter):
+        due = self._clock() + seconds
+        chat_id = envelope["chat_id"]
+        due = max(due, self.chat_next_due.get(chat_id, 0) + 1.0 / self.chat_rate)
+        if len(self.chat_next_due) >= MAX_CHAT_BUCKETS:
+            now = self._clock()
+            self.chat_next_due = {key: at for key, at in self.chat_next_due.items() if at > now}
+        self.chat_next_due[chat_id] = due
+        envelope["due"] = due
+        self.client.zadd(DELAYED_KEY, {json.dumps(envelope): due})
+        self._count(counter)
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= MAX_CHAT_BUCKETS:
+                self.chat_buckets = {key: b for key, b in self.chat_buckets.items() if not b.full}
+            bucket = self.chat_buckets[chat_id] = TokenBucket(
+                self.chat_rate, self.chat_burst, clock=self._clock, sleep=self._sleep
+            )
+        return bucket
+
+    def deliver(self, envelope):
+        """Send one message, or schedule its retry. Returns True if sent."""
+        chat_id = envelope["chat_id"]
+        now = self._clock()
+        # A message coming back from the delayed set already holds its turn
+        if envelope.pop("due", None) is None and self.chat_next_due.get(chat_id, 0) > now:
+            # Earlier messages for this chat are waiting; keep the order
+            self._defer(envelope, 0, "deferred")
+            return False
+        wait = self._chat_bucket(chat_id).try_acquire()
+        if wait:
+            self._defer(envelope, wait, "deferred")
+            return False
+
+        self.global_bucket.acquire()
+        lane = envelope["lane"]
+        try:
+            _call(self.bot, envelope)
+        except ApiTelegramException as e:
+            if e.error_code == 429:
+                retry_after = (e.result_json.get("parameters") or {}).get("retry_after", 1)
+                self.global_bucket.drain()
+                envelope["rate_limited"] += 1
+                if envelope["rate_limited"] <= MAX_RATE_LIMITED:
+                    logger.info(f"[message_gateway] 429 for {chat_id}, retrying in {retry_after}s")
+                    self._defer(envelope, float(retry_after), "rate_limited")
+                    return False
+                return self._give_up(envelope, e)
+            if e.error_code >= 500:
+                return self._retry(envelope, e)
+            return self._give_up(envelope, e)
+        except (FileNotFoundError, IsADirectoryError, PermissionError) as e:
+            # Missing/unreadable audio file — retrying will not help
+            return self._give_up(envelope, e)
+        except (ApiException, RequestException, OSError) as e:
+            return self._retry(envelope, e)
+        except Exception as e:
+            # A bug, not a delivery failure: drop it rather than retry it forever
+            logger.exception(f"[message_gateway] Unexpected error delivering to {chat_id}")
+            return self._give_up(envelope, e)
+
+        pipe = self.client.pipeline()
+        pipe.hincrby(METRICS_KEY, f"sent:{lane}", 1)
+        pipe.hincrbyfloat(METRICS_KEY, f"latency_sum:{lane}", max(0.0, time.time() - envelope["enqueued_at"]))
+        pipe.execute()
+        return True
+
+    def _retry(self, envelope, error):
+        envelope["attempts"] += 1
+        if envelope["attempts"] >= self.max_attempts:
+            return self._give_up(envelope, error)
+        backoff = min(MAX_BACKOFF_SECONDS, 2 ** envelope["attempts"]) * random.uniform(0.5, 1.5)
+        logger.warning(
+            f"[message_gateway] {envelope['method']} to {envelope['chat_id']} failed "
+            f"(attempt {envelope['attempts']}/{self.max_attempts}), retrying in {backoff:.0f}s: {error}"
+        )
+        self._defer(envelope, backoff, "retried")
+        return False
+
+    def _give_up(self, envelope, error):
+        logger.warning(f"[message_gateway] Dropping {envelope['method']} to {envelope['chat_id']}: {error}")
+        self._count(f"failed:{envelope['lane']}")
+        fallback = envelope.get("fallback")
+        if fallback:
+            fallback = dict(fallback)
+            text = fallback.pop("text")
+            send_message(envelope["chat_id"], text, lane=envelope["lane"], **fallback)
+        return False
+
+    def _count(self, counter):
+        self.client.hincrby(METRICS_KEY, counter, 1)
+
+
+# =============================================================================
+# Metrics
+# =============================================================================
+
+def stats(client=None):
+    """Queue depth per lane, delayed count, counters and mean latency per lane."""
+    client = client or _redis()
+    pipe = client.pipeline()
+    for lane in LANES:
+        pipe.llen(lane_key(lane))
+    pipe.zcard(DELAYED_KEY)
+    pipe.hgetall(METRICS_KEY)
+    results = pipe.execute()
+
+    counters = {
+        (key.decode() if isinstance(key, bytes) else key): float(value)
+        for key, value in results[-1].items()
+    }
+    lanes = {}
+    for lane, depth in zip(LANES, results[:len(LANES)]):
+        sent = int(counters.get(f"sent:{lane}", 0))
+        latency_sum = counters.get(f"latency_sum:{lane}", 0.0)
+        lanes[lane] = {
+            "queued": depth,
+            "enqueued": int(counters.get(f"enqueued:{lane}", 0)),
+            "sent": sent,
+            "failed": int(counters.get(f"failed:{lane}", 0)),
+            "avg_latency_seconds": round(latency_sum / sent, 3) if sent else None,
+        }
+    return {
+        "lanes": lanes,
+        "delayed": results[len(LANES)],
+        "deferred": int(counters.get("deferred", 0)),
+        "retried": int(counters.get("retried", 0)),
+        "rate_limited": int(counters.get("rate_limited", 0)),
+    }
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.13 on 2026-10-18 09:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bot", "0035_callrecording_call_summary_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RetellWebhookEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("call_id", models.CharField(max_length=255)),
+                ("event", models.CharField(max_length=50)),
+                ("payload", models.TextField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("processed", "Processed"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                    ),
+                ),
+                ("attempts", models.IntegerField(default=0)),
+                ("error_message", models.TextField(blank=True, default="")),
+                ("received_at", models.DateTimeField(auto_now_add=True)),
+                ("processed_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["call_id", "status"],
+                        name="bot_retellw_call_id_35d4ef_idx",
+                    ),
+                    models.Index(
+                        fields=["status", "received_at"],
+                        name="bot_retellw_status_2be6bd_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
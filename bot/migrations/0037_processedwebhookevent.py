@@ -0,0 +1,32 @@
+# Generated by Django 4.2.13 on 2026-10-18 09:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bot", "0036_retellwebhookevent"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProcessedWebhookEvent",
+            fields=[
+                (
+                    "event_key",
+                    models.CharField(max_length=64, primary_key=True, serialize=False),
+                ),
+                ("call_id", models.CharField(max_length=255)),
+                ("event", models.CharField(max_length=50)),
+                ("processed_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["processed_at"], name="bot_process_process_faf948_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.13 on 2026-10-18 09:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bot", "0037_processedwebhookevent"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CampaignRecipient",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("phone_number", models.CharField(max_length=20)),
+                ("source_row", models.IntegerField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "campaign",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="recipients",
+                        to="bot.campaignlogs",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="campaignrecipient",
+            constraint=models.UniqueConstraint(
+                fields=("campaign", "phone_number"), name="unique_campaign_recipient"
+            ),
+        ),
+    ]
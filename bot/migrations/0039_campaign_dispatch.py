@@ -0,0 +1,97 @@
+# Generated by Django 4.2.13 on 2026-10-18 09:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bot", "0038_campaignrecipient"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CampaignDispatch",
+            fields=[
+                (
+                    "campaign",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="dispatch",
+                        serialize=False,
+                        to="bot.campaignlogs",
+                    ),
+                ),
+                ("user_id", models.BigIntegerField()),
+                ("caller_id", models.CharField(blank=True, max_length=255, null=True)),
+                ("task", models.TextField(blank=True, null=True)),
+                ("pathway_id", models.CharField(blank=True, max_length=300, null=True)),
+                ("recording_requested", models.BooleanField(default=False)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="campaignlogs",
+            name="dispatch_status",
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name="campaignlogs",
+            name="dispatched_calls",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name="CampaignChunk",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("index", models.IntegerField()),
+                ("start", models.IntegerField()),
+                ("size", models.IntegerField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("dispatching", "Dispatching"),
+                            ("dispatched", "Dispatched"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "retell_batch_id",
+                    models.CharField(blank=True, default="", max_length=255),
+                ),
+                ("attempts", models.IntegerField(default=0)),
+                ("error_message", models.TextField(blank=True, default="")),
+                ("dispatched_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "campaign",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="chunks",
+                        to="bot.campaignlogs",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="campaignchunk",
+            constraint=models.UniqueConstraint(
+                fields=("campaign", "index"), name="unique_campaign_chunk"
+            ),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.13 on 2026-10-18 09:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bot", "0039_campaign_dispatch"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="callrecording",
+            name="compressed_path",
+            field=models.CharField(blank=True, default="", max_length=512),
+        ),
+        migrations.AddField(
+            model_name="callrecording",
+            name="content_hash",
+            field=models.CharField(
+                blank=True, db_index=True, default="", max_length=64
+            ),
+        ),
+        migrations.AddField(
+            model_name="callrecording",
+            name="file_size",
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.13 on 2026-10-18 09:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bot", "0040_callrecording_content"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BatchSummary",
+            fields=[
+                (
+                    "batch_id",
+                    models.CharField(max_length=255, primary_key=True, serialize=False),
+                ),
+                ("user_id", models.BigIntegerField()),
+                ("total_calls", models.IntegerField(default=0)),
+                ("completed_calls", models.IntegerField(default=0)),
+                ("total_duration_seconds", models.FloatField(default=0)),
+                ("dtmf_responses", models.IntegerField(default=0)),
+                ("recordings", models.IntegerField(default=0)),
+                ("summary_sent", models.BooleanField(default=False)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
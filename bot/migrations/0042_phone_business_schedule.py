@@ -0,0 +1,23 @@
+# Generated by Django 4.2.13 on 2026-10-18 10:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bot", "0041_batchsummary"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userphonenumber",
+            name="business_days",
+            field=models.CharField(blank=True, default="0123456", max_length=7),
+        ),
+        migrations.AddField(
+            model_name="userphonenumber",
+            name="business_holidays",
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.13 on 2026-10-18 10:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bot", "0042_phone_business_schedule"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="calldetails",
+            name="call_status",
+            field=models.CharField(blank=True, default="", max_length=20),
+        ),
+        migrations.AddField(
+            model_name="calldetails",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name="calldetails",
+            name="call_details",
+            field=models.BinaryField(),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.13 on 2026-10-18 10:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bot", "0043_call_details_store"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="batchcalllogs",
+            name="queued_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.13 on 2026-10-18 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bot", "0044_batchcalllogs_queued_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="batchsummary",
+            name="failed_calls",
+            field=models.IntegerField(default=0),
+        ),
+    ]
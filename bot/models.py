@@ -31,8 +31,12 @@ class CallLogsTable(models.Model):
 
 
 class CallDetails(models.Model):
+    """Latest Retell call object of a call, zlib-compressed JSON
+    (bot.call_details_store)."""
     call_id = models.TextField(primary_key=True)
-    call_details = models.TextField()
+    call_details = models.BinaryField()
+    call_status = models.CharField(max_length=20, blank=True, default="")
+    updated_at = models.DateTimeField(auto_now=True)
 
 
 class TransferCallNumbers(models.Model):
@@ -81,11 +85,37 @@ class BatchCallLogs(models.Model):
     from_number = models.CharField(max_length=255, null=True, blank=True)
     call_status = models.CharField(max_length=50, null=True, blank=True)
     recording_requested = models.BooleanField(default=False)
+    # When bot.campaign_dispatcher handed the call to Retell
+    queued_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"Call {self.call_id} Batch Call: {self.batch_id}"
 
 
+class BatchSummary(models.Model):
+    """Running aggregates for a batch, updated as its calls end
+    (bot.batch_summary), so completion checks and the consolidated summary
+    never re-scan the batch."""
+    batch_id = models.CharField(max_length=255, primary_key=True)
+    user_id = models.BigIntegerField()
+    total_calls = models.IntegerField(default=0)
+    completed_calls = models.IntegerField(default=0)
+    # Calls that were never placed (their campaign chunk gave up)
+    failed_calls = models.IntegerField(default=0)
+    total_duration_seconds = models.FloatField(default=0)
+    dtmf_responses = models.IntegerField(default=0)
+    recordings = models.IntegerField(default=0)
+    summary_sent = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def finished_calls(self):
+        return self.completed_calls + self.failed_calls
+
+    def __str__(self):
+        return f"BatchSummary({self.batch_id}, {self.completed_calls}/{self.total_calls})"
+
+
 class FrequentlyAskedQuestions(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     question = models.CharField(max_length=255)
@@ -139,6 +169,8 @@ class UserPhoneNumber(models.Model):
     business_hours_start = models.TimeField(null=True, blank=True)  # e.g. 09:00
     business_hours_end = models.TimeField(null=True, blank=True)    # e.g. 17:00
     business_hours_timezone = models.CharField(max_length=50, blank=True, default="US/Eastern")
+    business_days = models.CharField(max_length=7, blank=True, default="0123456")  # open weekdays, Monday=0
+    business_holidays = models.JSONField(default=list, blank=True)  # ["2026-12-25", ...] closed all day
 
     class Meta:
         indexes = [
@@ -152,7 +184,7 @@ class UserPhoneNumber(models.Model):
 class PendingDTMFApproval(models.Model):
     """Tracks supervisor approval for DTMF input during single IVR calls.
     Retell custom function calls our endpoint, which creates this record
-    and polls until the bot user approves/rejects via Telegram."""
+    and waits until the bot user approves/rejects via Telegram."""
     call_id = models.CharField(max_length=255)
     user_id = models.BigIntegerField()
     digits = models.CharField(max_length=50)
@@ -255,6 +287,8 @@ class CampaignLogs(models.Model):
     start_date = models.DateTimeField(null=True, blank=True)
     end_date = models.DateTimeField(null=True, blank=True)
     batch_id = models.CharField(max_length=255, null=True, blank=True)
+    dispatched_calls = models.IntegerField(default=0)
+    dispatch_status = models.CharField(max_length=20, null=True, blank=True)
 
     def __str__(self):
         return self.campaign_name
@@ -312,6 +346,10 @@ class CallRecording(models.Model):
     batch_id = models.CharField(max_length=255, blank=True, default="")
     retell_url = models.URLField(max_length=1024, blank=True, default="")
     file_path = models.CharField(max_length=512, blank=True, default="")
+    # sha256 of the original audio; files are stored content-addressed by it
+    content_hash = models.CharField(max_length=64, blank=True, default="", db_index=True)
+    file_size = models.BigIntegerField(default=0)
+    compressed_path = models.CharField(max_length=512, blank=True, default="")
     token = models.CharField(max_length=128, unique=True, db_index=True)
     downloaded = models.BooleanField(default=False)
     transcript_text = models.TextField(blank=True, default="")
@@ -328,3 +366,119 @@ class CallRecording(models.Model):
     def __str__(self):
         return f"Recording({self.call_id}, downloaded={self.downloaded})"
 
+
+
+class RetellWebhookEvent(models.Model):
+    """Durable inbox for raw Retell webhook deliveries.
+    The webhook view persists the event and returns immediately; a worker
+    drains pending events per call_id in arrival order."""
+    call_id = models.CharField(max_length=255)
+    event = models.CharField(max_length=50)
+    payload = models.TextField()
+    status = models.CharField(
+        max_length=20, default="pending",
+        choices=[("pending", "Pending"), ("processed", "Processed"), ("failed", "Failed")],
+    )
+    attempts = models.IntegerField(default=0)
+    error_message = models.TextField(blank=True, default="")
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["call_id", "status"]),
+            models.Index(fields=["status", "received_at"]),
+        ]
+
+    def __str__(self):
+        return f"RetellWebhookEvent({self.event}, call={self.call_id}, status={self.status})"
+
+
+class ProcessedWebhookEvent(models.Model):
+    """Idempotency ledger for Retell webhooks. A row is claimed before an
+    event's handlers run, so retried deliveries are dropped on the PK lookup."""
+    event_key = models.CharField(max_length=64, primary_key=True)
+    call_id = models.CharField(max_length=255)
+    event = models.CharField(max_length=50)
+    processed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["processed_at"]),
+        ]
+
+    def __str__(self):
+        return f"ProcessedWebhookEvent({self.event}, call={self.call_id})"
+
+
+class CampaignRecipient(models.Model):
+    """One E.164 recipient of a bulk IVR campaign, written by the streaming
+    importer in bot.recipient_import instead of a str(list) in call_data."""
+    campaign = models.ForeignKey(
+        CampaignLogs, on_delete=models.CASCADE, related_name="recipients"
+    )
+    phone_number = models.CharField(max_length=20)
+    source_row = models.IntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["campaign", "phone_number"], name="unique_campaign_recipient"
+            ),
+        ]
+
+    def __str__(self):
+        return f"CampaignRecipient({self.phone_number}, campaign={self.campaign_id})"
+
+
+class CampaignDispatch(models.Model):
+    """Call parameters of a bulk IVR campaign, kept so bot.campaign_dispatcher
+    can resume sending its chunks after a worker crash."""
+    campaign = models.OneToOneField(
+        CampaignLogs, on_delete=models.CASCADE, primary_key=True, related_name="dispatch"
+    )
+    user_id = models.BigIntegerField()
+    caller_id = models.CharField(max_length=255, null=True, blank=True)
+    task = models.TextField(null=True, blank=True)
+    pathway_id = models.CharField(max_length=300, null=True, blank=True)
+    recording_requested = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"CampaignDispatch({self.campaign_id})"
+
+
+class CampaignChunk(models.Model):
+    """One Retell batch call covering recipients [start, start + size) of a
+    campaign, in CampaignRecipient id order."""
+    campaign = models.ForeignKey(
+        CampaignLogs, on_delete=models.CASCADE, related_name="chunks"
+    )
+    index = models.IntegerField()
+    start = models.IntegerField()
+    size = models.IntegerField()
+    status = models.CharField(
+        max_length=20, default="pending",
+        choices=[
+            ("pending", "Pending"),
+            ("dispatching", "Dispatching"),
+            ("dispatched", "Dispatched"),
+            ("failed", "Failed"),
+        ],
+    )
+    retell_batch_id = models.CharField(max_length=255, blank=True, default="")
+    attempts = models.IntegerField(default=0)
+    error_message = models.TextField(blank=True, default="")
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["campaign", "index"], name="unique_campaign_chunk"
+            ),
+        ]
+
+    def __str__(self):
+        return f"CampaignChunk({self.campaign_id} #{self.index}, status={self.status})"
@@ -0,0 +1,128 @@
+"""
+Phone Index — process-local map of active purchased numbers to their owner
+and settings, for inbound routing without a database round-trip.
+
+  1. The first lookup in a process loads every active UserPhoneNumber in
+     one query into a dict keyed by the normalised number
+  2. Every save or delete of a UserPhoneNumber bumps `phone_index:version`
+     in Redis once the transaction commits (signal handlers below)
+  3. Lookups compare the loaded version with Redis at most once every
+     VERSION_CHECK_SECONDS and reload the whole index when it moved
+
+Lookups fall back to the database when Redis is unavailable.
+Queryset .update() / .bulk_*() on UserPhoneNumber skip the signals — call
+invalidate() after them.
+"""
+import datetime
+import logging
+import re
+import threading
+import time
+from typing import NamedTuple
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from redis.exceptions import RedisError
+
+from bot.models import UserPhoneNumber
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "phone_index:version"
+VERSION_CHECK_SECONDS = 1.0
+
+_FIELDS = (
+    "phone_number", "user_id", "voicemail_enabled", "forwarding_enabled", "forwarding_number",
+    "business_hours_enabled", "business_hours_start", "business_hours_end", "business_hours_timezone",
+    "business_days", "business_holidays",
+)
+
+
+class PhoneEntry(NamedTuple):
+    phone_number: str
+    user_id: int
+    voicemail_enabled: bool
+    forwarding_enabled: bool
+    forwarding_number: str
+    business_hours_enabled: bool
+    business_hours_start: datetime.time | None
+    business_hours_end: datetime.time | None
+    business_hours_timezone: str
+    business_days: str
+    business_holidays: list
+
+
+def normalize(number):
+    """Digits and a leading "+", so "+1 (555) 010-2000" matches "+15550102000"."""
+    return re.sub(r"[^\d+]", "", number or "")
+
+
+def _redis():
+    from bot.utils import redis_client
+
+    return redis_client
+
+
+# (version, {number: PhoneEntry}, monotonic time the version was last checked)
+_index = None
+_reload_lock = threading.Lock()
+
+
+def _load(version):
+    global _index
+    rows = UserPhoneNumber.objects.filter(is_active=True).values_list(*_FIELDS)
+    _index = (version, {normalize(row[0]): PhoneEntry(*row) for row in rows}, time.monotonic())
+    logger.info(f"[phone_index] Loaded {len(_index[1])} numbers at version {version}")
+
+
+def _current():
+    """The up-to-date index, reloading it if another process changed a number."""
+    global _index
+    index = _index
+    if index is not None and time.monotonic() - index[2] < VERSION_CHECK_SECONDS:
+        return index[1]
+
+    version = int(_redis().get(VERSION_KEY) or 0)
+    with _reload_lock:
+        if _index is None or _index[0] != version:
+            _load(version)
+        else:
+            _index = (version, _index[1], time.monotonic())
+        return _index[1]
+
+
+def lookup(number):
+    """PhoneEntry of the active purchased number, or None."""
+    if not number:
+        return None
+    try:
+        return _current().get(normalize(number))
+    except RedisError as e:
+        logger.warning(f"[phone_index] Version check failed, reading the database: {e}")
+        row = UserPhoneNumber.objects.filter(phone_number=number, is_active=True).values_list(*_FIELDS).first()
+        return PhoneEntry(*row) if row else None
+
+
+def forget():
+    """Drop this process's copy; the next lookup reloads it."""
+    global _index
+    _index = None
+
+
+def invalidate():
+    """Make every process reload its index (after this transaction commits)."""
+    def bump():
+        forget()
+        try:
+            _redis().incr(VERSION_KEY)
+        except RedisError as e:
+            logger.warning(f"[phone_index] Could not bump version: {e}")
+
+    transaction.on_commit(bump)
+
+
+@receiver(post_save, sender=UserPhoneNumber, dispatch_uid="phone_index_save")
+@receiver(post_delete, sender=UserPhoneNumber, dispatch_uid="phone_index_delete")
+def _number_changed(sender, **kwargs):
+    invalidate()
@@ -0,0 +1,51 @@
+"""
+Rate limiting primitives shared by the outbound pipelines
+(bot.campaign_dispatcher, bot.message_gateway).
+"""
+import time
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` (capped at capacity) are available, then take them."""
+        tokens = min(float(tokens), self.capacity)
+        self._refill()
+        while self.tokens < tokens:
+            # Floor the sleep: float rounding can leave a deficit too small to ever refill
+            self._sleep(max((tokens - self.tokens) / self.rate, 0.001))
+            self._refill()
+        self.tokens -= tokens
+
+    def try_acquire(self, tokens=1):
+        """Take `tokens` if available and return 0, else return the seconds to wait."""
+        tokens = min(float(tokens), self.capacity)
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+    def drain(self):
+        """Empty the bucket, e.g. after the upstream reported a rate limit."""
+        self._refill()
+        self.tokens = 0.0
+
+    @property
+    def full(self):
+        self._refill()
+        return self.tokens >= self.capacity
@@ -0,0 +1,325 @@
+"""
+Recipient Import — streaming bulk IVR recipient lists into CampaignRecipient.
+
+Pipeline (used by get_bulk_call_recipient):
+  1. Telegram documents are downloaded in chunks into a spooled temp file
+  2. Rows are parsed incrementally (csv reader / openpyxl read-only mode)
+  3. Every number is normalised to E.164 with phonenumbers; bad rows are
+     reported back with their row number
+  4. Duplicates are dropped and recipients are inserted in batches
+
+Only the de-duplication set grows with the list; file contents and parsed
+rows are never held in memory as a whole.
+"""
+import ast
+import csv
+import io
+import logging
+import re
+import tempfile
+import zipfile
+
+import phonenumbers
+import requests
+from django.db import transaction
+
+from bot.bot_config import bot
+from bot.models import CampaignRecipient
+from TelegramBot import http_transport
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_FILE_URL = "https://api.telegram.org/file/bot{token}/{file_path}"
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Spool to disk once an upload grows beyond this many bytes
+SPOOL_MAX_MEMORY = 1024 * 1024
+INSERT_BATCH_SIZE = 1000
+# Row errors listed back to the user; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+_HEADER_KEYWORDS = ("phone", "number", "mobile", "msisdn", "to_number", "recipient")
+_DIGITS_RE = re.compile(r"\d")
+_MARKDOWN_CHARS = str.maketrans("", "", "*_`[")
+
+
+class RecipientImportError(Exception):
+    """Upload could not be read at all (download failure, bad file format)."""
+
+
+class RecipientLimitExceeded(RecipientImportError):
+    def __init__(self, limit):
+        super().__init__(f"More than {limit} recipients")
+        self.limit = limit
+
+
+# =============================================================================
+# Normalisation
+# =============================================================================
+
+def normalize_number(raw, default_region=None):
+    """
+    Return the E.164 form of a phone number or raise ValueError with the reason.
+    Numbers must carry a country code unless default_region is given.
+    """
+    number = str(raw).strip()
+    if not number:
+        raise ValueError("empty")
+    if number.count("+") > 1 or (number.count("+") == 1 and not number.startswith("+")):
+        raise ValueError("misplaced '+'")
+
+    try:
+        parsed = phonenumbers.parse(number, default_region)
+    except phonenumbers.NumberParseException as e:
+        if e.error_type == phonenumbers.NumberParseException.INVALID_COUNTRY_CODE:
+            raise ValueError("missing country code") from None
+        raise ValueError("not a phone number") from None
+
+    if not phonenumbers.is_valid_number(parsed):
+        raise ValueError("not a valid number")
+    return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
+
+
+# =============================================================================
+# Row sources — each yields (row_number, [cell, ...])
+# =============================================================================
+
+def iter_text_rows(text):
+    for row_number, line in enumerate(io.StringIO(text), start=1):
+        yield row_number, [line.strip()]
+
+
+def iter_csv_rows(fileobj):
+    stream = io.TextIOWrapper(fileobj, encoding="utf-8-sig", errors="replace", newline="")
+    sample = stream.read(4096)
+    stream.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel
+    try:
+        yield from enumerate(csv.reader(stream, dialect), start=1)
+    finally:
+        stream.detach()
+
+
+def iter_xlsx_rows(fileobj):
+    try:
+        from openpyxl import load_workbook
+        from openpyxl.utils.exceptions import InvalidFileException
+    except ImportError:
+        raise RecipientImportError("XLSX support requires openpyxl") from None
+
+    try:
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    except (InvalidFileException, zipfile.BadZipFile, KeyError, ValueError, OSError) as e:
+        raise RecipientImportError(f"Could not open spreadsheet: {e}") from None
+
+    try:
+        sheet = workbook.active
+        for row_number, row in enumerate(sheet.iter_rows(values_only=True), start=1):
+            yield row_number, [_xlsx_cell(value) for value in row]
+    finally:
+        workbook.close()
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return ""
+    # Whole numbers are read back as floats: 14155550100.0 -> "14155550100";
+    # whether that is a full number is up to normalize_number
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def download_document(document):
+    """Stream a Telegram document into a spooled temp file and rewind it."""
+    file_info = bot.get_file(document.file_id)
+    url = TELEGRAM_FILE_URL.format(token=bot.token, file_path=file_info.file_path)
+
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)  # noqa: SIM115 — the caller closes it
+    try:
+        with http_transport.get(url, stream=True, timeout=(10, 60)) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                spool.write(chunk)
+    except requests.RequestException as e:
+        spool.close()
+        raise RecipientImportError(f"Download failed: {e}") from None
+
+    spool.seek(0)
+    return spool
+
+
+def iter_document_rows(document, fileobj):
+    name = (document.file_name or "").lower()
+    if name.endswith(".xlsx") or document.mime_type == (
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    ):
+        return iter_xlsx_rows(fileobj)
+    return iter_csv_rows(fileobj)
+
+
+# =============================================================================
+# Import
+# =============================================================================
+
+def _is_header(row):
+    cells = [cell.strip().lower() for cell in row]
+    has_keyword = any(keyword in cell for cell in cells for keyword in _HEADER_KEYWORDS)
+    return has_keyword and not any(_DIGITS_RE.search(cell) for cell in cells)
+
+
+def _phone_column(header):
+    for index, cell in enumerate(header):
+        if any(keyword in cell.strip().lower() for keyword in _HEADER_KEYWORDS):
+            return index
+    return None
+
+
+def _pick_cell(row, column):
+    if column is not None:
+        return row[column] if column < len(row) else ""
+    for cell in row:
+        if len(_DIGITS_RE.findall(cell)) >= 7:
+            return cell
+    return next((cell for cell in row if cell.strip()), "")
+
+
+def import_recipients(campaign_id, rows, max_contacts, default_region=None):
+    """
+    Replace the recipients of a campaign with the numbers read from rows.
+    Returns {"imported", "duplicates", "invalid", "errors": [(row, value, reason)]}.
+    Raises RecipientLimitExceeded (nothing is stored) past max_contacts.
+    """
+    seen = set()
+    batch = []
+    errors = []
+    invalid = 0
+    duplicates = 0
+    column = None
+
+    with transaction.atomic():
+        CampaignRecipient.objects.filter(campaign_id=campaign_id).delete()
+
+        for row_number, row in rows:
+            if not any(cell.strip() for cell in row):
+                continue
+            if row_number == 1 and _is_header(row):
+                column = _phone_column(row)
+                continue
+
+            raw = _pick_cell(row, column)
+            try:
+                number = normalize_number(raw, default_region)
+            except ValueError as e:
+                invalid += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append((row_number, raw.strip()[:32], str(e)))
+                continue
+
+            if number in seen:
+                duplicates += 1
+                continue
+            if len(seen) >= max_contacts:
+                raise RecipientLimitExceeded(max_contacts)
+            seen.add(number)
+
+            batch.append(CampaignRecipient(
+                campaign_id=campaign_id, phone_number=number, source_row=row_number,
+            ))
+            if len(batch) >= INSERT_BATCH_SIZE:
+                CampaignRecipient.objects.bulk_create(batch)
+                batch = []
+
+        if batch:
+            CampaignRecipient.objects.bulk_create(batch)
+
+    logger.info(
+        f"[recipient_import] campaign={campaign_id} imported={len(seen)} "
+        f"duplicates={duplicates} invalid={invalid}"
+    )
+    return {
+        "imported": len(seen),
+        "duplicates": duplicates,
+        "invalid": invalid,
+        "errors": errors,
+    }
+
+
+def import_text_recipients(campaign_id, text, max_contacts):
+    return import_recipients(campaign_id, iter_text_rows(text), max_contacts)
+
+
+def import_document_recipients(campaign_id, document, max_contacts):
+    with download_document(document) as fileobj:
+        return import_recipients(
+            campaign_id, iter_document_rows(document, fileobj), max_contacts
+        )
+
+
+def format_import_report(result):
+    """Human-readable summary of skipped rows for the Telegram chat."""
+    lines = [
+        f"Imported {result['imported']} recipients.",
+    ]
+    if result["duplicates"]:
+        lines.append(f"Skipped {result['duplicates']} duplicates.")
+    if result["invalid"]:
+        lines.append(f"Skipped {result['invalid']} invalid rows:")
+        for row_number, value, reason in result["errors"]:
+            value = value.translate(_MARKDOWN_CHARS)
+            lines.append(f"  Row {row_number}: {value or '(blank)'} — {reason}")
+        hidden = result["invalid"] - len(result["errors"])
+        if hidden > 0:
+            lines.append(f"  … and {hidden} more")
+    return "\n".join(lines)
+
+
+# =============================================================================
+# Readers
+# =============================================================================
+
+def campaign_recipient_tasks(campaign_id, chunk_size=INSERT_BATCH_SIZE):
+    """Recipients in upload order as call_data entries, yielded in lists of
+    up to chunk_size so a large campaign is never loaded at once."""
+    numbers = (
+        CampaignRecipient.objects.filter(campaign_id=campaign_id)
+        .order_by("id")
+        .values_list("phone_number", flat=True)
+        .iterator(chunk_size=chunk_size)
+    )
+    chunk = []
+    for number in numbers:
+        chunk.append({"phone_number": number})
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def recipient_preview(campaign_id, limit=20):
+    return list(
+        CampaignRecipient.objects.filter(campaign_id=campaign_id)
+        .order_by("id")
+        .values_list("phone_number", flat=True)[:limit]
+    )
+
+
+def scheduled_call_recipients(scheduled_call):
+    """
+    call_data for a ScheduledCalls row: None when the campaign has
+    CampaignRecipient rows (plan_campaign reads those itself), otherwise the
+    legacy str(list) stored in call_data for rows created before them.
+    """
+    if scheduled_call.campaign_id_id and CampaignRecipient.objects.filter(
+        campaign_id=scheduled_call.campaign_id_id
+    ).exists():
+        return None
+
+    call_data = ast.literal_eval(scheduled_call.call_data or "[]")
+    if not isinstance(call_data, list):
+        raise TypeError("call_data must be a list.")
+    return call_data
@@ -0,0 +1,327 @@
+"""
+Recording Pipeline — download, store, transcode and serve call recordings.
+
+  1. fetch_recording() streams the Retell file into a temp file next to its
+     destination in RECORDING_DOWNLOAD_CHUNK_SIZE reads, hashing as it goes,
+     then renames it atomically to a content-addressed path
+     (recordings/<sha[:2]>/<sha>.wav) — readers never see a partial file and
+     identical audio is stored once
+  2. A process-wide semaphore bounds concurrent downloads; download_many()
+     fetches a batch on RECORDING_DOWNLOAD_CONCURRENCY threads. A Redis lock
+     per call keeps the Celery task, the web view and batch delivery from
+     fetching the same recording twice
+  3. transcode() converts the WAV to RECORDING_TRANSCODE_FORMAT (mp3/opus)
+     with ffmpeg when it is installed; delivery_path() prefers that copy for
+     Telegram uploads and the web player
+  4. Files may have been moved to the cold tier; is_available() and
+     delivery_path() bring them back (bot.recording_storage)
+  5. recording_response() answers HTTP Range requests — through nginx
+     (X-Accel-Redirect) when RECORDING_ACCEL_REDIRECT_PREFIX is set, else by
+     streaming the file in RECORDING_STREAM_CHUNK_SIZE reads. Under ASGI
+     (uvicorn, backend/server.py) the body is an async iterator reading off
+     the event loop; Django would otherwise load a sync file body whole
+     before sending it
+"""
+import hashlib
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse
+from redis.exceptions import LockError, RedisError
+
+from bot.recording_storage import ensure_local, recordings_dir, storage_key
+from TelegramBot import http_transport
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {
+    ".wav": "audio/wav",
+    ".mp3": "audio/mpeg",
+    ".ogg": "audio/ogg",
+}
+TRANSCODE_ARGS = {
+    "mp3": (".mp3", ["-codec:a", "libmp3lame"]),
+    "opus": (".ogg", ["-codec:a", "libopus", "-application", "voip"]),
+}
+DOWNLOAD_LOCK_TIMEOUT = 300
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+_download_slots = threading.BoundedSemaphore(settings.RECORDING_DOWNLOAD_CONCURRENCY)
+
+
+def content_path(digest, ext):
+    return os.path.join(recordings_dir(), digest[:2], f"{digest}{ext}")
+
+
+# =============================================================================
+# Download
+# =============================================================================
+
+def fetch_recording(call_id, url):
+    """
+    Download `url` to its content-addressed path.
+    Returns (path, sha256 hex digest, size in bytes); raises on failure.
+    """
+    os.makedirs(recordings_dir(), exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    with _download_slots:
+        fd, temp_path = tempfile.mkstemp(prefix=f"{call_id[:32]}.", suffix=".part", dir=recordings_dir())
+        try:
+            with os.fdopen(fd, "wb") as f:
+                with http_transport.get(url, timeout=(10, 60), stream=True) as resp:
+                    resp.raise_for_status()
+                    for chunk in resp.iter_content(chunk_size=settings.RECORDING_DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+
+            path = content_path(digest.hexdigest(), ".wav")
+            if os.path.exists(path):
+                os.remove(temp_path)
+                logger.info(f"[recording] {call_id} is a duplicate of {path}")
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    logger.info(f"[recording] Downloaded {call_id} -> {path} ({size} bytes)")
+    return path, digest.hexdigest(), size
+
+
+def transcode(path, digest):
+    """Compressed copy of a WAV recording, or "" if disabled or unavailable."""
+    target = TRANSCODE_ARGS.get(settings.RECORDING_TRANSCODE_FORMAT)
+    ffmpeg = shutil.which("ffmpeg")
+    if target is None or ffmpeg is None:
+        return ""
+
+    ext, codec_args = target
+    out_path = content_path(digest, ext)
+    if os.path.exists(out_path):
+        return out_path
+
+    temp_path = f"{out_path}.{os.getpid()}.part"
+    command = [
+        ffmpeg, "-nostdin", "-loglevel", "error", "-y", "-i", path,
+        "-ac", "1", *codec_args, "-b:a", settings.RECORDING_TRANSCODE_BITRATE,
+        "-f", "ogg" if ext == ".ogg" else "mp3", temp_path,
+    ]
+    try:
+        subprocess.run(command, check=True, capture_output=True, timeout=120)
+        os.replace(temp_path, out_path)
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"[recording] Transcode of {path} failed: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return ""
+    return out_path
+
+
+def is_available(rec):
+    """True if the recording is on local disk, re-hydrating it from the cold
+    tier (bot.recording_storage) if it was evicted."""
+    return bool(rec.downloaded and ensure_local(rec.file_path))
+
+
+def ensure_recording(rec, url=None):
+    """
+    Make sure `rec` (a CallRecording) is on disk, downloading and transcoding
+    it if needed. Returns True when it is.
+    """
+    url = url or rec.retell_url
+    if is_available(rec):
+        return True
+    if not url:
+        return False
+
+    from bot.utils import redis_client
+
+    lock = redis_client.lock(
+        f"recording_download:{rec.call_id}", timeout=DOWNLOAD_LOCK_TIMEOUT,
+        blocking_timeout=DOWNLOAD_LOCK_TIMEOUT,
+    )
+    try:
+        acquired = lock.acquire()
+    except RedisError as e:
+        logger.warning(f"[recording] Download lock unavailable for {rec.call_id}: {e}")
+        acquired = False
+
+    try:
+        # Someone else may have finished it while we waited
+        rec.refresh_from_db()
+        if is_available(rec):
+            return True
+        try:
+            path, digest, size = fetch_recording(rec.call_id, url)
+        except (http_transport.requests.RequestException, OSError) as e:
+            logger.error(f"[recording] Download failed for {rec.call_id}: {e}")
+            return False
+        rec.file_path = path
+        rec.content_hash = digest
+        rec.file_size = size
+        rec.compressed_path = transcode(path, digest)
+        rec.downloaded = True
+        rec.save(update_fields=["file_path", "content_hash", "file_size", "compressed_path", "downloaded"])
+
+        from bot.batch_recordings import invalidate_batch_page
+
+        invalidate_batch_page(rec.batch_id)
+        return True
+    finally:
+        if acquired:
+            try:
+                lock.release()
+            except (LockError, RedisError):
+                pass
+
+
+def download_many(recordings):
+    """Download every recording that is not stored yet, at bounded concurrency.
+    Returns the recordings that are available afterwards."""
+    recordings = list(recordings)
+    missing = [rec for rec in recordings if not is_available(rec)]
+    if missing:
+        with ThreadPoolExecutor(max_workers=settings.RECORDING_DOWNLOAD_CONCURRENCY) as pool:
+            list(pool.map(ensure_recording, missing))
+    return [rec for rec in recordings if is_available(rec)]
+
+
+def delivery_path(rec):
+    """File to hand to Telegram or the browser: the compressed copy if any."""
+    if rec.compressed_path and ensure_local(rec.compressed_path):
+        return rec.compressed_path
+    return rec.file_path
+
+
+# =============================================================================
+# Serving
+# =============================================================================
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single-range `Range` header, None to serve
+    the whole file, or False when the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        # Absent, malformed or multi-range: RFC 9110 lets us ignore it
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+async def _stream_file(f, start, length, chunk_size):
+    """Async body for ASGI: `length` bytes of f from `start`, each read done
+    on a worker thread. Closes f when done or abandoned."""
+    read = sync_to_async(f.read, thread_sensitive=False)
+    try:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = await read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        f.close()
+
+
+class _RangeFile:
+    """File object limited to `length` bytes from its current offset, for
+    WSGI servers (runserver), which read the body in block_size chunks."""
+
+    def __init__(self, f, length):
+        self._file = f
+        self._remaining = length
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def tell(self):
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+
+def recording_response(request, path, filename):
+    """Serve a recording file, honouring single-range `Range` requests."""
+    ext = os.path.splitext(path)[1]
+    content_type = CONTENT_TYPES.get(ext, "application/octet-stream")
+    disposition_name = f"{filename}{ext}"
+
+    prefix = settings.RECORDING_ACCEL_REDIRECT_PREFIX
+    if prefix:
+        # nginx serves the bytes (and Range) straight from disk
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = f"{prefix.rstrip('/')}/{storage_key(path)}"
+        response["Content-Disposition"] = f'inline; filename="{disposition_name}"'
+        return response
+
+    size = os.path.getsize(path)
+    byte_range = parse_range(request.headers.get("Range"), size)
+    etag = f'"{os.path.basename(path)}-{size}"'
+    if_range = request.headers.get("If-Range")
+    if byte_range and if_range and if_range != etag:
+        byte_range = None
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    start, end = byte_range or (0, size - 1)
+    status = 200 if byte_range is None else 206
+    f = open(path, "rb")  # noqa: SIM115 — closed by the response
+    if isinstance(request, ASGIRequest):
+        body = _stream_file(f, start, end - start + 1, settings.RECORDING_STREAM_CHUNK_SIZE)
+    elif byte_range is None:
+        body = f
+    else:
+        f.seek(start)
+        body = _RangeFile(f, end - start + 1)
+    response = FileResponse(body, status=status, content_type=content_type)
+    response.block_size = settings.RECORDING_STREAM_CHUNK_SIZE
+    response["Content-Length"] = str(end - start + 1)
+    response["Content-Disposition"] = f'inline; filename="{disposition_name}"'
+    if byte_range is not None:
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    return response
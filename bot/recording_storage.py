@@ -0,0 +1,282 @@
+"""
+Recording Storage — hot local disk in front of an optional cold object store.
+
+Recording files live under MEDIA_ROOT/recordings (the hot tier); the key of
+a file is its path relative to that directory, so content-addressed files
+(bot.recording_pipeline) and legacy `<call_id>.wav` files are handled alike:
+
+  1. ensure_local() is called on every access — it bumps the file's mtime,
+     which is the LRU clock, and re-hydrates a file that was evicted by
+     copying it back from the cold tier (atomic rename, like downloads)
+  2. enforce_budget() keeps the hot tier under RECORDING_HOT_BUDGET_BYTES:
+     least recently used files are copied to the cold tier (if not there
+     yet) and removed locally until usage drops below the low watermark.
+     Without a cold tier, evicted files are fetched from Retell again
+  3. apply_retention() deletes recordings older than RECORDING_RETENTION_DAYS
+     from both tiers, once no newer CallRecording shares the file
+
+Cold tiers: S3ColdStorage (S3 or any S3-compatible store such as MinIO) and
+FilesystemColdStorage (a directory; local setups and tests), selected by
+RECORDING_COLD_STORAGE.
+"""
+import logging
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Evict down to this fraction of the budget, so eviction is not re-triggered
+# by the very next download
+LOW_WATERMARK = 0.9
+
+
+def recordings_dir():
+    return os.path.join(settings.MEDIA_ROOT, "recordings")
+
+
+def storage_key(path):
+    return os.path.relpath(path, recordings_dir()).replace(os.sep, "/")
+
+
+def _atomic_target(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(suffix=".part", dir=os.path.dirname(path))
+    os.close(fd)
+    return temp_path
+
+
+# =============================================================================
+# Cold tiers
+# =============================================================================
+
+class FilesystemColdStorage:
+    """Cold tier in a local (or network-mounted) directory."""
+
+    errors = (OSError,)
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def put(self, key, path):
+        target = self._path(key)
+        temp_path = _atomic_target(target)
+        shutil.copyfile(path, temp_path)
+        os.replace(temp_path, target)
+
+    def get(self, key, path):
+        shutil.copyfile(self._path(key), path)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class S3ColdStorage:
+    """Cold tier in an S3 bucket; endpoint_url points it at MinIO and co."""
+
+    def __init__(self, bucket, prefix="", endpoint_url=None):
+        import boto3
+        from boto3.exceptions import Boto3Error
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        # What put/get/delete can raise besides OSError for the local file
+        self.errors = (Boto3Error, BotoCoreError, ClientError)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client("s3", endpoint_url=endpoint_url or None)
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=f"{self.prefix}{key}")
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put(self, key, path):
+        self.client.upload_file(path, self.bucket, f"{self.prefix}{key}")
+
+    def get(self, key, path):
+        self.client.download_file(self.bucket, f"{self.prefix}{key}", path)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=f"{self.prefix}{key}")
+
+
+_cold = None
+
+
+def get_cold_storage():
+    """The configured cold tier, or None (RECORDING_COLD_STORAGE="")."""
+    global _cold
+    if _cold is None:
+        backend = settings.RECORDING_COLD_STORAGE
+        if backend == "s3":
+            _cold = S3ColdStorage(
+                settings.RECORDING_S3_BUCKET,
+                prefix=settings.RECORDING_S3_PREFIX,
+                endpoint_url=settings.RECORDING_S3_ENDPOINT_URL,
+            )
+        elif backend == "filesystem":
+            _cold = FilesystemColdStorage(settings.RECORDING_COLD_STORAGE_PATH)
+        elif backend:
+            raise ValueError(f"Unknown RECORDING_COLD_STORAGE: {backend}")
+    return _cold
+
+
+def _storage_errors():
+    """Errors moving files between the hot tier and the configured cold tier."""
+    cold = get_cold_storage()
+    return (OSError, *cold.errors) if cold is not None else (OSError,)
+
+
+# =============================================================================
+# Hot tier
+# =============================================================================
+
+def ensure_local(path):
+    """True if `path` is on local disk (re-hydrated from the cold tier if
+    needed). Marks the file as recently used."""
+    if not path:
+        return False
+    if os.path.exists(path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return True
+
+    cold = get_cold_storage()
+    if cold is None:
+        return False
+    key = storage_key(path)
+    temp_path = _atomic_target(path)
+    try:
+        cold.get(key, temp_path)
+        os.replace(temp_path, path)
+    except _storage_errors() as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        logger.warning(f"[recording_storage] Re-hydrating {key} failed: {e}")
+        return False
+    logger.info(f"[recording_storage] Re-hydrated {key} from cold storage")
+    return True
+
+
+def hot_files():
+    """[(mtime, size, path)] of every stored recording file, oldest first."""
+    files = []
+    for dirpath, _, filenames in os.walk(recordings_dir()):
+        for name in filenames:
+            if name.endswith(".part"):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+    files.sort()
+    return files
+
+
+def evict(path):
+    """Move one file out of the hot tier. Returns the bytes freed."""
+    cold = get_cold_storage()
+    size = os.path.getsize(path)
+    if cold is not None:
+        key = storage_key(path)
+        if not cold.exists(key):
+            cold.put(key, path)
+    os.remove(path)
+    return size
+
+
+def enforce_budget(budget=None):
+    """Evict least recently used files until the hot tier fits its budget.
+    Returns (files evicted, bytes freed)."""
+    budget = settings.RECORDING_HOT_BUDGET_BYTES if budget is None else budget
+    files = hot_files()
+    used = sum(size for _, size, _ in files)
+    if used <= budget:
+        return 0, 0
+
+    target = budget * LOW_WATERMARK
+    evicted = freed = 0
+    for _, _, path in files:
+        if used - freed <= target:
+            break
+        try:
+            freed += evict(path)
+            evicted += 1
+        except FileNotFoundError:
+            continue
+        except _storage_errors() as e:
+            logger.error(f"[recording_storage] Evicting {path} failed: {e}")
+            break
+    logger.info(f"[recording_storage] Evicted {evicted} files ({freed} bytes); hot tier {used - freed}/{budget} bytes")
+    return evicted, freed
+
+
+# =============================================================================
+# Retention
+# =============================================================================
+
+def _delete_everywhere(path):
+    cold = get_cold_storage()
+    if cold is not None:
+        cold.delete(storage_key(path))
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def apply_retention(days=None):
+    """Delete recording files older than `days` days. Returns the number of
+    CallRecording rows cleared; the rows themselves (transcripts) are kept."""
+    from bot.models import CallRecording
+
+    days = settings.RECORDING_RETENTION_DAYS if days is None else days
+    if not days:
+        return 0
+
+    cutoff = timezone.now() - timedelta(days=days)
+    expired = CallRecording.objects.filter(created_at__lt=cutoff, downloaded=True)
+    cleared = 0
+    for rec in expired.iterator():
+        paths = {p for p in (rec.file_path, rec.compressed_path) if p}
+        # Content-addressed files may be shared with a newer recording
+        if rec.content_hash and CallRecording.objects.filter(
+            content_hash=rec.content_hash, created_at__gte=cutoff
+        ).exists():
+            paths = set()
+        for path in paths:
+            try:
+                _delete_everywhere(path)
+            except _storage_errors() as e:
+                logger.error(f"[recording_storage] Deleting {path} failed: {e}")
+        CallRecording.objects.filter(call_id=rec.call_id).update(
+            downloaded=False, file_path="", compressed_path="", file_size=0,
+        )
+        cleared += 1
+    if cleared:
+        logger.info(f"[recording_storage] Retention cleared {cleared} recordings older than {days} days")
+    return cleared
+
@@ -7,7 +7,6 @@ import logging
 import os
 import time
 
-import requests
 from django.conf import settings
 
 logger = logging.getLogger(__name__)
@@ -52,21 +51,13 @@ def download_recording(call_id, retell_url):
     """Download recording from Retell and save locally.
     Returns the local file path on success, or empty string on failure.
     """
+    from bot.recording_pipeline import fetch_recording
+
     if not retell_url:
         return ""
 
-    media_dir = os.path.join(settings.MEDIA_ROOT, "recordings")
-    os.makedirs(media_dir, exist_ok=True)
-
-    file_path = os.path.join(media_dir, f"{call_id}.wav")
-
     try:
-        resp = requests.get(retell_url, timeout=60, stream=True)
-        resp.raise_for_status()
-        with open(file_path, "wb") as f:
-            for chunk in resp.iter_content(chunk_size=8192):
-                f.write(chunk)
-        logger.info(f"[recording] Downloaded {call_id} -> {file_path}")
+        file_path, _, _ = fetch_recording(call_id, retell_url)
         return file_path
     except Exception as e:
         logger.error(f"[recording] Download failed for {call_id}: {e}")
@@ -113,34 +104,10 @@ def format_transcript(transcript_object):
     Returns (full_text, short_summary).
     transcript_object is a list of {role, content} dicts.
     """
-    if not transcript_object:
-        return "", ""
-
-    lines = []
-    for entry in transcript_object:
-        role = entry.get("role", "")
-        content = entry.get("content", "").strip()
-        if not content:
-            continue
-
-        # Skip DTMF entries (already shown in summary)
-        if "Pressed Button:" in content:
-            continue
-
-        if role == "agent":
-            lines.append(f"Agent: {content}")
-        elif role == "user":
-            lines.append(f"Caller: {content}")
-
-    full_text = "\n".join(lines)
-
-    # Build a short summary (first 3 exchanges max)
-    short_lines = lines[:6]  # Up to 3 exchanges (agent + caller pairs)
-    short_summary = "\n".join(short_lines)
-    if len(lines) > 6:
-        short_summary += f"\n... ({len(lines) - 6} more lines)"
-
-    return full_text, short_summary
+    from bot.transcript_analysis import analyze
+
+    analysis = analyze(transcript_object)
+    return analysis.full_text, analysis.short_text
 
 
 def format_transcript_for_telegram(transcript_text, call_summary="", sentiment="", max_length=3500):
@@ -3,6 +3,7 @@ Retell AI service layer — replaces all Bland.ai API calls.
 Singleton client pattern for the Retell SDK.
 """
 import logging
+
 from retell import Retell
 from django.conf import settings
 
@@ -23,7 +24,6 @@ def get_retell_client():
     return _client
 
 
-
 # =============================================================================
 # Phone Number Management
 # =============================================================================
@@ -225,13 +225,17 @@ def update_agent_inbound_settings(agent_id, phone_record):
 
         # Business hours
         if phone_record.business_hours_enabled and phone_record.business_hours_start and phone_record.business_hours_end:
+            from bot.business_hours import describe_days
+
             start = phone_record.business_hours_start.strftime("%H:%M")
             end = phone_record.business_hours_end.strftime("%H:%M")
             tz = phone_record.business_hours_timezone or "US/Eastern"
+            days = describe_days(phone_record.business_days)
+            holidays = ", except listed holidays" if phone_record.business_holidays else ""
             inbound_instructions.append(
-                f"BUSINESS HOURS: This line operates {start} to {end} ({tz}). "
+                f"BUSINESS HOURS: This line operates {start} to {end} ({tz}), {days}{holidays}. "
                 f"Call the get_current_time function to check the current time. "
-                f"If the current time is outside business hours, inform the caller that "
+                f"If it reports is_business_hours false, inform the caller that "
                 f"the office is closed and offer to take a voicemail message."
             )
 
@@ -0,0 +1,489 @@
+"""
+User State Store — persistent backend for the `user_data` conversation state.
+
+`bot.bot_config.user_data` is a UserDataStore: a dict-like mapping of
+user_id -> UserSession, where each session is itself dict-like. Handlers
+keep using `user_data[user_id]["step"] = ...` unchanged.
+
+  - Sessions are loaded lazily on first access and cached for the
+    duration of one Telegram update (per thread)
+  - At the end of the update (UserStateMiddleware.post_process) changed
+    fields are written back in one round-trip; nested mutations such as
+    `user_data[uid]["items"].append(x)` are caught by diffing encodings
+  - Outside an update scope every write goes straight to the backend:
+    nested dicts and lists are handed out as tracked copies whose
+    mutations flush the session too
+  - Each flush refreshes the session TTL, so idle sessions expire
+
+Backends: RedisStateBackend (one hash per user, shared by every web worker)
+and InMemoryStateBackend (single process; tests and local polling).
+"""
+import datetime
+import json
+import logging
+import threading
+import time
+import uuid
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from decimal import Decimal
+
+from redis.exceptions import RedisError
+from telebot.handler_backends import BaseMiddleware
+
+logger = logging.getLogger(__name__)
+
+# Always present, so an empty session still exists in the backend
+_SESSION_MARKER = "__session__"
+
+
+# =============================================================================
+# Value encoding — JSON with tags for the non-JSON types handlers store.
+# Anything else is rejected: state is never decoded with pickle, so a value
+# read back from Redis can only ever build plain data.
+# =============================================================================
+
+def _tag(value):
+    if isinstance(value, datetime.datetime):
+        return {"__t": "datetime", "v": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"__t": "date", "v": value.isoformat()}
+    if isinstance(value, uuid.UUID):
+        return {"__t": "uuid", "v": str(value)}
+    if isinstance(value, Decimal):
+        return {"__t": "decimal", "v": str(value)}
+    if isinstance(value, tuple):
+        return {"__t": "tuple", "v": [_tag(item) for item in value]}
+    if isinstance(value, list):
+        return [_tag(item) for item in value]
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value):
+            return {key: _tag(item) for key, item in value.items()}
+        # Non-string keys (e.g. user ids) keep their type as [key, value] pairs
+        return {"__t": "dict", "v": [[_tag(key), _tag(item)] for key, item in value.items()]}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    raise TypeError(f"{type(value).__name__} cannot be stored in user state")
+
+
+def _untag(value):
+    if isinstance(value, list):
+        return [_untag(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    tag = value.get("__t")
+    if tag is None:
+        return {key: _untag(item) for key, item in value.items()}
+    raw = value["v"]
+    if tag == "datetime":
+        return datetime.datetime.fromisoformat(raw)
+    if tag == "date":
+        return datetime.date.fromisoformat(raw)
+    if tag == "uuid":
+        return uuid.UUID(raw)
+    if tag == "decimal":
+        return Decimal(raw)
+    if tag == "tuple":
+        return tuple(_untag(item) for item in raw)
+    if tag == "dict":
+        return {_untag(key): _untag(item) for key, item in raw}
+    raise ValueError(f"Unknown state tag: {tag}")
+
+
+def encode_value(value):
+    return json.dumps(_tag(value), separators=(",", ":"), sort_keys=True)
+
+
+def decode_value(raw):
+    if isinstance(raw, bytes):
+        raw = raw.decode("utf-8")
+    return _untag(json.loads(raw))
+
+
+# =============================================================================
+# Backends — store {field: encoded value} per user
+# =============================================================================
+
+class InMemoryStateBackend:
+    def __init__(self, ttl, clock=time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        item = self._items.get(key)
+        if item and item[1] <= self._clock():
+            del self._items[key]
+            return None
+        return item
+
+    def load(self, key):
+        with self._lock:
+            item = self._live(key)
+            return dict(item[0]) if item else None
+
+    def save(self, key, changed, removed=(), replace=False):
+        with self._lock:
+            item = None if replace else self._live(key)
+            fields = dict(item[0]) if item else {}
+            fields.update(changed)
+            for field in removed:
+                fields.pop(field, None)
+            self._items[key] = (fields, self._clock() + self.ttl)
+
+    def touch(self, key):
+        with self._lock:
+            item = self._live(key)
+            if item:
+                self._items[key] = (item[0], self._clock() + self.ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def keys(self):
+        with self._lock:
+            return [key for key in list(self._items) if self._live(key)]
+
+
+class RedisStateBackend:
+    def __init__(self, client, ttl, prefix="user_state:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, key):
+        return f"{self.prefix}{key}"
+
+    def load(self, key):
+        fields = self.client.hgetall(self._key(key))
+        if not fields:
+            return None
+        return {field.decode("utf-8"): value for field, value in fields.items()}
+
+    def save(self, key, changed, removed=(), replace=False):
+        redis_key = self._key(key)
+        pipe = self.client.pipeline()
+        if replace:
+            pipe.delete(redis_key)
+        if removed:
+            pipe.hdel(redis_key, *removed)
+        if changed:
+            pipe.hset(redis_key, mapping=changed)
+        pipe.expire(redis_key, self.ttl)
+        pipe.execute()
+
+    def touch(self, key):
+        self.client.expire(self._key(key), self.ttl)
+
+    def delete(self, key):
+        self.client.delete(self._key(key))
+
+    def keys(self):
+        return [
+            key.decode("utf-8")[len(self.prefix):]
+            for key in self.client.scan_iter(match=f"{self.prefix}*", count=500)
+        ]
+
+
+# =============================================================================
+# Nested values outside an update scope — no end-of-update diff will run,
+# so every mutation flushes the owning session
+# =============================================================================
+
+def _tracked(value, on_change):
+    if isinstance(value, (_TrackedDict, _TrackedList)):
+        return value
+    if isinstance(value, dict):
+        return _TrackedDict(value, on_change)
+    if isinstance(value, list):
+        return _TrackedList(value, on_change)
+    return value
+
+
+def _notifying(base, name):
+    original = getattr(base, name)
+
+    def method(self, *args, **kwargs):
+        result = original(self, *args, **kwargs)
+        self._on_change()
+        return result
+
+    method.__name__ = name
+    return method
+
+
+class _TrackedDict(dict):
+    def __init__(self, value, on_change):
+        super().__init__((key, _tracked(item, on_change)) for key, item in value.items())
+        self._on_change = on_change
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, _tracked(value, self._on_change))
+        self._on_change()
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            super().__setitem__(key, _tracked(value, self._on_change))
+        self._on_change()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+
+class _TrackedList(list):
+    def __init__(self, value, on_change):
+        super().__init__(_tracked(item, on_change) for item in value)
+        self._on_change = on_change
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = [_tracked(item, self._on_change) for item in value]
+        else:
+            value = _tracked(value, self._on_change)
+        super().__setitem__(index, value)
+        self._on_change()
+
+    def append(self, value):
+        super().append(_tracked(value, self._on_change))
+        self._on_change()
+
+    def insert(self, index, value):
+        super().insert(index, _tracked(value, self._on_change))
+        self._on_change()
+
+    def extend(self, values):
+        super().extend(_tracked(item, self._on_change) for item in values)
+        self._on_change()
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+
+for _name in ("__delitem__", "clear", "pop", "popitem"):
+    setattr(_TrackedDict, _name, _notifying(dict, _name))
+for _name in ("__delitem__", "__imul__", "clear", "pop", "remove", "reverse", "sort"):
+    setattr(_TrackedList, _name, _notifying(list, _name))
+
+
+# =============================================================================
+# Sessions
+# =============================================================================
+
+class UserSession(MutableMapping):
+    """Conversation state of one user. Behaves like the plain dict it replaces."""
+
+    def __init__(self, store, key, data, snapshot=None, replaced=False):
+        self._store = store
+        self._key = key
+        self._data = data
+        self._snapshot = snapshot or {}
+        self._replaced = replaced
+
+    def __getitem__(self, field):
+        value = self._data[field]
+        if isinstance(value, (dict, list)) and not self._store._in_scope():
+            value = self._data[field] = _tracked(value, self._nested_changed)
+        return value
+
+    def _nested_changed(self):
+        self._store._changed(self)
+
+    def __setitem__(self, field, value):
+        encode_value(value)  # raises TypeError here rather than at flush
+        self._data[field] = value
+        self._store._changed(self)
+
+    def __delitem__(self, field):
+        del self._data[field]
+        self._store._changed(self)
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return repr(self._data)
+
+    def copy(self):
+        return dict(self._data)
+
+    def flush(self):
+        """Write changed fields back and refresh the TTL."""
+        encoded = {str(field): encode_value(value) for field, value in self._data.items()}
+        encoded[_SESSION_MARKER] = "1"
+        if self._replaced:
+            self._store.backend.save(self._key, encoded, replace=True)
+        else:
+            changed = {
+                field: value for field, value in encoded.items()
+                if self._snapshot.get(field) != value
+            }
+            removed = [field for field in self._snapshot if field not in encoded]
+            if changed or removed:
+                self._store.backend.save(self._key, changed, removed)
+            else:
+                self._store.backend.touch(self._key)
+        self._snapshot = encoded
+        self._replaced = False
+
+
+class UserDataStore(MutableMapping):
+    """user_id -> UserSession mapping over a pluggable backend."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._local = threading.local()
+
+    # -- update scope -------------------------------------------------------
+
+    def _sessions(self):
+        sessions = getattr(self._local, "sessions", None)
+        if sessions is None:
+            sessions = self._local.sessions = {}
+            self._local.depth = 0
+        return sessions
+
+    def _in_scope(self):
+        self._sessions()
+        return self._local.depth > 0
+
+    @contextmanager
+    def scope(self):
+        """Cache sessions for the duration of one update and write back at the end."""
+        self.begin()
+        try:
+            yield self
+        finally:
+            self.end()
+
+    def begin(self):
+        self._sessions()
+        self._local.depth += 1
+
+    def end(self):
+        self._local.depth = max(0, self._local.depth - 1)
+        if self._local.depth == 0:
+            try:
+                self.flush()
+            finally:
+                self._local.sessions = {}
+
+    def flush(self):
+        for key, session in list(self._sessions().items()):
+            if session is None:
+                continue
+            try:
+                session.flush()
+            except (RedisError, TypeError) as e:
+                logger.error(f"[state_store] Could not save state for {key}: {e}")
+
+    def _changed(self, session):
+        if not self._in_scope():
+            session.flush()
+
+    # -- mapping API --------------------------------------------------------
+
+    @staticmethod
+    def _normalize(user_id):
+        return str(user_id)
+
+    def _load(self, user_id):
+        key = self._normalize(user_id)
+        sessions = self._sessions()
+        if key in sessions:
+            return sessions[key]
+
+        fields = self.backend.load(key)
+        session = None
+        if fields is not None:
+            fields.pop(_SESSION_MARKER, None)
+            snapshot = {field: value.decode("utf-8") if isinstance(value, bytes) else value
+                        for field, value in fields.items()}
+            data = {}
+            for field, value in snapshot.items():
+                try:
+                    data[field] = decode_value(value)
+                except ValueError as e:
+                    # e.g. written by an older encoder; left out, so the next flush removes it
+                    logger.warning(f"[state_store] Dropping unreadable {field!r} for {key}: {e}")
+            snapshot[_SESSION_MARKER] = "1"
+            session = UserSession(self, key, data, snapshot)
+        if self._in_scope():
+            sessions[key] = session
+        return session
+
+    def __getitem__(self, user_id):
+        session = self._load(user_id)
+        if session is None:
+            raise KeyError(user_id)
+        return session
+
+    def __setitem__(self, user_id, value):
+        key = self._normalize(user_id)
+        if isinstance(value, UserSession) and value._key == key:
+            return
+        data = value.copy() if isinstance(value, UserSession) else dict(value)
+        for item in data.values():
+            encode_value(item)
+        session = UserSession(self, key, data, replaced=True)
+        if self._in_scope():
+            self._sessions()[key] = session
+        else:
+            session.flush()
+
+    def __delitem__(self, user_id):
+        key = self._normalize(user_id)
+        self.backend.delete(key)
+        if self._in_scope():
+            self._sessions()[key] = None
+
+    def __contains__(self, user_id):
+        return self._load(user_id) is not None
+
+    def __iter__(self):
+        for key in self.backend.keys():  # noqa: SIM118 — a backend method, not dict.keys()
+            yield int(key) if key.lstrip("-").isdigit() else key
+
+    def __len__(self):
+        return len(self.backend.keys())
+
+    def __repr__(self):
+        loaded = {key: session for key, session in self._sessions().items() if session is not None}
+        return f"UserDataStore({type(self.backend).__name__}, loaded={loaded!r})"
+
+
+class UserStateMiddleware(BaseMiddleware):
+    """Opens a state scope around every update so each handler run loads a
+    user's state at most once and writes it back once."""
+
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+        self.update_types = ["message", "edited_message", "callback_query"]
+
+    def pre_process(self, message, data):
+        self.store.begin()
+
+    def post_process(self, message, data, exception):
+        self.store.end()
+
+
+def build_user_data_store(backend_name, ttl, redis_url=None):
+    """Create the store configured by USER_STATE_BACKEND ("redis" or "memory")."""
+    if backend_name == "memory":
+        return UserDataStore(InMemoryStateBackend(ttl))
+
+    import redis
+
+    return UserDataStore(RedisStateBackend(redis.StrictRedis.from_url(redis_url), ttl))
@@ -1,8 +1,7 @@
-import ast
+import json
 import logging
 import os
 from datetime import timedelta
-from decimal import Decimal
 from huey import crontab
 from huey.contrib.djhuey import db_task, periodic_task, HUEY
 from celery import shared_task
@@ -46,18 +45,25 @@ from translations.translations import (
     CAMPAIGN_INITIATED,
 )
 from user.models import TelegramUser
-from .models import CallDuration, BatchCallLogs, CallLogsTable, ReminderTable, ActiveCall, UserPhoneNumber
+from .models import CallDuration, BatchCallLogs, CallLogsTable, ReminderTable, UserPhoneNumber, CampaignLogs
 from .utils import (
     get_user_subscription_by_call_id,
     convert_dollars_to_crypto,
     get_user_language,
     extract_call_details,
+    redis_client,
 )
 from .call_gate import US_CA_OVERAGE_RATE
 from .retell_service import release_phone_number, sync_caller_ids_with_retell
 from .bot_config import *
-from .views import stop_active_batch_calls, stop_single_active_call
-from .recording_utils import download_recording
+from .views import stop_active_batch_calls
+from .message_gateway import (
+    BILLING,
+    BULK,
+    NORMAL,
+    send_audio as queue_audio,
+    send_message as queue_message,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -105,27 +111,28 @@ def call_status_free_plan():
 
 
 @shared_task
-def download_and_cache_recording(call_id, retell_url):
-    """Download a call recording from Retell, cache locally, and send inline in Telegram."""
-    from bot.models import CallRecording, CallLogsTable, BatchCallLogs
-    from bot.recording_utils import get_recording_url, format_duration, mask_phone_number
+def download_and_cache_recording(call_id, retell_url, notify=True):
+    """Download a call recording from Retell, cache locally, and (unless
+    notify is False) send it inline in Telegram."""
+    from bot.models import CallRecording
+    from bot.recording_pipeline import delivery_path, ensure_recording
     try:
         rec = CallRecording.objects.filter(call_id=call_id).first()
         if not rec:
             logger.warning(f"[download_recording] No CallRecording for {call_id}")
             return "No record"
 
-        file_path = download_recording(call_id, retell_url)
-        if file_path:
-            rec.file_path = file_path
-            rec.downloaded = True
-            rec.save()
-            logger.info(f"[download_recording] Cached {call_id} at {file_path}")
+        if ensure_recording(rec, retell_url):
+            logger.info(f"[download_recording] Cached {call_id} at {rec.file_path}")
+            if not notify:
+                return f"Downloaded: {rec.file_path}"
 
             # Send audio inline in Telegram
-            _send_recording_inline(rec, call_id, file_path)
-            return f"Downloaded and sent: {file_path}"
+            _send_recording_inline(rec, call_id, delivery_path(rec))
+            return f"Downloaded and sent: {rec.file_path}"
 
+        if not notify:
+            return "Download failed"
         # Download failed — send fallback link
         _send_recording_fallback(rec, call_id)
         return "Download failed, sent fallback link"
@@ -134,6 +141,29 @@ def download_and_cache_recording(call_id, retell_url):
         return f"Error: {e}"
 
 
+@shared_task
+def maintain_recording_storage():
+    """Apply recording retention, then evict least recently used files until
+    the hot tier fits RECORDING_HOT_BUDGET_BYTES (bot.recording_storage)."""
+    from redis.exceptions import LockError
+
+    from bot.recording_storage import apply_retention, enforce_budget
+
+    lock = redis_client.lock("recording_storage:maintain", timeout=3600)
+    if not lock.acquire(blocking=False):
+        return "Busy"
+
+    try:
+        cleared = apply_retention()
+        evicted, freed = enforce_budget()
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            logger.warning("[recording_storage] Maintenance lock expired before release")
+    return f"Retention cleared {cleared}, evicted {evicted} files ({freed} bytes)"
+
+
 def _send_recording_inline(rec, call_id, file_path):
     """Send the audio file directly in Telegram chat."""
     try:
@@ -152,16 +182,22 @@ def _send_recording_inline(rec, call_id, file_path):
                 logger.info(f"[recording_inline] Skipping inline for large batch call {call_id}")
                 return
 
-        with open(file_path, "rb") as audio_file:
-            bot.send_audio(
-                rec.user_id,
-                audio_file,
-                caption=caption,
-                parse_mode="Markdown",
-                title=f"Call Recording {to_number}",
-                performer="Speechcue",
-            )
-        logger.info(f"[recording_inline] Sent audio to user {rec.user_id} for call {call_id}")
+        from bot.recording_utils import get_recording_url
+        queue_audio(
+            rec.user_id,
+            audio_path=file_path,
+            caption=caption,
+            parse_mode="Markdown",
+            title=f"Call Recording {to_number}",
+            performer="Speechcue",
+            lane=BULK,
+            fallback={
+                "text": f"🎙 [Play Recording]({get_recording_url(rec.token)})",
+                "parse_mode": "Markdown",
+                "disable_web_page_preview": True,
+            },
+        )
+        logger.info(f"[recording_inline] Queued audio to user {rec.user_id} for call {call_id}")
     except Exception as e:
         logger.warning(f"[recording_inline] Failed to send audio for {call_id}: {e}")
         # Fallback to link
@@ -173,127 +209,257 @@ def _send_recording_fallback(rec, call_id):
     from bot.recording_utils import get_recording_url
     try:
         our_url = get_recording_url(rec.token)
-        bot.send_message(
+        queue_message(
             rec.user_id,
             f"🎙 [Play Recording]({our_url})",
             parse_mode="Markdown",
             disable_web_page_preview=True,
+            lane=NORMAL,
         )
     except Exception as e:
         logger.warning(f"[recording_fallback] Failed to send fallback for {call_id}: {e}")
 
 
+# Per-call drain lock must outlive the slowest event (batch summary + audio uploads)
+RETELL_DRAIN_LOCK_TIMEOUT = 300
+RETELL_EVENT_MAX_ATTEMPTS = 5
+# Re-tries of a drain that found the call locked; after that the sweep takes over
+RETELL_DRAIN_BUSY_RETRIES = 10
+# Pending events older than this are assumed to have lost their drain task
+RETELL_EVENT_SWEEP_AGE_SECONDS = 30
+
+
+@shared_task(bind=True)
+def drain_retell_events(self, call_id):
+    """
+    Apply queued Retell webhook events for one call, oldest first.
+    A Redis lock per call_id keeps events for the same call strictly ordered
+    while different calls drain in parallel across workers.
+    """
+    from celery.exceptions import MaxRetriesExceededError
+    from redis.exceptions import LockError
+
+    from bot.models import RetellWebhookEvent
+    from bot.webhooks import dispatch_retell_event
+
+    lock = redis_client.lock(f"retell_events:{call_id}", timeout=RETELL_DRAIN_LOCK_TIMEOUT)
+    if not lock.acquire(blocking=False):
+        # Another worker owns this call — come back so the new event is not
+        # stranded. A holder that stays stuck is left to the periodic sweep
+        try:
+            raise self.retry(countdown=1, max_retries=RETELL_DRAIN_BUSY_RETRIES)
+        except MaxRetriesExceededError:
+            logger.warning(f"[retell_events] {call_id} still locked — left for the sweep")
+            return "Busy"
+
+    processed = 0
+    try:
+        while True:
+            event_row = (
+                RetellWebhookEvent.objects.filter(call_id=call_id, status="pending")
+                .order_by("id")
+                .first()
+            )
+            if not event_row:
+                break
+
+            event_row.attempts += 1
+            try:
+                payload = json.loads(event_row.payload)
+                dispatch_retell_event(event_row.event, payload.get("data", payload))
+                event_row.status = "processed"
+                event_row.error_message = ""
+            except Exception as e:
+                logger.error(f"[retell_events] {event_row.event} failed for {call_id}: {e}")
+                event_row.error_message = str(e)
+                if event_row.attempts < RETELL_EVENT_MAX_ATTEMPTS:
+                    # Leave pending and stop — later events must not overtake it
+                    event_row.save(update_fields=["attempts", "error_message"])
+                    break
+                event_row.status = "failed"
+
+            event_row.processed_at = timezone.now()
+            event_row.save(update_fields=["status", "attempts", "error_message", "processed_at"])
+            processed += 1
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            logger.warning(f"[retell_events] Drain lock for {call_id} expired before release")
+
+    return f"Processed {processed} events for {call_id}"
+
+
 @shared_task
-def monitor_active_calls():
+def sweep_pending_retell_events():
+    """Safety net — re-enqueue calls whose pending events were never drained
+    (broker outage, worker crash, or a handler failure left for retry)."""
+    from bot.models import RetellWebhookEvent
+
+    cutoff = timezone.now() - timedelta(seconds=RETELL_EVENT_SWEEP_AGE_SECONDS)
+    call_ids = list(
+        RetellWebhookEvent.objects.filter(status="pending", received_at__lte=cutoff)
+        .values_list("call_id", flat=True)
+        .distinct()[:500]
+    )
+    for call_id in call_ids:
+        drain_retell_events.delay(call_id)
+
+    if call_ids:
+        logger.info(f"[retell_events] Re-enqueued {len(call_ids)} calls with stale events")
+    return f"Re-enqueued {len(call_ids)} calls"
+
+
+# Retell retries within minutes; a week of ledger is ample for dedupe
+PROCESSED_EVENT_RETENTION_DAYS = 7
+
+
+@shared_task
+def prune_webhook_event_ledgers():
+    """Drop old idempotency-ledger rows and drained webhook events."""
+    from bot.models import ProcessedWebhookEvent, RetellWebhookEvent
+
+    cutoff = timezone.now() - timedelta(days=PROCESSED_EVENT_RETENTION_DAYS)
+    ledger_deleted, _ = ProcessedWebhookEvent.objects.filter(processed_at__lt=cutoff).delete()
+    events_deleted, _ = RetellWebhookEvent.objects.filter(
+        status="processed", received_at__lt=cutoff
+    ).delete()
+    logger.info(f"[prune_ledgers] ledger={ledger_deleted}, events={events_deleted}")
+    return f"Pruned ledger={ledger_deleted}, events={events_deleted}"
+
+
+# Campaign dispatch lock must outlive one dispatcher run (MAX_RUN_SECONDS)
+CAMPAIGN_DISPATCH_LOCK_TIMEOUT = 300
+CAMPAIGN_THROTTLE_RETRY_SECONDS = 15
+CAMPAIGN_FAILURE_RETRY_SECONDS = 30
+
+
+@shared_task
+def dispatch_campaign(campaign_id):
     """
-    Real-time billing monitor — runs every 30 seconds.
-    For each active call:
-      1. Calculate elapsed time since last billing
-      2. Debit wallet for the elapsed period
-      3. Send low-balance warning if wallet running low
-      4. Force-end call if wallet cannot cover 30 more seconds
+    Send the remaining chunks of a bulk IVR campaign (bot.campaign_dispatcher).
+    Re-enqueues itself while the campaign is throttled, retrying a failed
+    chunk, or out of run budget.
     """
-    active_calls = ActiveCall.objects.filter(is_active=True)
-    if not active_calls.exists():
-        return "No active calls"
+    from redis.exceptions import LockError
 
-    now = timezone.now()
-    logger.info(f"[monitor] Checking {active_calls.count()} active calls")
+    from bot.campaign_dispatcher import PENDING, RETRYING, THROTTLED, CampaignDispatcher
+
+    lock = redis_client.lock(f"campaign_dispatch:{campaign_id}", timeout=CAMPAIGN_DISPATCH_LOCK_TIMEOUT)
+    if not lock.acquire(blocking=False):
+        return "Busy"
 
-    for call in active_calls:
+    try:
+        result = CampaignDispatcher(campaign_id).run()
+    finally:
         try:
-            # Skip plan-billed calls (no wallet deduction needed during call)
-            if call.billing_source == "plan" and call.rate_per_minute == 0:
-                continue
+            lock.release()
+        except LockError:
+            logger.warning(f"[campaign_dispatch] Lock for {campaign_id} expired before release")
 
-            elapsed_since_last = (now - call.last_billed_at).total_seconds()
-            if elapsed_since_last < 25:
-                continue  # Already billed recently
+    if result == PENDING:
+        dispatch_campaign.delay(campaign_id)
+    elif result == THROTTLED:
+        dispatch_campaign.apply_async((campaign_id,), countdown=CAMPAIGN_THROTTLE_RETRY_SECONDS)
+    elif result == RETRYING:
+        dispatch_campaign.apply_async((campaign_id,), countdown=CAMPAIGN_FAILURE_RETRY_SECONDS)
+    return f"Campaign {campaign_id}: {result}"
 
-            elapsed_minutes = Decimal(str(round(elapsed_since_last / 60, 4)))
-            charge = call.rate_per_minute * elapsed_minutes
 
-            if charge <= 0:
-                continue
+@shared_task
+def resume_campaign_dispatches():
+    """Safety net — restart dispatch for campaigns whose task was lost
+    (broker outage or worker crash mid-run)."""
+    from bot.campaign_dispatcher import DISPATCHING, PENDING, RETRYING, THROTTLED
+
+    campaign_ids = list(
+        CampaignLogs.objects.filter(
+            dispatch_status__in=(PENDING, DISPATCHING, THROTTLED, RETRYING)
+        ).values_list("campaign_id", flat=True)[:200]
+    )
+    for campaign_id in campaign_ids:
+        dispatch_campaign.delay(str(campaign_id))
 
-            # Get current wallet balance
-            try:
-                user = TelegramUser.objects.get(user_id=call.user_id)
-                balance = user.wallet_balance
-            except TelegramUser.DoesNotExist:
-                continue
+    if campaign_ids:
+        logger.info(f"[campaign_dispatch] Resumed {len(campaign_ids)} campaigns")
+    return f"Resumed {len(campaign_ids)} campaigns"
 
-            # Check if wallet can cover the next 60 seconds
-            cost_next_minute = call.rate_per_minute
-            if balance < cost_next_minute and not call.warning_sent:
-                # Send low balance warning
-                try:
-                    bot.send_message(
-                        call.user_id,
-                        f"⚠️ LOW BALANCE WARNING\n"
-                        f"Active call to {call.region} ({call.to_number})\n"
-                        f"Rate: ${call.rate_per_minute}/min\n"
-                        f"Balance: ${balance:.2f}\n"
-                        f"Call will auto-end when balance runs out.",
-                    )
-                    call.warning_sent = True
-                    call.save(update_fields=["warning_sent"])
-                except Exception as e:
-                    logger.warning(f"[monitor] Warning send failed for {call.call_id}: {e}")
-
-            # Check if wallet is exhausted — force end call
-            if balance < charge:
-                # Try to bill what we can
-                if balance > Decimal("0.01"):
-                    debit_wallet(
-                        call.user_id, float(balance),
-                        description=f"Final billing: {call.region} ({call.call_id[:12]})",
-                        tx_type="OVR",
-                    )
-                    call.total_billed += balance
-                    call.last_billed_at = now
-                    call.save(update_fields=["total_billed", "last_billed_at"])
 
-                # Force-end the call
-                logger.info(f"[monitor] Force-ending call {call.call_id} — wallet exhausted")
-                try:
-                    stop_result = stop_single_active_call(call.call_id)
-                    logger.info(f"[monitor] Stop call result: {stop_result.status_code}")
-                except Exception as e:
-                    logger.error(f"[monitor] Force-end failed for {call.call_id}: {e}")
+# One drainer at a time; the lock outlives a run plus a slow final upload
+OUTBOX_LOCK_TIMEOUT = 180
+OUTBOX_RUN_SECONDS = 55
 
-                try:
-                    bot.send_message(
-                        call.user_id,
-                        f"🛑 Call to {call.region} ended — insufficient wallet balance.\n"
-                        f"Total charged: ${call.total_billed:.2f}\n"
-                        f"Please top up your wallet to continue making calls.",
-                    )
-                except Exception:
-                    pass
 
-                call.is_active = False
-                call.save(update_fields=["is_active"])
-                continue
+@shared_task
+def deliver_outbound_messages():
+    """Drain the outbound Telegram queue (bot.message_gateway) for up to a
+    minute. Started by the beat schedule and kicked on enqueue."""
+    from redis.exceptions import LockError
 
-            # Debit for elapsed period
-            result = debit_wallet(
-                call.user_id, float(charge),
-                description=f"Live billing: {call.region} ({call.call_id[:12]}) {elapsed_minutes:.2f}min",
-                tx_type="OVR",
-            )
-            if result["status"] == 200:
-                call.total_billed += charge
-                call.last_billed_at = now
-                call.save(update_fields=["total_billed", "last_billed_at"])
-                logger.debug(f"[monitor] Billed ${charge:.4f} for {call.call_id}")
-            else:
-                logger.warning(f"[monitor] Debit failed for {call.call_id}: {result}")
+    from bot.message_gateway import OutboxWorker
 
-        except Exception as e:
-            logger.error(f"[monitor] Error processing {call.call_id}: {e}")
+    lock = redis_client.lock("telegram_outbox:deliver", timeout=OUTBOX_LOCK_TIMEOUT)
+    if not lock.acquire(blocking=False):
+        return "Busy"
 
-    return f"Monitored {active_calls.count()} calls"
+    try:
+        sent = OutboxWorker().run(OUTBOX_RUN_SECONDS)
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            logger.warning("[message_gateway] Drain lock expired before release")
+    return f"Delivered {sent} messages"
+
+
+@shared_task
+def refresh_crypto_prices():
+    """Batch-refresh the shared crypto USD rates (TelegramBot.price_service)
+    so payment requests are served from the store instead of Tatum."""
+    from TelegramBot.price_service import refresh_prices
+
+    prices = refresh_prices(wait=0)
+    return f"{len(prices)} prices stored"
+
+
+MONITOR_LOCK_TIMEOUT = 120
+
+
+@shared_task
+def monitor_active_calls():
+    """
+    Real-time billing monitor — runs every 30 seconds.
+    Delegates to bot.live_billing, which per tick:
+      1. Computes the elapsed-period charge for every due call from locked rows
+      2. Debits each user's wallet once for all of their calls
+      3. Sends low-balance warnings when the wallet cannot cover a minute
+      4. Force-ends calls the wallet can no longer cover
+    A tick that overruns the interval keeps the lock; the next one is skipped.
+    Without Redis the tick still runs — the row locks prevent double billing.
+    """
+    from redis.exceptions import LockError, RedisError
+
+    from bot.live_billing import run_billing_tick
+
+    lock = redis_client.lock("billing:monitor_active_calls:lock", timeout=MONITOR_LOCK_TIMEOUT)
+    try:
+        if not lock.acquire(blocking=False):
+            return "Busy"
+    except RedisError as e:
+        logger.warning(f"[live_billing] Tick lock unavailable, relying on row locks: {e}")
+        lock = None
+
+    try:
+        result = run_billing_tick()
+    finally:
+        if lock is not None:
+            try:
+                lock.release()
+            except (LockError, RedisError):
+                logger.warning("[live_billing] Tick lock expired before release")
+    if not result["calls"]:
+        return "No calls due for billing"
+    return f"Monitored {result['calls']} calls in {result['duration_ms']:.0f}ms"
 
 
 
@@ -333,11 +499,12 @@ def renew_phone_numbers():
                         record.save()
                         logger.info(f"[renew_numbers] Released {record.phone_number} (no auto-renew, grace expired)")
                         try:
-                            bot.send_message(
+                            queue_message(
                                 user_id,
                                 f"📞 Your number `{record.phone_number}` has been released "
                                 f"(auto-renewal was disabled and grace period expired).",
                                 parse_mode="Markdown",
+                                lane=BILLING,
                             )
                         except Exception:
                             pass
@@ -355,12 +522,13 @@ def renew_phone_numbers():
                 record.save()
                 logger.info(f"[renew_numbers] Renewed {record.phone_number} for user {user_id}")
                 try:
-                    bot.send_message(
+                    queue_message(
                         user_id,
                         f"✅ Phone number `{record.phone_number}` renewed.\n"
                         f"💰 Charged: ${record.monthly_cost}/mo\n"
                         f"📅 Next renewal: {record.next_renewal_date.strftime('%Y-%m-%d')}",
                         parse_mode="Markdown",
+                        lane=BILLING,
                     )
                 except Exception:
                     pass
@@ -378,23 +546,25 @@ def renew_phone_numbers():
                         record.is_active = False
                         record.save()
                         try:
-                            bot.send_message(
+                            queue_message(
                                 user_id,
                                 f"🛑 Your number `{record.phone_number}` has been released "
                                 f"due to insufficient wallet balance.\n"
                                 f"Please top up and purchase a new number.",
                                 parse_mode="Markdown",
+                                lane=BILLING,
                             )
                         except Exception:
                             pass
                 else:
                     try:
-                        bot.send_message(
+                        queue_message(
                             user_id,
                             f"⚠️ Phone number renewal failed for `{record.phone_number}`\n"
                             f"Insufficient wallet balance (need ${record.monthly_cost}).\n"
                             f"You have {days_left} days to top up before the number is released.",
                             parse_mode="Markdown",
+                            lane=BILLING,
                         )
                     except Exception:
                         pass
@@ -439,9 +609,10 @@ def charge_user_for_additional_minutes():
                 tx_type="OVR",
             )
             if result["status"] != 200:
-                bot.send_message(
+                queue_message(
                     call_duration.user_id,
                     f"{PROCESSING_ERROR[lg]}\n{result.get('message', '')}",
+                    lane=BILLING,
                 )
                 return
             print("response 200 debited user wallet")
@@ -478,7 +649,7 @@ def notify_users():
         lg = TelegramUser.objects.get(user_id=user_id).language
 
         paid_minutes = user["total_paid_minutes"]
-        bot.send_message(user_id, f"{CHARGED_SUCCESSFULLY[lg]} {paid_minutes:.4f} ")
+        queue_message(user_id, f"{CHARGED_SUCCESSFULLY[lg]} {paid_minutes:.4f} ", lane=BILLING)
         CallDuration.objects.filter(
             user_id=user_id, charged=True, notified=False
         ).update(notified=True)
@@ -488,10 +659,11 @@ def notify_users():
         lg = TelegramUser.objects.get(user_id=user_id).language
         unpaid_minutes = user["total_unpaid_minutes"]
         if unpaid_minutes > 0:
-            bot.send_message(
+            queue_message(
                 user_id,
                 f"{INSUFFICIENT_BALANCE_FOR_PAYMENT[lg]} {unpaid_minutes:.4f} {ADDITIONAL_MINUTES[lg]}"
                 f"{WALLET_TOP_UP[lg]}",
+                lane=BILLING,
             )
 
 
@@ -538,10 +710,11 @@ def check_subscription_status():
                         print(
                             f"Subscription for user {user.user_id} renewed successfully."
                         )
-                        bot.send_message(
+                        queue_message(
                             user.user_id,
                             f"🎉 {plan.name} {SUBSCRIPTION_RENEWED_SUCCESSFULLY[lg]}\n"
                             f"{EXPIRY_DATE_MESSAGE[lg]} {subscription.date_of_expiry}.",
+                            lane=BILLING,
                         )
                         subscription.bulk_ivr_calls_left = (
                             plan.number_of_bulk_call_minutes
@@ -566,9 +739,10 @@ def check_subscription_status():
                         print(
                             f"Renewal failed for user {user.user_id}. Result: {result}"
                         )
-                        bot.send_message(
+                        queue_message(
                             user.user_id,
                             f"🚨 {RENEWAL_FAILED[lg]}",
+                            lane=BILLING,
                         )
                         subscription.subscription_status = "inactive"
                         subscription.save()
@@ -576,17 +750,19 @@ def check_subscription_status():
                     print(f"User {user.user_id} has insufficient balance for renewal.")
                     subscription.subscription_status = "inactive"
                     subscription.save()
-                    bot.send_message(
+                    queue_message(
                         user.user_id,
                         f"⚠️ {RENEWAL_FAILED_DUE_TO_INSUFFICIENT_BALANCE[lg]}",
+                        lane=BILLING,
                     )
             else:
                 print(
                     f"User {user.user_id} has availed the free trial, no payment required."
                 )
-                bot.send_message(
+                queue_message(
                     user.user_id,
                     f"⚠️ {FREE_TRIAL_AVAILED[lg]}",
+                    lane=BILLING,
                 )
                 subscription.subscription_status = "inactive"
                 subscription.save()
@@ -595,7 +771,7 @@ def check_subscription_status():
             print(f"User {user.user_id} does not have auto-renewal enabled.")
             subscription.subscription_status = "inactive"
             subscription.save()
-            bot.send_message(user.user_id, SUBSCRIPTION_RENEWAL_MESSAGE[lg])
+            queue_message(user.user_id, SUBSCRIPTION_RENEWAL_MESSAGE[lg], lane=BILLING)
 
     print("Subscription status check completed.")
 
@@ -632,6 +808,7 @@ def process_call_logs():
 from celery import shared_task
 from .models import ScheduledCalls
 from bot.views import bulk_ivr_flow
+from bot.recipient_import import scheduled_call_recipients
 
 
 @shared_task
@@ -655,7 +832,7 @@ def send_scheduled_ivr_calls():
             if call.task and not call.pathway_id:
                 print(f"Passing task: {call.task}")
                 bulk_ivr_flow(
-                    call.call_data,
+                    scheduled_call_recipients(call),
                     user_id=call.user_id,
                     caller_id=call.caller_id,
                     task=call.task,
@@ -664,7 +841,7 @@ def send_scheduled_ivr_calls():
                 # If pathway_id exists and task is null, pass pathway_id to the IVR flow
                 print(f"Passing pathway_id: {call.pathway_id}")
                 bulk_ivr_flow(
-                    call.call_data,
+                    scheduled_call_recipients(call),
                     user_id=call.user_id,
                     caller_id=call.caller_id,
                     pathway_id=call.pathway_id,
@@ -702,12 +879,7 @@ def execute_bulk_ivr(scheduled_call_id):
             print(f"Scheduled call {scheduled_call_id} has been canceled.")
             return
         try:
-            call_data = ast.literal_eval(
-                scheduled_call.call_data
-            )  # Safely evaluate the string to a list
-            if not isinstance(call_data, list):
-                raise ValueError("call_data must be a list.")
-                print("Converted call_data:", call_data)
+            call_data = scheduled_call_recipients(scheduled_call)
         except Exception as e:
             print(f"Error converting call_data: {str(e)}")
 
@@ -724,12 +896,13 @@ def execute_bulk_ivr(scheduled_call_id):
         scheduled_call.save()
         lg = get_user_language(scheduled_call.user_id_id)
         if response.status_code != 200:
-            bot.send_message(
+            queue_message(
                 scheduled_call.user_id_id,
                 f"Failed to initiate campaign {scheduled_call.campaign_id.campaign_name}.",
+                lane=NORMAL,
             )
             return
-        bot.send_message(scheduled_call.user_id_id, CAMPAIGN_INITIATED[lg])
+        queue_message(scheduled_call.user_id_id, CAMPAIGN_INITIATED[lg], lane=NORMAL)
 
     except ScheduledCalls.DoesNotExist:
         print(f"Scheduled call with ID {scheduled_call_id} does not exist.")
@@ -759,7 +932,7 @@ def send_reminder(scheduled_call_id, reminder_time):
             f"Reminder: Your call is scheduled at {scheduled_call.schedule_time}.\n"
             f"Time left: {reminder_time} minutes."
         )
-        bot.send_message(user_id, reminder_message)
+        queue_message(user_id, reminder_message, lane=NORMAL)
 
         # Mark the reminder as sent (if using the Reminder model)
         reminder = ReminderTable.objects.create(
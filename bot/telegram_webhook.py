@@ -1,12 +1,12 @@
-import json
 import logging
-import threading
 
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 import telebot
 
 from bot.bot_config import bot
+from bot.internal_api import internal_only
+from bot.update_dispatcher import get_update_dispatcher
 
 logger = logging.getLogger(__name__)
 
@@ -35,22 +35,43 @@ def _sync_user_info(update):
         pass
 
 
+def process_update(update):
+    """Run one update to completion (called on an update dispatcher shard)."""
+    # Auto-answer callback queries to prevent UI spinners
+    _auto_answer_callback(update)
+    # Sync user chat_id + username on every interaction
+    _sync_user_info(update)
+    bot.process_new_updates([update])
+
+
 @csrf_exempt
 def telegram_webhook(request):
     """
-    Receives Telegram updates via webhook and processes them.
+    Receives Telegram updates via webhook and queues them for processing.
     """
     if request.method == "POST":
         try:
             json_str = request.body.decode("utf-8")
             update = telebot.types.Update.de_json(json_str)
-            # Auto-answer callback queries to prevent UI spinners
-            _auto_answer_callback(update)
-            # Sync user chat_id + username on every interaction
-            _sync_user_info(update)
-            bot.process_new_updates([update])
+            if not get_update_dispatcher().submit(update, json_str):
+                # Telegram redelivers updates that were not acknowledged
+                return JsonResponse({"status": "busy"}, status=503)
             return JsonResponse({"status": "ok"})
         except Exception as e:
             logger.error(f"Error processing Telegram webhook: {e}")
             return JsonResponse({"status": "error", "message": str(e)}, status=500)
     return JsonResponse({"status": "method not allowed"}, status=405)
+
+
+@internal_only
+def telegram_dispatcher_stats(request):
+    """Queue depth, counters and handler latency histograms of this process."""
+    return JsonResponse(get_update_dispatcher().stats())
+
+
+@internal_only
+def telegram_outbox_stats(request):
+    """Outbound message queue depth, delivery counters and latency per lane."""
+    from bot.message_gateway import stats
+
+    return JsonResponse(stats())
@@ -4,17 +4,19 @@ from PIL import Image
 import json
 from uuid import UUID
 import re
-import io
+from django.conf import settings
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from phonenumbers import geocoder
 from calendar import isleap
 from datetime import datetime, timedelta
+from itertools import chain
 import phonenumbers
 from timezonefinder import TimezoneFinder
 
 import bot.bot_config
 from TelegramBot.constants import STATUS_CODE_200, MAX_INFINITY_CONSTANT
+from TelegramBot.price_service import usd_to_crypto
 from bot.tasks import execute_bulk_ivr, send_reminder, cancel_scheduled_call
 from payment.decorator_functions import (
     check_expiry_date,
@@ -73,7 +75,20 @@ from bot.views import (
     make_wizard_test_call,
 )
 
-from bot.call_gate import pre_call_check, pre_call_check_bulk, classify_destination
+from bot.call_gate import pre_call_check, bulk_gate, classify_destination
+from bot.handler_index import install_handler_index, text_matcher
+from bot.business_hours import describe_days, parse_days, parse_holidays
+from bot import call_details_store
+from bot.dtmf_approval import resolve as resolve_dtmf_approval
+from bot.recipient_import import (
+    RecipientImportError,
+    RecipientLimitExceeded,
+    campaign_recipient_tasks,
+    format_import_report,
+    import_document_recipients,
+    import_text_recipients,
+    recipient_preview,
+)
 from bot.retell_service import (
     purchase_phone_number, release_phone_number, update_phone_number_agent,
     get_retell_phone_number_set, sync_caller_ids_with_retell,
@@ -201,11 +216,17 @@ def handle_cancel_text(message):
 # New UI/UX Hub Handlers
 # =============================================================================
 
+MENU_EMOJI_PREFIXES = ["📞 ", "🎙 ", "☎️ ", "📋 ", "📬 ", "💰 ", "👤 ", "❓ ", ""]
+
+
+@text_matcher(lambda translations_dict: {
+    f"{prefix}{text}" for text in translations_dict.values() for prefix in MENU_EMOJI_PREFIXES
+})
 def _match_menu_text(message_text, translations_dict):
     """Match message text against translated menu buttons with emoji prefix."""
     for lg, text in translations_dict.items():
         # Match with various emoji prefixes
-        for prefix in ["📞 ", "🎙 ", "☎️ ", "📋 ", "📬 ", "💰 ", "👤 ", "❓ ", ""]:
+        for prefix in MENU_EMOJI_PREFIXES:
             if message_text == f"{prefix}{text}":
                 return True
     return False
@@ -368,15 +389,16 @@ def handle_play_recording(call):
 
     try:
         from bot.models import CallRecording
+        from bot.recording_pipeline import delivery_path, is_available
         from bot.recording_utils import download_recording as dl_recording
 
         # Check if we already have a cached recording
         rec = CallRecording.objects.filter(call_id__startswith=call_id).first()
-        if rec and rec.downloaded and rec.file_path and os.path.exists(rec.file_path):
+        if rec and is_available(rec):
             # Send cached audio inline
             call_log = CallLogsTable.objects.filter(call_id__startswith=call_id).first()
             to_num = call_log.call_number if call_log else "Unknown"
-            with open(rec.file_path, "rb") as af:
+            with open(delivery_path(rec), "rb") as af:
                 bot.send_audio(
                     user_id, af,
                     caption=f"🎙 *Recording* — `{to_num}`",
@@ -386,14 +408,11 @@ def handle_play_recording(call):
                 )
             return
 
-        # No cached copy — fetch from Retell
-        from retell import Retell
-        retell_client = Retell(api_key=os.environ.get("RETELL_API_KEY"))
+        # No cached copy — look up the recording URL (stored call, else Retell)
         # Reconstruct full call_id if truncated
         full_call_log = CallLogsTable.objects.filter(call_id__startswith=call_id).first()
         full_call_id = full_call_log.call_id if full_call_log else call_id
-        call_detail = retell_client.call.retrieve(full_call_id)
-        recording_url = getattr(call_detail, "recording_url", None)
+        recording_url = call_details_store.load(full_call_id).get("recording_url")
 
         if recording_url:
             bot.send_message(user_id, "🎙 Downloading recording...")
@@ -2291,7 +2310,6 @@ def handle_plan_selection(call):
     if user_id not in user_data:
         user_data[user_id] = {}
 
-    user_data[user_id]["selected_plan"] = plan
     user_data[user_id]["subscription_price"] = plan.plan_price
     user_data[user_id]["subscription_name"] = plan.name
     user_data[user_id]["subscription_id"] = plan.plan_id
@@ -2897,7 +2915,8 @@ def make_payment(user_id, amount):
     response_data = crypto_payment.json().get("data", {})
     qr_code_base64 = response_data.get("qr_code")
     address = response_data.get("address")
-    crypto_amount = response_data.get("crypto_amount")
+    # Quote from the shared rate store if the gateway omitted the amount
+    crypto_amount = response_data.get("crypto_amount") or usd_to_crypto(amount, currency)
 
     if tx_type == "buy_number":
         bot.send_message(
@@ -4627,46 +4646,17 @@ def get_summary_details():
 def get_bulk_call_recipient(message):
     user_id = message.chat.id
     lg = get_user_language(user_id)
-    user_id = message.chat.id
-    lg = get_user_language(user_id)
-    max_contacts = 50
-    valid_phone_number_pattern = re.compile(r"^[\d\+\-\(\)\s]+$")
-    base_prompts = []
-
-    if message.content_type == "text":
-        lines = message.text.split("\n")
-        base_prompts = [
-            line.strip()
-            for line in lines
-            if valid_phone_number_pattern.match(line.strip())
-        ]
-        print(f"Base Prompts: {base_prompts}")
-
-    elif message.content_type == "document":
-        file_info = bot.get_file(message.document.file_id)
-        downloaded_file = bot.download_file(file_info.file_path)
-        file_stream = io.BytesIO(downloaded_file)
-        try:
-            content = file_stream.read().decode("utf-8")
-            lines = content.split("\n")
-            base_prompts = [
-                line.strip()
-                for line in lines
-                if valid_phone_number_pattern.match(line.strip())
-            ]
-            print(f"Base Prompts: {base_prompts}")
+    max_contacts = settings.BULK_MAX_CONTACTS
+    campaign_id = user_data[user_id]["campaign_id"]
 
-        except Exception as e:
-            bot.send_message(
-                user_id,
-                f"{PROCESSING_ERROR[lg]} {str(e)}",
-                reply_markup=get_main_menu_keyboard(user_id),
+    try:
+        if message.content_type == "text":
+            result = import_text_recipients(campaign_id, message.text, max_contacts)
+        else:
+            result = import_document_recipients(
+                campaign_id, message.document, max_contacts
             )
-
-            return
-    calls_sent = len(base_prompts)
-
-    if calls_sent > max_contacts:
+    except RecipientLimitExceeded:
         bot.send_message(
             user_id,
             f"{max_contacts}{REDUCE_NUMBER_OF_CONTACTS[lg]}"
@@ -4674,17 +4664,26 @@ def get_bulk_call_recipient(message):
             reply_markup=get_main_menu_keyboard(user_id),
         )
         return
-    user_data[user_id]["call_count"] = calls_sent
-    for number in base_prompts:
-        check_validation = validate_mobile(number)
-        if not check_validation:
-            bot.send_message(user_id, INVALID_NUMBER_PROMPT[lg])
-            return
+    except RecipientImportError as e:
+        bot.send_message(
+            user_id,
+            f"{PROCESSING_ERROR[lg]} {str(e)}",
+            reply_markup=get_main_menu_keyboard(user_id),
+        )
+        return
 
-    formatted_prompts = [{"phone_number": phone} for phone in base_prompts if phone]
-    print(formatted_prompts)
-    user_data[user_id]["base_prompts"] = formatted_prompts
-    user_data[user_id]["phone_number"] = formatted_prompts
+    if result["imported"] == 0:
+        bot.send_message(
+            user_id, f"{INVALID_NUMBER_PROMPT[lg]}\n\n{format_import_report(result)}"
+        )
+        return
+    if result["invalid"] or result["duplicates"]:
+        bot.send_message(user_id, format_import_report(result))
+
+    # Recipients live in CampaignRecipient; user_data only keeps the count
+    user_data[user_id]["call_count"] = result["imported"]
+    user_data[user_id].pop("base_prompts", None)
+    user_data[user_id]["phone_number"] = None
     user_data[user_id]["step"] = ""
 
     send_caller_id_selection_prompt(user_id)
@@ -4747,8 +4746,11 @@ def handle_caller_id(call):
     if user_data[user_id]["call_type"] == "bulk_ivr":
         total_count = user_data[user_id]["call_count"]
         summary_details += f"{RECIPIENTS[lg]}\n"
-        for number in phone_number:
-            summary_details += f"{number['phone_number']}\n"
+        preview = recipient_preview(user_data[user_id]["campaign_id"])
+        for number in preview:
+            summary_details += f"{number}\n"
+        if total_count > len(preview):
+            summary_details += f"… +{total_count - len(preview)}\n"
         summary_details += (
             f"{CAMPAIGN[lg]} {user_data[user_id]['campaign_name']}\n\n"
             f"{TOTAL_NUMBERS_BULK[lg]} {total_count}\n"
@@ -5323,12 +5325,8 @@ def handle_dtmf_approve(call):
     user_id = call.message.chat.id
     approval_id = call.data.replace("dtmf_approve_", "")
     try:
-        from django.utils import timezone as tz
-        approval = PendingDTMFApproval.objects.get(id=int(approval_id), user_id=user_id)
-        if approval.status == "pending":
-            approval.status = "approved"
-            approval.resolved_at = tz.now()
-            approval.save()
+        approval, decided = resolve_dtmf_approval(int(approval_id), user_id, "approved")
+        if decided:
             bot.edit_message_text(
                 f"✅ *Approved* — digits `{approval.digits}` accepted.\nCall proceeding.",
                 chat_id=user_id,
@@ -5350,12 +5348,8 @@ def handle_dtmf_reject(call):
     user_id = call.message.chat.id
     approval_id = call.data.replace("dtmf_reject_", "")
     try:
-        from django.utils import timezone as tz
-        approval = PendingDTMFApproval.objects.get(id=int(approval_id), user_id=user_id)
-        if approval.status == "pending":
-            approval.status = "rejected"
-            approval.resolved_at = tz.now()
-            approval.save()
+        approval, decided = resolve_dtmf_approval(int(approval_id), user_id, "rejected")
+        if decided:
             bot.edit_message_text(
                 f"❌ *Rejected* — digits `{approval.digits}` declined.\nAgent will ask caller to re-enter.",
                 chat_id=user_id,
@@ -5494,7 +5488,7 @@ def handle_number_settings(call):
 
     # Business hours toggle
     if record.business_hours_enabled and record.business_hours_start and record.business_hours_end:
-        bh_status = f"ON ({record.business_hours_start.strftime('%H:%M')}-{record.business_hours_end.strftime('%H:%M')} {record.business_hours_timezone})"
+        bh_status = f"ON ({record.business_hours_start.strftime('%H:%M')}-{record.business_hours_end.strftime('%H:%M')} {describe_days(record.business_days)} {record.business_hours_timezone})"
     else:
         bh_status = "OFF ❌"
     markup.add(types.InlineKeyboardButton(
@@ -5506,6 +5500,11 @@ def handle_number_settings(call):
             "🕐 Set Business Hours",
             callback_data=f"bh_set_{phone}"
         ))
+    else:
+        markup.add(types.InlineKeyboardButton(
+            f"🗓 Holidays: {len(record.business_holidays)}",
+            callback_data=f"bh_holidays_{phone}"
+        ))
 
     markup.add(types.InlineKeyboardButton("⬅️ Back", callback_data="my_numbers"))
 
@@ -5754,8 +5753,9 @@ def handle_business_hours_toggle(call):
             user_data[user_id]["bh_phone"] = phone
             bot.send_message(
                 user_id,
-                "🕐 Enter business hours in format: `HH:MM-HH:MM TIMEZONE`\n"
-                "Example: `09:00-17:00 US/Eastern`\n\n"
+                "🕐 Enter business hours in format: `HH:MM-HH:MM TIMEZONE [DAYS]`\n"
+                "Example: `09:00-17:00 US/Eastern Mon-Fri`\n\n"
+                "Days are optional (default: every day).\n"
                 "Common timezones: US/Eastern, US/Central, US/Pacific, Europe/London, Asia/Tokyo",
                 parse_mode="Markdown",
             )
@@ -5774,8 +5774,9 @@ def handle_business_hours_set(call):
 
     bot.send_message(
         user_id,
-        "🕐 Enter business hours in format: `HH:MM-HH:MM TIMEZONE`\n"
-        "Example: `09:00-17:00 US/Eastern`\n\n"
+        "🕐 Enter business hours in format: `HH:MM-HH:MM TIMEZONE [DAYS]`\n"
+        "Example: `09:00-17:00 US/Eastern Mon-Fri`\n\n"
+        "Days are optional (default: every day).\n"
         "Common timezones: US/Eastern, US/Central, US/Pacific, Europe/London, Asia/Tokyo",
         parse_mode="Markdown",
     )
@@ -5791,17 +5792,23 @@ def handle_business_hours_input(message):
     import re
     from datetime import time as dt_time
 
-    # Parse: HH:MM-HH:MM TIMEZONE
-    match = re.match(r"^(\d{1,2}:\d{2})\s*-\s*(\d{1,2}:\d{2})\s+(.+)$", text)
+    # Parse: HH:MM-HH:MM TIMEZONE [DAYS]
+    match = re.match(r"^(\d{1,2}:\d{2})\s*-\s*(\d{1,2}:\d{2})\s+(\S+)(?:\s+(.+))?$", text)
     if not match:
         bot.send_message(
             user_id,
-            "Invalid format. Please use: `HH:MM-HH:MM TIMEZONE`\nExample: `09:00-17:00 US/Eastern`",
+            "Invalid format. Please use: `HH:MM-HH:MM TIMEZONE [DAYS]`\nExample: `09:00-17:00 US/Eastern Mon-Fri`",
             parse_mode="Markdown",
         )
         return
 
-    start_str, end_str, tz_str = match.groups()
+    start_str, end_str, tz_str, days_str = match.groups()
+
+    try:
+        days = parse_days(days_str) if days_str else "0123456"
+    except ValueError:
+        bot.send_message(user_id, f"Unknown days: {days_str}. Try Mon-Fri, Mon,Wed,Fri or daily.")
+        return
 
     # Validate timezone
     import pytz
@@ -5828,13 +5835,14 @@ def handle_business_hours_input(message):
         record.business_hours_start = start_time
         record.business_hours_end = end_time
         record.business_hours_timezone = tz_str.strip()
+        record.business_days = days
         record.business_hours_enabled = True
         record.save()
         _sync_inbound_settings_to_retell(user_id, record)
         bot.send_message(
             user_id,
             f"✅ Business hours set for `{phone}`\n"
-            f"🕐 {start_time.strftime('%H:%M')} - {end_time.strftime('%H:%M')} ({tz_str.strip()})\n\n"
+            f"🕐 {start_time.strftime('%H:%M')} - {end_time.strftime('%H:%M')}, {describe_days(days)} ({tz_str.strip()})\n\n"
             f"Outside these hours, callers will be routed to voicemail (if enabled).",
             reply_markup=get_main_menu_keyboard(user_id),
             parse_mode="Markdown",
@@ -5846,6 +5854,71 @@ def handle_business_hours_input(message):
     user_data[user_id].pop("bh_phone", None)
 
 
+@bot.callback_query_handler(func=lambda call: call.data.startswith("bh_holidays_"))
+def handle_business_holidays_set(call):
+    """Prompt user to enter the dates a number is closed all day."""
+    user_id = call.message.chat.id
+    phone = call.data.replace("bh_holidays_", "")
+
+    record = UserPhoneNumber.objects.filter(
+        user__user_id=user_id, phone_number=phone, is_active=True
+    ).first()
+    if not record:
+        bot.send_message(user_id, "Number not found.", reply_markup=get_main_menu_keyboard(user_id))
+        return
+
+    if user_id not in user_data:
+        user_data[user_id] = {}
+    user_data[user_id]["step"] = "set_business_holidays"
+    user_data[user_id]["bh_phone"] = phone
+
+    current = ", ".join(record.business_holidays) or "none"
+    bot.send_message(
+        user_id,
+        f"🗓 Holidays for `{phone}`: {current}\n\n"
+        "Enter the dates it is closed all day as `YYYY-MM-DD`, separated by commas.\n"
+        "Example: `2026-12-25, 2027-01-01`\n"
+        "Send `none` to clear them.",
+        parse_mode="Markdown",
+    )
+
+
+@bot.message_handler(func=lambda message: user_data.get(message.chat.id, {}).get("step") == "set_business_holidays")
+def handle_business_holidays_input(message):
+    """Parse and save holiday dates."""
+    user_id = message.chat.id
+    phone = user_data[user_id].get("bh_phone", "")
+
+    try:
+        holidays = parse_holidays(message.text or "")
+    except ValueError:
+        bot.send_message(
+            user_id,
+            "Invalid date. Use `YYYY-MM-DD`, e.g. `2026-12-25, 2027-01-01`, or `none`.",
+            parse_mode="Markdown",
+        )
+        return
+
+    record = UserPhoneNumber.objects.filter(
+        user__user_id=user_id, phone_number=phone, is_active=True
+    ).first()
+    if record:
+        record.business_holidays = holidays
+        record.save()
+        _sync_inbound_settings_to_retell(user_id, record)
+        bot.send_message(
+            user_id,
+            f"✅ Holidays for `{phone}`: {', '.join(holidays) or 'none'}",
+            reply_markup=get_main_menu_keyboard(user_id),
+            parse_mode="Markdown",
+        )
+    else:
+        bot.send_message(user_id, "Number not found.", reply_markup=get_main_menu_keyboard(user_id))
+
+    user_data[user_id].pop("step", None)
+    user_data[user_id].pop("bh_phone", None)
+
+
 @bot.message_handler(func=lambda message: message.text and "Recording:" in message.text and ("tap to enable" in message.text or "ON ($0.02)" in message.text))
 def handle_recording_toggle(message):
     """Toggle recording on/off in the call confirmation screen."""
@@ -6013,13 +6086,12 @@ def proceed_single_ivr(message):
 def start_batch_calls_now(message):
     user_id = message.chat.id
     lg = get_user_language(user_id)
-    phone_number = user_data[user_id]["phone_number"]
     caller_id = user_data[user_id]["caller_id"]
     campaign_id = user_data[user_id]["campaign_id"]
     recording_requested = user_data[user_id].get("recording_requested", False)
 
-    # Pre-call gate for bulk
-    gate = pre_call_check_bulk(user_id, phone_number, call_type="bulk")
+    # Pre-call gate for bulk; recipients are read from the table chunk by chunk
+    gate = bulk_gate(user_id, chain.from_iterable(campaign_recipient_tasks(campaign_id)), call_type="bulk")
     if not gate["allowed"]:
         bot.send_message(
             user_id, gate["message"],
@@ -6028,7 +6100,7 @@ def start_batch_calls_now(message):
         return
 
     # Charge recording fee for all calls in batch
-    total_calls = len(phone_number) if isinstance(phone_number, list) else 1
+    total_calls = gate["domestic_count"] + gate["intl_count"]
     if recording_requested:
         rec_total = 0.02 * total_calls
         from payment.views import debit_wallet as dw
@@ -6044,7 +6116,7 @@ def start_batch_calls_now(message):
     if check_user_data(user_data, user_id) == "task":
         task = user_data[user_id]["task"]
         response = bulk_ivr_flow(
-            call_data=phone_number,
+            call_data=None,  # plan_campaign reads the campaign's recipients
             user_id=user_id,
             caller_id=caller_id,
             campaign_id=campaign_id,
@@ -6056,7 +6128,7 @@ def start_batch_calls_now(message):
     else:
         pathway_id = user_data[user_id]["pathway_id"]
         response = bulk_ivr_flow(
-            call_data=phone_number,
+            call_data=None,  # plan_campaign reads the campaign's recipients
             user_id=user_id,
             caller_id=caller_id,
             campaign_id=campaign_id,
@@ -6178,12 +6250,11 @@ def handle_datetime_input_for_schedule(message):
         campaign_id = user_data[user_id]["campaign_id"]
         campaign = CampaignLogs.objects.get(campaign_id=campaign_id)
         print(campaign.campaign_name)
-        call_data = user_data[user_id]["phone_number"]
         caller_id = user_data[user_id]["caller_id"]
+        # Recipients are read from CampaignRecipient when the call fires
         schedule_call = ScheduledCalls.objects.create(
             user_id=user,
             campaign_id=campaign,
-            call_data=call_data,
             schedule_time=utc_time,
             caller_id=caller_id,
         )
@@ -6748,6 +6819,10 @@ def handle_single_call_inbox(message):
     )
 
 
+# Route updates through the precomputed handler index (see bot.handler_index)
+install_handler_index(bot, user_data)
+
+
 def start_bot():
     """
     Start the Telegram bot and initiate infinity polling.
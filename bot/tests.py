@@ -1,3 +1,1698 @@
-from django.test import TestCase
+import asyncio
+import copy
+import datetime
+import fnmatch
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import requests
+import retell
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import (
+    AsyncRequestFactory,
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from redis.exceptions import RedisError, WatchError
+from telebot.apihelper import ApiTelegramException
+
+from bot import (
+    batch_recordings,
+    batch_summary,
+    business_hours,
+    call_details_store,
+    call_gate,
+    call_state,
+    dtmf_approval,
+    live_billing,
+    message_gateway,
+    phone_index,
+    recipient_import,
+    recording_pipeline,
+    recording_storage,
+    state_store,
+    transcript_analysis,
+    views,
+    webhooks,
+)
+from bot.call_context import CallContext
+from bot.campaign_dispatcher import (
+    DISPATCHED,
+    RETRYING,
+    THROTTLED,
+    CampaignDispatcher,
+    plan_campaign,
+)
+from bot.models import (
+    ActiveCall,
+    BatchCallLogs,
+    BatchSummary,
+    CallDuration,
+    CallLogsTable,
+    CallRecording,
+    CampaignChunk,
+    CampaignLogs,
+    CampaignRecipient,
+    ScheduledCalls,
+    UserPhoneNumber,
+)
+from bot.rate_limit import TokenBucket
+from bot.update_dispatcher import ALIVE_PREFIX, PENDING_PREFIX, UpdateDispatcher
+from payment.models import (
+    DTMF_Inbox,
+    SubscriptionPlans,
+    UserSubscription,
+    WalletTransaction,
+)
+from TelegramBot import crypto_cache, http_transport
+from user.models import TelegramUser
+
+
+class FakeRetellClient:
+    """
+    In-process stand-in for the Retell batch call API. Submitted batches
+    are kept in `batches`; the first `fail_times` requests raise.
+    """
+
+    def __init__(self, fail_times=0):
+        self.batches = []
+        self.fail_times = fail_times
+        self.batch_call = self
+
+    def create_batch_call(self, tasks, from_number=None, **kwargs):
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise retell.APIConnectionError(request=httpx.Request("POST", "https://api.retellai.com/create-batch-call"))
+        batch_id = f"fake_batch_{len(self.batches) + 1}"
+        self.batches.append({"batch_call_id": batch_id, "from_number": from_number, "tasks": tasks})
+        return SimpleNamespace(batch_call_id=batch_id, total_task_count=len(tasks))
+
+
+class FakeRedis:
+    """
+    In-process stand-in for the parts of a Redis client the outbound queue
+    uses: lists, one sorted set, hashes and plain keys. Values come back as
+    bytes, like redis-py's.
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    @staticmethod
+    def _bytes(value):
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    def _list(self, key):
+        return self.data.setdefault(key, [])
+
+    def pipeline(self):
+        return _FakePipeline(self)
+
+    # -- keys
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = self._bytes(value)
+        return True
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def expire(self, key, seconds):
+        return int(key in self.data)
+
+    def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def incr(self, key, amount=1):
+        self.data[key] = self._bytes(int(self.data.get(key, b"0")) + amount)
+        return int(self.data[key])
+
+    def scan_iter(self, match="*", count=None):
+        return [key.encode() for key in list(self.data) if fnmatch.fnmatchcase(key, match)]
+
+    def lock(self, name, timeout=None):
+        return _FakeLock(self, name)
+
+    # -- lists
+    def rpush(self, key, *values):
+        self._list(key).extend(self._bytes(value) for value in values)
+        return len(self.data[key])
+
+    def lpush(self, key, *values):
+        for value in values:
+            self._list(key).insert(0, self._bytes(value))
+        return len(self.data[key])
+
+    def lmove(self, source, destination, src="LEFT", dest="RIGHT"):
+        items = self.data.get(source)
+        if not items:
+            return None
+        value = items.pop(0 if src == "LEFT" else -1)
+        if not items:
+            del self.data[source]
+        target = self._list(destination)
+        if dest == "LEFT":
+            target.insert(0, value)
+        else:
+            target.append(value)
+        return value
+
+    def lindex(self, key, index):
+        items = self.data.get(key) or []
+        return items[index] if -len(items) <= index < len(items) else None
+
+    def lrem(self, key, count, value):
+        items = self.data.get(key) or []
+        if self._bytes(value) in items:
+            items.remove(self._bytes(value))
+            if not items:
+                del self.data[key]
+            return 1
+        return 0
+
+    def llen(self, key):
+        return len(self.data.get(key) or [])
+
+    # -- sorted set
+    def zadd(self, key, mapping):
+        self.data.setdefault(key, {}).update({self._bytes(member): score for member, score in mapping.items()})
+
+    def zrangebyscore(self, key, low, high, start=0, num=None):
+        low = float("-inf") if low == "-inf" else low
+        members = sorted((score, member) for member, score in (self.data.get(key) or {}).items())
+        return [member for score, member in members if low <= score <= high][start:][:num]
+
+    def zrem(self, key, member):
+        return int((self.data.get(key) or {}).pop(self._bytes(member), None) is not None)
+
+    def zcard(self, key):
+        return len(self.data.get(key) or {})
+
+    # -- hashes
+    def hincrby(self, key, field, amount=1):
+        fields = self.data.setdefault(key, {})
+        fields[field.encode()] = self._bytes(int(fields.get(field.encode(), b"0")) + amount)
+
+    def hincrbyfloat(self, key, field, amount):
+        fields = self.data.setdefault(key, {})
+        fields[field.encode()] = self._bytes(float(fields.get(field.encode(), b"0")) + amount)
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        fields = self.data.setdefault(key, {})
+        for name, item in ({field: value} if mapping is None else mapping).items():
+            fields[name.encode()] = self._bytes(item)
+
+    def hget(self, key, field):
+        return (self.data.get(key) or {}).get(field.encode())
+
+    def hdel(self, key, *fields):
+        values = self.data.get(key) or {}
+        return sum(values.pop(field.encode(), None) is not None for field in fields)
+
+    def hsetnx(self, key, field, value):
+        fields = self.data.setdefault(key, {})
+        if field.encode() in fields:
+            return 0
+        fields[field.encode()] = self._bytes(value)
+        return 1
+
+    def hmget(self, key, *fields):
+        values = self.data.get(key) or {}
+        return [values.get(field.encode()) for field in fields]
+
+    def hgetall(self, key):
+        return dict(self.data.get(key) or {})
+
+
+class _FakeLock:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def acquire(self, blocking=True):
+        return bool(self.client.set(self.name, 1, nx=True))
+
+    def release(self):
+        self.client.delete(self.name)
+
+
+class _FakePipeline:
+    """Queues commands until execute(). Between watch() and multi() commands
+    run immediately, and execute() raises WatchError if a watched key changed."""
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+        self.watched = {}
+        self.immediate = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.calls, self.watched, self.immediate = [], {}, False
+
+    def __getattr__(self, name):
+        if self.immediate:
+            return getattr(self.client, name)
+
+        def queued(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return queued
+
+    def watch(self, *keys):
+        self.watched = {key: copy.deepcopy(self.client.data.get(key)) for key in keys}
+        self.immediate = True
+
+    def unwatch(self):
+        self.watched, self.immediate = {}, False
+
+    def multi(self):
+        self.immediate = False
+
+    def execute(self):
+        calls, self.calls = self.calls, []
+        watched, self.watched = self.watched, {}
+        if any(self.client.data.get(key) != value for key, value in watched.items()):
+            raise WatchError("Watched variable changed.")
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in calls]
+
+
+# =============================================================================
+# Campaign dispatch (bot.campaign_dispatcher)
+# =============================================================================
+
+@override_settings(RETELL_IN_FLIGHT_TIMEOUT_SECONDS=600)
+class CampaignDispatcherTests(TestCase):
+    def setUp(self):
+        self.user = TelegramUser.objects.create(user_id=1001, user_name="dispatch")
+        self.campaign = CampaignLogs.objects.create(user_id=self.user, campaign_name="Test")
+        self.numbers = [f"+1555010{i:04d}" for i in range(5)]
+        plan_campaign(self.campaign, self.numbers, self.user.user_id, "+15550009999", task="Say hi", chunk_size=2)
+        self.client = FakeRetellClient()
+
+    def dispatcher(self, **kwargs):
+        kwargs.setdefault("max_in_flight", 100)
+        return CampaignDispatcher(
+            self.campaign.campaign_id, client=self.client, bucket=TokenBucket(1000, 1000), **kwargs
+        )
+
+    def test_sends_every_chunk_as_one_batch_call(self):
+        self.assertEqual(self.dispatcher().run(), DISPATCHED)
+
+        sent = [task["to_number"] for batch in self.client.batches for task in batch["tasks"]]
+        self.assertEqual([len(batch["tasks"]) for batch in self.client.batches], [2, 2, 1])
+        self.assertEqual(sent, self.numbers)
+        self.assertEqual(self.client.batches[0]["from_number"], "+15550009999")
+
+        calls = BatchCallLogs.objects.filter(batch_id=str(self.campaign.campaign_id))
+        self.assertEqual(calls.filter(call_status="queued", queued_at__isnull=False).count(), 5)
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.dispatched_calls, 5)
+
+    def test_failed_chunk_is_retried_on_the_next_run(self):
+        self.client.fail_times = 1
+
+        self.assertEqual(self.dispatcher().run(), RETRYING)
+        self.assertEqual(self.dispatcher().run(), DISPATCHED)
+
+        self.assertEqual(len(self.client.batches), 3)
+        first = CampaignChunk.objects.get(campaign=self.campaign, index=0)
+        self.assertEqual((first.status, first.attempts), ("dispatched", 2))
+
+    def test_throttled_until_in_flight_calls_expire(self):
+        self.assertEqual(self.dispatcher(max_in_flight=2).run(), THROTTLED)
+        self.assertEqual(len(self.client.batches), 1)
+
+        # call_ended never arrives for the first chunk; once its calls are
+        # past the in-flight window they stop holding the campaign back
+        BatchCallLogs.objects.filter(batch_id=str(self.campaign.campaign_id), call_status="queued").update(
+            queued_at=timezone.now() - timedelta(seconds=601)
+        )
+        self.assertEqual(self.dispatcher(max_in_flight=2).run(), THROTTLED)
+        self.assertEqual(len(self.client.batches), 2)
+
+    def test_finished_campaign_is_not_planned_again(self):
+        self.dispatcher().run()
+        self.campaign.refresh_from_db()
+
+        with self.assertRaises(ValueError):
+            plan_campaign(self.campaign, self.numbers, self.user.user_id, "+15550009999", task="Say hi")
+
+
+# =============================================================================
+# Internal stats endpoints (bot.internal_api)
+# =============================================================================
+
+@override_settings(INTERNAL_STATS_TOKEN="stats-token")
+class InternalStatsEndpointTests(TestCase):
+    urls = ("/api/telegram/dispatcher/stats", "/api/telegram/outbox/stats", "/api/prices/stats")
+    # Served from process memory, so it answers without Redis
+    local_url = "/api/telegram/dispatcher/stats"
+
+    def test_anonymous_requests_are_refused(self):
+        for url in self.urls:
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer wrong").status_code, 404, url)
+
+    def test_non_staff_users_are_refused(self):
+        self.client.force_login(User.objects.create_user("member"))
+        for url in self.urls:
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+
+    def test_token_and_staff_requests_are_served(self):
+        response = self.client.get(self.local_url, HTTP_AUTHORIZATION="Bearer stats-token")
+        self.assertEqual(response.status_code, 200)
+
+        self.client.force_login(User.objects.create_user("ops", is_staff=True))
+        self.assertEqual(self.client.get(self.local_url).status_code, 200)
+
+
+# =============================================================================
+# Call details store (bot.call_details_store)
+# =============================================================================
+
+ENDED_CALL = {"call_id": "call_1", "call_status": "ended", "transcript_object": []}
+ANALYZED_CALL = {**ENDED_CALL, "call_analysis": {"custom_analysis_data": {"zip_user_input": "10001"}}}
+
+
+class CallDetailsStoreTests(TestCase):
+    def retell_returning(self, call):
+        client = mock.Mock()
+        client.call.retrieve.return_value.to_dict.return_value = call
+        return mock.patch.object(call_details_store, "get_retell_client", return_value=client)
+
+    def test_analyzed_call_is_served_from_the_store(self):
+        call_details_store.save(ANALYZED_CALL)
+        with self.retell_returning(ANALYZED_CALL) as get_client:
+            self.assertEqual(call_details_store.load("call_1"), ANALYZED_CALL)
+        get_client.assert_not_called()
+
+    def test_ended_call_without_analysis_is_fetched_again(self):
+        call_details_store.save(ENDED_CALL)
+        with self.retell_returning(ANALYZED_CALL) as get_client:
+            self.assertEqual(call_details_store.load("call_1"), ANALYZED_CALL)
+        get_client.assert_called_once()
+        self.assertEqual(call_details_store.stored("call_1"), ANALYZED_CALL)
+
+
+# =============================================================================
+# Retell webhook replay (bot.webhooks)
+# =============================================================================
+
+REPLAY_CALL_STARTED = {
+    "call_id": "call_replay",
+    "call_status": "ongoing",
+    "direction": "outbound",
+    "from_number": "+15550009999",
+    "to_number": "+12125550123",
+    "start_timestamp": 1700000000000,
+}
+
+
+@mock.patch.object(webhooks, "send_message")
+class RetellReplayTests(TestCase):
+    def setUp(self):
+        self.user = TelegramUser.objects.create(user_id=1002, user_name="replay", wallet_balance=Decimal("10.00"))
+        CallLogsTable.objects.create(call_id="call_replay", call_number="+12125550123", user_id=self.user.user_id)
+
+    def charges(self):
+        return WalletTransaction.objects.filter(user=self.user)
+
+    def test_duplicate_deliveries_charge_once(self, send_message):
+        for _ in range(10):
+            webhooks.dispatch_retell_event("call_started", dict(REPLAY_CALL_STARTED))
+
+        self.assertEqual(self.charges().count(), 1)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.wallet_balance, Decimal("9.30"))
+
+    def test_retry_after_a_failed_handler_charges_and_notifies_once(self, send_message):
+        handle = webhooks._handle_call_started
+
+        def charge_and_notify(call_data, ctx, fail=False):
+            handle(call_data, ctx)
+            webhooks.queue_message(self.user.user_id, "charged")
+            if fail:
+                raise RuntimeError("handler failed after charging")
+
+        failing = mock.patch.object(
+            webhooks, "_handle_call_started", side_effect=lambda *a: charge_and_notify(*a, fail=True),
+        )
+        with self.captureOnCommitCallbacks(execute=True), failing, self.assertRaises(RuntimeError):
+            webhooks.dispatch_retell_event("call_started", dict(REPLAY_CALL_STARTED))
+        self.assertFalse(self.charges().exists())
+        send_message.assert_not_called()
+
+        retried = mock.patch.object(webhooks, "_handle_call_started", side_effect=charge_and_notify)
+        with self.captureOnCommitCallbacks(execute=True), retried:
+            for _ in range(10):
+                webhooks.dispatch_retell_event("call_started", dict(REPLAY_CALL_STARTED))
+        self.assertEqual(self.charges().count(), 1)
+        send_message.assert_called_once_with(self.user.user_id, "charged")
+
+
+class RetellDrainTests(SimpleTestCase):
+    @mock.patch("bot.tasks.redis_client")
+    def test_busy_call_is_retried_a_bounded_number_of_times(self, redis_client):
+        from bot import tasks
+
+        redis_client.lock.return_value.acquire.return_value = False
+        result = tasks.drain_retell_events.apply(args=("call_busy",), throw=False)
+
+        self.assertEqual(result.result, "Busy")
+        self.assertEqual(
+            redis_client.lock.return_value.acquire.call_count, tasks.RETELL_DRAIN_BUSY_RETRIES + 1
+        )
+
+
+# =============================================================================
+# Per-call reads of a Retell event (bot.call_context)
+# =============================================================================
+
+READS_CALL = {
+    "call_id": "call_reads",
+    "direction": "outbound",
+    "from_number": "+15550009999",
+    "to_number": "+12125550123",
+    "start_timestamp": 1700000000000,
+}
+
+
+# to_number is not a purchased number; phone_index answers from memory
+# (or, without Redis, from one extra query), so it is kept out of the reads
+@mock.patch.object(phone_index, "lookup", return_value=None)
+@mock.patch.object(webhooks, "send_message")
+class RetellEventReadTests(TestCase):
+    """
+    Every row stored about the call comes from the event's CallContext, one
+    query per table at most. The other queries of an event are its writes
+    (ledger claim, stored payload, status updates, ActiveCall, wallet
+    debit) and the two rows those writes read back: the ActiveCall being
+    settled and the wallet it is billed to. They are not counted, so the
+    test does not pin a total that moves with every new write.
+    """
+    context_tables = frozenset({
+        "bot_calllogstable", "bot_batchcalllogs", "bot_callrecording",
+        "payment_managefreeplansingleivrcall", "payment_usersubscription",
+    })
+    billing_tables = frozenset({"bot_activecall", "user_telegramuser"})
+
+    def setUp(self):
+        self.user = TelegramUser.objects.create(user_id=1003, user_name="reads", wallet_balance=Decimal("10.00"))
+        CallLogsTable.objects.create(call_id="call_reads", call_number="+12125550123", user_id=self.user.user_id)
+
+    def reads(self, event, call_data):
+        with CaptureQueriesContext(connection) as queries:
+            webhooks.dispatch_retell_event(event, call_data)
+        return Counter(
+            re.search(r'FROM "(\w+)"', query["sql"]).group(1)
+            for query in queries.captured_queries if query["sql"].startswith("SELECT")
+        )
+
+    def assert_reads_from_context(self, reads):
+        self.assertLessEqual(set(reads), self.context_tables | self.billing_tables)
+        for table in self.context_tables:
+            self.assertLessEqual(reads[table], 1, table)
+
+    def test_call_started(self, send_message, lookup):
+        self.assert_reads_from_context(self.reads("call_started", {**READS_CALL, "call_status": "ongoing"}))
+
+    def test_call_ended(self, send_message, lookup):
+        webhooks.dispatch_retell_event("call_started", {**READS_CALL, "call_status": "ongoing"})
+        # Two minutes: settled by the pre-hold, nothing left to charge or refund
+        ended = {**READS_CALL, "call_status": "ended", "end_timestamp": 1700000120000, "duration_ms": 120000}
+        self.assert_reads_from_context(self.reads("call_ended", ended))
+
+    def test_call_analyzed(self, send_message, lookup):
+        ended = {**READS_CALL, "call_status": "ended", "end_timestamp": 1700000120000, "duration_ms": 120000}
+        webhooks.dispatch_retell_event("call_ended", ended)
+        analyzed = {**ended, "call_analysis": {"call_summary": "Booked", "user_sentiment": "Positive"}}
+        self.assert_reads_from_context(self.reads("call_analyzed", analyzed))
+
+
+# =============================================================================
+# User state encoding (bot.state_store)
+# =============================================================================
+
+class UserStateEncodingTests(SimpleTestCase):
+    def setUp(self):
+        self.backend = state_store.InMemoryStateBackend(ttl=60)
+        self.store = state_store.UserDataStore(self.backend)
+
+    def test_values_round_trip_as_json(self):
+        self.store[1] = {"step": "amount", "amount": Decimal("2.50"), "by_user": {7: ("a", 1)}}
+
+        self.assertEqual(self.store[1].copy(), {"step": "amount", "amount": Decimal("2.50"), "by_user": {7: ("a", 1)}})
+        for raw in self.backend.load("1").values():
+            json.loads(raw)
+
+    def test_values_that_are_not_plain_data_are_rejected(self):
+        self.store[1] = {"step": "start"}
+        with self.assertRaises(TypeError):
+            self.store[1]["callback"] = object()
+        with self.assertRaises(TypeError):
+            self.store[2] = {"items": {1, 2}}
+        self.assertEqual(self.store[1].copy(), {"step": "start"})
+
+    def test_nested_writes_outside_a_scope_are_saved(self):
+        self.store[1] = {"draft": {"name": "a"}, "items": []}
+
+        self.store[1]["draft"]["name"] = "b"
+        self.store[1]["items"].append({"n": 1})
+        self.store[1]["items"][0]["n"] = 2
+        self.store[1]["draft"].setdefault("tags", []).append("x")
+
+        reloaded = state_store.UserDataStore(self.backend)
+        self.assertEqual(reloaded[1].copy(), {"draft": {"name": "b", "tags": ["x"]}, "items": [{"n": 2}]})
+
+    def test_nested_write_of_a_non_json_value_raises(self):
+        self.store[1] = {"draft": {}}
+        with self.assertRaises(TypeError):
+            self.store[1]["draft"]["callback"] = object()
+
+    def test_pickled_values_are_never_loaded(self):
+        self.backend.save("1", {"__session__": "1", "step": '"start"', "blob": '{"__t":"pickle","v":"gASVAA=="}'})
+
+        with self.store.scope():
+            self.assertEqual(self.store[1].copy(), {"step": "start"})
+            self.store[1]["step"] = "next"
+        self.assertNotIn("blob", self.backend.load("1"))
+
+
+@mock.patch("bot.telegrambot.get_user_language", return_value="English")
+@mock.patch("bot.telegrambot.bot")
+class PlanSelectionStateTests(TestCase):
+    def test_selected_plan_is_stored_as_plain_data(self, bot, get_user_language):
+        from bot import telegrambot
+        from payment.models import SubscriptionPlans
+
+        plan = SubscriptionPlans.objects.create(
+            name="Pro", plan_price=Decimal("20.00"), customer_support_level="High", validity_days=30,
+        )
+        user_id = 1004
+        TelegramUser.objects.create(user_id=user_id, user_name="plans")
+        call = SimpleNamespace(data=f"plan_{plan.plan_id}", message=SimpleNamespace(chat=SimpleNamespace(id=user_id)))
+
+        with mock.patch.object(telegrambot, "generate_invoice", return_value="invoice"):
+            telegrambot.handle_plan_selection(call)
+
+        self.assertEqual(telegrambot.user_data[user_id]["subscription_id"], plan.plan_id)
+        bot.send_message.assert_called_once()
+
+
+# =============================================================================
+# DTMF approval listener (bot.dtmf_approval)
+# =============================================================================
+
+@mock.patch.object(dtmf_approval, "SUBSCRIBE_TIMEOUT", 0.05)
+class ApprovalListenerTests(SimpleTestCase):
+    def setUp(self):
+        dtmf_approval._listener = None
+        dtmf_approval._listener_failed_at = None
+        self.attempts = 0
+
+    async def unreachable(self, subscribed):
+        # Redis never answers the connect
+        self.attempts += 1
+        await asyncio.sleep(3600)
+
+    async def test_requests_back_off_after_a_failed_subscribe(self):
+        with mock.patch.object(dtmf_approval, "_listen", self.unreachable):
+            self.assertFalse(await dtmf_approval._ensure_listener())
+
+            started = time.monotonic()
+            for _ in range(5):
+                self.assertFalse(await dtmf_approval._ensure_listener())
+            self.assertLess(time.monotonic() - started, 0.05)
+            self.assertEqual(self.attempts, 1)
+
+            dtmf_approval._listener_failed_at -= dtmf_approval.LISTENER_RETRY_SECONDS
+            self.assertFalse(await dtmf_approval._ensure_listener())
+            self.assertEqual(self.attempts, 2)
+
+
+
+# =============================================================================
+# Outbound Telegram queue (bot.message_gateway)
+# =============================================================================
+
+@override_settings(
+    TELEGRAM_GLOBAL_MESSAGES_PER_SECOND=30, TELEGRAM_CHAT_MESSAGES_PER_SECOND=1,
+    TELEGRAM_CHAT_MESSAGE_BURST=1, TELEGRAM_OUTBOX_MAX_ATTEMPTS=5,
+)
+class OutboxWorkerTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        self.bot = mock.Mock()
+        self.now = 1000.0
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def worker(self):
+        return message_gateway.OutboxWorker(client=self.redis, bot=self.bot, clock=self.clock, sleep=self.sleep)
+
+    def enqueue(self, chat_id, text, lane=message_gateway.NORMAL):
+        envelope = message_gateway._envelope("send_message", chat_id, {"text": text}, lane, None)
+        self.redis.rpush(message_gateway.lane_key(lane), json.dumps(envelope))
+
+    def test_message_taken_by_a_crashed_drainer_is_delivered_by_the_next(self):
+        self.enqueue(1, "first")
+        self.enqueue(1, "second")
+        crashed = self.worker()
+        crashed.heartbeat()
+        self.assertIsNotNone(crashed.claim())
+        # The drainer dies before sending; its heartbeat expires
+        self.redis.delete(f"{message_gateway.WORKER_PREFIX}{crashed.worker_id}")
+
+        self.assertEqual(self.worker().run(max_seconds=5), 2)
+
+        texts = [call.kwargs["text"] for call in self.bot.send_message.call_args_list]
+        self.assertEqual(texts, ["first", "second"])
+        self.assertEqual(self.redis.scan_iter(match=f"{message_gateway.PROCESSING_PREFIX}*"), [])
+
+    def test_messages_of_a_live_drainer_are_left_alone(self):
+        self.enqueue(1, "in progress")
+        busy = self.worker()
+        busy.heartbeat()
+        busy.claim()
+
+        self.assertEqual(self.worker().recover(), 0)
+        self.assertEqual(self.redis.llen(busy.processing_key), 1)
+
+    def test_429_is_retried_after_retry_after_without_using_up_an_attempt(self):
+        sent_at = []
+
+        def send_message(chat_id, text):
+            sent_at.append(self.now)
+            if len(sent_at) == 1:
+                raise ApiTelegramException("sendMessage", None, {
+                    "error_code": 429, "description": "Too Many Requests", "parameters": {"retry_after": 7},
+                })
+
+        self.bot.send_message.side_effect = send_message
+        self.enqueue(1, "hello")
+
+        worker = self.worker()
+        self.assertEqual(worker.run(max_seconds=20), 1)
+
+        self.assertEqual(len(sent_at), 2)
+        self.assertGreaterEqual(sent_at[1] - sent_at[0], 7)
+        self.assertEqual(self.redis.zcard(message_gateway.DELAYED_KEY), 0)
+        counters = self.redis.hgetall(message_gateway.METRICS_KEY)
+        self.assertEqual(counters[b"rate_limited"], b"1")
+        self.assertNotIn(b"retried", counters)
+
+
+# =============================================================================
+# Telegram update dispatch (bot.update_dispatcher)
+# =============================================================================
+
+def _update(update_id, chat_id):
+    return SimpleNamespace(update_id=update_id, message=SimpleNamespace(chat=SimpleNamespace(id=chat_id)))
+
+
+def _parse_update(raw):
+    data = json.loads(raw)
+    return _update(data["update_id"], data["chat_id"])
+
+
+class UpdateDispatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        self.processed = []
+        self.done = threading.Condition()
+
+    def process(self, update):
+        with self.done:
+            self.processed.append(update.update_id)
+            self.done.notify_all()
+
+    def dispatcher(self):
+        dispatcher = UpdateDispatcher(
+            self.process, shards=1, queue_size=10, chat_lock_timeout=60,
+            redis_client=self.redis, parse=_parse_update,
+        )
+        self.addCleanup(dispatcher.stop, 5)
+        return dispatcher
+
+    def wait_for(self, *update_ids):
+        with self.done:
+            self.assertTrue(self.done.wait_for(lambda: set(update_ids) <= set(self.processed), timeout=5))
+
+    def submit(self, dispatcher, update_id, chat_id):
+        raw = json.dumps({"update_id": update_id, "chat_id": chat_id})
+        self.assertTrue(dispatcher.submit(_update(update_id, chat_id), raw))
+
+    def test_chat_locked_elsewhere_does_not_hold_up_its_shard(self):
+        dispatcher = self.dispatcher()
+        self.redis.set("telegram_chat:1", 1)  # another web worker is on chat 1
+
+        self.submit(dispatcher, 1, chat_id=1)
+        self.submit(dispatcher, 2, chat_id=1)
+        self.submit(dispatcher, 3, chat_id=2)
+        self.wait_for(3)
+        self.assertEqual(self.processed, [3])
+        self.assertEqual(self.redis.llen(dispatcher.pending_key), 2)
+
+        self.redis.delete("telegram_chat:1")
+        self.wait_for(1, 2)
+        self.assertEqual(self.processed, [3, 1, 2])
+
+    def test_update_stays_pending_until_it_has_run(self):
+        dispatcher = self.dispatcher()
+        started, release = threading.Event(), threading.Event()
+
+        def process(update):
+            started.set()
+            release.wait(5)
+            self.process(update)
+
+        dispatcher.process = process
+        self.submit(dispatcher, 1, chat_id=1)
+        self.assertTrue(started.wait(5))
+        self.assertEqual(self.redis.llen(dispatcher.pending_key), 1)
+
+        release.set()
+        self.wait_for(1)
+        dispatcher.stop(5)
+        self.assertEqual(self.redis.llen(dispatcher.pending_key), 0)
+
+    def test_updates_of_a_dead_process_are_recovered_in_order(self):
+        dead = f"{PENDING_PREFIX}dead"
+        live = f"{PENDING_PREFIX}live"
+        self.redis.rpush(dead, *(json.dumps({"update_id": i, "chat_id": 1}) for i in (1, 2)))
+        self.redis.rpush(live, json.dumps({"update_id": 9, "chat_id": 1}))
+        self.redis.set(f"{ALIVE_PREFIX}live", 1)
+
+        dispatcher = self.dispatcher()
+        dispatcher.start()
+        self.wait_for(1, 2)
+        dispatcher.stop(5)
+        self.assertEqual(self.processed, [1, 2])
+        self.assertEqual(self.redis.llen(dead), 0)
+        self.assertEqual(self.redis.llen(dispatcher.pending_key), 0)
+        self.assertEqual(self.redis.llen(live), 1)
+
+
+# =============================================================================
+# Crypto price cache (TelegramBot.crypto_cache)
+# =============================================================================
+
+class CryptoPriceCacheTests(SimpleTestCase):
+    def test_missing_price_is_logged_and_returns_none(self):
+        with mock.patch.object(crypto_cache.price_service, "get_price", side_effect=ValueError("no rate")), \
+                self.assertLogs("TelegramBot.crypto_cache", "WARNING") as logs:
+            self.assertIsNone(crypto_cache.get_cached_crypto_price("BTC"))
+        self.assertIn("BTC", logs.output[0])
+
+    def test_price_comes_from_the_price_service(self):
+        with mock.patch.object(crypto_cache.price_service, "get_price", return_value=Decimal(65000)) as get_price:
+            self.assertEqual(crypto_cache.get_cached_crypto_price("BTC"), Decimal(65000))
+        get_price.assert_called_once_with("BTC")
+
+
+# =============================================================================
+# Recipient import (bot.recipient_import)
+# =============================================================================
+
+class RecipientImportTests(TestCase):
+    def setUp(self):
+        self.user = TelegramUser.objects.create(user_id=1201, user_name="import")
+        self.campaign = CampaignLogs.objects.create(user_id=self.user, campaign_name="Import")
+
+    def test_numbers_are_normalised_to_e164(self):
+        self.assertEqual(recipient_import.normalize_number(" +1 (415) 555-0100 "), "+14155550100")
+        self.assertEqual(recipient_import.normalize_number("020 7946 0958", "GB"), "+442079460958")
+        for raw, reason in (("", "empty"), ("1+4155550100", "misplaced '+'"),
+                            ("4155550100", "missing country code"), ("+1415", "not a valid number")):
+            with self.assertRaisesMessage(ValueError, reason):
+                recipient_import.normalize_number(raw)
+
+    def test_numeric_spreadsheet_cells_are_left_to_the_normaliser(self):
+        self.assertEqual(recipient_import._xlsx_cell(14155550100.0), "14155550100")
+        self.assertEqual(recipient_import._xlsx_cell(14155550100), "14155550100")
+        self.assertEqual(recipient_import._xlsx_cell("+14155550100"), "+14155550100")
+        self.assertEqual(recipient_import._xlsx_cell(None), "")
+
+    def test_import_skips_the_header_duplicates_and_invalid_rows(self):
+        rows = iter([
+            (1, ["name", "phone"]),
+            (2, ["Ann", "+1 415 555 0100"]),
+            (3, ["Bob", "+14155550100"]),
+            (4, ["Cy", "14155550101"]),
+            (5, ["Di", "+44 20 7946 0958"]),
+        ])
+        result = recipient_import.import_recipients(self.campaign.campaign_id, rows, max_contacts=10)
+
+        self.assertEqual((result["imported"], result["duplicates"], result["invalid"]), (2, 1, 1))
+        self.assertEqual(result["errors"], [(4, "14155550101", "missing country code")])
+        chunks = list(recipient_import.campaign_recipient_tasks(self.campaign.campaign_id, chunk_size=1))
+        self.assertEqual(chunks, [[{"phone_number": "+14155550100"}], [{"phone_number": "+442079460958"}]])
+
+    def test_recipient_limit_stores_nothing(self):
+        rows = iter([(1, ["+14155550100"]), (2, ["+14155550101"])])
+        with self.assertRaises(recipient_import.RecipientLimitExceeded):
+            recipient_import.import_recipients(self.campaign.campaign_id, rows, max_contacts=1)
+        self.assertFalse(CampaignRecipient.objects.filter(campaign=self.campaign).exists())
+
+    def test_scheduled_call_leaves_imported_recipients_to_the_planner(self):
+        scheduled = ScheduledCalls.objects.create(
+            user_id=self.user, campaign_id=self.campaign, call_data=str([{"phone_number": "+14155550199"}]),
+        )
+        self.assertEqual(recipient_import.scheduled_call_recipients(scheduled), [{"phone_number": "+14155550199"}])
+
+        CampaignRecipient.objects.create(campaign=self.campaign, phone_number="+14155550100")
+        self.assertIsNone(recipient_import.scheduled_call_recipients(scheduled))
+
+
+# =============================================================================
+# Recording downloads (bot.recording_pipeline)
+# =============================================================================
+
+@override_settings(RECORDING_ACCEL_REDIRECT_PREFIX="", RECORDING_STREAM_CHUNK_SIZE=4)
+class RecordingResponseTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "call.wav")
+        with open(self.path, "wb") as f:
+            f.write(b"0123456789")
+
+    def test_parse_range(self):
+        parse = recording_pipeline.parse_range
+        self.assertEqual(parse("bytes=2-5", 10), (2, 5))
+        self.assertEqual(parse("bytes=4-", 10), (4, 9))
+        self.assertEqual(parse("bytes=8-20", 10), (8, 9))
+        self.assertEqual(parse("bytes=-3", 10), (7, 9))
+        self.assertEqual(parse("bytes=-30", 10), (0, 9))
+        self.assertIsNone(parse(None, 10))
+        self.assertIsNone(parse("bytes=0-1,4-5", 10))
+        self.assertIsNone(parse("lines=1-2", 10))
+        self.assertFalse(parse("bytes=10-", 10))
+        self.assertFalse(parse("bytes=5-2", 10))
+        self.assertFalse(parse("bytes=-0", 10))
+
+    async def test_range_is_streamed_from_an_async_iterator_under_asgi(self):
+        request = AsyncRequestFactory().get("/recording", headers={"Range": "bytes=2-8"})
+        response = recording_pipeline.recording_response(request, self.path, "call")
+
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response.is_async)
+        self.assertEqual(response["Content-Range"], "bytes 2-8/10")
+        self.assertEqual(response["Content-Length"], "7")
+        self.assertEqual([chunk async for chunk in response], [b"2345", b"678"])
+
+    def test_range_under_wsgi(self):
+        request = RequestFactory().get("/recording", HTTP_RANGE="bytes=-3")
+        response = recording_pipeline.recording_response(request, self.path, "call")
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), b"789")
+        response.close()
+
+    def test_unsatisfiable_range(self):
+        request = RequestFactory().get("/recording", HTTP_RANGE="bytes=20-")
+        response = recording_pipeline.recording_response(request, self.path, "call")
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */10")
+
+
+# =============================================================================
+# Outbound HTTP (TelegramBot.http_transport)
+# =============================================================================
+
+def _response(status):
+    response = requests.Response()
+    response.status_code = status
+    response.raw = io.BytesIO()
+    return response
+
+
+@override_settings(HTTP_CIRCUIT_FAILURES=3, HTTP_CIRCUIT_RESET_SECONDS=30, HTTP_MAX_RETRIES=2)
+class HttpTransportTests(SimpleTestCase):
+    url = "https://upstream.test/rates"
+
+    def setUp(self):
+        self.host = http_transport._host(self.url)
+        self.addCleanup(http_transport._hosts.pop, self.host.name, None)
+        patcher = mock.patch.object(http_transport.time, "sleep")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upstream(self, *outcomes):
+        return mock.patch.object(self.host.session, "request", side_effect=outcomes)
+
+    def test_circuit_opens_after_repeated_failures_and_a_trial_closes_it(self):
+        with self.upstream(*[requests.ConnectionError("refused")] * 3) as request:
+            for _ in range(3):
+                with self.assertRaises(requests.ConnectionError):
+                    http_transport.get(self.url, retries=0)
+            with self.assertRaises(http_transport.CircuitOpenError):
+                http_transport.get(self.url, retries=0)
+        self.assertEqual(request.call_count, 3)
+        self.assertEqual(self.host.snapshot()["short_circuited"], 1)
+
+        self.host.opened_at -= 30
+        with self.upstream(_response(200)):
+            self.assertEqual(http_transport.get(self.url).status_code, 200)
+        self.assertEqual(self.host.snapshot()["circuit"], "closed")
+
+    def test_post_that_may_have_reached_the_server_is_not_retried(self):
+        with self.upstream(requests.ReadTimeout("slow"), _response(200)) as request, \
+                self.assertRaises(requests.ReadTimeout):
+            http_transport.post(self.url, json={})
+        self.assertEqual(request.call_count, 1)
+
+        with self.upstream(_response(503), _response(200)) as request:
+            self.assertEqual(http_transport.post(self.url, json={}).status_code, 503)
+        self.assertEqual(request.call_count, 1)
+
+    def test_post_is_retried_when_it_was_never_sent_or_rate_limited(self):
+        with self.upstream(requests.ConnectTimeout("no route"), _response(429), _response(200)) as request:
+            self.assertEqual(http_transport.post(self.url, json={}).status_code, 200)
+        self.assertEqual(request.call_count, 3)
+
+    def test_get_is_retried_on_timeouts(self):
+        with self.upstream(requests.ReadTimeout("slow"), _response(503), _response(200)) as request:
+            self.assertEqual(http_transport.get(self.url).status_code, 200)
+        self.assertEqual(request.call_count, 3)
+
+
+# =============================================================================
+# Live billing tick (bot.live_billing)
+# =============================================================================
+
+def _per_call_charges(calls, now):
+    """Per-user totals as the old monitor_active_calls loop charged them, one call at a time."""
+    totals = Counter()
+    for call in calls:
+        elapsed_seconds = (now - call.last_billed_at).total_seconds()
+        if elapsed_seconds < 25:
+            continue
+        charge = call.rate_per_minute * Decimal(str(round(elapsed_seconds / 60, 4)))
+        if charge > 0:
+            totals[call.user_id] += charge
+    return totals
+
+
+@mock.patch.object(live_billing, "redis_client")
+class BillingTickTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.alice = TelegramUser.objects.create(user_id=2001, user_name="alice", wallet_balance=Decimal("50.00"))
+        self.bob = TelegramUser.objects.create(user_id=2002, user_name="bob", wallet_balance=Decimal("50.00"))
+
+    def active_call(self, call_id, user, rate, seconds_since_billed, billing_source="wallet"):
+        return ActiveCall.objects.create(
+            call_id=call_id, user_id=user.user_id, to_number="+442071234567", region="UK",
+            rate_per_minute=Decimal(rate), billing_source=billing_source,
+            start_time=self.now - timedelta(minutes=5),
+            last_billed_at=self.now - timedelta(seconds=seconds_since_billed),
+        )
+
+    def tick(self):
+        with mock.patch.object(live_billing.timezone, "now", return_value=self.now), \
+                mock.patch.object(
+                    TelegramUser.objects, "select_for_update", wraps=TelegramUser.objects.select_for_update
+                ) as wallet_locks, \
+                CaptureQueriesContext(connection) as queries:
+            summary = live_billing.run_billing_tick()
+        return summary, wallet_locks, [query["sql"] for query in queries.captured_queries]
+
+    def test_tick_charges_the_per_call_totals_with_one_wallet_update_per_user(self, redis_client):
+        self.active_call("call_a1", self.alice, "0.50", 90)
+        self.active_call("call_a2", self.alice, "0.20", 60)
+        self.active_call("call_a3", self.alice, "1.00", 45)
+        self.active_call("call_a_plan", self.alice, "0", 90, billing_source="plan")
+        self.active_call("call_b1", self.bob, "0.30", 120)
+        self.active_call("call_b_recent", self.bob, "0.30", 10)
+        expected = _per_call_charges(ActiveCall.objects.all(), self.now)
+
+        summary, wallet_locks, queries = self.tick()
+
+        self.assertEqual(summary["calls"], 4)
+        self.assertEqual(summary["users"], 2)
+        for user in (self.alice, self.bob):
+            user.refresh_from_db()
+            self.assertEqual(user.wallet_balance, Decimal("50.00") - expected[user.user_id])
+            charged = sum(tx.amount for tx in WalletTransaction.objects.filter(user=user))
+            self.assertEqual(charged, expected[user.user_id])
+        self.assertEqual(wallet_locks.call_count, 2)
+        self.assertEqual(sum(sql.startswith('UPDATE "user_telegramuser"') for sql in queries), 2)
+        self.assertEqual(sum(sql.startswith('INSERT INTO "payment_wallettransaction"') for sql in queries), 2)
+        self.assertEqual(ActiveCall.objects.get(call_id="call_a1").total_billed, Decimal("0.75"))
+        self.assertEqual(ActiveCall.objects.get(call_id="call_b_recent").total_billed, 0)
+
+        # Everything was billed up to now, so an overlapping tick charges nothing
+        summary, _, _ = self.tick()
+        self.assertEqual(summary["calls"], 0)
+        self.assertEqual(WalletTransaction.objects.count(), 4)
+
+    @mock.patch.object(live_billing, "queue_message")
+    @mock.patch.object(live_billing, "stop_single_active_call")
+    def test_exhausted_wallet_is_billed_what_is_left_and_the_call_ended(self, stop_call, queue_message, redis_client):
+        TelegramUser.objects.filter(user_id=self.bob.user_id).update(wallet_balance=Decimal("0.40"))
+        self.active_call("call_b1", self.bob, "0.30", 120)
+
+        summary, _, _ = self.tick()
+
+        self.assertEqual(summary["exhausted"], 1)
+        self.bob.refresh_from_db()
+        self.assertEqual(self.bob.wallet_balance, Decimal("0.00"))
+        call = ActiveCall.objects.get(call_id="call_b1")
+        self.assertFalse(call.is_active)
+        self.assertEqual(call.total_billed, Decimal("0.40"))
+        stop_call.assert_called_once_with("call_b1")
+
+
+# =============================================================================
+# Pre-call gate (bot.call_gate)
+# =============================================================================
+
+class ClassifyDestinationTests(SimpleTestCase):
+    def test_numbers_are_matched_on_their_longest_prefix(self):
+        self.assertEqual(call_gate.classify_destination("+971 50 123 4567"), ("UAE", Decimal("0.60"), False))
+        self.assertEqual(call_gate.classify_destination("+44 (20) 7123-4567"), ("UK", Decimal("0.45"), False))
+        self.assertEqual(call_gate.classify_destination("+1 212-555-0123"), ("US/Canada", Decimal("0.00"), True))
+
+    def test_numbers_without_a_country_code_are_domestic(self):
+        self.assertEqual(call_gate.classify_destination("2125550123"), ("US/Canada", Decimal("0.00"), True))
+        self.assertEqual(call_gate.classify_destination(2125550123), ("US/Canada", Decimal("0.00"), True))
+
+    def test_unlisted_prefix_gets_the_default_rate(self):
+        self.assertEqual(
+            call_gate.classify_destination("+999 123 4567"),
+            ("International", call_gate.DEFAULT_INTERNATIONAL_RATE, False),
+        )
+
+    def test_rates_file_extends_and_overrides_the_built_in_table(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as rates_file:
+            rates_file.write("# prefix|region|rate\n\n+1242|Bahamas|0.60\n+44|UK|0.40\n")
+        self.addCleanup(os.remove, rates_file.name)
+
+        with override_settings(INTERNATIONAL_RATES_FILE=rates_file.name):
+            index, lengths = call_gate.build_prefix_index(call_gate._load_rate_table())
+        self.assertEqual(lengths[0], 5)
+
+        with mock.patch.object(call_gate, "_PREFIX_INDEX", index), \
+                mock.patch.object(call_gate, "_PREFIX_LENGTHS", lengths):
+            self.assertEqual(call_gate.classify_destination("+1 242 555 0100"), ("Bahamas", Decimal("0.60"), False))
+            self.assertEqual(call_gate.classify_destination("+1 212 555 0100"), ("US/Canada", Decimal("0.00"), True))
+            self.assertEqual(call_gate.classify_destination("+44 20 7123 4567"), ("UK", Decimal("0.40"), False))
+            self.assertEqual(call_gate.classify_destination("+33 1 23 45 67 89"), ("France", Decimal("0.45"), False))
+
+    def test_unreadable_rates_file_falls_back_to_the_built_in_table(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as rates_file:
+            rates_file.write("+44|UK|not-a-rate\n")
+        self.addCleanup(os.remove, rates_file.name)
+
+        with override_settings(INTERNATIONAL_RATES_FILE=rates_file.name):
+            self.assertEqual(call_gate._load_rate_table(), call_gate.INTERNATIONAL_RATES)
+
+
+BULK_GATE_NUMBERS = (
+    "+1 212 555 0100", "2125550101", {"phone_number": "+13125550102"},
+    "+44 20 7123 4567", {"to_number": "+442071234568"}, "+971501234567", "+999 123 4567",
+)
+
+
+class BulkGateTests(TestCase):
+    def setUp(self):
+        self.user = TelegramUser.objects.create(user_id=1005, user_name="gate", wallet_balance=Decimal("5.00"))
+        plan = SubscriptionPlans.objects.create(
+            name="Pro", plan_price=Decimal("20.00"), customer_support_level="High", validity_days=30,
+        )
+        self.subscription = UserSubscription.objects.create(
+            user_id=self.user, plan_id=plan, subscription_status="active", bulk_ivr_calls_left=Decimal(10),
+        )
+
+    def test_numbers_are_priced_per_region_in_one_query(self):
+        with self.assertNumQueries(1):
+            gate = call_gate.bulk_gate(self.user.user_id, iter(BULK_GATE_NUMBERS))
+
+        self.assertTrue(gate["allowed"])
+        self.assertEqual(gate["regions"], ["US/Canada"] * 3 + ["UK", "UK", "UAE", "International"])
+        self.assertEqual(gate["billing_sources"], ["plan"] * 3 + ["wallet"] * 4)
+        self.assertEqual((gate["domestic_count"], gate["intl_count"]), (3, 4))
+        self.assertEqual(gate["cost_by_region"], {
+            "US/Canada": {"count": 3, "rate": Decimal("0.00"), "estimate": Decimal("0.00")},
+            "UK": {"count": 2, "rate": Decimal("0.45"), "estimate": Decimal("1.80")},
+            "UAE": {"count": 1, "rate": Decimal("0.60"), "estimate": Decimal("1.20")},
+            "International": {"count": 1, "rate": Decimal("0.70"), "estimate": Decimal("1.40")},
+        })
+        self.assertEqual(gate["total_wallet_needed"], Decimal("4.40"))
+        self.assertEqual(
+            sum(bucket["estimate"] for bucket in gate["cost_by_region"].values()), gate["total_wallet_needed"]
+        )
+
+    def test_domestic_calls_beyond_the_plan_are_billed_at_the_overage_rate(self):
+        self.subscription.bulk_ivr_calls_left = Decimal(4)
+        self.subscription.save()
+
+        gate = call_gate.bulk_gate(self.user.user_id, BULK_GATE_NUMBERS)
+
+        self.assertFalse(gate["allowed"])
+        self.assertEqual(gate["billing_sources"][:3], ["wallet"] * 3)
+        self.assertEqual(gate["cost_by_region"]["US/Canada"]["estimate"], Decimal("2.10"))
+        self.assertEqual(gate["total_wallet_needed"], Decimal("6.50"))
+        self.assertIn("Required: $6.50 | Balance: $5.00", gate["message"])
+
+    def test_unknown_user_is_blocked(self):
+        gate = call_gate.bulk_gate(999999, BULK_GATE_NUMBERS)
+        self.assertFalse(gate["allowed"])
+        self.assertEqual(gate["billing_sources"], ["blocked"] * len(BULK_GATE_NUMBERS))
+
+
+# =============================================================================
+# Batch call logs (bot.views)
+# =============================================================================
+
+class BatchCallLogsTests(TestCase):
+    batch_id = "batch_logs"
+
+    def persist(self, count):
+        entries = [(views.placeholder_call_id(self.batch_id, i), f"+1212555{i:04d}") for i in range(count)]
+        with mock.patch.object(views, "BULK_LOG_CHUNK_SIZE", 2), \
+                CaptureQueriesContext(connection) as queries:
+            views.persist_batch_call_logs(entries, self.batch_id, 1007, "+15550009999", recording_requested=True)
+        return [query["sql"] for query in queries.captured_queries]
+
+    def test_rows_are_inserted_in_chunks(self):
+        queries = self.persist(5)
+
+        self.assertEqual(BatchCallLogs.objects.filter(batch_id=self.batch_id).count(), 5)
+        self.assertEqual(CallLogsTable.objects.filter(call_id__startswith=f"{self.batch_id}_call_").count(), 5)
+        self.assertEqual(sum(sql.startswith('INSERT INTO "bot_batchcalllogs"') for sql in queries), 3)
+        self.assertEqual(sum(sql.startswith('INSERT INTO "bot_calllogstable"') for sql in queries), 3)
+        self.assertEqual(BatchSummary.objects.get(batch_id=self.batch_id).total_calls, 5)
+        self.assertTrue(CallLogsTable.objects.get(call_id=f"{self.batch_id}_call_4").recording_requested)
+
+    def test_first_webhook_swaps_the_placeholder_for_the_real_call_id(self):
+        self.persist(2)
+        placeholder = views.placeholder_call_id(self.batch_id, 1)
+        task = views.build_batch_task("+12125550001", placeholder)
+
+        webhooks._reconcile_batch_call_id({"call_id": "call_real", "metadata": task["metadata"]})
+
+        self.assertEqual(BatchCallLogs.objects.get(call_id="call_real").to_number, "+12125550001")
+        self.assertEqual(CallLogsTable.objects.get(call_id="call_real").call_number, "+12125550001")
+        self.assertFalse(BatchCallLogs.objects.filter(call_id=placeholder).exists())
+        # A later event of the same call finds the rows already re-keyed
+        webhooks._reconcile_batch_call_id({"call_id": "call_real", "metadata": task["metadata"]})
+
+    def test_webhook_before_the_rows_are_committed_is_retried(self):
+        metadata = {"placeholder_call_id": views.placeholder_call_id(self.batch_id, 0)}
+        with self.assertRaises(LookupError):
+            webhooks._reconcile_batch_call_id({"call_id": "call_early", "metadata": metadata})
+
+
+# =============================================================================
+# Recording storage tiers (bot.recording_storage)
+# =============================================================================
+
+class RecordingStorageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        cold_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.addCleanup(cold_root.cleanup)
+        storage_settings = override_settings(
+            MEDIA_ROOT=media_root.name,
+            RECORDING_COLD_STORAGE="filesystem",
+            RECORDING_COLD_STORAGE_PATH=cold_root.name,
+        )
+        storage_settings.enable()
+        self.addCleanup(storage_settings.disable)
+        cold = mock.patch.object(recording_storage, "_cold", None)
+        cold.start()
+        self.addCleanup(cold.stop)
+        self.cold_root = cold_root.name
+
+    def recording(self, name, age_seconds, content=b"x" * 100):
+        path = os.path.join(recording_storage.recordings_dir(), name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
+        used_at = time.time() - age_seconds
+        os.utime(path, (used_at, used_at))
+        return path
+
+    def test_least_recently_used_files_are_moved_to_the_cold_tier(self):
+        oldest = self.recording("a.wav", 30, b"oldest" * 20)
+        middle = self.recording("b.wav", 20)
+        newest = self.recording("c.wav", 10)
+
+        self.assertEqual(recording_storage.enforce_budget(budget=250), (1, 120))
+        self.assertFalse(os.path.exists(oldest))
+        self.assertTrue(os.path.exists(os.path.join(self.cold_root, "a.wav")))
+
+        # Serving it brings it back, as the most recently used file
+        self.assertTrue(recording_storage.ensure_local(oldest))
+        with open(oldest, "rb") as f:
+            self.assertEqual(f.read(), b"oldest" * 20)
+        recording_storage.enforce_budget(budget=250)
+        self.assertTrue(os.path.exists(oldest))
+        self.assertFalse(os.path.exists(middle))
+        self.assertTrue(os.path.exists(newest))
+
+    def test_failed_cold_write_keeps_the_file_on_local_disk(self):
+        path = self.recording("a.wav", 30)
+        self.recording("b.wav", 20)
+
+        with mock.patch.object(recording_storage.FilesystemColdStorage, "put", side_effect=PermissionError):
+            self.assertEqual(recording_storage.enforce_budget(budget=150), (0, 0))
+        self.assertTrue(os.path.exists(path))
+
+    def test_missing_file_without_a_cold_copy_is_not_local(self):
+        path = os.path.join(recording_storage.recordings_dir(), "gone.wav")
+        self.assertFalse(recording_storage.ensure_local(path))
+        self.assertEqual(os.listdir(recording_storage.recordings_dir()), [])
+
+    def test_retention_keeps_files_shared_with_a_newer_recording(self):
+        shared = self.recording("shared.wav", 0)
+        expired = self.recording("expired.wav", 0)
+        for call_id, path, content_hash in (
+            ("call_old_shared", shared, "hash_shared"),
+            ("call_new_shared", shared, "hash_shared"),
+            ("call_old", expired, "hash_expired"),
+        ):
+            CallRecording.objects.create(
+                call_id=call_id, user_id=1016, token=call_id, file_path=path,
+                content_hash=content_hash, downloaded=True,
+            )
+        CallRecording.objects.filter(call_id__in=["call_old_shared", "call_old"]).update(
+            created_at=timezone.now() - timedelta(days=40)
+        )
+
+        self.assertEqual(recording_storage.apply_retention(days=30), 2)
+        self.assertTrue(os.path.exists(shared))
+        self.assertFalse(os.path.exists(expired))
+        self.assertFalse(CallRecording.objects.get(call_id="call_old").downloaded)
+        self.assertEqual(CallRecording.objects.get(call_id="call_new_shared").file_path, shared)
+
+
+# =============================================================================
+# Batch recordings page (bot.batch_recordings)
+# =============================================================================
+
+class BatchRecordingsPageTests(TestCase):
+    batch_id = "0f1e2d3c-batch"
+
+    def setUp(self):
+        self.user = TelegramUser.objects.create(user_id=1017, user_name="pages")
+        self.token = f"b_sig_{self.batch_id[:8]}_{self.user.user_id}"
+        for i in range(5):
+            call_id = f"call_page_{i}"
+            CallRecording.objects.create(
+                call_id=call_id, user_id=self.user.user_id, batch_id=self.batch_id, token=f"token_{i}",
+                transcript_text=f"Agent: hello {i}", user_sentiment="Positive",
+            )
+            BatchCallLogs.objects.create(
+                call_id=call_id, batch_id=self.batch_id, user_id=self.user.user_id, to_number=f"+1212555000{i}",
+            )
+            CallDuration.objects.create(call_id=call_id, pathway_id="", duration_in_seconds=60 + i)
+        DTMF_Inbox.objects.create(call_id="call_page_3", call_number="+12125550003", dtmf_input="1", user_id=self.user)
+        redis = mock.patch("bot.utils.redis_client", FakeRedis())
+        redis.start()
+        self.addCleanup(redis.stop)
+
+    def get(self, **headers):
+        query = headers.pop("query", {})
+        return views.batch_recordings_page(RequestFactory().get("/", query, headers=headers), self.token)
+
+    def test_pages_walk_every_row_once_with_one_query_each(self):
+        rows = batch_recordings.batch_rows(self.batch_id, self.user.user_id)
+        seen = []
+        cursor = None
+        while True:
+            with self.assertNumQueries(1):
+                records, cursor = batch_recordings.page(rows, cursor, size=2)
+            seen.extend(records)
+            if cursor is None:
+                break
+
+        self.assertEqual([rec.call_id for rec in seen], [f"call_page_{i}" for i in range(5)])
+        self.assertEqual(
+            (seen[3].to_number, seen[3].duration_seconds, seen[3].keypresses), ("+12125550003", 63, "1")
+        )
+        self.assertIsNone(seen[0].keypresses)
+
+    def test_unchanged_page_is_not_modified_until_the_batch_changes(self):
+        first = self.get()
+        self.assertEqual(first.status_code, 200)
+        self.assertContains(first, "hello 4")
+
+        self.assertEqual(self.get(if_none_match=first["ETag"]).status_code, 304)
+        # The rendered page comes from the cache: only the batch lookup hits the database
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get().content, first.content)
+
+        batch_recordings.invalidate_batch_page(self.batch_id)
+        changed = self.get(if_none_match=first["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], first["ETag"])
+
+    def test_csv_export_streams_every_row(self):
+        response = self.get(query={"format": "csv"})
+
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], ",".join(batch_recordings.EXPORT_FIELDS))
+        self.assertEqual(len(lines), 6)
+        self.assertIn("call_page_3", lines[4])
+
+
+# =============================================================================
+# Batch summary counters (bot.batch_summary)
+# =============================================================================
+
+class BatchSummaryTests(TestCase):
+    batch_id = "batch_summary"
+    user_id = 1018
+
+    def batch_calls(self, count, call_status="queued"):
+        entries = [(f"call_sum_{i}", f"+1212555{i:04d}") for i in range(count)]
+        views.persist_batch_call_logs(entries, self.batch_id, self.user_id, "", call_status=call_status)
+        return list(BatchCallLogs.objects.filter(batch_id=self.batch_id).order_by("call_id"))
+
+    def test_redelivered_call_ended_is_counted_once(self):
+        first, second, third = self.batch_calls(3, call_status="pending")
+
+        batch_summary.record_call_completed(first, 60, has_dtmf=True)
+        batch_summary.record_call_completed(first, 60, has_dtmf=True)
+        batch_summary.record_call_completed(second, 30.5, has_dtmf=False)
+        self.assertFalse(batch_summary.claim_consolidated_summary(self.batch_id))
+
+        batch_summary.record_calls_failed(self.batch_id, self.user_id, [third.call_id, first.call_id])
+        summary = batch_summary.get_batch_summary(self.batch_id, self.user_id)
+        self.assertEqual(
+            (summary.total_calls, summary.completed_calls, summary.failed_calls, summary.dtmf_responses),
+            (3, 2, 1, 1),
+        )
+        self.assertEqual(summary.total_duration_seconds, 90.5)
+
+        with self.assertNumQueries(1):
+            self.assertTrue(batch_summary.claim_consolidated_summary(self.batch_id))
+        self.assertFalse(batch_summary.claim_consolidated_summary(self.batch_id))
+
+    def test_batch_without_counters_is_built_from_one_scan(self):
+        calls = self.batch_calls(2)
+        BatchSummary.objects.filter(batch_id=self.batch_id).delete()
+        BatchCallLogs.objects.filter(call_id=calls[0].call_id).update(call_status="complete")
+        CallDuration.objects.create(call_id=calls[0].call_id, pathway_id="", duration_in_seconds=42)
+        user = TelegramUser.objects.create(user_id=self.user_id, user_name="summary")
+        DTMF_Inbox.objects.create(call_id=calls[0].call_id, call_number="+12125550000", dtmf_input="2", user_id=user)
+        CallRecording.objects.create(
+            call_id=calls[0].call_id, user_id=self.user_id, batch_id=self.batch_id, token="token_sum",
+        )
+
+        # The recording was created before the row existed, so the scan has already counted it
+        batch_summary.record_recording(self.batch_id, self.user_id)
+        summary = batch_summary.get_batch_summary(self.batch_id, self.user_id)
+        self.assertEqual(
+            (summary.total_calls, summary.completed_calls, summary.dtmf_responses, summary.recordings),
+            (2, 1, 1, 1),
+        )
+        self.assertEqual(summary.total_duration_seconds, 42)
+
+        batch_summary.record_call_completed(calls[1], 18, has_dtmf=False)
+        summary.refresh_from_db()
+        self.assertEqual((summary.completed_calls, summary.total_duration_seconds), (2, 60))
+
+
+# =============================================================================
+# Per-call event ordering (bot.call_state)
+# =============================================================================
+
+ORDER_CALL = {"call_id": "call_order"}
+
+
+class CallStateTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        redis = mock.patch("bot.utils.redis_client", self.redis)
+        redis.start()
+        self.addCleanup(redis.stop)
+
+    def test_late_and_repeated_lifecycle_events_are_dropped(self):
+        self.assertEqual(call_state.begin("call_started", ORDER_CALL), call_state.APPLY)
+        self.assertEqual(call_state.begin("call_started", ORDER_CALL), call_state.DROP)
+        self.assertEqual(call_state.begin("call_ended", ORDER_CALL), call_state.APPLY)
+        self.assertEqual(call_state.begin("call_ended", ORDER_CALL), call_state.DROP)
+
+        late_call = {"call_id": "call_late"}
+        self.assertEqual(call_state.begin("call_ended", late_call), call_state.APPLY)
+        self.assertEqual(call_state.begin("call_started", late_call), call_state.DROP)
+
+    def test_analysis_before_call_ended_is_parked_until_it_is_applied(self):
+        analyzed = {**ORDER_CALL, "call_analysis": {"call_summary": "Booked"}}
+        self.assertEqual(call_state.begin("call_analyzed", analyzed), call_state.DEFER)
+        self.assertEqual(call_state.begin("call_ended", ORDER_CALL), call_state.APPLY)
+
+        parked = call_state.pending_analysis("call_order")
+        self.assertEqual(parked, analyzed)
+        self.assertEqual(call_state.begin("call_analyzed", parked), call_state.APPLY)
+        # The handler failed: the retry is applied rather than dropped, and the payload is still there
+        call_state.rollback("call_analyzed", "call_order")
+        self.assertEqual(call_state.begin("call_analyzed", call_state.pending_analysis("call_order")), call_state.APPLY)
+
+        call_state.clear_pending_analysis("call_order")
+        self.assertIsNone(call_state.pending_analysis("call_order"))
+        self.assertEqual(call_state.begin("call_analyzed", analyzed), call_state.DROP)
+
+    def test_transcript_entries_are_streamed_once_and_not_after_the_call_ended(self):
+        self.assertEqual(call_state.advance_transcript("call_order", 2), 0)
+        self.assertIsNone(call_state.advance_transcript("call_order", 2))
+        self.assertIsNone(call_state.advance_transcript("call_order", 1))
+        self.assertEqual(call_state.advance_transcript("call_order", 5), 2)
+
+        call_state.begin("call_ended", ORDER_CALL)
+        self.assertIsNone(call_state.advance_transcript("call_order", 7))
+
+    def test_concurrent_update_is_decided_again_on_the_new_state(self):
+        read_state = self.redis.hgetall
+
+        def hgetall_raced_by_another_worker(key):
+            state = read_state(key)
+            if self.redis.hgetall is hgetall_raced_by_another_worker:
+                self.redis.hgetall = read_state
+                self.assertEqual(call_state.advance_transcript("call_order", 3), 0)
+            return state
+
+        self.redis.hgetall = hgetall_raced_by_another_worker
+        # Read cursor 0, lost the race to the worker that moved it to 3
+        self.assertEqual(call_state.advance_transcript("call_order", 4), 3)
+        self.assertEqual(self.redis.hget("call_state:call_order", "cursor"), b"4")
+        self.assertEqual(self.redis.hget("call_state:call_order", "seq"), b"2")
+
+
+# =============================================================================
+# Inbound number index (bot.phone_index)
+# =============================================================================
+
+class PhoneIndexTests(TestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        redis = mock.patch("bot.utils.redis_client", self.redis)
+        redis.start()
+        self.addCleanup(redis.stop)
+        phone_index.forget()
+        self.addCleanup(phone_index.forget)
+
+        user = TelegramUser.objects.create(user_id=1022, user_name="numbers")
+        self.number = UserPhoneNumber.objects.create(
+            user=user, phone_number="+15550102000", next_renewal_date=timezone.now(), voicemail_enabled=True,
+        )
+        UserPhoneNumber.objects.create(
+            user=user, phone_number="+15550102001", next_renewal_date=timezone.now(), is_active=False,
+        )
+
+    def test_lookups_are_answered_from_memory_after_one_load(self):
+        with self.assertNumQueries(1):
+            entry = phone_index.lookup("+1 (555) 010-2000")
+            self.assertEqual((entry.user_id, entry.voicemail_enabled), (1022, True))
+            self.assertEqual(phone_index.lookup("+15550102000"), entry)
+            self.assertIsNone(phone_index.lookup("+15550102001"))
+            self.assertIsNone(phone_index.lookup("+15559999999"))
+
+    def test_saved_number_reloads_the_index_of_every_process(self):
+        stale = phone_index.lookup("+15550102000")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.number.forwarding_enabled = True
+            self.number.forwarding_number = "+12125550100"
+            self.number.save()
+        self.assertEqual(self.redis.get(phone_index.VERSION_KEY), b"1")
+
+        # Another process still holds the index it loaded before the save
+        phone_index._index = (0, {"+15550102000": stale}, 0)
+        self.assertEqual(phone_index.lookup("+15550102000").forwarding_number, "+12125550100")
+        # Up to date: the version check alone, no reload
+        phone_index._index = (1, phone_index._index[1], 0)
+        with self.assertNumQueries(0):
+            self.assertTrue(phone_index.lookup("+15550102000").forwarding_enabled)
+
+    def test_database_answers_while_redis_is_down(self):
+        with mock.patch.object(self.redis, "get", side_effect=RedisError("down")), \
+                self.assertNumQueries(1):
+            self.assertEqual(phone_index.lookup("+15550102000").user_id, 1022)
+
+
+# =============================================================================
+# Business hours schedules (bot.business_hours)
+# =============================================================================
+
+def _hours_entry(start, end, days="01234", holidays=()):
+    return phone_index.PhoneEntry(
+        phone_number="+15550102000", user_id=1023, voicemail_enabled=False, forwarding_enabled=False,
+        forwarding_number="", business_hours_enabled=True, business_hours_start=datetime.time(*start),
+        business_hours_end=datetime.time(*end), business_hours_timezone="US/Eastern", business_days=days,
+        business_holidays=list(holidays),
+    )
+
+
+class BusinessHoursTests(SimpleTestCase):
+    tz = business_hours.get_timezone("US/Eastern")
+
+    def setUp(self):
+        schedules = mock.patch.dict(business_hours._schedules, clear=True)
+        schedules.start()
+        self.addCleanup(schedules.stop)
+
+    def status(self, entry, *local):
+        now = self.tz.localize(datetime.datetime(*local)).timestamp()
+        with mock.patch.object(phone_index, "lookup", return_value=entry):
+            return business_hours.status(entry.phone_number, now=now)
+
+    def assert_next_change(self, status, *local):
+        self.assertEqual(status.next_change, self.tz.localize(datetime.datetime(*local)))
+
+    def test_open_and_closed_on_weekdays(self):
+        weekdays = _hours_entry((9, 0), (17, 0))
+        # Monday 2 March 2026
+        status = self.status(weekdays, 2026, 3, 2, 10, 0)
+        self.assertTrue(status.is_open)
+        self.assert_next_change(status, 2026, 3, 2, 17, 0)
+        self.assertEqual((status.hours, status.days), ("09:00-17:00", "Mon-Fri"))
+
+        # Friday evening: closed over the weekend, opening after the DST change
+        status = self.status(weekdays, 2026, 3, 6, 18, 0)
+        self.assertFalse(status.is_open)
+        self.assert_next_change(status, 2026, 3, 9, 9, 0)
+        self.assertEqual(status.next_change.utcoffset(), datetime.timedelta(hours=-4))
+
+    def test_holiday_stays_closed(self):
+        status = self.status(_hours_entry((9, 0), (17, 0), holidays=["2026-03-09"]), 2026, 3, 6, 18, 0)
+        self.assertFalse(status.is_open)
+        self.assert_next_change(status, 2026, 3, 10, 9, 0)
+
+    def test_window_past_midnight(self):
+        overnight = _hours_entry((22, 0), (6, 0), days="0")
+        status = self.status(overnight, 2026, 3, 3, 2, 0)
+        self.assertTrue(status.is_open)
+        self.assert_next_change(status, 2026, 3, 3, 6, 0)
+        self.assertFalse(self.status(overnight, 2026, 3, 3, 23, 0).is_open)
+
+    def test_number_without_business_hours(self):
+        entry = _hours_entry((9, 0), (17, 0))._replace(business_hours_enabled=False)
+        self.assertIsNone(self.status(entry, 2026, 3, 2, 10, 0))
+
+    def test_days_round_trip(self):
+        self.assertEqual(business_hours.parse_days("Mon-Fri"), "01234")
+        self.assertEqual(business_hours.parse_days("fri-mon"), "0456")
+        self.assertEqual(business_hours.describe_days("0456"), "Mon, Fri-Sun")
+        self.assertEqual(business_hours.parse_holidays("2026-12-25, 2026-01-01"), ["2026-01-01", "2026-12-25"])
+        with self.assertRaises(ValueError):
+            business_hours.parse_days("Funday")
+
+
+# =============================================================================
+# Transcript analysis (bot.transcript_analysis)
+# =============================================================================
+
+TRANSCRIPT = [
+    {"role": "agent", "content": "Hello! How satisfied were you with our service?",
+     "words": [{"start": 0.0, "end": 0.5}, {"start": 2.0, "end": 2.5}]},
+    {"role": "user", "content": "Very satisfied, thanks.", "words": [{"start": 3.0, "end": 4.25}]},
+    {"role": "user", "content": "Pressed Button: 4"},
+    {"role": "agent", "content": "Would you recommend us?", "words": [{"start": 5.0, "end": 6.0}]},
+    {"role": "user", "content": "Pressed Button: 2"},
+    {"role": "user", "content": "Yes"},
+]
+
+
+class TranscriptAnalysisTests(SimpleTestCase):
+    def test_one_pass_feeds_every_consumer(self):
+        analysis = transcript_analysis.analyze(TRANSCRIPT)
+
+        self.assertEqual(analysis.dtmf_digits, "42")
+        self.assertEqual(analysis.full_text, (
+            "Agent: Hello! How satisfied were you with our service?\n"
+            "Caller: Very satisfied, thanks.\n"
+            "Agent: Would you recommend us?\n"
+            "Caller: Yes"
+        ))
+        self.assertEqual(analysis.word_counts, {"agent": 12, "caller": 4})
+        self.assertEqual(analysis.timing, {
+            "agent_seconds": 3.5, "caller_seconds": 1.25, "first_caller_word": 3.0, "last_word": 6.0,
+        })
+        self.assertEqual(
+            analysis.feedback_answers(["how satisfied were you", "Would you recommend us", "Anything else?"]),
+            ["Very satisfied, thanks.", "Pressed Button: 2", transcript_analysis.NO_RESPONSE],
+        )
+
+    def test_bland_format_copy_gives_the_same_result(self):
+        bland = [
+            {"user": "assistant" if entry["role"] == "agent" else "user", "text": entry["content"]}
+            for entry in TRANSCRIPT
+        ]
+        retell, copied = transcript_analysis.analyze(TRANSCRIPT), transcript_analysis.analyze(bland)
+
+        self.assertEqual(
+            (copied.dtmf_digits, copied.full_text, copied.word_counts),
+            (retell.dtmf_digits, retell.full_text, retell.word_counts),
+        )
+
+    def test_short_text_keeps_the_first_exchanges(self):
+        long_call = [{"role": "agent" if i % 2 else "user", "content": f"line {i}"} for i in range(10)]
+        short_text = transcript_analysis.analyze(long_call).short_text
+
+        self.assertEqual(short_text.splitlines()[-1], "... (4 more lines)")
+        self.assertEqual(len(short_text.splitlines()), transcript_analysis.SHORT_LINES + 1)
+
+    def test_call_is_analysed_once_and_cached_for_later_readers(self):
+        redis = FakeRedis()
+        ctx = CallContext({"call_id": "call_transcript", "transcript_object": TRANSCRIPT})
+        with mock.patch("bot.utils.redis_client", redis), \
+                mock.patch.object(transcript_analysis, "analyze", wraps=transcript_analysis.analyze) as analyze:
+            self.assertEqual(ctx.transcript.dtmf_digits, "42")
+            self.assertIs(ctx.transcript, ctx.transcript)
+            self.assertEqual(transcript_analysis.cached("call_transcript"), ctx.transcript)
+            self.assertIsNone(transcript_analysis.cached("call_other"))
+        analyze.assert_called_once()
@@ -0,0 +1,170 @@
+"""
+Transcript Analysis — one pass over a call transcript for every consumer.
+
+analyze() walks the entries once and returns a TranscriptAnalysis:
+
+  dtmf_digits     keypresses ("Pressed Button: X" caller entries)
+  full_text       Agent/Caller dialogue without the keypress entries
+  short_text      the first 3 exchanges, for Telegram summaries
+  word_counts     words spoken per role ("agent", "caller")
+  timing          speaking seconds per role, first caller word and last
+                  word offsets (from Retell's per-word timestamps)
+  contents        every entry's text, in order, and agent_entries — the
+                  indexes of agent entries — for feedback_answers()
+
+Retell entries ({role, content, words}) and the Bland-compatible copies
+from bot.views.get_call_details ({user, text}) are both accepted.
+
+analyze_call() also stores the result in Redis under
+`transcript_analysis:<call_id>`, so later consumers (the feedback view)
+read it with cached() instead of fetching and re-scanning the call.
+"""
+import json
+import logging
+from typing import NamedTuple
+
+from redis.exceptions import RedisError
+
+from bot.utils import remove_punctuation_and_spaces
+
+logger = logging.getLogger(__name__)
+
+DTMF_MARKER = "Pressed Button: "
+SHORT_LINES = 6  # 3 agent + caller exchanges
+CACHE_TTL = 7 * 86400
+NO_RESPONSE = "No response found."
+ROLE_LABELS = {"agent": "Agent", "caller": "Caller"}
+
+
+class TranscriptAnalysis(NamedTuple):
+    dtmf_digits: str
+    full_text: str
+    short_text: str
+    word_counts: dict
+    timing: dict
+    contents: list
+    agent_entries: list
+
+    def feedback_answers(self, questions):
+        """The entry after the first agent entry containing each question."""
+        # Each agent entry is normalised once, not once per question
+        agent_lines = [
+            (index, remove_punctuation_and_spaces(self.contents[index].lower()))
+            for index in self.agent_entries
+        ]
+        answers = []
+        for question in questions:
+            needle = remove_punctuation_and_spaces(question.lower())
+            answer = NO_RESPONSE
+            for index, text in agent_lines:
+                if needle in text:
+                    if index + 1 < len(self.contents):
+                        answer = self.contents[index + 1]
+                    break
+            answers.append(answer)
+        return answers
+
+
+def _role(entry):
+    role = entry.get("role") or entry.get("user", "")
+    if role in ("agent", "assistant"):
+        return "agent"
+    if role == "user":
+        return "caller"
+    return role
+
+
+def analyze(transcript_object):
+    dtmf = []
+    lines = []
+    contents = []
+    agent_entries = []
+    word_counts = {"agent": 0, "caller": 0}
+    speaking = {"agent": 0.0, "caller": 0.0}
+    first_caller_word = None
+    last_word = 0.0
+
+    for index, entry in enumerate(transcript_object or ()):
+        role = _role(entry)
+        raw = entry.get("content", entry.get("text", "")) or ""
+        contents.append(raw)
+        content = raw.strip()
+
+        if role == "agent":
+            agent_entries.append(index)
+
+        if "Pressed Button:" in content:
+            # Keypresses go to dtmf_digits, not the dialogue
+            if role == "caller" and DTMF_MARKER in content:
+                digit = content.split(DTMF_MARKER)[1].strip()
+                if digit.isdigit():
+                    dtmf.append(digit)
+            continue
+        if not content or role not in ROLE_LABELS:
+            continue
+
+        lines.append(f"{ROLE_LABELS[role]}: {content}")
+        word_counts[role] += len(content.split())
+
+        words = entry.get("words") or ()
+        if words:
+            start, end = words[0].get("start") or 0.0, words[-1].get("end") or 0.0
+            speaking[role] += max(end - start, 0.0)
+            last_word = max(last_word, end)
+            if role == "caller" and first_caller_word is None:
+                first_caller_word = start
+
+    short_text = "\n".join(lines[:SHORT_LINES])
+    if len(lines) > SHORT_LINES:
+        short_text += f"\n... ({len(lines) - SHORT_LINES} more lines)"
+
+    return TranscriptAnalysis(
+        dtmf_digits="".join(dtmf),
+        full_text="\n".join(lines),
+        short_text=short_text,
+        word_counts=word_counts,
+        timing={
+            "agent_seconds": round(speaking["agent"], 2),
+            "caller_seconds": round(speaking["caller"], 2),
+            "first_caller_word": first_caller_word,
+            "last_word": round(last_word, 2),
+        },
+        contents=contents,
+        agent_entries=agent_entries,
+    )
+
+
+# =============================================================================
+# Per-call cache
+# =============================================================================
+
+def _key(call_id):
+    return f"transcript_analysis:{call_id}"
+
+
+def _redis():
+    from bot.utils import redis_client
+
+    return redis_client
+
+
+def analyze_call(call_id, transcript_object):
+    """analyze() a finished call's transcript and cache it for cached()."""
+    analysis = analyze(transcript_object)
+    if call_id and transcript_object:
+        try:
+            _redis().set(_key(call_id), json.dumps(analysis._asdict()), ex=CACHE_TTL)
+        except RedisError as e:
+            logger.warning(f"[transcript] Could not cache analysis for {call_id}: {e}")
+    return analysis
+
+
+def cached(call_id):
+    """The stored TranscriptAnalysis of a call, or None."""
+    try:
+        raw = _redis().get(_key(call_id))
+    except RedisError:
+        return None
+    if raw is None:
+        return None
+    return TranscriptAnalysis(**json.loads(raw))
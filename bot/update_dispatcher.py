@@ -0,0 +1,417 @@
+"""
+Update Dispatcher — queued, per-chat ordered processing of Telegram updates.
+
+The webhook view only parses the update and hands it to submit(), so
+Telegram gets its 200 right away:
+
+  1. Updates are sharded by chat id onto a fixed set of worker threads, each
+     with its own bounded queue — one chat's updates run strictly in arrival
+     order while different chats run in parallel
+  2. Before it is queued, the raw update is pushed onto this process's
+     pending list in Redis, and it is removed once it has run. A full
+     shard, or a pending list that cannot be written, rejects the update;
+     the webhook answers 503 and Telegram redelivers it later
+  3. While an update runs, a Redis lock on its chat keeps other web workers
+     (processes) from running the same chat concurrently. An update whose
+     chat is locked elsewhere is parked, with any later updates of that
+     chat, and retried every LOCK_RETRY_SECONDS — the shard goes on with
+     other chats meanwhile
+  4. Every process refreshes a heartbeat key; the pending lists of
+     processes whose heartbeat expired (crash, SIGKILL, OOM) are taken over
+     and their updates run here
+  5. Queue depth, counters and a latency histogram per update type are
+     available from stats() (served at api/telegram/dispatcher/stats)
+
+The bot is created with threaded=False, so handlers run on the shard thread.
+Shard threads live as long as the process, so Django's per-request
+connection cleanup never runs for them: stale or broken database
+connections are closed before and after every update instead.
+
+Without a Redis client (tests, local polling) updates are held in memory
+only and nothing is recovered. A graceful shutdown drains the queues first
+(for up to SHUTDOWN_DRAIN_SECONDS); whatever is left stays on the pending
+list for another process.
+"""
+import atexit
+import bisect
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+
+from django.conf import settings
+from django.db import close_old_connections
+from redis.exceptions import LockError, RedisError
+
+logger = logging.getLogger(__name__)
+
+# How long process exit waits for the shard queues to drain
+SHUTDOWN_DRAIN_SECONDS = 10
+
+PENDING_PREFIX = "telegram_updates:pending:"
+ALIVE_PREFIX = "telegram_updates:alive:"
+# A process's pending list is taken over this long after its last heartbeat
+HEARTBEAT_TTL_SECONDS = 30
+HEARTBEAT_SECONDS = 10
+# How often a shard retries updates parked behind another process's chat lock
+LOCK_RETRY_SECONDS = 0.2
+
+_STOP = object()
+
+# Upper bounds (seconds) of the latency histogram buckets; the last is +Inf
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+UPDATE_TYPES = (
+    "message", "edited_message", "callback_query", "inline_query",
+    "pre_checkout_query", "shipping_query", "my_chat_member", "chat_member",
+)
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram, reported cumulatively like a Prometheus one."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.total += seconds
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.total
+        cumulative, running = {}, 0
+        for bound, count in zip(self.buckets + ("+Inf",), counts):
+            running += count
+            cumulative[str(bound)] = running
+        return {"buckets": cumulative, "count": running, "sum": round(total, 6)}
+
+
+def update_type(update):
+    for name in UPDATE_TYPES:
+        if getattr(update, name, None) is not None:
+            return name
+    return "other"
+
+
+def update_chat_id(update):
+    """Chat an update belongs to, used for sharding and the chat lock."""
+    for name in ("message", "edited_message", "channel_post", "edited_channel_post"):
+        message = getattr(update, name, None)
+        if message is not None:
+            return message.chat.id
+    callback = getattr(update, "callback_query", None)
+    if callback is not None:
+        if callback.message is not None:
+            return callback.message.chat.id
+        return callback.from_user.id
+    for name in ("my_chat_member", "chat_member", "chat_join_request"):
+        member = getattr(update, name, None)
+        if member is not None:
+            return member.chat.id
+    for name in UPDATE_TYPES:
+        item = getattr(update, name, None)
+        if item is not None and getattr(item, "from_user", None) is not None:
+            return item.from_user.id
+    return update.update_id
+
+
+def _parse_update(raw):
+    import telebot
+
+    return telebot.types.Update.de_json(raw)
+
+
+class UpdateDispatcher:
+    def __init__(self, process, shards, queue_size, chat_lock_timeout=0, redis_client=None,
+                 parse=_parse_update):
+        """
+        process: callable(update) that runs one update to completion.
+        chat_lock_timeout: seconds a Redis chat lock is held at most; 0 disables it.
+        redis_client: keeps the pending list and the chat locks; None keeps
+          updates in memory only.
+        parse: callable(raw JSON) -> update, for updates taken over from
+          another process.
+        """
+        self.process = process
+        self.queue_size = queue_size
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(shards)]
+        self.chat_lock_timeout = chat_lock_timeout
+        self.redis_client = redis_client
+        self.parse = parse
+        self.dispatcher_id = uuid.uuid4().hex
+        self.pending_key = f"{PENDING_PREFIX}{self.dispatcher_id}"
+        self.latency = {}
+        self.counters = {"enqueued": 0, "rejected": 0, "processed": 0, "failed": 0, "parked": 0, "recovered": 0}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._stopping = threading.Event()
+        self._started = False
+
+    # -- lifecycle ------------------------------------------------------------
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            for shard, shard_queue in enumerate(self.queues):
+                thread = threading.Thread(
+                    target=self._work, args=(shard_queue,),
+                    name=f"telegram-shard-{shard}", daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+            if self.redis_client is not None:
+                # Alive before the first update lands on the pending list
+                try:
+                    self.heartbeat()
+                except RedisError as e:
+                    logger.warning(f"[update_dispatcher] Heartbeat failed: {e}")
+                thread = threading.Thread(target=self._maintain, name="telegram-dispatch-heartbeat", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._started = True
+        logger.info(f"[update_dispatcher] Started {len(self.queues)} shards")
+
+    def stop(self, timeout=None):
+        """Drain the queues and stop the workers (tests / graceful shutdown).
+        timeout bounds the whole drain, not each shard."""
+        if not self._started:
+            return
+        self._stopping.set()
+        for shard_queue in self.queues:
+            shard_queue.put(_STOP)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(deadline - time.monotonic(), 0))
+        undrained = sum(shard_queue.qsize() for shard_queue in self.queues)
+        if undrained:
+            logger.warning(f"[update_dispatcher] Stopped with {undrained} updates still queued")
+        self._threads = []
+        self._stopping.clear()
+        self._started = False
+
+    # -- submission -----------------------------------------------------------
+
+    def shard_for(self, chat_id):
+        return hash(chat_id) % len(self.queues)
+
+    def submit(self, update, raw=None):
+        """Queue an update; raw is its JSON, kept on the pending list until it
+        has run. Returns False if it was not queued: its shard is full, or
+        the pending list could not be written."""
+        self.start()
+        chat_id = update_chat_id(update)
+        if raw is not None and self.redis_client is not None:
+            try:
+                self.redis_client.rpush(self.pending_key, raw)
+            except RedisError as e:
+                self._count("rejected")
+                logger.warning(f"[update_dispatcher] Could not persist update {update.update_id}: {e}")
+                return False
+        else:
+            raw = None
+        try:
+            self.queues[self.shard_for(chat_id)].put_nowait((update, chat_id, time.monotonic(), raw))
+        except queue.Full:
+            self._ack(raw)
+            self._count("rejected")
+            logger.warning(f"[update_dispatcher] Shard full, rejected update {update.update_id} (chat {chat_id})")
+            return False
+        self._count("enqueued")
+        return True
+
+    def _ack(self, raw):
+        if raw is None:
+            return
+        try:
+            self.redis_client.lrem(self.pending_key, 1, raw)
+        except RedisError as e:
+            logger.warning(f"[update_dispatcher] Could not remove a finished update from the pending list: {e}")
+
+    # -- recovery -------------------------------------------------------------
+
+    def _maintain(self):
+        while not self._stopping.is_set():
+            try:
+                self.heartbeat()
+                self.recover()
+            except RedisError as e:
+                logger.warning(f"[update_dispatcher] Heartbeat failed: {e}")
+            self._stopping.wait(HEARTBEAT_SECONDS)
+
+    def heartbeat(self):
+        self.redis_client.set(f"{ALIVE_PREFIX}{self.dispatcher_id}", 1, ex=HEARTBEAT_TTL_SECONDS)
+
+    def recover(self):
+        """Take over the pending updates of processes that stopped
+        heartbeating and queue them here, oldest first. Returns how many."""
+        recovered = 0
+        for key in self.redis_client.scan_iter(match=f"{PENDING_PREFIX}*", count=100):
+            key = key.decode() if isinstance(key, bytes) else key
+            owner = key[len(PENDING_PREFIX):]
+            if owner == self.dispatcher_id or self.redis_client.exists(f"{ALIVE_PREFIX}{owner}"):
+                continue
+            while True:
+                raw = self.redis_client.lmove(key, self.pending_key, "LEFT", "RIGHT")
+                if raw is None:
+                    break
+                try:
+                    update = self.parse(raw.decode() if isinstance(raw, bytes) else raw)
+                except (ValueError, TypeError, KeyError) as e:
+                    logger.error(f"[update_dispatcher] Dropping unreadable pending update: {e}")
+                    self._ack(raw)
+                    continue
+                chat_id = update_chat_id(update)
+                # Blocks while the shard is full; this thread has nothing else to do
+                self.queues[self.shard_for(chat_id)].put((update, chat_id, time.monotonic(), raw))
+                self._count("recovered")
+                recovered += 1
+        if recovered:
+            logger.warning(f"[update_dispatcher] Recovered {recovered} updates from a stopped process")
+        return recovered
+
+    # -- workers --------------------------------------------------------------
+
+    def _work(self, shard_queue):
+        # chat id -> this shard's updates waiting for that chat's lock, oldest first
+        parked = {}
+        parked_count = 0
+        retry_at = 0
+        stopping = False
+        while not (stopping and not parked):
+            # Parked updates still count against the shard's capacity
+            if not stopping and parked_count < self.queue_size:
+                try:
+                    item = shard_queue.get(timeout=LOCK_RETRY_SECONDS if parked else None)
+                except queue.Empty:
+                    item = None
+            else:
+                item = None
+                time.sleep(LOCK_RETRY_SECONDS)
+
+            if item is _STOP:
+                stopping = True
+            elif item is not None:
+                chat_id = item[1]
+                if chat_id in parked or not self._try_run(*item):
+                    parked.setdefault(chat_id, deque()).append(item)
+                    parked_count += 1
+                    self._count("parked")
+
+            if parked and (stopping or time.monotonic() >= retry_at):
+                for chat_id in list(parked):
+                    waiting = parked[chat_id]
+                    while waiting and self._try_run(*waiting[0]):
+                        waiting.popleft()
+                        parked_count -= 1
+                    if not waiting:
+                        del parked[chat_id]
+                retry_at = time.monotonic() + LOCK_RETRY_SECONDS
+            if stopping and parked:
+                # Still locked elsewhere; they stay on the pending list for another process
+                return
+
+    def _try_run(self, update, chat_id, enqueued_at, raw):
+        """Run the update unless its chat is locked by another process.
+        Returns False (and runs nothing) if it is."""
+        lock = self._chat_lock(chat_id)
+        if lock is False:
+            return False
+        self._run(update, chat_id, enqueued_at, raw, lock)
+        return True
+
+    def _run(self, update, chat_id, enqueued_at, raw, lock):
+        kind = update_type(update)
+        started = time.monotonic()
+        close_old_connections()
+        try:
+            self.process(update)
+            self._count("processed")
+        except Exception:
+            self._count("failed")
+            logger.exception(f"[update_dispatcher] Update {update.update_id} (chat {chat_id}) failed")
+        finally:
+            close_old_connections()
+            self._ack(raw)
+            if lock is not None:
+                try:
+                    lock.release()
+                except (LockError, RedisError):
+                    pass
+            finished = time.monotonic()
+            self._histogram(f"{kind}_handler").observe(finished - started)
+            self._histogram(f"{kind}_total").observe(finished - enqueued_at)
+
+    def _chat_lock(self, chat_id):
+        """The acquired chat lock, None to run without one (disabled, or Redis
+        unavailable), or False if another process holds it."""
+        if not self.chat_lock_timeout or self.redis_client is None:
+            return None
+        lock = self.redis_client.lock(f"telegram_chat:{chat_id}", timeout=self.chat_lock_timeout)
+        try:
+            if lock.acquire(blocking=False):
+                return lock
+        except RedisError as e:
+            logger.warning(f"[update_dispatcher] Chat lock unavailable for {chat_id}: {e}")
+            return None
+        return False
+
+    # -- metrics --------------------------------------------------------------
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _histogram(self, name):
+        histogram = self.latency.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.latency.setdefault(name, LatencyHistogram())
+        return histogram
+
+    def stats(self):
+        depths = [shard_queue.qsize() for shard_queue in self.queues]
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            "shards": len(self.queues),
+            "queue_depth": sum(depths),
+            "queue_depth_by_shard": depths,
+            "counters": counters,
+            "latency_seconds": {
+                name: histogram.snapshot() for name, histogram in sorted(self.latency.items())
+            },
+        }
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_update_dispatcher(process=None):
+    """Process-wide dispatcher, created from settings on first use."""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                from bot.utils import redis_client
+
+                if process is None:
+                    from bot.telegram_webhook import process_update as process
+                _dispatcher = UpdateDispatcher(
+                    process,
+                    shards=settings.TELEGRAM_DISPATCH_SHARDS,
+                    queue_size=settings.TELEGRAM_DISPATCH_QUEUE_SIZE,
+                    chat_lock_timeout=settings.TELEGRAM_CHAT_LOCK_TIMEOUT,
+                    redis_client=redis_client,
+                )
+                atexit.register(_dispatcher.stop, SHUTDOWN_DRAIN_SECONDS)
+    return _dispatcher
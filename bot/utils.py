@@ -58,20 +58,12 @@ def extract_call_details(data):
     timestamp = data.get("end_at", "Unknown")
 
     # Process transcripts
-    transcripts = data.get("transcripts", [])
-    dtmf_input = []
+    from bot.transcript_analysis import analyze
 
-    for entry in transcripts:
-        if entry.get("user") == "user":
-            text = entry.get("text", "")
-            if "Pressed Button: " in text:
-                # Extract the number after "Pressed Button: "
-                number = text.split("Pressed Button: ")[1].strip()
-                if number.isdigit():
-                    dtmf_input.append(number)
+    dtmf_input = analyze(data.get("transcripts", [])).dtmf_digits
 
-    # Concatenate DTMF input or set to "No DTMF input found"
-    dtmf_input_result = "".join(dtmf_input) if dtmf_input else "No DTMF input found"
+    # DTMF input or "No DTMF input found"
+    dtmf_input_result = dtmf_input or "No DTMF input found"
 
     # Return all extracted details
     return {
@@ -327,26 +319,29 @@ def get_batch_id(data):
     return batch_id
 
 
+# Payment-method button text -> crypto currency code (also priced by TelegramBot.price_service)
+PAYMENT_METHOD_CURRENCIES = {
+    "Bitcoin (BTC) ₿": f"{BTC}",
+    "比特币 (BTC) ₿": f"{BTC}",
+    "Ethereum (ETH) Ξ": f"{ETH}",
+    "以太坊 (ETH) Ξ": f"{ETH}",
+    "TRC-20 USDT 💵": "USDT-TRC20",
+    "TRC-20 USDT 💵": "USDT-TRC20",
+    "ERC-20 USDT 💵": "USDT-ERC20",
+    "ERC-20 USDT 💵": "USDT-ERC20",
+    "Litecoin (LTC) Ł": f"{LTC}",
+    "莱特币 (LTC) Ł": f"{LTC}",
+    "DOGE (DOGE) Ɖ": "DOGE",
+    "狗狗币 (DOGE) Ɖ": "DOGE",
+    "Bitcoin Hash (BCH) Ƀ": "BCH",
+    "比特币现金 (BCH) Ƀ": "BCH",
+    "TRON (TRX)": "TRX",
+    "波场 (TRX)": "TRX",
+}
+
+
 def get_currency(payment_method):
-    mapping = {
-        "Bitcoin (BTC) ₿": f"{BTC}",
-        "比特币 (BTC) ₿": f"{BTC}",
-        "Ethereum (ETH) Ξ": f"{ETH}",
-        "以太坊 (ETH) Ξ": f"{ETH}",
-        "TRC-20 USDT 💵": "USDT-TRC20",
-        "TRC-20 USDT 💵": "USDT-TRC20",
-        "ERC-20 USDT 💵": "USDT-ERC20",
-        "ERC-20 USDT 💵": "USDT-ERC20",
-        "Litecoin (LTC) Ł": f"{LTC}",
-        "莱特币 (LTC) Ł": f"{LTC}",
-        "DOGE (DOGE) Ɖ": "DOGE",
-        "狗狗币 (DOGE) Ɖ": "DOGE",
-        "Bitcoin Hash (BCH) Ƀ": "BCH",
-        "比特币现金 (BCH) Ƀ": "BCH",
-        "TRON (TRX)": "TRX",
-        "波场 (TRX)": "TRX",
-    }
-    payment_currency = mapping.get(payment_method, "Unsupported")
+    payment_currency = PAYMENT_METHOD_CURRENCIES.get(payment_method, "Unsupported")
     if payment_currency == "Unsupported":
         status = 400
     else:
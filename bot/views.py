@@ -10,9 +10,11 @@ logger = logging.getLogger(__name__)
 
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import render
+from kombu.exceptions import OperationalError
 
 from bot.models import (
     Pathways,
@@ -24,13 +26,15 @@ from bot.models import (
     CampaignLogs,
     AI_Assisted_Tasks,
 )
+from bot.batch_summary import add_batch_calls
 from bot.retell_service import get_retell_client
-from bot.utils import add_node, get_pathway_data, remove_punctuation_and_spaces
+from bot import call_details_store, transcript_analysis
+from bot.internal_api import internal_only
+from bot.utils import add_node, get_pathway_data
 from payment.models import (
     UserSubscription,
     SubscriptionPlans,
     ManageFreePlanSingleIVRCall,
-    DTMF_Inbox,
 )
 from user.models import TelegramUser
 
@@ -639,17 +643,18 @@ def make_wizard_test_call(phone_number, user_id, caller_id=None):
 
 
 # =============================================================================
-# Call Details & Status — Retell call.retrieve()
+# Call Details & Status — Retell call objects (bot.call_details_store)
 # =============================================================================
 
-def get_call_details(call_id):
+def get_call_details(call_id, refresh=False):
     """
-    Get call details from Retell (replaces Bland GET /v1/calls/{call_id}).
+    Get call details (replaces Bland GET /v1/calls/{call_id}).
+    Finished calls are read from the local store the webhooks fill; others,
+    and refresh=True, go to Retell call.retrieve().
     Returns a dict with Bland-compatible field names for backward compat.
     """
     try:
-        client = get_retell_client()
-        call = client.call.retrieve(call_id)
+        call = call_details_store.load(call_id, refresh=refresh)
 
         # Map Retell status to Bland-compatible status
         status_map = {
@@ -661,46 +666,42 @@ def get_call_details(call_id):
 
         # Convert Retell transcript format to Bland format
         transcripts = []
-        if hasattr(call, "transcript_object") and call.transcript_object:
-            for entry in call.transcript_object:
-                role = "assistant" if entry.role == "agent" else "user"
-                transcripts.append({"user": role, "text": entry.content})
+        for entry in call.get("transcript_object") or []:
+            role = "assistant" if entry.get("role") == "agent" else "user"
+            transcripts.append({"user": role, "text": entry.get("content")})
 
         # Convert epoch ms timestamps to ISO strings
         started_at = None
         end_at = None
-        if hasattr(call, "start_timestamp") and call.start_timestamp:
+        if call.get("start_timestamp"):
             from datetime import datetime, timezone
-            started_at = datetime.fromtimestamp(call.start_timestamp / 1000, tz=timezone.utc).isoformat()
-        if hasattr(call, "end_timestamp") and call.end_timestamp:
+            started_at = datetime.fromtimestamp(call["start_timestamp"] / 1000, tz=timezone.utc).isoformat()
+        if call.get("end_timestamp"):
             from datetime import datetime, timezone
-            end_at = datetime.fromtimestamp(call.end_timestamp / 1000, tz=timezone.utc).isoformat()
+            end_at = datetime.fromtimestamp(call["end_timestamp"] / 1000, tz=timezone.utc).isoformat()
 
         # Convert duration from ms to minutes
         call_length = 0
-        if hasattr(call, "duration_ms") and call.duration_ms:
-            call_length = call.duration_ms / 60000
+        if call.get("duration_ms"):
+            call_length = call["duration_ms"] / 60000
 
         # Extract variables
-        variables = {}
-        if hasattr(call, "call_analysis") and call.call_analysis:
-            if hasattr(call.call_analysis, "custom_analysis_data"):
-                variables = call.call_analysis.custom_analysis_data or {}
+        variables = (call.get("call_analysis") or {}).get("custom_analysis_data") or {}
 
         return {
-            "call_id": call.call_id,
-            "queue_status": status_map.get(call.call_status, call.call_status),
-            "status": call.call_status,
+            "call_id": call.get("call_id", call_id),
+            "queue_status": status_map.get(call.get("call_status"), call.get("call_status")),
+            "status": call.get("call_status"),
             "started_at": started_at,
             "end_at": end_at,
             "call_length": call_length,
             "transcripts": transcripts,
             "variables": variables,
-            "recording_url": getattr(call, "recording_url", None),
-            "disconnection_reason": getattr(call, "disconnection_reason", None),
-            "to": getattr(call, "to_number", None),
-            "from": getattr(call, "from_number", None),
-            "pathway_id": getattr(call, "agent_id", None),
+            "recording_url": call.get("recording_url"),
+            "disconnection_reason": call.get("disconnection_reason"),
+            "to": call.get("to_number"),
+            "from": call.get("from_number"),
+            "pathway_id": call.get("agent_id"),
         }
     except Exception as e:
         logging.error(f"get_call_details error: {e}")
@@ -743,69 +744,96 @@ def get_voices():
 # Bulk/Batch Calls — Retell batch_call API
 # =============================================================================
 
-def bulk_ivr_flow(call_data, user_id, caller_id, campaign_id, task=None, pathway_id=None, recording_requested=False):
+# Rows per INSERT when persisting batch call logs
+BULK_LOG_CHUNK_SIZE = 1000
+
+
+def placeholder_call_id(campaign_id, index):
     """
-    Send batch calls via Retell (replaces Bland POST /v1/batches).
+    Local call_id for a batch task until Retell assigns the real one.
+    It travels in the task metadata and is swapped for the real call_id
+    by bot.webhooks._reconcile_batch_call_id on the first webhook.
     """
-    try:
-        client = get_retell_client()
+    return f"{campaign_id}_call_{index}"
 
-        tasks = []
-        for call_entry in call_data:
-            call_task = {
-                "to_number": call_entry.get("phone_number", call_entry.get("to_number", "")),
-            }
-            if pathway_id:
-                call_task["override_agent_id"] = str(pathway_id)
-            if task:
-                call_task["retell_llm_dynamic_variables"] = {"task_prompt": task}
-            tasks.append(call_task)
-
-        kwargs = {"tasks": tasks}
-        if caller_id:
-            kwargs["from_number"] = caller_id
 
-        batch = client.batch_call.create_batch_call(**kwargs)
-        batch_id = batch.batch_call_id if hasattr(batch, "batch_call_id") else str(batch)
+def build_batch_task(phone, call_id, task=None, pathway_id=None):
+    """One Retell batch task; the placeholder call_id rides in metadata."""
+    call_task = {
+        "to_number": phone,
+        "metadata": {"placeholder_call_id": call_id},
+    }
+    if pathway_id:
+        call_task["override_agent_id"] = str(pathway_id)
+    if task:
+        call_task["retell_llm_dynamic_variables"] = {"task_prompt": task}
+    return call_task
+
 
-        # Save campaign details
-        user = TelegramUser.objects.get(user_id=user_id)
+def persist_batch_call_logs(entries, batch_id, user_id, caller_id, pathway_id=None,
+                            recording_requested=False, call_status="queued"):
+    """
+    Write the BatchCallLogs + CallLogsTable rows for a batch in one
+    transaction with chunked bulk INSERTs. entries: [(call_id, phone), ...]
+    """
+    batch_logs = []
+    call_logs = []
+    for call_id, phone in entries:
+        batch_logs.append(BatchCallLogs(
+            call_id=call_id,
+            batch_id=batch_id,
+            pathway_id=pathway_id or "",
+            user_id=user_id,
+            to_number=phone,
+            from_number=caller_id or "",
+            call_status=call_status,
+            recording_requested=recording_requested,
+        ))
+        call_logs.append(CallLogsTable(
+            call_id=call_id,
+            call_number=phone,
+            pathway_id=pathway_id or "",
+            user_id=user_id,
+            call_status="new",
+            recording_requested=recording_requested,
+            recording_fee=0.02 if recording_requested else 0.00,
+        ))
+
+    with transaction.atomic():
+        BatchCallLogs.objects.bulk_create(batch_logs, batch_size=BULK_LOG_CHUNK_SIZE)
+        CallLogsTable.objects.bulk_create(call_logs, batch_size=BULK_LOG_CHUNK_SIZE)
+        add_batch_calls(batch_id, user_id, len(batch_logs))
+
+
+def bulk_ivr_flow(call_data, user_id, caller_id, campaign_id, task=None, pathway_id=None, recording_requested=False):
+    """
+    Send batch calls via Retell (replaces Bland POST /v1/batches).
+    The campaign is split into chunks that bot.tasks.dispatch_campaign sends
+    as separate, rate-limited Retell batch calls (see bot.campaign_dispatcher).
+    """
+    from bot.campaign_dispatcher import plan_campaign
+    from bot.tasks import dispatch_campaign
+
+    try:
         campaign = CampaignLogs.objects.get(campaign_id=campaign_id)
-        campaign.batch_id = batch_id
-        campaign.total_calls = len(call_data)
-        campaign.save()
-
-        if ScheduledCalls.objects.filter(user_id=user, campaign_id=campaign).exists():
-            scheduled_call = ScheduledCalls.objects.get(user_id=user, campaign_id=campaign)
-            scheduled_call.call_status = True
-            scheduled_call.save()
-
-        # Create call log entries for each task
-        for i, call_entry in enumerate(call_data):
-            phone = call_entry.get("phone_number", call_entry.get("to_number", ""))
-            call_id_entry = f"{batch_id}_call_{i}"
-
-            BatchCallLogs.objects.create(
-                call_id=call_id_entry,
-                batch_id=batch_id,
-                pathway_id=pathway_id or "",
-                user_id=user_id,
-                to_number=phone,
-                from_number=caller_id or "",
-                call_status="queued",
-                recording_requested=recording_requested,
-            )
-            CallLogsTable.objects.create(
-                call_id=call_id_entry,
-                call_number=phone,
-                pathway_id=pathway_id or "",
-                user_id=user_id,
-                call_status="new",
-                recording_requested=recording_requested,
-                recording_fee=0.02 if recording_requested else 0.00,
-            )
+        chunks = plan_campaign(
+            campaign, call_data, user_id, caller_id,
+            task=task, pathway_id=pathway_id, recording_requested=recording_requested,
+        )
+
+        ScheduledCalls.objects.filter(user_id=user_id, campaign_id=campaign).update(call_status=True)
 
-        return FakeResponse(200, {"batch_id": batch_id, "total_calls": len(call_data)})
+        try:
+            dispatch_campaign.delay(str(campaign_id))
+        except OperationalError as e:
+            # Chunk state is durable — resume_campaign_dispatches will pick it up
+            logger.warning(f"bulk_ivr_flow: dispatch enqueue failed for {campaign_id}: {e}")
+
+        return FakeResponse(200, {
+            "batch_id": campaign.batch_id,
+            "total_calls": campaign.total_calls,
+            "chunks": chunks,
+        })
     except Exception as e:
         logging.error(f"bulk_ivr_flow error: {e}")
         return FakeResponse(400, {"error": str(e)})
@@ -902,29 +930,15 @@ def get_transcript(call_id, pathway_id):
     """Get transcript and extract feedback answers (uses Retell transcripts)."""
     feedback_log = FeedbackLogs.objects.get(pathway_id=pathway_id)
     feedback_questions = feedback_log.feedback_questions
-    data = get_call_details(call_id)
-    feedback_answers = []
-
-    for feedback_question in feedback_questions:
-        index = None
-        for i, transcript in enumerate(data.get("transcripts", [])):
-            assistant_text = transcript.get("text", "").lower()
-            feedback_string = feedback_question.lower()
-            formatted_string_feedback = remove_punctuation_and_spaces(feedback_string)
-            formatted_string_assistant = remove_punctuation_and_spaces(assistant_text)
-
-            if (
-                transcript.get("user") == "assistant"
-                and formatted_string_feedback in formatted_string_assistant
-            ):
-                index = i
-                break
-
-        if index is not None and index + 1 < len(data["transcripts"]):
-            next_text = data["transcripts"][index + 1].get("text", "No response found.")
-            feedback_answers.append(next_text)
+    # call_ended already analysed and cached a finished call's transcript
+    analysis = transcript_analysis.cached(call_id)
+    if analysis is None:
+        data = get_call_details(call_id)
+        if data.get("status") == "ended":
+            analysis = transcript_analysis.analyze_call(call_id, data.get("transcripts", []))
         else:
-            feedback_answers.append("No response found.")
+            analysis = transcript_analysis.analyze(data.get("transcripts", []))
+    feedback_answers = analysis.feedback_answers(feedback_questions)
 
     feedback_detail, created = FeedbackDetails.objects.update_or_create(
         call_id=call_id,
@@ -997,194 +1011,141 @@ def view_flows(request):
 
 def serve_recording(request, token):
     """
-    Proxy endpoint to serve call recordings via our own URL.
-    Downloads from Retell on-demand if not cached locally.
+    Proxy endpoint to serve call recordings via our own URL (Range-aware).
+    A recording that is not cached yet is downloaded by a Celery task rather
+    than on this request.
     GET /api/recordings/<token>/
     """
-    from django.http import FileResponse, HttpResponse
+    from django.http import HttpResponse
     from bot.models import CallRecording
-    from bot.recording_utils import download_recording
+    from bot.recording_pipeline import delivery_path, is_available, recording_response
+    from bot.utils import redis_client
 
     rec = CallRecording.objects.filter(token=token).first()
     if not rec:
         return HttpResponse("Recording not found", status=404)
 
-    # If already downloaded locally, serve it
-    if rec.downloaded and rec.file_path and os.path.exists(rec.file_path):
-        return FileResponse(
-            open(rec.file_path, "rb"),
-            content_type="audio/wav",
-            as_attachment=False,
-            filename=f"recording_{rec.call_id[:12]}.wav",
-        )
+    # Re-hydrates from the cold tier if the file was evicted
+    if is_available(rec):
+        return recording_response(request, delivery_path(rec), f"recording_{rec.call_id[:12]}")
 
-    # Download on-demand from Retell
     if rec.retell_url:
-        file_path = download_recording(rec.call_id, rec.retell_url)
-        if file_path and os.path.exists(file_path):
-            rec.file_path = file_path
-            rec.downloaded = True
-            rec.save()
-            return FileResponse(
-                open(file_path, "rb"),
-                content_type="audio/wav",
-                as_attachment=False,
-                filename=f"recording_{rec.call_id[:12]}.wav",
-            )
+        # One background fetch per call, however many times the link is opened
+        if redis_client.set(f"recording_fetch:{rec.call_id}", 1, nx=True, ex=60):
+            from bot.tasks import download_and_cache_recording
+            download_and_cache_recording.delay(rec.call_id, rec.retell_url, notify=False)
 
-    return HttpResponse("Recording not available yet. Please try again shortly.", status=202)
+    response = HttpResponse("Recording not available yet. Please try again shortly.", status=202)
+    response["Retry-After"] = "5"
+    return response
 
 
 def batch_recordings_page(request, token):
     """
-    HTML page listing all recordings in a batch.
-    GET /api/recordings/batch/<token>/
+    HTML page listing the recordings in a batch, PAGE_SIZE rows at a time.
+    GET /api/recordings/batch/<token>/?after=<cursor>&size=<n>
+    GET /api/recordings/batch/<token>/?format=csv|json  (streamed export)
     """
-    from django.http import HttpResponse
-    from bot.models import CallRecording, BatchCallLogs, CampaignLogs, CallDuration
-    from bot.recording_utils import get_recording_url, format_duration, mask_phone_number
+    import csv
+    from django.http import HttpResponse, StreamingHttpResponse
+    from django.template.loader import render_to_string
+    from django.utils.cache import get_conditional_response
+    from django.utils.http import http_date
+    from redis.exceptions import RedisError
+    from bot.models import CallRecording, CampaignLogs
+    from bot import batch_recordings as batch_page
 
     # Parse batch token: format is b_<sig>_<batch_id>_<user_id>
     parts = token.split("_", 3)
-    if len(parts) < 4:
+    if len(parts) < 4 or not parts[3].isdigit():
         return HttpResponse("Invalid token", status=403)
 
     batch_id_partial = parts[2]
-    user_id_str = parts[3]
+    user_id = int(parts[3])
 
-    # Find recordings for this batch
-    recordings = CallRecording.objects.filter(
-        batch_id__startswith=batch_id_partial,
-        user_id=int(user_id_str),
-    ).order_by("created_at")
-
-    if not recordings.exists():
+    batch_id = (
+        CallRecording.objects.filter(batch_id__startswith=batch_id_partial, user_id=user_id)
+        .values_list("batch_id", flat=True)
+        .first()
+    )
+    if batch_id is None:
         return HttpResponse("No recordings found for this batch.", status=404)
 
-    batch_id = recordings.first().batch_id
-
-    # Get campaign name
-    campaign = CampaignLogs.objects.filter(batch_id=batch_id).first()
-    campaign_name = campaign.campaign_name if campaign else "Batch Campaign"
-
-    # Build HTML rows
-    rows_html = ""
-    for rec in recordings:
-        # Get call details
-        batch_log = BatchCallLogs.objects.filter(call_id=rec.call_id).first()
-        phone = mask_phone_number(batch_log.to_number if batch_log else "")
-
-        # Duration
-        dur = CallDuration.objects.filter(call_id=rec.call_id).first()
-        duration = format_duration((dur.duration_in_seconds or 0) * 1000) if dur else "N/A"
-
-        # DTMF
-        dtmf = DTMF_Inbox.objects.filter(call_id=rec.call_id).first()
-        keypresses = dtmf.dtmf_input if dtmf and dtmf.dtmf_input else "-"
-
-        rec_url = get_recording_url(rec.token)
-
-        # Transcript snippet
-        transcript_snippet = ""
-        if rec.transcript_text:
-            lines = rec.transcript_text.split("\n")[:4]
-            snippet_text = "<br>".join(lines)
-            if len(rec.transcript_text.split("\n")) > 4:
-                snippet_text += "<br>..."
-            transcript_snippet = f'<div class="transcript">{snippet_text}</div>'
-
-        # AI summary
-        summary_badge = ""
-        if rec.call_summary:
-            summary_badge = f'<div class="summary">{rec.call_summary[:120]}</div>'
-
-        # Sentiment
-        sentiment_html = ""
-        if rec.user_sentiment:
-            icon = {{"Positive": "😊", "Negative": "😞", "Neutral": "😐"}}.get(rec.user_sentiment, "📊")
-            sentiment_html = f'<span class="sentiment">{icon} {rec.user_sentiment}</span>'
-
-        rows_html += f"""
-        <tr>
-            <td>{phone}</td>
-            <td>{duration} {sentiment_html}</td>
-            <td><code>{keypresses}</code></td>
-            <td>
-                <audio controls preload="none" style="height:32px;">
-                    <source src="{rec_url}" type="audio/wav">
-                </audio>
-                {summary_badge}
-                {transcript_snippet}
-            </td>
-        </tr>"""
-
-    html = f"""<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{campaign_name} - Recordings</title>
-    <style>
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-        body {{
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
-            background: #0f0f0f; color: #e0e0e0;
-            padding: 20px; max-width: 900px; margin: 0 auto;
-        }}
-        h1 {{ color: #ffffff; margin-bottom: 6px; font-size: 1.4em; }}
-        .subtitle {{ color: #888; margin-bottom: 24px; font-size: 0.9em; }}
-        table {{
-            width: 100%; border-collapse: collapse;
-            background: #1a1a1a; border-radius: 8px; overflow: hidden;
-        }}
-        th {{
-            background: #252525; padding: 12px 16px; text-align: left;
-            font-size: 0.8em; text-transform: uppercase; letter-spacing: 0.5px;
-            color: #888;
-        }}
-        td {{ padding: 12px 16px; border-bottom: 1px solid #2a2a2a; font-size: 0.9em; }}
-        tr:last-child td {{ border-bottom: none; }}
-        tr:hover td {{ background: #222; }}
-        code {{
-            background: #2a2a2a; padding: 2px 8px; border-radius: 4px;
-            font-family: 'SF Mono', monospace; font-size: 0.85em;
-        }}
-        audio {{ max-width: 200px; }}
-        .badge {{
-            display: inline-block; background: #1db954; color: #000;
-            padding: 2px 8px; border-radius: 12px; font-size: 0.75em; font-weight: 600;
-        }}
-        .transcript {{
-            margin-top: 8px; padding: 8px 10px; background: #1a1a2e;
-            border-left: 3px solid #4a4af0; border-radius: 4px;
-            font-size: 0.8em; color: #aaa; line-height: 1.5;
-        }}
-        .summary {{
-            margin-top: 6px; padding: 6px 10px; background: #1a2e1a;
-            border-left: 3px solid #1db954; border-radius: 4px;
-            font-size: 0.8em; color: #8fdf8f; font-style: italic;
-        }}
-        .sentiment {{
-            font-size: 0.75em; margin-left: 6px; opacity: 0.8;
-        }}
-    </style>
-</head>
-<body>
-    <h1>🎙 {campaign_name}</h1>
-    <p class="subtitle">{recordings.count()} recordings &middot; <span class="badge">Batch Complete</span></p>
-    <table>
-        <thead>
-            <tr>
-                <th>Phone</th>
-                <th>Duration</th>
-                <th>Keypresses</th>
-                <th>Recording</th>
-            </tr>
-        </thead>
-        <tbody>{rows_html}</tbody>
-    </table>
-</body>
-</html>"""
-
-    return HttpResponse(html, content_type="text/html")
+    export_format = request.GET.get("format")
+    if export_format == "json":
+        def json_stream():
+            yield "["
+            for index, row in enumerate(batch_page.export_rows(batch_id, user_id)):
+                yield ("," if index else "") + json.dumps(row)
+            yield "]"
+
+        response = StreamingHttpResponse(json_stream(), content_type="application/json")
+        response["Content-Disposition"] = f'attachment; filename="recordings_{batch_id[:20]}.json"'
+        return response
+    if export_format == "csv":
+        class Echo:
+            def write(self, value):
+                return value
+
+        writer = csv.DictWriter(Echo(), fieldnames=batch_page.EXPORT_FIELDS)
+
+        def csv_stream():
+            yield writer.writeheader()
+            for row in batch_page.export_rows(batch_id, user_id):
+                yield writer.writerow(row)
+
+        response = StreamingHttpResponse(csv_stream(), content_type="text/csv")
+        response["Content-Disposition"] = f'attachment; filename="recordings_{batch_id[:20]}.csv"'
+        return response
+
+    cursor = request.GET.get("after") or None
+    try:
+        size = min(max(int(request.GET.get("size", batch_page.PAGE_SIZE)), 1), batch_page.MAX_PAGE_SIZE)
+    except ValueError:
+        size = batch_page.PAGE_SIZE
+
+    try:
+        version, modified = batch_page.page_state(batch_id)
+    except RedisError as e:
+        logger.warning(f"[batch_recordings] Page state unavailable for {batch_id}: {e}")
+        version = modified = None
+
+    etag = None
+    if version is not None:
+        etag = f'"{batch_id[:20]}-{version}-{cursor or 0}-{size}"'
+        not_modified = get_conditional_response(request, etag=etag, last_modified=modified)
+        if not_modified is not None:
+            return not_modified
+        html = batch_page.cached_page(batch_id, version, cursor, size)
+    else:
+        html = None
+
+    if html is None:
+        rows = batch_page.batch_rows(batch_id, user_id)
+        records, next_cursor = batch_page.page(rows, cursor, size)
+        campaign = CampaignLogs.objects.filter(batch_id=batch_id).only("campaign_name").first()
+        html = render_to_string("batch_recordings.html", {
+            "campaign_name": campaign.campaign_name if campaign else "Batch Campaign",
+            "total": rows.count(),
+            "rows": [batch_page.row_context(rec) for rec in records],
+            "cursor": cursor,
+            "next_cursor": next_cursor,
+            "size": size,
+        })
+        if version is not None:
+            batch_page.store_page(batch_id, version, cursor, size, html)
+
+    response = HttpResponse(html, content_type="text/html")
+    if etag is not None:
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(modified)
+        response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+@internal_only
+def crypto_price_stats(request):
+    """Age (seconds) of each cached crypto USD rate (TelegramBot.price_service)."""
+    from TelegramBot.price_service import price_ages
 
+    return JsonResponse({"price_age_seconds": price_ages()})
@@ -11,14 +11,19 @@ Replaces these Celery polling tasks:
   - call_status_free_plan   (free plan call limit enforcement)
   - process_call_logs       (DTMF extraction)
 """
+import hashlib
 import json
 import logging
 from datetime import datetime, timezone as tz
 from decimal import Decimal
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
+from kombu.exceptions import OperationalError
 
 from bot.bot_config import bot
 from bot.models import (
@@ -26,13 +31,22 @@ from bot.models import (
     BatchCallLogs,
     CallLogsTable,
     ActiveCall,
-    UserPhoneNumber,
     PendingDTMFApproval,
     SMSInbox,
     CallRecording,
+    RetellWebhookEvent,
+    ProcessedWebhookEvent,
 )
-from bot.utils import get_user_subscription_by_call_id, get_user_language
+from bot.utils import get_user_language
 from bot.call_gate import classify_destination, US_CA_OVERAGE_RATE
+from bot.message_gateway import (
+    BILLING,
+    BULK,
+    NORMAL,
+    URGENT,
+    send_audio,
+    send_message,
+)
 from bot.recording_utils import (
     RECORDING_FEE,
     BATCH_THRESHOLD,
@@ -42,12 +56,20 @@ from bot.recording_utils import (
     get_batch_recordings_url,
     format_duration,
     mask_phone_number,
-    format_transcript,
     format_transcript_for_telegram,
 )
+from bot import business_hours, call_details_store, call_state, phone_index
+from bot.call_context import CallContext
+from bot.batch_recordings import invalidate_batch_page
+from bot.batch_summary import (
+    claim_consolidated_summary,
+    get_batch_summary,
+    record_call_completed,
+    record_recording,
+)
+from bot.dtmf_approval import wait_for_decision
 from payment.models import (
     ManageFreePlanSingleIVRCall,
-    UserSubscription,
     DTMF_Inbox,
     OveragePricingTable,
     UserTransactionLogs,
@@ -58,14 +80,28 @@ from user.models import TelegramUser
 
 logger = logging.getLogger(__name__)
 
-# Track last seen transcript index per call to avoid duplicate messages
-_transcript_cursor = {}
-
 
 # =============================================================================
 # Helpers
 # =============================================================================
 
+def _after_commit(fn, *args, **kwargs):
+    """Run fn once the enclosing transaction commits (at once outside one).
+    dispatch_retell_event applies an event in one transaction, so a handler
+    that fails and is retried has sent nothing, and the transaction never
+    waits on Redis, Telegram or HTTP. Errors are logged, not raised: the
+    event's writes are committed by then."""
+    transaction.on_commit(lambda: fn(*args, **kwargs), robust=True)
+
+
+def queue_message(*args, **kwargs):
+    _after_commit(send_message, *args, **kwargs)
+
+
+def queue_audio(*args, **kwargs):
+    _after_commit(send_audio, *args, **kwargs)
+
+
 def _epoch_ms_to_datetime(epoch_ms):
     """Convert Retell epoch milliseconds to timezone-aware datetime."""
     if not epoch_ms:
@@ -73,22 +109,6 @@ def _epoch_ms_to_datetime(epoch_ms):
     return datetime.fromtimestamp(epoch_ms / 1000, tz=tz.utc)
 
 
-def _extract_dtmf_from_transcript(transcript_object):
-    """Extract DTMF digits from Retell transcript."""
-    dtmf_digits = []
-    if not transcript_object:
-        return ""
-    for entry in transcript_object:
-        if entry.get("role") == "user":
-            text = entry.get("content", "")
-            # Retell marks DTMF as "Pressed Button: X"
-            if "Pressed Button: " in text:
-                digit = text.split("Pressed Button: ")[1].strip()
-                if digit.isdigit():
-                    dtmf_digits.append(digit)
-    return "".join(dtmf_digits) if dtmf_digits else ""
-
-
 def _charge_overage_realtime(call_id, user_id, additional_minutes):
     """
     Charge overage immediately when a call ends — replaces the 5-min Celery poll.
@@ -116,10 +136,11 @@ def _charge_overage_realtime(call_id, user_id, additional_minutes):
             )
             try:
                 user = TelegramUser.objects.get(user_id=user_id)
-                bot.send_message(
+                queue_message(
                     user_id,
                     f"⚠️ Overage: {additional_minutes:.2f} extra minutes (${total_charges:.2f}) "
                     f"but wallet has ${available_balance:.2f}. Please top up.",
+                    lane=BILLING,
                 )
             except Exception:
                 pass
@@ -151,7 +172,7 @@ def _charge_overage_realtime(call_id, user_id, additional_minutes):
 
         # Notify user immediately
         try:
-            bot.send_message(
+            queue_message(
                 user_id,
                 f"📊 *Overage Charged*\n"
                 f"Call: `{call_id[:12]}`\n"
@@ -159,6 +180,7 @@ def _charge_overage_realtime(call_id, user_id, additional_minutes):
                 f"Charged: ${total_charges:.2f} (${price_per_min}/min)\n"
                 f"Wallet: ${available_balance - total_charges:.2f}",
                 parse_mode="Markdown",
+                lane=BILLING,
             )
         except Exception:
             pass
@@ -178,7 +200,7 @@ INBOUND_RATE_PER_MINUTE = Decimal("0.02")
 VOICEMAIL_FLAT_FEE = Decimal("0.05")
 
 
-def _handle_call_started(call_data):
+def _handle_call_started(call_data, ctx):
     """
     Update call status to 'started' in local DB.
     Register ActiveCall for real-time billing and pre-deduct 2 minutes from wallet.
@@ -193,15 +215,13 @@ def _handle_call_started(call_data):
     # --- Check if this is an inbound call to a user's purchased number ---
     is_inbound = False
     inbound_user_id = None
-    if direction == "inbound" or (to_number and not CallLogsTable.objects.filter(call_id=call_id).exists()):
-        phone_record = UserPhoneNumber.objects.filter(
-            phone_number=to_number, is_active=True
-        ).first()
+    if direction == "inbound" or (to_number and ctx.call_log is None):
+        phone_record = ctx.phone_number
         if phone_record:
             is_inbound = True
-            inbound_user_id = phone_record.user.user_id
+            inbound_user_id = phone_record.user_id
             # Create a CallLogsTable entry for inbound calls
-            CallLogsTable.objects.get_or_create(
+            ctx.call_log, _ = CallLogsTable.objects.get_or_create(
                 call_id=call_id,
                 defaults={
                     "call_number": from_number,
@@ -212,10 +232,11 @@ def _handle_call_started(call_data):
             )
             # Notify user
             try:
-                bot.send_message(
+                queue_message(
                     inbound_user_id,
                     f"📞 *Incoming Call*\nFrom: `{from_number}`\nTo: `{to_number}`",
                     parse_mode="Markdown",
+                    lane=URGENT,
                 )
             except Exception as e:
                 logger.warning(f"[call_started] Failed to notify user {inbound_user_id}: {e}")
@@ -230,7 +251,7 @@ def _handle_call_started(call_data):
     ManageFreePlanSingleIVRCall.objects.filter(call_id=call_id).update(call_status="started")
 
     # ---- Register ActiveCall for real-time billing ----
-    call_log = CallLogsTable.objects.filter(call_id=call_id).first()
+    call_log = ctx.call_log
     if not call_log:
         logger.warning(f"[call_started] No CallLogsTable entry for {call_id}, skipping ActiveCall")
         return
@@ -255,21 +276,16 @@ def _handle_call_started(call_data):
             effective_rate = rate
         else:
             # Check if user has plan minutes, otherwise wallet overage
-            try:
-                sub = UserSubscription.objects.get(user_id=user_id)
-                if sub.subscription_status == "active" and sub.plan_id and sub.plan_id.plan_price > 0:
-                    billing_source = "plan"
-                    effective_rate = Decimal("0.00")
-                else:
-                    billing_source = "wallet"
-                    effective_rate = US_CA_OVERAGE_RATE
-            except UserSubscription.DoesNotExist:
+            sub = ctx.subscription
+            if sub and sub.subscription_status == "active" and sub.plan_id and sub.plan_id.plan_price > 0:
+                billing_source = "plan"
+                effective_rate = Decimal("0.00")
+            else:
                 billing_source = "wallet"
                 effective_rate = US_CA_OVERAGE_RATE
 
         # Determine call type
-        batch_call = BatchCallLogs.objects.filter(call_id=call_id).exists()
-        call_type = "bulk" if batch_call else "single"
+        call_type = "bulk" if ctx.batch_call else "single"
 
     now = timezone.now()
     ActiveCall.objects.update_or_create(
@@ -311,7 +327,7 @@ def _handle_call_started(call_data):
 # call_ended — replaces check_call_status, call_status_free_plan, process_call_logs
 # =============================================================================
 
-def _handle_call_ended(call_data):
+def _handle_call_ended(call_data, ctx):
     """
     Process a completed call:
     1. Calculate duration & update subscription minutes
@@ -325,7 +341,6 @@ def _handle_call_ended(call_data):
     duration_ms = call_data.get("duration_ms", 0) or 0
     start_ts = call_data.get("start_timestamp")
     end_ts = call_data.get("end_timestamp")
-    transcript_obj = call_data.get("transcript_object", [])
     disconnection_reason = call_data.get("disconnection_reason", "")
 
     started_at = _epoch_ms_to_datetime(start_ts)
@@ -337,34 +352,34 @@ def _handle_call_ended(call_data):
         f"reason={disconnection_reason}"
     )
 
-    # ---- 1. Update BatchCallLogs (batch calls) ----
-    batch_call = BatchCallLogs.objects.filter(call_id=call_id).first()
+    dtmf_input = ctx.transcript.dtmf_digits
+
+    # ---- 1. Update BatchCallLogs (batch calls) + running batch aggregates ----
+    batch_call = ctx.batch_call
     if batch_call:
-        batch_call.call_status = "complete"
-        batch_call.save()
+        record_call_completed(batch_call, duration_ms / 1000.0, bool(dtmf_input))
 
         # Process subscription minutes (replaces check_call_status)
         _process_batch_call_duration(
-            call_id, agent_id, batch_call, started_at, ended_at,
+            ctx, agent_id, started_at, ended_at,
             duration_minutes, duration_ms / 1000.0
         )
 
     # ---- 2. Update free plan calls (replaces call_status_free_plan) ----
-    free_plan_call = ManageFreePlanSingleIVRCall.objects.filter(call_id=call_id).first()
+    free_plan_call = ctx.free_plan_call
     if free_plan_call:
         free_plan_call.call_status = "complete"
         free_plan_call.save()
 
         _process_free_plan_call_duration(
-            call_id, agent_id, free_plan_call, started_at, ended_at,
+            ctx, agent_id, started_at, ended_at,
             duration_minutes, duration_ms / 1000.0
         )
 
     # ---- 3. Update CallLogsTable ----
     CallLogsTable.objects.filter(call_id=call_id).update(call_status="complete")
 
-    # ---- 4. Extract DTMF and update inbox (replaces process_call_logs) ----
-    dtmf_input = _extract_dtmf_from_transcript(transcript_obj)
+    # ---- 4. Update DTMF inbox (replaces process_call_logs) ----
     if dtmf_input:
         try:
             dtmf_record = DTMF_Inbox.objects.filter(call_id=call_id).first()
@@ -377,21 +392,22 @@ def _handle_call_ended(call_data):
             logger.warning(f"[call_ended] DTMF update failed for {call_id}: {e}")
 
     # ---- 5. Reconcile real-time billing via ActiveCall ----
-    _reconcile_active_call(call_id, to_number, duration_minutes)
+    _reconcile_active_call(ctx, to_number, duration_minutes)
 
 
-def _process_batch_call_duration(call_id, agent_id, batch_call, started_at, ended_at, duration_minutes, duration_seconds):
+def _process_batch_call_duration(ctx, agent_id, started_at, ended_at, duration_minutes, duration_seconds):
     """
     Process batch call duration — deduct from subscription minutes, track overage.
     Replaces the 'complete' branch of check_call_status Celery task.
     """
+    call_id = ctx.call_id
     try:
-        subscription_result = get_user_subscription_by_call_id(call_id)
-        if subscription_result["status"] != "Success":
-            logger.warning(f"No subscription for call {call_id}: {subscription_result['status']}")
+        user_subscription = ctx.subscription
+        if user_subscription is None:
+            logger.warning(f"No subscription for call {call_id}")
             return
 
-        user_subscription = subscription_result["user_subscription"]
+        user_id = ctx.user_id
         bulk_ivr_left = float(user_subscription.bulk_ivr_calls_left or 0)
 
         if duration_minutes > bulk_ivr_left:
@@ -406,7 +422,7 @@ def _process_batch_call_duration(call_id, agent_id, batch_call, started_at, ende
                     "queue_status": "complete",
                     "duration_in_seconds": duration_seconds,
                     "additional_minutes": f"{overage}",
-                    "user_id": subscription_result["user_id"],
+                    "user_id": user_id,
                 },
             )
             user_subscription.bulk_ivr_calls_left = 0
@@ -414,7 +430,7 @@ def _process_batch_call_duration(call_id, agent_id, batch_call, started_at, ende
             logger.info(f"[batch] Overage {overage:.2f}min for call {call_id}")
 
             # Charge overage immediately instead of waiting for Celery
-            _charge_overage_realtime(call_id, subscription_result["user_id"], overage)
+            _charge_overage_realtime(call_id, user_id, overage)
         else:
             # Within limits
             remaining = bulk_ivr_left - duration_minutes
@@ -427,7 +443,7 @@ def _process_batch_call_duration(call_id, agent_id, batch_call, started_at, ende
                     "queue_status": "complete",
                     "duration_in_seconds": duration_seconds,
                     "additional_minutes": 0,
-                    "user_id": subscription_result["user_id"],
+                    "user_id": user_id,
                 },
             )
             user_subscription.bulk_ivr_calls_left = Decimal(str(remaining))
@@ -437,17 +453,18 @@ def _process_batch_call_duration(call_id, agent_id, batch_call, started_at, ende
         logger.error(f"[batch] Duration processing error for {call_id}: {e}")
 
 
-def _process_free_plan_call_duration(call_id, agent_id, free_call, started_at, ended_at, duration_minutes, duration_seconds):
+def _process_free_plan_call_duration(ctx, agent_id, started_at, ended_at, duration_minutes, duration_seconds):
     """
     Process free plan call duration — deduct from single IVR minutes.
     Replaces the 'complete' branch of call_status_free_plan Celery task.
     """
+    call_id = ctx.call_id
     try:
-        subscription_result = get_user_subscription_by_call_id(call_id)
-        if subscription_result["status"] != "Success":
+        user_subscription = ctx.subscription
+        if user_subscription is None:
             return
 
-        user_subscription = subscription_result["user_subscription"]
+        user_id = ctx.user_id
         single_ivr_left = float(user_subscription.single_ivr_left or 0)
 
         if duration_minutes > single_ivr_left:
@@ -461,14 +478,14 @@ def _process_free_plan_call_duration(call_id, agent_id, free_call, started_at, e
                     "queue_status": "complete",
                     "duration_in_seconds": duration_seconds,
                     "additional_minutes": f"{overage}",
-                    "user_id": subscription_result["user_id"],
+                    "user_id": user_id,
                 },
             )
             user_subscription.single_ivr_left = 0
             user_subscription.save()
 
             # Charge overage immediately instead of waiting for Celery
-            _charge_overage_realtime(call_id, subscription_result["user_id"], overage)
+            _charge_overage_realtime(call_id, user_id, overage)
         else:
             remaining = single_ivr_left - duration_minutes
             CallDuration.objects.update_or_create(
@@ -480,7 +497,7 @@ def _process_free_plan_call_duration(call_id, agent_id, free_call, started_at, e
                     "queue_status": "complete",
                     "duration_in_seconds": duration_seconds,
                     "additional_minutes": 0,
-                    "user_id": subscription_result["user_id"],
+                    "user_id": user_id,
                 },
             )
             user_subscription.single_ivr_left = Decimal(str(remaining))
@@ -490,7 +507,7 @@ def _process_free_plan_call_duration(call_id, agent_id, free_call, started_at, e
 
 
 
-def _reconcile_active_call(call_id, to_number, duration_minutes):
+def _reconcile_active_call(ctx, to_number, duration_minutes):
     """
     Reconcile billing when call ends:
     - Calculate final cost based on actual duration
@@ -498,6 +515,7 @@ def _reconcile_active_call(call_id, to_number, duration_minutes):
     - Charge shortfall or refund overpayment
     - Mark ActiveCall as inactive
     """
+    call_id = ctx.call_id
     try:
         active_call = ActiveCall.objects.filter(call_id=call_id, is_active=True).first()
         if not active_call:
@@ -506,7 +524,7 @@ def _reconcile_active_call(call_id, to_number, duration_minutes):
             if to_number and duration_minutes > 0:
                 region, rate, is_domestic = classify_destination(to_number)
                 if not is_domestic:
-                    _bill_international_fallback(call_id, to_number, duration_minutes)
+                    _bill_international_fallback(ctx, to_number, duration_minutes)
             return
 
         user_id = active_call.user_id
@@ -553,12 +571,13 @@ def _reconcile_active_call(call_id, to_number, duration_minutes):
         if effective_rate > 0:
             try:
                 user = TelegramUser.objects.get(user_id=user_id)
-                bot.send_message(
+                queue_message(
                     user_id,
                     f"📞 Call to {active_call.region} ended.\n"
                     f"⏱ Duration: {duration_minutes:.2f} min\n"
                     f"💳 Total charged: ${final_cost:.2f} (${effective_rate}/min)\n"
                     f"💰 Wallet balance: ${user.wallet_balance:.2f}",
+                    lane=BILLING,
                 )
             except Exception:
                 pass
@@ -572,14 +591,15 @@ def _reconcile_active_call(call_id, to_number, duration_minutes):
         logger.error(f"[reconcile] Error for {call_id}: {e}")
 
 
-def _bill_international_fallback(call_id, to_number, duration_minutes):
+def _bill_international_fallback(ctx, to_number, duration_minutes):
     """Fallback billing for international calls without ActiveCall record."""
+    call_id = ctx.call_id
     try:
         region, rate, is_domestic = classify_destination(to_number)
         if is_domestic:
             return
 
-        call_log = CallLogsTable.objects.filter(call_id=call_id).first()
+        call_log = ctx.call_log
         if not call_log:
             return
 
@@ -604,7 +624,7 @@ def _bill_international_fallback(call_id, to_number, duration_minutes):
 # call_analyzed — post-call analysis (bonus: Retell provides sentiment, summary)
 # =============================================================================
 
-def _handle_call_analyzed(call_data):
+def _handle_call_analyzed(call_data, ctx):
     """Process post-call analysis (sentiment, summary, success evaluation).
     Stores AI-generated summary and sentiment in CallRecording and sends to user.
     """
@@ -624,17 +644,18 @@ def _handle_call_analyzed(call_data):
     )
 
     # Store in CallRecording if it exists
-    rec = CallRecording.objects.filter(call_id=call_id).first()
+    rec = ctx.recording
     if rec:
         if call_summary:
             rec.call_summary = call_summary
         if user_sentiment:
             rec.user_sentiment = user_sentiment
         rec.save()
+        _after_commit(invalidate_batch_page, rec.batch_id)
 
     # Send AI summary to user if meaningful
     if call_summary or user_sentiment:
-        call_log = CallLogsTable.objects.filter(call_id=call_id).first()
+        call_log = ctx.call_log
         if call_log:
             user_id = call_log.user_id
             sentiment_icon = {"Positive": "😊", "Negative": "😞", "Neutral": "😐"}.get(
@@ -647,7 +668,7 @@ def _handle_call_analyzed(call_data):
                 parts.append(f"*Caller Sentiment:* {sentiment_icon} {user_sentiment}")
             msg = "🤖 *Call Analysis*\n\n" + "\n".join(parts)
             try:
-                bot.send_message(user_id, msg, parse_mode="Markdown")
+                queue_message(user_id, msg, parse_mode="Markdown", lane=BULK)
             except Exception as e:
                 logger.warning(f"[call_analyzed] Failed to send analysis to {user_id}: {e}")
 
@@ -656,7 +677,7 @@ def _handle_call_analyzed(call_data):
 # transcript_updated — real-time DTMF streaming to bot user
 # =============================================================================
 
-def _handle_transcript_updated(call_data):
+def _handle_transcript_updated(call_data, ctx):
     """
     Process real-time transcript updates to detect DTMF presses
     and stream them to the bot user via Telegram instantly.
@@ -668,22 +689,20 @@ def _handle_transcript_updated(call_data):
     if not transcript_obj:
         return
 
-    # Get cursor position — only process new entries
-    cursor = _transcript_cursor.get(call_id, 0)
-    new_entries = transcript_obj[cursor:]
-    _transcript_cursor[call_id] = len(transcript_obj)
-
-    if not new_entries:
+    # Claim the entries past the shared cursor — each is streamed by one worker only
+    cursor = call_state.advance_transcript(call_id, len(transcript_obj))
+    if cursor is None:
         return
+    new_entries = transcript_obj[cursor:]
 
     # Look up user — skip bulk campaign calls
-    call_log = CallLogsTable.objects.filter(call_id=call_id).first()
+    call_log = ctx.call_log
     if not call_log:
         return
     user_id = call_log.user_id
 
     # Skip bulk calls — supervisor check is single-call only
-    if BatchCallLogs.objects.filter(call_id=call_id).exists():
+    if ctx.batch_call:
         return
 
     for entry in new_entries:
@@ -695,21 +714,22 @@ def _handle_transcript_updated(call_data):
         if "Pressed Button: " in text:
             digit = text.split("Pressed Button: ")[1].strip()
             try:
-                bot.send_message(
+                queue_message(
                     user_id,
                     f"🔢 *DTMF Input Detected*\nCaller pressed: `{digit}`\nCall: `{call_id[:12]}...`",
                     parse_mode="Markdown",
+                    lane=URGENT,
                 )
             except Exception as e:
                 logger.warning(f"[transcript_updated] Failed to notify user {user_id}: {e}")
 
 
-def _deliver_recording_to_user(call_data):
+def _deliver_recording_to_user(call_data, ctx):
     """Legacy wrapper — now delegates to _send_call_outcome_summary."""
-    _send_call_outcome_summary(call_data)
+    _send_call_outcome_summary(call_data, ctx)
 
 
-def _send_call_outcome_summary(call_data):
+def _send_call_outcome_summary(call_data, ctx):
     """
     Auto-send call outcome summary after every call:
     - Duration, keypress responses, disconnection reason
@@ -723,29 +743,27 @@ def _send_call_outcome_summary(call_data):
     from_number = call_data.get("from_number", "")
     duration_ms = call_data.get("duration_ms", 0) or 0
     disconnection_reason = call_data.get("disconnection_reason", "")
-    transcript_obj = call_data.get("transcript_object", [])
     direction = call_data.get("direction", "outbound")
 
-    call_log = CallLogsTable.objects.filter(call_id=call_id).first()
+    call_log = ctx.call_log
     if not call_log:
         return
 
     user_id = call_log.user_id
     duration_str = format_duration(duration_ms)
 
-    # Extract DTMF keypresses for summary
-    dtmf_digits = _extract_dtmf_from_transcript(transcript_obj)
-
-    # Format transcript
-    full_transcript, short_transcript = format_transcript(transcript_obj)
+    # Keypresses and dialogue, from the analysis call_ended already made
+    transcript = ctx.transcript
+    dtmf_digits = transcript.dtmf_digits
+    full_transcript, short_transcript = transcript.full_text, transcript.short_text
 
     # Check if this call is part of a batch
-    batch_call = BatchCallLogs.objects.filter(call_id=call_id).first()
+    batch_call = ctx.batch_call
 
     # Handle recording: create record + trigger download if requested
     recording_line = ""
     if call_log.recording_requested and recording_url:
-        rec = CallRecording.objects.filter(call_id=call_id).first()
+        rec = ctx.recording
         if not rec:
             token = generate_recording_token(call_id, user_id)
             rec = CallRecording.objects.create(
@@ -756,17 +774,20 @@ def _send_call_outcome_summary(call_data):
                 token=token,
                 transcript_text=full_transcript,
             )
+            ctx.recording = rec
+            record_recording(rec.batch_id, user_id)
         else:
             if not rec.transcript_text:
                 rec.transcript_text = full_transcript
                 rec.save()
         # Trigger async download + inline Telegram delivery
+        _after_commit(invalidate_batch_page, rec.batch_id)
         from bot.tasks import download_and_cache_recording
-        download_and_cache_recording.delay(call_id, recording_url)
+        _after_commit(download_and_cache_recording.delay, call_id, recording_url)
         recording_line = "\n🎙 Recording incoming..."
     elif (batch_call and batch_call.recording_requested and recording_url):
         # Batch-level recording requested
-        rec = CallRecording.objects.filter(call_id=call_id).first()
+        rec = ctx.recording
         if not rec:
             token = generate_recording_token(call_id, user_id)
             rec = CallRecording.objects.create(
@@ -777,18 +798,20 @@ def _send_call_outcome_summary(call_data):
                 token=token,
                 transcript_text=full_transcript,
             )
+            ctx.recording = rec
+            record_recording(rec.batch_id, user_id)
         else:
             if not rec.transcript_text:
                 rec.transcript_text = full_transcript
                 rec.save()
+        _after_commit(invalidate_batch_page, rec.batch_id)
         from bot.tasks import download_and_cache_recording
-        download_and_cache_recording.delay(call_id, recording_url)
+        _after_commit(download_and_cache_recording.delay, call_id, recording_url)
         recording_line = "\n🎙 Recording incoming..."
 
     # Determine if inbound
-    is_inbound = direction == "inbound" or UserPhoneNumber.objects.filter(
-        phone_number=to_number, user__user_id=user_id, is_active=True
-    ).exists()
+    phone_record = ctx.phone_number
+    is_inbound = direction == "inbound" or bool(phone_record and phone_record.user_id == user_id)
 
     # --- Batch call: threshold-based delivery ---
     if batch_call:
@@ -822,7 +845,7 @@ def _send_call_outcome_summary(call_data):
     )
 
     try:
-        bot.send_message(user_id, msg, parse_mode="Markdown", disable_web_page_preview=True)
+        queue_message(user_id, msg, parse_mode="Markdown", disable_web_page_preview=True, lane=NORMAL)
     except Exception as e:
         logger.warning(f"[outcome] Failed to send summary to user {user_id}: {e}")
 
@@ -837,7 +860,7 @@ def _send_transcript_message(user_id, short_transcript, full_transcript=""):
         # Use full transcript if short enough, otherwise use short version
         display = full_transcript if len(full_transcript) < 3000 else short_transcript
         msg = f"📝 *Call Transcript:*\n```\n{display}\n```"
-        bot.send_message(user_id, msg, parse_mode="Markdown")
+        queue_message(user_id, msg, parse_mode="Markdown", lane=BULK)
     except Exception as e:
         logger.warning(f"[transcript] Failed to send transcript to user {user_id}: {e}")
 
@@ -853,10 +876,9 @@ def _handle_batch_call_summary(batch_call, call_data, user_id, duration_str,
     batch_id = batch_call.batch_id
     to_number = call_data.get("to_number", "")
 
-    total_in_batch = BatchCallLogs.objects.filter(batch_id=batch_id).count()
-    completed_in_batch = BatchCallLogs.objects.filter(
-        batch_id=batch_id, call_status="complete"
-    ).count()
+    summary = get_batch_summary(batch_id, user_id)
+    total_in_batch = summary.total_calls
+    completed_in_batch = summary.completed_calls
 
     if total_in_batch < BATCH_THRESHOLD:
         # Small batch — send individual summary
@@ -874,7 +896,7 @@ def _handle_batch_call_summary(batch_call, call_data, user_id, duration_str,
             f"{recording_line}"
         )
         try:
-            bot.send_message(user_id, msg, parse_mode="Markdown", disable_web_page_preview=True)
+            queue_message(user_id, msg, parse_mode="Markdown", disable_web_page_preview=True, lane=NORMAL)
             # Send transcript for individual batch calls
             if short_transcript:
                 _send_transcript_message(user_id, short_transcript)
@@ -884,34 +906,23 @@ def _handle_batch_call_summary(batch_call, call_data, user_id, duration_str,
         # Large batch — only log, consolidated comes at the end
         logger.info(f"[batch_outcome] {completed_in_batch}/{total_in_batch} complete for batch {batch_id}")
 
-    # Check if batch is fully complete — send consolidated summary
-    if completed_in_batch >= total_in_batch:
-        _send_batch_consolidated_summary(batch_id, user_id, total_in_batch)
+    # Check if batch is fully complete — send consolidated summary (once)
+    if summary.finished_calls >= total_in_batch and claim_consolidated_summary(batch_id):
+        # Downloads any missing recordings, so it runs outside the transaction
+        _after_commit(_send_batch_consolidated_summary, batch_id, user_id, total_in_batch)
 
 
 def _send_batch_consolidated_summary(batch_id, user_id, total_calls):
-    """Send a consolidated summary when all calls in a batch are complete."""
-    from django.db.models import Count, Q
-
-    batch_calls = BatchCallLogs.objects.filter(batch_id=batch_id)
-    completed = batch_calls.filter(call_status="complete").count()
-
-    # Calculate aggregate stats
-    call_ids = list(batch_calls.values_list("call_id", flat=True))
-    from bot.models import CallDuration
-    durations = CallDuration.objects.filter(call_id__in=call_ids)
-    total_seconds = sum(d.duration_in_seconds or 0 for d in durations)
-    avg_seconds = total_seconds / max(completed, 1)
+    """Send a consolidated summary when all calls in a batch are complete
+    or failed. Reads the running aggregates (bot.batch_summary) instead of
+    the calls. Also called by bot.campaign_dispatcher when a campaign's last
+    chunks give up."""
+    summary = get_batch_summary(batch_id, user_id)
+    completed = summary.completed_calls
+    avg_seconds = summary.total_duration_seconds / max(completed, 1)
     avg_duration = format_duration(avg_seconds * 1000)
-
-    # Count DTMF responses
-    from payment.models import DTMF_Inbox
-    dtmf_count = DTMF_Inbox.objects.filter(call_id__in=call_ids).exclude(
-        dtmf_input__isnull=True
-    ).exclude(dtmf_input="").count()
-
-    # Count recordings
-    recording_count = CallRecording.objects.filter(batch_id=batch_id).count()
+    dtmf_count = summary.dtmf_responses
+    recording_count = summary.recordings
 
     # Get campaign name
     from bot.models import CampaignLogs
@@ -925,6 +936,9 @@ def _send_batch_consolidated_summary(batch_id, user_id, total_calls):
         f"⏱ Avg Duration: {avg_duration}\n"
     )
 
+    if summary.failed_calls:
+        msg += f"❌ {summary.failed_calls} could not be placed\n"
+
     if dtmf_count:
         msg += f"🔢 Keypress Responses: {dtmf_count} collected\n"
 
@@ -936,38 +950,41 @@ def _send_batch_consolidated_summary(batch_id, user_id, total_calls):
 
     try:
         from bot.keyboard_menus import get_main_menu_keyboard
-        bot.send_message(
+        queue_message(
             user_id, msg, parse_mode="Markdown",
             disable_web_page_preview=True,
             reply_markup=get_main_menu_keyboard(user_id),
+            lane=NORMAL,
         )
 
         # Send all batch recordings as inline audio files
         if recording_count > 0:
-            recordings = CallRecording.objects.filter(
-                batch_id=batch_id, downloaded=True
-            ).exclude(file_path="")
-            import os
+            from bot.recording_pipeline import delivery_path, download_many
+            # Fetch any still-pending downloads now, a few at a time
+            recordings = download_many(
+                CallRecording.objects.filter(batch_id=batch_id).order_by("created_at")
+            )
             for rec in recordings:
-                if rec.file_path and os.path.exists(rec.file_path):
+                if rec.file_path:
                     try:
                         batch_log = BatchCallLogs.objects.filter(call_id=rec.call_id).first()
                         to_num = batch_log.to_number if batch_log else "Unknown"
-                        with open(rec.file_path, "rb") as af:
-                            bot.send_audio(
-                                user_id, af,
-                                caption=f"🎙 `{to_num}`",
-                                parse_mode="Markdown",
-                                title=f"Recording {to_num}",
-                                performer="Speechcue",
-                            )
+                        queue_audio(
+                            user_id,
+                            audio_path=delivery_path(rec),
+                            caption=f"🎙 `{to_num}`",
+                            parse_mode="Markdown",
+                            title=f"Recording {to_num}",
+                            performer="Speechcue",
+                            lane=BULK,
+                        )
                     except Exception as e:
                         logger.warning(f"[batch_audio] Failed to send {rec.call_id}: {e}")
     except Exception as e:
         logger.warning(f"[batch_consolidated] Failed to send summary: {e}")
 
 
-def _bill_voicemail_if_applicable(call_data):
+def _bill_voicemail_if_applicable(call_data, ctx):
     """
     Charge a flat voicemail fee when an inbound call to a user's number
     results in a voicemail recording (recording_url present + short duration).
@@ -979,11 +996,8 @@ def _bill_voicemail_if_applicable(call_data):
     if not recording_url or not to_number:
         return
 
-    phone_record = UserPhoneNumber.objects.filter(
-        phone_number=to_number, is_active=True, voicemail_enabled=True
-    ).first()
-
-    if not phone_record:
+    phone_record = ctx.phone_number
+    if not phone_record or not phone_record.voicemail_enabled:
         return
 
     user_id = phone_record.user.user_id
@@ -997,10 +1011,11 @@ def _bill_voicemail_if_applicable(call_data):
     if result["status"] == 200:
         logger.info(f"[voicemail] Charged ${VOICEMAIL_FLAT_FEE} to user {user_id} for voicemail on {to_number}")
         try:
-            bot.send_message(
+            queue_message(
                 user_id,
                 f"📬 *Voicemail received* — ${VOICEMAIL_FLAT_FEE} charged to wallet.",
                 parse_mode="Markdown",
+                lane=BILLING,
             )
         except Exception:
             pass
@@ -1016,7 +1031,8 @@ def _bill_voicemail_if_applicable(call_data):
 def time_check_endpoint(request):
     """
     Endpoint for Retell custom function to check current time in user's timezone.
-    Used for after-hours/business hours routing.
+    Used for after-hours/business hours routing. The caller is on the line,
+    so the answer comes from precomputed schedules (bot.business_hours).
 
     POST /api/time-check
     Body: {"call_id": "...", "args": {"phone_number": "+1..."}}
@@ -1041,31 +1057,22 @@ def time_check_endpoint(request):
                 "is_business_hours": True,
             })
 
-        phone_record = UserPhoneNumber.objects.filter(
-            phone_number=phone_number, is_active=True
-        ).first()
+        hours = business_hours.status(phone_number)
 
-        if not phone_record or not phone_record.business_hours_enabled:
+        if hours is None:
             return JsonResponse({
                 "current_time": timezone.now().strftime("%H:%M"),
                 "timezone": "UTC",
                 "is_business_hours": True,
             })
 
-        import pytz
-        user_tz = pytz.timezone(phone_record.business_hours_timezone or "US/Eastern")
-        now_local = timezone.now().astimezone(user_tz)
-        current_time = now_local.time()
-
-        is_business_hours = (
-            phone_record.business_hours_start <= current_time <= phone_record.business_hours_end
-        )
-
         return JsonResponse({
-            "current_time": now_local.strftime("%H:%M"),
-            "timezone": str(user_tz),
-            "is_business_hours": is_business_hours,
-            "business_hours": f"{phone_record.business_hours_start.strftime('%H:%M')}-{phone_record.business_hours_end.strftime('%H:%M')}",
+            "current_time": hours.local_time.strftime("%H:%M"),
+            "timezone": hours.timezone,
+            "is_business_hours": hours.is_open,
+            "business_hours": hours.hours,
+            "business_days": hours.days,
+            "next_change": hours.next_change.strftime("%a %H:%M") if hours.next_change else None,
         })
 
     except Exception as e:
@@ -1082,13 +1089,22 @@ def time_check_endpoint(request):
 # Supervisor DTMF Check — called by Retell custom function mid-call
 # =============================================================================
 
-@csrf_exempt
-def dtmf_supervisor_check(request):
+SUPERVISOR_RESULTS = {
+    "approved": {"result": "proceed", "message": "Supervisor approved."},
+    "rejected": {"result": "re_enter", "message": "Supervisor rejected. Ask caller to re-enter."},
+    "timeout": {"result": "proceed", "message": "Timeout, auto-approved."},
+}
+
+
+async def dtmf_supervisor_check(request):
     """
     Endpoint called by Retell custom function tool during single IVR calls.
-    Receives DTMF digits, notifies bot user, polls for approval/rejection.
+    Receives DTMF digits, notifies bot user, waits for approval/rejection.
     Only for single calls, NOT bulk campaigns.
 
+    Async: the wait is a coroutine woken by the supervisor's tap
+    (bot.dtmf_approval), so pending approvals hold no worker thread.
+
     POST /api/dtmf/supervisor-check
     Body: {"call_id": "...", "args": {"digits": "123456", "node_name": "Enter PIN"}}
     """
@@ -1106,18 +1122,18 @@ def dtmf_supervisor_check(request):
             return JsonResponse({"result": "proceed", "message": "Missing data, proceeding."})
 
         # Look up user
-        call_log = CallLogsTable.objects.filter(call_id=call_id).first()
+        call_log = await CallLogsTable.objects.filter(call_id=call_id).afirst()
         if not call_log:
             return JsonResponse({"result": "proceed", "message": "Call not found, proceeding."})
 
         user_id = call_log.user_id
 
         # Skip bulk campaign calls — proceed without supervisor check
-        if BatchCallLogs.objects.filter(call_id=call_id).exists():
+        if await BatchCallLogs.objects.filter(call_id=call_id).aexists():
             return JsonResponse({"result": "proceed", "message": "Bulk call, auto-approved."})
 
         # Create pending approval
-        approval = PendingDTMFApproval.objects.create(
+        approval = await PendingDTMFApproval.objects.acreate(
             call_id=call_id,
             user_id=user_id,
             digits=digits,
@@ -1132,14 +1148,17 @@ def dtmf_supervisor_check(request):
             types.InlineKeyboardButton("✅ Approve", callback_data=f"dtmf_approve_{approval.id}"),
             types.InlineKeyboardButton("❌ Re-enter", callback_data=f"dtmf_reject_{approval.id}"),
         )
+        timeout = settings.DTMF_SUPERVISOR_TIMEOUT_SECONDS
+        # Sent directly, not via the message gateway: the caller is on hold
+        # and the answer is needed within seconds
         try:
-            bot.send_message(
+            await sync_to_async(bot.send_message, thread_sensitive=False)(
                 user_id,
                 f"🔔 *Supervisor Check*\n\n"
                 f"Step: *{node_name}*\n"
                 f"Caller entered: `{digits}`\n"
                 f"Call: `{call_id[:16]}...`\n\n"
-                f"⏱ Respond within 20 seconds or it will auto-approve.",
+                f"⏱ Respond within {timeout} seconds or it will auto-approve.",
                 reply_markup=markup,
                 parse_mode="Markdown",
             )
@@ -1147,21 +1166,8 @@ def dtmf_supervisor_check(request):
             logger.warning(f"[supervisor] Failed to notify user {user_id}: {e}")
             return JsonResponse({"result": "proceed", "message": "Notification failed, auto-approved."})
 
-        # Poll for response — up to 20 seconds
-        import time
-        for _ in range(10):
-            time.sleep(2)
-            approval.refresh_from_db()
-            if approval.status == "approved":
-                return JsonResponse({"result": "proceed", "message": "Supervisor approved."})
-            elif approval.status == "rejected":
-                return JsonResponse({"result": "re_enter", "message": "Supervisor rejected. Ask caller to re-enter."})
-
-        # Timeout — auto-approve
-        approval.status = "timeout"
-        approval.resolved_at = timezone.now()
-        approval.save()
-        return JsonResponse({"result": "proceed", "message": "Timeout, auto-approved."})
+        status = await wait_for_decision(approval.id, timeout)
+        return JsonResponse(SUPERVISOR_RESULTS.get(status, SUPERVISOR_RESULTS["timeout"]))
 
     except json.JSONDecodeError:
         return JsonResponse({"result": "proceed", "message": "Invalid JSON."})
@@ -1170,6 +1176,10 @@ def dtmf_supervisor_check(request):
         return JsonResponse({"result": "proceed", "message": f"Error: {str(e)}"})
 
 
+# csrf_exempt only learns to wrap coroutine views in Django 5.0
+dtmf_supervisor_check.csrf_exempt = True
+
+
 # =============================================================================
 # Inbound SMS Webhook — delivers SMS to bot user's Telegram
 # =============================================================================
@@ -1196,19 +1206,17 @@ def inbound_sms_webhook(request):
             return JsonResponse({"status": "error", "message": "Missing number fields"}, status=400)
 
         # Find the user who owns this number
-        phone_record = UserPhoneNumber.objects.filter(
-            phone_number=to_number, is_active=True
-        ).first()
+        phone_record = phone_index.lookup(to_number)
 
         if not phone_record:
             logger.warning(f"[sms] Received SMS for unregistered number: {to_number}")
             return JsonResponse({"status": "ok", "message": "Number not assigned to any user"})
 
-        user_id = phone_record.user.user_id
+        user_id = phone_record.user_id
 
         # Store in SMS Inbox
         SMSInbox.objects.create(
-            user=phone_record.user,
+            user_id=user_id,
             phone_number=to_number,
             from_number=from_number,
             message=message_text or "(empty message)",
@@ -1216,13 +1224,14 @@ def inbound_sms_webhook(request):
 
         # Deliver to bot user via Telegram
         try:
-            bot.send_message(
+            queue_message(
                 user_id,
                 f"📩 *New SMS Received*\n\n"
                 f"From: `{from_number}`\n"
                 f"To: `{to_number}`\n"
                 f"Message:\n{message_text or '(empty)'}",
                 parse_mode="Markdown",
+                lane=NORMAL,
             )
         except Exception as e:
             logger.warning(f"[sms] Failed to deliver SMS to user {user_id}: {e}")
@@ -1241,39 +1250,197 @@ def inbound_sms_webhook(request):
 # Webhook endpoints
 # =============================================================================
 
+RETELL_EVENTS = ("call_started", "call_ended", "call_analyzed", "transcript_updated")
+
+
+def _event_key(event, call_data):
+    """Stable identity for a Retell delivery: call_id + event type + a hash of
+    its timestamps. Retries carry the same payload and so the same key.
+    transcript_updated fires repeatedly per call, so its transcript length is
+    part of the identity."""
+    call_id = call_data.get("call_id", "")
+    marker = f"{call_data.get('start_timestamp') or ''}:{call_data.get('end_timestamp') or ''}"
+    if event == "transcript_updated":
+        transcript_obj = call_data.get("transcript_with_tool_calls") or call_data.get("transcript_object") or []
+        marker += f":{len(transcript_obj)}"
+    return hashlib.sha256(f"{call_id}:{event}:{marker}".encode()).hexdigest()
+
+
+def _claim_event(event, call_data):
+    """Atomically claim an event in the ledger.
+    Returns the key if this delivery should run, or None for a duplicate."""
+    key = _event_key(event, call_data)
+    try:
+        with transaction.atomic():
+            ProcessedWebhookEvent.objects.create(
+                event_key=key,
+                call_id=call_data.get("call_id", ""),
+                event=event,
+            )
+    except IntegrityError:
+        return None
+    return key
+
+
+def _reconcile_batch_call_id(call_data):
+    """
+    Batch rows are written by bulk_ivr_flow under a placeholder call_id
+    (see bot.views.placeholder_call_id) carried in the task metadata.
+    Re-key them to Retell's real call_id so every handler finds them.
+    """
+    metadata = call_data.get("metadata")
+    if not isinstance(metadata, dict):
+        return
+    placeholder = metadata.get("placeholder_call_id")
+    call_id = call_data.get("call_id")
+    if not placeholder or placeholder == call_id:
+        return
+
+    with transaction.atomic():
+        moved = BatchCallLogs.objects.filter(call_id=placeholder).update(call_id=call_id)
+        CallLogsTable.objects.filter(call_id=placeholder).update(call_id=call_id)
+
+    if moved:
+        logger.info(f"[retell_webhook] Reconciled {placeholder} -> {call_id}")
+    elif not BatchCallLogs.objects.filter(call_id=call_id).exists():
+        # bulk_ivr_flow has not committed the batch rows yet — let the retry apply it
+        raise LookupError(f"Batch rows for {placeholder} not persisted yet")
+
+
+def dispatch_retell_event(event, call_data):
+    """Run the handlers for a single Retell event. Shared by the inline
+    webhook path and the queued worker path (bot.tasks.drain_retell_events).
+    Duplicate deliveries are dropped after one ledger lookup."""
+    if event not in RETELL_EVENTS:
+        logger.warning(f"[retell_webhook] Unknown event: {event}")
+        return
+    if not call_data.get("call_id"):
+        logger.warning(f"[retell_webhook] {event} without call_id — skipped")
+        return
+
+    call_id = call_data["call_id"]
+    # The claim commits together with everything the handlers write, debits
+    # included: if a handler raises, both roll back and the retry re-runs
+    # the event from scratch instead of charging a second time. The
+    # transaction only touches the database — messages, cache bumps and
+    # downloads are queued with _after_commit and go out once it commits.
+    with transaction.atomic():
+        if _claim_event(event, call_data) is None:
+            logger.info(f"[retell_webhook] Duplicate {event} for {call_id} — skipped")
+        else:
+            _run_claimed_event(event, call_id, call_data)
+
+    if event == "call_ended":
+        # Also covers a retry after the parked call_analyzed failed to apply
+        _apply_parked_analysis(call_id)
+
+
+def _run_claimed_event(event, call_id, call_data):
+    """The handlers of an event this delivery has claimed. Runs inside the
+    claim's transaction."""
+    if event in call_state.FLAGS:
+        decision = call_state.begin(event, call_data)
+        if decision == call_state.DROP:
+            logger.info(f"[retell_webhook] Late or repeated {event} for {call_id} — dropped")
+            return
+        if decision == call_state.DEFER:
+            logger.info(f"[retell_webhook] {event} for {call_id} before call_ended — parked")
+            return
+
+    try:
+        if event != "transcript_updated":
+            _reconcile_batch_call_id(call_data)
+            call_details_store.save(call_data)
+
+        # Built after reconciling so it reads the re-keyed batch rows
+        ctx = CallContext(call_data)
+        if event == "call_started":
+            _handle_call_started(call_data, ctx)
+        elif event == "call_ended":
+            _handle_call_ended(call_data, ctx)
+            _deliver_recording_to_user(call_data, ctx)
+            _bill_voicemail_if_applicable(call_data, ctx)
+        elif event == "call_analyzed":
+            _handle_call_analyzed(call_data, ctx)
+        elif event == "transcript_updated":
+            _handle_transcript_updated(call_data, ctx)
+    except Exception:
+        # The transaction rolls the claim back; undo the ordering step too
+        # so Retell's retry (or the queue worker) is applied
+        if event in call_state.FLAGS:
+            call_state.rollback(event, call_id)
+        raise
+
+
+def _apply_parked_analysis(call_id):
+    """Apply a call_analyzed that overtook call_ended and was parked. Its
+    ledger claim was taken on arrival, so it bypasses the ledger here.
+    The payload stays parked until it has been applied: if a handler fails,
+    the error reaches call_ended's caller, and call_ended's retry — a
+    duplicate for everything else — applies it again."""
+    parked = call_state.pending_analysis(call_id)
+    if parked is None or call_state.begin("call_analyzed", parked) != call_state.APPLY:
+        return
+    logger.info(f"[retell_webhook] Applying parked call_analyzed for {call_id}")
+    try:
+        with transaction.atomic():
+            _reconcile_batch_call_id(parked)
+            call_details_store.save(parked)
+            _handle_call_analyzed(parked, CallContext(parked))
+    except Exception:
+        call_state.rollback("call_analyzed", call_id)
+        raise
+    call_state.clear_pending_analysis(call_id)
+
+
+def _enqueue_retell_event(event, call_data, raw_body):
+    """Persist the raw event and hand it to the worker pool.
+    The view returns as soon as the row is committed."""
+    from bot.tasks import drain_retell_events
+
+    call_id = call_data.get("call_id", "")
+    RetellWebhookEvent.objects.create(
+        call_id=call_id,
+        event=event,
+        payload=raw_body,
+    )
+    try:
+        drain_retell_events.delay(call_id)
+    except OperationalError as e:
+        # Row is durable — the periodic sweep will pick it up
+        logger.warning(f"[retell_webhook] Enqueue failed for {call_id}, left for sweep: {e}")
+
+
 @csrf_exempt
 def retell_webhook(request):
     """
     Main Retell AI webhook — handles all call lifecycle events.
     Replaces: check_call_status, call_status_free_plan, process_call_logs
+
+    With RETELL_WEBHOOK_ASYNC enabled the view only validates and persists the
+    event, and bot.tasks.drain_retell_events applies it in per-call order.
     """
     if request.method != "POST":
         return JsonResponse({"status": "method_not_allowed"}, status=405)
 
     try:
-        payload = json.loads(request.body)
+        raw_body = request.body.decode("utf-8")
+        payload = json.loads(raw_body)
         event = payload.get("event", "")
         call_data = payload.get("data", payload)
 
         logger.info(f"[retell_webhook] event={event}, call_id={call_data.get('call_id', 'unknown')}")
 
-        if event == "call_started":
-            _handle_call_started(call_data)
-        elif event == "call_ended":
-            _handle_call_ended(call_data)
-            _deliver_recording_to_user(call_data)
-            _bill_voicemail_if_applicable(call_data)
-            # Clean up transcript cursor
-            _transcript_cursor.pop(call_data.get("call_id", ""), None)
-        elif event == "call_analyzed":
-            _handle_call_analyzed(call_data)
-        elif event == "transcript_updated":
-            _handle_transcript_updated(call_data)
-        else:
-            logger.warning(f"[retell_webhook] Unknown event: {event}")
+        if settings.RETELL_WEBHOOK_ASYNC:
+            if event not in RETELL_EVENTS or not call_data.get("call_id"):
+                logger.warning(f"[retell_webhook] Rejected event={event} without call_id or unknown type")
+                return JsonResponse({"status": "ignored"})
+            _enqueue_retell_event(event, call_data, raw_body)
+            return JsonResponse({"status": "queued"})
 
+        dispatch_retell_event(event, call_data)
         return JsonResponse({"status": "ok"})
-    except json.JSONDecodeError:
+    except (json.JSONDecodeError, UnicodeDecodeError):
         logger.error("[retell_webhook] Invalid JSON payload")
         return JsonResponse({"status": "error", "message": "Invalid JSON"}, status=400)
     except Exception as e:
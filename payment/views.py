@@ -9,10 +9,10 @@ import logging
 import os
 from decimal import Decimal
 
-import requests
 from django.db import transaction
 from requests.exceptions import RequestException
 
+from TelegramBot import http_transport
 from user.models import TelegramUser
 from payment.models import WalletTransaction, TransactionType, UserTransactionLogs
 
@@ -208,7 +208,7 @@ def create_crypto_payment(user_id, amount, currency, redirect_uri, auto_renewal,
     }
 
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=15)
+        response = http_transport.post(url, json=payload, headers=headers, timeout=(5, 15))
         logger.info(f"DynoPay cryptoPayment for user {user_id}: {response.status_code}")
         return response
     except RequestException as e: